@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Benchmark kubed's shell artifacts, CLI cold start and setup runtime.
+
+Everything runs against this checkout in a throwaway $HOME whose PATH has
+stub kubectl, helm, docker, terraform and brew binaries, so results do not
+depend on what is installed or on the network. Measured:
+
+- non-interactive bash and zsh startup sourcing each artifact in setup's
+  plan (get_setup_plan), written into the throwaway $HOME, plus the init
+  bundle;
+- cold start of every console script;
+- the import time of `kubed completions-path`, which runs at shell init;
+- setup_command(force_yes=True) on a fresh $HOME and re-run with nothing
+  to do.
+
+Results are written as JSON. The run fails when a benchmark's p50 is slower
+than the stored baseline by more than the threshold, or over its budget.
+
+Usage:
+    python benchmarks/run.py [--runs 10] [--output results.json]
+    python benchmarks/run.py --update-baseline
+"""
+
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+BASELINE_PATH = os.path.join(REPO, 'benchmarks', 'baseline.json')
+
+# Console scripts from pyproject.toml: module, function and the arguments to time them with.
+# kubed-setup is timed by the setup benchmarks.
+CONSOLE_SCRIPTS = {
+    'kubed --help': ('kubed.main', 'cli', ['--help']),
+    'kubed completions-path': ('kubed.main', 'cli', ['completions-path']),
+    'kubed-completions-path': ('kubed.cli', 'completions_path_command', []),
+    'kubed-aliases-path': ('kubed.cli', 'aliases_path_command', []),
+}
+
+# Answers what kubed asks the tools during setup and completion caching
+STUB = '''#!/bin/sh
+case "$1" in
+    completion) echo "# {tool} $2 completion stub" ;;
+    __complete) echo ":4" ;;
+    -help|--help|help) printf 'Usage: {tool} [options] <subcommand> [args]\\n\\nMain commands:\\n  init          Prepare\\n  plan          Show changes\\n' ;;
+    *) echo "{tool} version v1.0.0" ;;
+esac
+'''
+STUB_TOOLS = ['kubectl', 'helm', 'docker', 'terraform', 'brew']
+
+def make_home(root):
+    """Create a throwaway $HOME with stub tools, returning the environment to run kubed in."""
+    home = tempfile.mkdtemp(prefix='home-', dir=root)
+    bin_dir = os.path.join(home, 'stub-bin')
+    os.makedirs(bin_dir)
+    for tool in STUB_TOOLS:
+        path = os.path.join(bin_dir, tool)
+        with open(path, 'w') as f:
+            f.write(STUB.replace('{tool}', tool))
+        os.chmod(path, 0o755)
+    # Skip the network installs of oh-my-zsh and powerlevel10k
+    os.makedirs(os.path.join(home, '.oh-my-zsh', 'custom', 'themes', 'powerlevel10k'))
+    path = os.pathsep.join([bin_dir, os.path.dirname(sys.executable), '/usr/bin', '/bin'])
+    env = {
+        'HOME': home,
+        'PATH': path,
+        'PYTHONPATH': REPO,
+        'LANG': os.environ.get('LANG', 'C.UTF-8'),
+        'TMPDIR': root,
+    }
+    return home, env
+
+def summarize(samples):
+    """Get p50/p95/max of a list of millisecond timings."""
+    from kubed.startup import percentile
+
+    return {
+        'p50_ms': round(percentile(samples, 50), 2),
+        'p95_ms': round(percentile(samples, 95), 2),
+        'max_ms': round(max(samples), 2),
+    }
+
+def time_command(argv, env, runs, warmup=True):
+    """Time a command several times, after one untimed run to warm the page cache."""
+    samples = []
+    for i in range(runs + (1 if warmup else 0)):
+        start = time.perf_counter()
+        subprocess.run(argv, env=env, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+        if i or not warmup:
+            samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+# Writes each shell's setup artifacts, with the package's aliases and completion files
+# moved from the checkout to ~/package, so the tracked copies are never rewritten
+WRITE_ARTIFACTS = '''
+import os
+from kubed.cli import PACKAGE_DIR, get_setup_plan
+from kubed.manifest import apply_changes, plan_changes
+
+for shell in ('bash', 'zsh'):
+    artifacts, _ = get_setup_plan(shell, os.path.expanduser(f'~/.{shell}rc'))
+    for artifact in artifacts:
+        if artifact.path.startswith(PACKAGE_DIR + os.sep):
+            artifact.path = os.path.join(os.path.expanduser('~/package'), os.path.relpath(artifact.path, PACKAGE_DIR))
+    changes, _ = plan_changes(artifacts)
+    apply_changes(changes, artifacts)
+'''
+
+def write_artifacts(env):
+    """Write every artifact the shell benchmarks source into the throwaway $HOME."""
+    subprocess.run([sys.executable, '-c', WRITE_ARTIFACTS], env=env, check=True, stdout=subprocess.DEVNULL)
+
+def bench_shells(env, runs):
+    """Time bash and zsh startup with each kubed artifact."""
+    from kubed.startup import ZSH_PRELUDE
+
+    home = env['HOME']
+    package = os.path.join(home, 'package')
+    results = {}
+    for shell in ('bash', 'zsh'):
+        shell_path = shutil.which(shell)
+        if not shell_path:
+            click.echo(f"{shell} is not installed; skipping its startup benchmarks", err=True)
+            continue
+        if shell == 'zsh':
+            argv, prelude = [shell_path, '-f', '-c'], ZSH_PRELUDE
+        else:
+            argv, prelude = [shell_path, '--norc', '--noprofile', '-c'], ':'
+        artifacts = [
+            ('aliases', os.path.join(package, 'aliases', 'aliases.sh')),
+            ('help_wrapper', os.path.join(package, 'aliases', 'help_wrapper.sh')),
+            ('completions', os.path.join(package, 'completions', shell, f'{shell}_completions.sh')),
+            ('bundle', os.path.join(home, '.kubed', f'init.{shell}')),
+        ]
+        scripts = [('baseline', prelude)] + [(name, f'{prelude}\nsource "{path}"') for name, path in artifacts]
+        for name, script in scripts:
+            results[f'shell:{shell}:{name}'] = summarize(time_command(argv + [script], env, runs))
+    return results
+
+def bench_console_scripts(env, runs):
+    """Time the cold start of each console script, the way its entry-point wrapper runs it."""
+    results = {}
+    for name, (module, function, args) in CONSOLE_SCRIPTS.items():
+        script = f'import sys; from {module} import {function}; sys.exit({function}())'
+        argv = [sys.executable, '-c', script] + args
+        results[f'cli:{name}'] = summarize(time_command(argv, env, runs))
+    return results
+
+def bench_import_time(env, runs):
+    """Measure the import time of `kubed completions-path` with -X importtime."""
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-m', 'kubed', 'completions-path'],
+                                env=env, capture_output=True, text=True)
+        total = 0
+        for line in result.stderr.splitlines():
+            # "import time: self [us] | cumulative | imported package"; top-level imports are not indented
+            match = re.match(r'import time:\s+\d+\s+\|\s+(\d+)\s+\|\s(\S.*)$', line)
+            if match:
+                total += int(match.group(1))
+        samples.append(total / 1000)
+    return {'import:kubed completions-path': summarize(samples)}
+
+def bench_setup(root, runs):
+    """Time setup_command(force_yes=True) on a fresh $HOME and again with nothing to change."""
+    script = 'from kubed.cli import setup_command; setup_command(force_yes=True)'
+    results = {}
+    for shell in ('bash', 'zsh'):
+        first, noop = [], []
+        for _ in range(runs):
+            _, env = make_home(root)
+            env['SHELL'] = f'/bin/{shell}'
+            first += time_command([sys.executable, '-c', script], env, 1, warmup=False)
+            noop += time_command([sys.executable, '-c', script], env, 1, warmup=False)
+        results[f'setup:{shell}:first'] = summarize(first)
+        results[f'setup:{shell}:noop'] = summarize(noop)
+    return results
+
+def compare(results, baseline, threshold, min_delta):
+    """Find benchmarks slower than the baseline or over their budget.
+
+    Returns:
+        list: One message per regression.
+    """
+    failures = []
+    for name, summary in sorted(results.items()):
+        budget = baseline.get('budgets', {}).get(name)
+        if budget is not None and summary['p50_ms'] > budget:
+            failures.append(f"{name}: p50 {summary['p50_ms']}ms is over its {budget}ms budget")
+        previous = baseline.get('results', {}).get(name)
+        if not previous:
+            continue
+        limit = max(previous['p50_ms'] * (1 + threshold), previous['p50_ms'] + min_delta)
+        if summary['p50_ms'] > limit:
+            failures.append(f"{name}: p50 {summary['p50_ms']}ms vs baseline {previous['p50_ms']}ms "
+                            f"(limit {limit:.2f}ms)")
+    return failures
+
+@click.command()
+@click.option('--runs', default=10, show_default=True, help='Samples per benchmark.')
+@click.option('--output', default=os.path.join(REPO, 'benchmarks', 'results.json'), show_default=True,
+              help='Where to write the results JSON.')
+@click.option('--baseline', 'baseline_path', default=BASELINE_PATH, show_default=True,
+              help='Baseline JSON to compare against.')
+@click.option('--threshold', default=0.25, show_default=True,
+              help='Allowed slowdown of a p50 over the baseline, as a fraction.')
+@click.option('--min-delta', default=5.0, show_default=True,
+              help='Slowdowns smaller than this many milliseconds are never regressions.')
+@click.option('--only', help='Only run benchmarks whose name starts with this prefix (shell, cli, import, setup).')
+@click.option('--update-baseline', is_flag=True, help='Store the results as the new baseline.')
+def main(runs, output, baseline_path, threshold, min_delta, only, update_baseline):
+    """Run the kubed benchmarks and compare them with the stored baseline."""
+    from kubed.startup import get_kubed_version
+
+    root = tempfile.mkdtemp(prefix='kubed-bench-')
+    try:
+        _, env = make_home(root)
+        env['SHELL'] = '/bin/bash'
+        write_artifacts(env)
+        suites = [
+            ('shell', lambda: bench_shells(env, runs)),
+            ('cli', lambda: bench_console_scripts(env, runs)),
+            ('import', lambda: bench_import_time(env, runs)),
+            ('setup', lambda: bench_setup(root, max(1, runs // 2))),
+        ]
+        results = {}
+        for name, suite in suites:
+            if only and not name.startswith(only.split(':')[0]):
+                continue
+            click.echo(f"Running {name} benchmarks...", err=True)
+            results.update({key: value for key, value in suite().items()
+                            if not only or key.startswith(only)})
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    report = {
+        'kubed_version': get_kubed_version(),
+        'python': platform.python_version(),
+        'platform': f'{platform.system().lower()}-{platform.machine()}',
+        'runs': runs,
+        'results': results,
+    }
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+    width = max(map(len, results), default=0)
+    for name, summary in sorted(results.items()):
+        click.echo(f"{name:<{width}}  p50 {summary['p50_ms']:>8.2f}ms  p95 {summary['p95_ms']:>8.2f}ms  "
+                   f"max {summary['max_ms']:>8.2f}ms")
+
+    try:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+    except (OSError, ValueError):
+        baseline = {}
+    if update_baseline:
+        # Budgets are set by hand and survive baseline updates
+        report['budgets'] = baseline.get('budgets', {})
+        with open(baseline_path, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+        click.echo(f"Updated {baseline_path}")
+        return
+
+    failures = compare(results, baseline, threshold, min_delta)
+    for failure in failures:
+        click.echo(f"❌ {failure}", err=True)
+    if failures:
+        sys.exit(1)
+    click.echo(f"✅ No regressions against {baseline_path}")
+
+if __name__ == '__main__':
+    main()
@@ -11,6 +11,16 @@ alias kx='kubectl exec -it'
 alias kaf='kubectl apply -f'
 alias kdel='kubectl delete'
 
+# Opt in with KUBED_NATIVE_K8S=1 to serve the get aliases in-process with
+# `kubed k8s`, skipping kubectl's process startup and API discovery
+if [ -n "$KUBED_NATIVE_K8S" ]; then
+    alias kgp='kubed k8s get pods'
+    alias kgd='kubed k8s get deployments'
+    alias kgs='kubed k8s get services'
+    alias kgn='kubed k8s get nodes'
+    alias kaf='kubed k8s apply -f'
+fi
+
 # Docker
 alias d='docker'
 alias dc='docker-compose'
@@ -34,3 +44,9 @@ alias hi='helm install'
 alias hu='helm upgrade'
 alias hun='helm uninstall'
 alias hr='helm repo'
+
+# With KUBED_NATIVE_K8S=1, hl decodes release records in-process with
+# `kubed helm releases` instead of running helm list
+if [ -n "$KUBED_NATIVE_K8S" ]; then
+    alias hl='kubed helm releases'
+fi
@@ -1,18 +1,163 @@
-# Kubed help wrapper function
-function _kubed_help_wrapper() {
-    if [[ "$@" == *--help* ]] || [[ "$@" == *-h* ]]; then
-        # Run the original command
-        "$@"
-        echo -e "\n\033[1;32mℹ️  For more information, visit: https://cmds.daleyarborough.com\033[0m\n"
-    else
-        # Just run the original command
-        "$@"
+# Kubed help hints and command latency stats
+#
+# kubectl, docker, terraform and helm are not wrapped or shadowed. Shell hooks
+# (preexec/precmd in zsh; in bash, bash-preexec's hooks if it is loaded, else a
+# chained DEBUG trap and PROMPT_COMMAND) print the help hint after a real
+# -h/--help and record each command's wall time into a fixed-size ring buffer
+# of 64-byte records that `kubed stats` summarizes.
+KUBED_STATS_FILE="${KUBED_STATS_FILE:-$HOME/.kubed/stats/latency.ring}"
+KUBED_STATS_SLOTS="${KUBED_STATS_SLOTS:-4096}"
+
+# Set REPLY to the tool a command word runs, or fail for anything else
+_kubed_tool_name() {
+    case "$1" in
+        kubectl|k) REPLY=kubectl ;;
+        docker|d) REPLY=docker ;;
+        terraform|tf) REPLY=terraform ;;
+        helm|h) REPLY=helm ;;
+        *) return 1 ;;
+    esac
+}
+
+# Start tracking a command line given as words, if it runs one of the tools
+_kubed_start_command() {
+    local word skip=0
+    [ "$1" = command ] && shift
+    _kubed_tool_name "$1" || return 0
+    _kubed_cmd_tool=$REPLY _kubed_cmd_sub=- _kubed_cmd_help=0
+    shift
+    for word in "$@"; do
+        case "$word" in
+            -h|--help) _kubed_cmd_help=1 ;;
+            -n|--namespace|--context|--kube-context|--kubeconfig|-H|--host) skip=1; continue ;;
+            -*) ;;
+            *) [ "$skip" = 0 ] && [ "$_kubed_cmd_sub" = - ] && _kubed_cmd_sub=$word ;;
+        esac
+        skip=0
+    done
+    _kubed_now_us
+    _kubed_cmd_start=$REPLY _kubed_cmd_pending=1
+}
+
+# Print the help hint and record the latency of the tracked command, if any
+_kubed_finish_command() {
+    [ "$_kubed_cmd_pending" = 1 ] || return 0
+    _kubed_cmd_pending=0
+    if [ "$_kubed_cmd_help" = 1 ]; then
+        printf '\n\033[1;32mℹ️  For more information and quick links, visit: https://cmds.daleyarborough.com\033[0m\n\n'
     fi
+    _kubed_now_us
+    if [ -n "$REPLY" ] && [ -n "$_kubed_cmd_start" ]; then
+        _kubed_record_latency $(( REPLY - _kubed_cmd_start ))
+    fi
+}
+
+# Write one record into the next ring-buffer slot
+_kubed_record_latency() {
+    local us=$1 slot=0 record
+    [ -d "${KUBED_STATS_FILE%/*}" ] || mkdir -p "${KUBED_STATS_FILE%/*}" || return 0
+    [ -r "$KUBED_STATS_FILE.idx" ] && read -r slot < "$KUBED_STATS_FILE.idx"
+    case "$slot" in ''|*[!0-9]*) slot=0 ;; esac
+    [ "$slot" -lt "$KUBED_STATS_SLOTS" ] || slot=0
+    [ "$us" -gt 9999999999 ] && us=9999999999
+    printf -v record '%-10.10s %-24.24s %7d.%03d %15d' \
+        "$_kubed_cmd_tool" "$_kubed_cmd_sub" $(( us / 1000 )) $(( us % 1000 )) "${EPOCHSECONDS:-0}"
+    _kubed_write_slot "$slot" "$record"
+    printf '%s\n' $(( (slot + 1) % KUBED_STATS_SLOTS )) > "$KUBED_STATS_FILE.idx"
 }
 
-# Apply help wrapper to common tools
-for cmd in docker terraform kubectl helm; do
-    if command -v $cmd >/dev/null 2>&1; then
-        alias $cmd="_kubed_help_wrapper $cmd"
+if [ -n "$ZSH_VERSION" ]; then
+    zmodload zsh/datetime zsh/system 2>/dev/null
+
+    _kubed_now_us() {
+        local -i us
+        (( us = EPOCHREALTIME * 1000000 ))
+        REPLY=$us
+    }
+
+    _kubed_write_slot() {
+        local fd
+        sysopen -w -o creat -u fd "$KUBED_STATS_FILE" 2>/dev/null || return 0
+        sysseek -u $fd $(( $1 * 64 ))
+        syswrite -o $fd "$2"$'\n'
+        exec {fd}>&-
+    }
+
+    _kubed_preexec() {
+        _kubed_cmd_pending=0
+        _kubed_start_command ${(z)3}
+    }
+
+    autoload -Uz add-zsh-hook
+    add-zsh-hook preexec _kubed_preexec
+    add-zsh-hook precmd _kubed_finish_command
+elif [ -n "$BASH_VERSION" ]; then
+    _kubed_now_us() {
+        REPLY=${EPOCHREALTIME//[!0-9]/}
+    }
+
+    # bash cannot seek, so the record is placed with dd (one fork per tracked command)
+    _kubed_write_slot() {
+        dd of="$KUBED_STATS_FILE" bs=64 seek="$1" conv=notrunc 2>/dev/null <<< "$2"
+    }
+
+    # The DEBUG trap fires for every simple command; only the first one after a prompt counts
+    _kubed_preexec() {
+        [ -n "$COMP_LINE" ] && return 0
+        [ "$_kubed_at_prompt" = 1 ] || return 0
+        _kubed_at_prompt=0 _kubed_cmd_pending=0
+        local -a words
+        _kubed_tool_name "${BASH_COMMAND%% *}" || [ "${BASH_COMMAND%% *}" = command ] || return 0
+        read -r -a words <<< "$BASH_COMMAND"
+        _kubed_start_command "${words[@]}"
+    }
+
+    _kubed_precmd() {
+        local status=$?
+        _kubed_finish_command
+        return $status
+    }
+
+    _kubed_prompt_ready() {
+        local status=$?
+        _kubed_at_prompt=1
+        return $status
+    }
+
+    # Time the first command of the session too
+    _kubed_at_prompt=1
+
+    if [ -n "${bash_preexec_imported:-${__bp_imported:-}}" ]; then
+        # bash-preexec owns the DEBUG trap and PROMPT_COMMAND; use its hooks
+        _kubed_bp_preexec() {
+            local -a words
+            _kubed_cmd_pending=0
+            read -r -a words <<< "$1"
+            _kubed_start_command "${words[@]}"
+        }
+        [[ " ${preexec_functions[*]} " == *" _kubed_bp_preexec "* ]] || preexec_functions+=(_kubed_bp_preexec)
+        [[ " ${precmd_functions[*]} " == *" _kubed_finish_command "* ]] || precmd_functions+=(_kubed_finish_command)
+    else
+        # Chain onto a DEBUG trap set by the user or another framework, running it first so it
+        # sees $_ and $?. A sourced file cannot see the caller's DEBUG trap, so this is done once,
+        # from the first prompt, with the trap expanded at the top level of PROMPT_COMMAND.
+        _kubed_install_debug_trap() {
+            local status=$? previous=
+            local -a words
+            [ -n "$1" ] && eval "words=($1)" && previous=${words[2]}
+            case "$previous" in
+                *_kubed_preexec*) ;;
+                '') trap '_kubed_preexec' DEBUG ;;
+                *) trap "$previous"$'\n''_kubed_preexec' DEBUG ;;
+            esac
+            PROMPT_COMMAND=${PROMPT_COMMAND//$'\n''_kubed_install_debug_trap "$(trap -p DEBUG)"'/}
+            return $status
+        }
+
+        case "$PROMPT_COMMAND" in
+            *_kubed_precmd*) ;;
+            *) PROMPT_COMMAND="_kubed_precmd${PROMPT_COMMAND:+$'\n'$PROMPT_COMMAND}"$'\n'
+               PROMPT_COMMAND+='_kubed_install_debug_trap "$(trap -p DEBUG)"'$'\n''_kubed_prompt_ready' ;;
+        esac
     fi
-done
+fi
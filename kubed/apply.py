@@ -0,0 +1,462 @@
+"""
+Apply directories of manifests with server-side apply, for `kubed k8s apply`.
+
+Every YAML or JSON file given is split into objects, which are applied in
+phases: CRDs and Namespaces, then the objects others refer to (RBAC,
+ServiceAccounts, ConfigMaps, Secrets, storage), then everything else, and
+admission webhooks and aggregated APIs last so they cannot reject or
+intercept objects applied in the same run. Objects within a phase are
+applied concurrently over the context's shared API client.
+
+After each successful apply the hash of the object's normalized content is
+recorded per context in ~/.kubed/cache/apply, and objects whose hash
+matches are skipped without a request. The record only knows what kubed
+applied, not what changed on the cluster since; `--force-all` applies
+everything again. Whether a kind is namespaced decides whether an object
+gets the default namespace, so the store also keeps the server's discovery
+answers, letting a run where nothing changed finish without any request.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+
+import click
+
+STORE_VERSION = 2
+MANIFEST_EXTENSIONS = ('.yaml', '.yml', '.json')
+# How long to wait for applied CRDs to be served before applying custom resources
+CRD_TIMEOUT = 60
+
+# Apply phases, in order; kinds not listed are applied with the workloads
+PHASES = ['definitions', 'dependencies', 'workloads', 'webhooks']
+PHASE_KINDS = {
+    'CustomResourceDefinition': 'definitions',
+    'Namespace': 'definitions',
+    'ServiceAccount': 'dependencies',
+    'Secret': 'dependencies',
+    'ConfigMap': 'dependencies',
+    'ClusterRole': 'dependencies',
+    'ClusterRoleBinding': 'dependencies',
+    'Role': 'dependencies',
+    'RoleBinding': 'dependencies',
+    'StorageClass': 'dependencies',
+    'PersistentVolume': 'dependencies',
+    'PersistentVolumeClaim': 'dependencies',
+    'PriorityClass': 'dependencies',
+    'ResourceQuota': 'dependencies',
+    'LimitRange': 'dependencies',
+    'IngressClass': 'dependencies',
+    'RuntimeClass': 'dependencies',
+    'MutatingWebhookConfiguration': 'webhooks',
+    'ValidatingWebhookConfiguration': 'webhooks',
+    'ValidatingAdmissionPolicy': 'webhooks',
+    'ValidatingAdmissionPolicyBinding': 'webhooks',
+    'APIService': 'webhooks',
+}
+
+# Metadata the server sets; dropped from what is hashed and applied
+SERVER_METADATA = ('creationTimestamp', 'generation', 'managedFields', 'resourceVersion', 'selfLink', 'uid')
+
+class Manifest:
+    """One object to apply, read from a manifest file; body is already normalized.
+
+    The namespace, and so the key and hash, are only set by resolve(), once
+    discovery has said whether the kind is namespaced.
+    """
+
+    def __init__(self, body, source):
+        self.body = body
+        self.source = source
+        self.api_version = body['apiVersion']
+        self.kind = body['kind']
+        self.name = body['metadata']['name']
+        self.explicit_namespace = body['metadata'].get('namespace') or None
+        self.namespace = None
+        self.phase = PHASE_KINDS.get(self.kind, 'workloads')
+        self.hash = None
+
+    def resolve(self, namespaced, namespace):
+        """Fill in the namespace of a namespaced object, or drop it from a cluster-scoped one."""
+        metadata = self.body['metadata']
+        if namespaced:
+            metadata['namespace'] = self.explicit_namespace or namespace
+        else:
+            metadata.pop('namespace', None)
+        self.namespace = metadata.get('namespace')
+        self.hash = content_hash(self.body)
+
+    @property
+    def group(self):
+        return self.api_version.rpartition('/')[0]
+
+    @property
+    def key(self):
+        """Identify the object in the hash store: group, kind, namespace and name."""
+        return f"{self.group}/{self.kind}/{self.namespace or ''}/{self.name}"
+
+    @property
+    def label(self):
+        """Name the object kubectl style, e.g. deployment.apps/web."""
+        kind = self.kind.lower() + (f'.{self.group}' if self.group else '')
+        return f"{kind}/{self.name}"
+
+def find_manifest_files(paths, recursive=False):
+    """Get the manifest files named by -f, expanding directories in sorted order."""
+    files = []
+    for path in paths:
+        if path == '-' or os.path.isfile(path):
+            files.append(path)
+        elif os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs[:] = sorted(dirs) if recursive else []
+                files.extend(os.path.join(root, name) for name in sorted(names)
+                             if name.endswith(MANIFEST_EXTENSIONS))
+        else:
+            raise click.BadParameter(f"{path} does not exist", param_hint='-f')
+    return files
+
+def _documents(value):
+    """Expand kubectl's List kinds into their items."""
+    if isinstance(value, dict) and value.get('kind', '').endswith('List') and 'items' in value:
+        for item in value['items'] or []:
+            yield from _documents(item)
+    else:
+        yield value
+
+def load_manifests(files):
+    """Parse manifest files into objects.
+
+    Args:
+        files (list): Paths from find_manifest_files ('-' reads stdin).
+
+    Returns:
+        list: Manifest objects, in file order, not resolved yet.
+    """
+    import yaml
+
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    manifests = []
+    for path in files:
+        try:
+            if path == '-':
+                documents = list(yaml.load_all(sys.stdin, Loader=loader))
+            else:
+                with open(path, 'rb') as f:
+                    documents = list(yaml.load_all(f, Loader=loader))
+        except (OSError, yaml.YAMLError) as e:
+            raise click.ClickException(f"{path}: {e}")
+        for index, document in enumerate(documents, 1):
+            for body in _documents(document):
+                if body is None:
+                    continue
+                if not isinstance(body, dict) or not body.get('apiVersion') or not body.get('kind'):
+                    raise click.ClickException(f"{path}: document {index} has no apiVersion or kind")
+                if not (body.get('metadata') or {}).get('name'):
+                    raise click.ClickException(f"{path}: {body['kind']} in document {index} has no metadata.name")
+                manifests.append(Manifest(normalize(body), path))
+    return manifests
+
+def normalize(body):
+    """Get the body to apply: no status, server-set metadata or unset metadata fields."""
+    body = {key: value for key, value in body.items() if key != 'status'}
+    body['metadata'] = {key: value for key, value in body['metadata'].items()
+                        if key not in SERVER_METADATA and value is not None}
+    return body
+
+def resolve_manifests(manifests, discovery, namespace, enforce_namespace=False):
+    """Settle the namespace of every object and check that no object is defined twice.
+
+    Kinds discovery does not know are taken as namespaced; applying them
+    fails later with the server's answer.
+
+    Args:
+        manifests (list): Manifest objects from load_manifests.
+        discovery (Discovery): Loaded with the group versions of the manifests.
+        namespace (str): Namespace for namespaced objects that do not set one.
+        enforce_namespace (bool): If True, namespaced objects setting another
+            namespace are an error, as with `kubectl apply -n`.
+    """
+    seen = {}
+    for manifest in manifests:
+        namespaced = discovery.namespaced(manifest) is not False
+        explicit = manifest.explicit_namespace
+        if namespaced and enforce_namespace and explicit and explicit != namespace:
+            raise click.ClickException(f"{manifest.source}: {manifest.kind} {manifest.name} is in namespace "
+                                       f"'{explicit}', not '{namespace}'")
+        manifest.resolve(namespaced, namespace)
+        if manifest.key in seen:
+            raise click.ClickException(f"{manifest.label} is defined in both {seen[manifest.key]} "
+                                       f"and {manifest.source}")
+        seen[manifest.key] = manifest.source
+
+def content_hash(body):
+    """Hash an object's content independently of key order and YAML formatting."""
+    return hashlib.sha256(json.dumps(body, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+def get_store_path(context):
+    """Get the path of the hash store for a context."""
+    from kubed.cache import get_cache_dir
+
+    safe = re.sub(r'[^\w.-]', '_', context)[:64]
+    digest = hashlib.sha256(context.encode()).hexdigest()[:8]
+    return os.path.join(get_cache_dir('apply'), f'{safe}-{digest}.json')
+
+def load_store(path, server):
+    """Load the hashes of objects last applied to a context, if it still points at server.
+
+    Returns:
+        tuple: (object key to hash, discovered group versions as kept by Discovery)
+    """
+    from kubed.cache import read_json
+
+    store = read_json(path, {})
+    if store.get('version') != STORE_VERSION or store.get('server') != server:
+        return {}, {}
+    resources = {api_version: {kind: tuple(resource) for kind, resource in kinds.items()}
+                 for api_version, kinds in store.get('resources', {}).items()}
+    return store.get('objects', {}), resources
+
+def save_store(path, server, objects, resources):
+    """Save the hashes of the objects last applied to a context, and the discovered group versions."""
+    from kubed.cache import write_json
+
+    write_json(path, {'version': STORE_VERSION, 'server': server, 'objects': objects, 'resources': resources})
+
+def request(api_client, method, path, body=None, query=(), content_type=None, timeout=None):
+    """Send a request over the shared API client and decode the JSON response.
+
+    Raises:
+        ApiException: If the server answers with an error status.
+    """
+    from kubernetes.client.exceptions import ApiException
+
+    headers = {'Accept': 'application/json', 'Content-Type': content_type or 'application/json'}
+    if not hasattr(api_client, 'param_serialize'):
+        # Clients generated before the v35 openapi-generator upgrade
+        response = api_client.call_api(path, method, query_params=list(query), header_params=headers, body=body,
+                                       auth_settings=['BearerToken'], _preload_content=False,
+                                       _return_http_data_only=True, _request_timeout=timeout)
+        return json.loads(response.data)
+    serialized = api_client.param_serialize(method, path, query_params=list(query), header_params=headers,
+                                            body=body, auth_settings=['BearerToken'])
+    response = api_client.call_api(*serialized, _request_timeout=timeout)
+    response.read()
+    if not 200 <= response.status <= 299:
+        raise ApiException.from_response(http_resp=response, body=None, data=None)
+    return json.loads(response.data)
+
+class Discovery:
+    """Map kinds to resource paths, asking the server once per group version.
+
+    Args:
+        api_client: The context's shared API client.
+        timeout (float): Seconds to wait for each discovery request.
+        resources (dict): Group versions discovered before, from the hash store.
+    """
+
+    def __init__(self, api_client, timeout, resources=None):
+        self.api_client = api_client
+        self.timeout = timeout
+        # Group version to kind to (plural, namespaced)
+        self.resources = dict(resources or {})
+        # The same, from CRDs being applied whose kinds are not served yet
+        self.defined = {}
+
+    def load(self, api_versions, concurrency):
+        """Discover the group versions not seen yet, concurrently.
+
+        Group versions the server does not serve are asked again next time,
+        as CRDs applied in between may have added them.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from kubernetes.client.exceptions import ApiException
+
+        def fetch(api_version):
+            path = f'/api/{api_version}' if '/' not in api_version else f'/apis/{api_version}'
+            try:
+                return api_version, request(self.api_client, 'GET', path, timeout=self.timeout)
+            except ApiException as e:
+                if e.status == 404:
+                    return api_version, None
+                raise
+
+        missing = sorted(set(api_versions) - set(self.resources))
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(missing) or 1))) as pool:
+            for api_version, result in pool.map(fetch, missing):
+                if result is not None:
+                    self.resources[api_version] = {
+                        resource['kind']: (resource['name'], resource['namespaced'])
+                        for resource in result.get('resources', []) if '/' not in resource['name']
+                    }
+
+    def define(self, manifests):
+        """Learn the kinds of the CRDs among manifests, for their custom resources in the same run."""
+        for manifest in manifests:
+            if manifest.kind != 'CustomResourceDefinition' or manifest.group != 'apiextensions.k8s.io':
+                continue
+            spec = manifest.body.get('spec') or {}
+            names = spec.get('names') or {}
+            if not spec.get('group') or not names.get('kind') or not names.get('plural'):
+                continue
+            for version in spec.get('versions') or []:
+                if isinstance(version, dict) and version.get('name'):
+                    kinds = self.defined.setdefault(f"{spec['group']}/{version['name']}", {})
+                    kinds[names['kind']] = (names['plural'], spec.get('scope') == 'Namespaced')
+
+    def forget(self, api_version):
+        """Drop what was discovered of a group version, so it is asked again."""
+        self.resources.pop(api_version, None)
+
+    def namespaced(self, manifest):
+        """Check whether an object's kind is namespaced; None if neither the server nor a CRD says."""
+        resource = self.resources.get(manifest.api_version, {}).get(manifest.kind) or \
+            self.defined.get(manifest.api_version, {}).get(manifest.kind)
+        return None if resource is None else resource[1]
+
+    def path(self, manifest):
+        """Get the URL path of a resolved object.
+
+        Returns:
+            str: The path, or None if the server does not serve the kind.
+        """
+        resource = self.resources.get(manifest.api_version, {}).get(manifest.kind)
+        if resource is None:
+            return None
+        plural, namespaced = resource
+        prefix = f'/apis/{manifest.api_version}' if manifest.group else f'/api/{manifest.api_version}'
+        if not namespaced:
+            return f'{prefix}/{plural}/{manifest.name}'
+        return f"{prefix}/namespaces/{manifest.namespace}/{plural}/{manifest.name}"
+
+def wait_for_crds(api_client, names, timeout):
+    """Wait until applied CRDs are established, so their custom resources can be applied.
+
+    Returns:
+        list: Names of the CRDs still not established after timeout.
+    """
+    pending = set(names)
+    deadline = time.monotonic() + timeout
+    while pending and time.monotonic() < deadline:
+        for name in sorted(pending):
+            crd = request(api_client, 'GET', f'/apis/apiextensions.k8s.io/v1/customresourcedefinitions/{name}')
+            conditions = (crd.get('status') or {}).get('conditions') or []
+            if any(c.get('type') == 'Established' and c.get('status') == 'True' for c in conditions):
+                pending.discard(name)
+        if pending:
+            time.sleep(0.5)
+    return sorted(pending)
+
+def apply_manifests(paths, recursive=False, namespace=None, context=None, force_all=False, concurrency=16,
+                    field_manager='kubed', force_conflicts=False, dry_run=False, timeout=30):
+    """Apply every object in the manifest files and directories given.
+
+    Returns:
+        bool: True if every object was applied or skipped.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from kubernetes.client.exceptions import ApiException
+    from kubed.k8s import api_error_message, get_api_client, get_context_namespaces, print_table
+
+    started = time.monotonic()
+    context_namespaces, current = get_context_namespaces()
+    context = context or current
+    if not context:
+        raise click.ClickException('no current context is set; use --context')
+    default_namespace = context_namespaces.get(context, 'default')
+    files = find_manifest_files(paths, recursive)
+    manifests = load_manifests(files)
+
+    api_client = get_api_client(context)
+    server = api_client.configuration.host
+    store_path = get_store_path(context)
+    store, resources = load_store(store_path, server)
+    # One pooled connection per concurrent request instead of discarding them
+    pool_kw = api_client.rest_client.pool_manager.connection_pool_kw
+    pool_kw['maxsize'] = max(pool_kw.get('maxsize') or 1, concurrency)
+    discovery = Discovery(api_client, timeout, resources)
+    # Scopes decide namespaces, and so keys and hashes; only group versions not in the store are asked for
+    discovery.load({m.api_version for m in manifests}, concurrency)
+    discovery.define(manifests)
+    resolve_manifests(manifests, discovery, namespace or default_namespace, enforce_namespace=bool(namespace))
+    click.echo(f"Read {len(manifests)} objects from {len(files)} files in "
+               f"{time.monotonic() - started:.2f}s", err=True)
+    query = [('fieldManager', field_manager)]
+    if force_conflicts:
+        query.append(('force', 'true'))
+    if dry_run:
+        query.append(('dryRun', 'All'))
+
+    def apply(manifest, path):
+        start = time.monotonic()
+        request(api_client, 'PATCH', path, body=json.dumps(manifest.body), query=query,
+                content_type='application/apply-patch+yaml', timeout=timeout)
+        return time.monotonic() - start
+
+    rows = []
+    totals = {'applied': 0, 'skipped': 0, 'failed': 0}
+    try:
+        for phase in PHASES:
+            objects = [m for m in manifests if m.phase == phase]
+            if not objects:
+                continue
+            phase_start = time.monotonic()
+            pending = [m for m in objects if force_all or store.get(m.key) != m.hash]
+            counts = {'applied': 0, 'skipped': len(objects) - len(pending), 'failed': 0}
+            if pending:
+                discovery.load({m.api_version for m in pending}, concurrency)
+            applied_crds = []
+            with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+                futures = {}
+                for manifest in pending:
+                    path = discovery.path(manifest)
+                    if path is None:
+                        click.echo(f"error: {manifest.label} ({manifest.source}): no kind \"{manifest.kind}\" "
+                                   f"is served in version \"{manifest.api_version}\"", err=True)
+                        store.pop(manifest.key, None)
+                        counts['failed'] += 1
+                        continue
+                    futures[pool.submit(apply, manifest, path)] = manifest
+                for future in as_completed(futures):
+                    manifest = futures[future]
+                    try:
+                        elapsed = future.result()
+                    except Exception as e:
+                        if isinstance(e, ApiException) and e.status == 404:
+                            # Perhaps no longer served as discovered; ask again next time
+                            discovery.forget(manifest.api_version)
+                        message = api_error_message(e) if isinstance(e, ApiException) else str(e)
+                        click.echo(f"error: {manifest.label} ({manifest.source}): {message}", err=True)
+                        store.pop(manifest.key, None)
+                        counts['failed'] += 1
+                        continue
+                    click.echo(f"{manifest.label} serverside-applied{' (server dry run)' if dry_run else ''} "
+                               f"({elapsed:.2f}s)")
+                    counts['applied'] += 1
+                    if not dry_run:
+                        store[manifest.key] = manifest.hash
+                        if manifest.kind == 'CustomResourceDefinition':
+                            applied_crds.append(manifest.name)
+            if applied_crds:
+                for name in wait_for_crds(api_client, applied_crds, CRD_TIMEOUT):
+                    click.echo(f"warning: customresourcedefinition/{name} is not established after "
+                               f"{CRD_TIMEOUT}s", err=True)
+            rows.append([phase, str(len(objects)), str(counts['applied']), str(counts['skipped']),
+                         str(counts['failed']), f'{time.monotonic() - phase_start:.2f}s'])
+            for name in totals:
+                totals[name] += counts[name]
+    finally:
+        if not dry_run:
+            save_store(store_path, server, store, discovery.resources)
+
+    if not rows:
+        click.echo('No objects found.', err=True)
+        return True
+    click.echo()
+    print_table(['PHASE', 'OBJECTS', 'APPLIED', 'UNCHANGED', 'FAILED', 'TIME'], rows)
+    click.echo(f"Applied {totals['applied']}, skipped {totals['skipped']} unchanged, {totals['failed']} failed "
+               f"in {time.monotonic() - started:.2f}s")
+    return not totals['failed']
@@ -0,0 +1,365 @@
+"""
+Download and install kubectl, helm and terraform from a local artifact store.
+
+Release files are fetched for the detected OS and architecture over one pooled
+requests.Session, several tools at once, and checked against the checksum the
+project publishes next to them. Interrupted downloads resume from where they
+stopped. Verified files are kept in a content-addressed store,
+~/.kubed/artifacts/sha256/<hash>, with index.json mapping each tool, version
+and platform to its hash, so reinstalling never downloads again.
+
+Downloads can come from a mirror instead of upstream: a URL or a local
+directory laid out as <mirror>/<tool>/<upstream path>, e.g.
+<mirror>/kubectl/v1.29.3/bin/linux/amd64/kubectl. That lets air-gapped hosts
+install with no network at all.
+
+Each tool's version is pinned in TOOLS; $KUBED_<TOOL>_VERSION (e.g.
+KUBED_KUBECTL_VERSION=v1.30.0) or `kubed install --version tool=version`
+picks another release.
+"""
+
+import hashlib
+import io
+import os
+import platform
+import re
+import tarfile
+import threading
+import zipfile
+
+from kubed.cache import atomic_write, get_kubed_dir, read_json, write_json
+
+# Where each tool's release file and checksum live, relative to its base URL.
+# `member` is the binary's path inside an archive; None for a bare binary.
+TOOLS = {
+    'kubectl': {
+        'version': 'v1.29.3',
+        'base': 'https://dl.k8s.io/release',
+        'path': '{version}/bin/{os}/{arch}/kubectl',
+        'checksum': '{version}/bin/{os}/{arch}/kubectl.sha256',
+        'member': None,
+    },
+    'helm': {
+        'version': 'v3.14.4',
+        'base': 'https://get.helm.sh',
+        'path': 'helm-{version}-{os}-{arch}.tar.gz',
+        'checksum': 'helm-{version}-{os}-{arch}.tar.gz.sha256sum',
+        'member': '{os}-{arch}/helm',
+    },
+    'terraform': {
+        'version': '1.7.5',
+        'base': 'https://releases.hashicorp.com/terraform',
+        'path': '{version}/terraform_{version}_{os}_{arch}.zip',
+        'checksum': '{version}/terraform_{version}_SHA256SUMS',
+        'member': 'terraform',
+    },
+}
+
+MACHINES = {
+    'x86_64': 'amd64',
+    'amd64': 'amd64',
+    'aarch64': 'arm64',
+    'arm64': 'arm64',
+}
+
+CHUNK_SIZE = 64 * 1024
+# Times a broken download is resumed before giving up
+RESUME_ATTEMPTS = 3
+DEFAULT_TIMEOUT = 60
+
+class ArtifactError(Exception):
+    """A download could not be fetched or failed verification."""
+
+def detect_platform():
+    """Get the (os, arch) pair release files are named by, e.g. ('darwin', 'arm64')."""
+    machine = platform.machine().lower()
+    return platform.system().lower(), MACHINES.get(machine, machine)
+
+def get_artifacts_dir(*parts):
+    """Get the path to a directory under ~/.kubed/artifacts, creating it if needed."""
+    path = os.path.join(get_kubed_dir(), 'artifacts', *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def get_blob_path(digest):
+    """Get the store path of a file by its sha256."""
+    return os.path.join(get_artifacts_dir('sha256', digest[:2]), digest)
+
+def get_index_path():
+    """Get the path to the store's index of tool, version and platform to hash."""
+    return os.path.join(get_artifacts_dir(), 'index.json')
+
+def get_version(tool, version=None):
+    """Get the version of a tool to fetch.
+
+    Args:
+        tool (str): Name from TOOLS.
+        version (str): Requested version; defaults to $KUBED_<TOOL>_VERSION,
+            then the version pinned in TOOLS. A leading 'v' is added or dropped
+            to match how the project tags its releases.
+    """
+    pinned = TOOLS[tool]['version']
+    version = (version or os.environ.get(f'KUBED_{tool.upper()}_VERSION') or pinned).lstrip('v')
+    return f'v{version}' if pinned.startswith('v') else version
+
+def parse_versions(values):
+    """Parse `tool=version` arguments into a dict of tool name to version."""
+    import click
+
+    versions = {}
+    for value in values:
+        tool, _, version = value.partition('=')
+        if tool not in TOOLS or not version.strip():
+            raise click.BadParameter(f"expected TOOL=VERSION with TOOL one of {', '.join(TOOLS)}, got '{value}'",
+                                     param_hint='--version')
+        versions[tool] = version.strip()
+    return versions
+
+def get_mirror():
+    """Get the mirror URL or directory from $KUBED_ARTIFACT_MIRROR, if set."""
+    return os.environ.get('KUBED_ARTIFACT_MIRROR') or None
+
+def create_session(pool_size=8):
+    """Create a requests session whose connection pool fits pool_size concurrent downloads."""
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=('GET',))
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+def parse_checksum(text, filename):
+    """Find the sha256 for filename in a checksum file.
+
+    Handles both a bare hash (kubectl) and `<hash>  <filename>` lines
+    (helm, terraform SHA256SUMS).
+    """
+    for line in text.splitlines():
+        fields = line.split()
+        if not fields or not re.fullmatch(r'[0-9a-fA-F]{64}', fields[0]):
+            continue
+        if len(fields) == 1 or os.path.basename(fields[-1].lstrip('*')) == filename:
+            return fields[0].lower()
+    raise ArtifactError(f'no checksum for {filename}')
+
+class Downloader:
+    """Fetch verified release files into the artifact store.
+
+    Args:
+        session: A requests session shared by every download.
+        mirror (str): URL or directory to fetch from instead of upstream.
+        timeout (float): Seconds to wait for the server at each read.
+    """
+
+    def __init__(self, session=None, mirror=None, timeout=DEFAULT_TIMEOUT):
+        self.session = session
+        self.mirror = mirror
+        self.timeout = timeout
+        self.lock = threading.Lock()
+
+    def source(self, tool, relative):
+        """Get the URL or local path of a file, upstream or on the mirror."""
+        if not self.mirror:
+            return f"{TOOLS[tool]['base']}/{relative}"
+        if re.match(r'^[a-z][a-z0-9+.-]*://', self.mirror) and not self.mirror.startswith('file://'):
+            return f"{self.mirror.rstrip('/')}/{tool}/{relative}"
+        root = self.mirror[len('file://'):] if self.mirror.startswith('file://') else self.mirror
+        return os.path.join(os.path.expanduser(root), tool, *relative.split('/'))
+
+    def fetch_text(self, tool, relative):
+        """Fetch a small file, such as a checksum list."""
+        location = self.source(tool, relative)
+        if not re.match(r'^https?://', location):
+            try:
+                with open(location) as f:
+                    return f.read()
+            except OSError as e:
+                raise ArtifactError(f'cannot read {location}: {e}')
+        response = self.session.get(location, timeout=self.timeout)
+        if response.status_code != 200:
+            raise ArtifactError(f'{location}: HTTP {response.status_code}')
+        return response.text
+
+    def fetch_file(self, tool, relative, partial, expected):
+        """Download a file to partial, resuming it if it exists, and verify its sha256."""
+        location = self.source(tool, relative)
+        digest = hashlib.sha256()
+        if not re.match(r'^https?://', location):
+            try:
+                with open(location, 'rb') as src, open(partial, 'wb') as dst:
+                    for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                        digest.update(chunk)
+                        dst.write(chunk)
+            except OSError as e:
+                raise ArtifactError(f'cannot read {location}: {e}')
+        else:
+            offset = os.path.getsize(partial) if os.path.exists(partial) else 0
+            headers = {'Range': f'bytes={offset}-'} if offset else {}
+            with self.session.get(location, headers=headers, stream=True, timeout=self.timeout) as response:
+                if response.status_code == 416:
+                    # The partial file is no prefix of this file; start over
+                    os.unlink(partial)
+                    return self.fetch_file(tool, relative, partial, expected)
+                if response.status_code not in (200, 206):
+                    raise ArtifactError(f'{location}: HTTP {response.status_code}')
+                if response.status_code == 206 and offset:
+                    # Hash what was downloaded before, then append the rest
+                    with open(partial, 'rb') as f:
+                        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                            digest.update(chunk)
+                    mode = 'ab'
+                else:
+                    mode = 'wb'
+                with open(partial, mode) as f:
+                    for chunk in response.iter_content(CHUNK_SIZE):
+                        digest.update(chunk)
+                        f.write(chunk)
+        actual = digest.hexdigest()
+        if actual != expected:
+            os.unlink(partial)
+            raise ArtifactError(f'{location}: checksum mismatch (expected {expected}, got {actual})')
+        return actual
+
+    def fetch(self, tool, version=None, os_name=None, arch=None):
+        """Get a tool's release file into the store, downloading it only if it is not there yet.
+
+        Returns:
+            str: The sha256 of the release file.
+        """
+        detected_os, detected_arch = detect_platform()
+        fields = {
+            'version': get_version(tool, version),
+            'os': os_name or detected_os,
+            'arch': arch or detected_arch,
+        }
+        key = f"{tool}/{fields['version']}/{fields['os']}/{fields['arch']}"
+        with self.lock:
+            entry = read_json(get_index_path(), {}).get(key)
+        if entry and os.path.exists(get_blob_path(entry['sha256'])):
+            return entry['sha256']
+
+        relative = TOOLS[tool]['path'].format(**fields)
+        filename = os.path.basename(relative)
+        expected = parse_checksum(self.fetch_text(tool, TOOLS[tool]['checksum'].format(**fields)), filename)
+        blob = get_blob_path(expected)
+        if not os.path.exists(blob):
+            import requests
+
+            partial = os.path.join(get_artifacts_dir('partial'), f'{expected}.part')
+            for attempt in range(RESUME_ATTEMPTS):
+                try:
+                    self.fetch_file(tool, relative, partial, expected)
+                    break
+                except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                        requests.Timeout) as e:
+                    # Keep the partial file; the next attempt (or run) resumes it
+                    if attempt == RESUME_ATTEMPTS - 1:
+                        raise ArtifactError(f'{tool}: download interrupted: {e}')
+            os.replace(partial, blob)
+
+        with self.lock:
+            index = read_json(get_index_path(), {})
+            index[key] = {'sha256': expected, 'file': filename}
+            write_json(get_index_path(), index)
+        return expected
+
+def extract_binary(tool, digest, os_name=None, arch=None):
+    """Get a tool's binary out of its release file in the store."""
+    detected_os, detected_arch = detect_platform()
+    member = TOOLS[tool]['member']
+    with open(get_blob_path(digest), 'rb') as f:
+        data = f.read()
+    if member is None:
+        return data
+    member = member.format(os=os_name or detected_os, arch=arch or detected_arch)
+    try:
+        if zipfile.is_zipfile(io.BytesIO(data)):
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                return archive.read(member)
+        with tarfile.open(fileobj=io.BytesIO(data)) as archive:
+            return archive.extractfile(member).read()
+    except (KeyError, AttributeError, tarfile.TarError, zipfile.BadZipFile) as e:
+        raise ArtifactError(f'{tool}: cannot extract {member}: {e}')
+
+def install_tools(tools, mirror=None, dest=None, os_name=None, arch=None, download_only=False,
+                  concurrency=None, on_result=None, versions=None):
+    """Fetch several tools concurrently and install their binaries.
+
+    Args:
+        tools (list): Names from TOOLS.
+        mirror (str): URL or directory to fetch from; defaults to $KUBED_ARTIFACT_MIRROR.
+        dest (str): Directory to install into; defaults to ~/.kubed/bin.
+        os_name (str): OS to fetch for; defaults to this host's.
+        arch (str): Architecture to fetch for; defaults to this host's.
+        download_only (bool): If True, only fill the store.
+        concurrency (int): Downloads at once; defaults to one per tool.
+        on_result: Called with (tool, path or sha256, error message) as each tool finishes.
+        versions (dict): Tool name to version, for tools not to fetch at their
+            default version (see get_version).
+
+    Returns:
+        dict: Tool name to error message, for the tools that failed.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    workers = max(1, concurrency or len(tools))
+    downloader = Downloader(create_session(workers), mirror or get_mirror())
+    dest = dest or os.path.join(get_kubed_dir(), 'bin')
+
+    def install(tool):
+        digest = downloader.fetch(tool, (versions or {}).get(tool), os_name=os_name, arch=arch)
+        if download_only:
+            return digest
+        path = os.path.join(dest, tool)
+        atomic_write(path, extract_binary(tool, digest, os_name, arch), mode=0o755)
+        return path
+
+    failed = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(install, tool): tool for tool in tools}
+        for future in as_completed(futures):
+            tool = futures[future]
+            try:
+                result, error = future.result(), None
+            except Exception as e:
+                # requests errors and OSErrors are reported per tool like ArtifactError
+                result, error = None, str(e)
+                failed[tool] = error
+            if on_result:
+                on_result(tool, result, error)
+    return failed
+
+def install_command(tools, mirror=None, dest=None, os_name=None, arch=None, download_only=False, versions=()):
+    """Install kubectl, helm and terraform from the artifact store.
+
+    Args:
+        tools (tuple): Tools to install; all of TOOLS if empty.
+        mirror (str): URL or directory to fetch from instead of upstream.
+        dest (str): Directory to install into; defaults to ~/.kubed/bin.
+        os_name (str): OS to fetch for; defaults to this host's.
+        arch (str): Architecture to fetch for; defaults to this host's.
+        download_only (bool): If True, only fill the store, e.g. to copy it to another host.
+        versions (tuple): `tool=version` overrides of the default versions.
+    """
+    import sys
+
+    import click
+
+    def report(tool, result, error):
+        if error:
+            click.echo(f"❌ {tool}: {error}", err=True)
+        elif download_only:
+            click.echo(f"✅ {tool}: {get_blob_path(result)}")
+        else:
+            click.echo(f"✅ {tool}: installed {result}")
+
+    versions = parse_versions(versions)
+    failed = install_tools(list(tools) or list(TOOLS), mirror=mirror, dest=dest, os_name=os_name, arch=arch,
+                           download_only=download_only, on_result=report, versions=versions)
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,137 @@
+"""
+Build the single init bundle that a user's rc file sources.
+
+The bundle combines the aliases, completion wiring and help wrapper into one
+file with absolute paths filled in, so shell startup reads one file and never
+has to look the package up (e.g. through `pip3 show kubed`).
+"""
+
+import hashlib
+import os
+import shutil
+import sys
+
+from kubed.cache import atomic_write, get_cache_dir, get_kubed_dir, zcompile
+
+HASH_PREFIX = '# kubed-bundle-hash: '
+
+def get_bundle_path(shell):
+    """Get the path to the init bundle for a shell."""
+    return os.path.join(get_kubed_dir(), f'init.{shell}')
+
+def get_kubed_bin():
+    """Get the absolute path of the kubed console script, if installed."""
+    candidate = os.path.join(os.path.dirname(sys.executable), 'kubed')
+    if os.access(candidate, os.X_OK):
+        return candidate
+    return shutil.which('kubed')
+
+def get_bundle_sources(shell):
+    """Get the package files combined into the bundle, in sourcing order."""
+    from kubed.cli import get_aliases_path, get_completions_path
+
+    return [
+        os.path.join(get_aliases_path(), 'aliases.sh'),
+        os.path.join(get_completions_path(), shell, f'{shell}_completions.sh'),
+        os.path.join(get_aliases_path(), 'help_wrapper.sh'),
+    ]
+
+def build_bundle(shell, overrides=None):
+    """Build the bundle content for a shell.
+
+    Args:
+        shell (str): 'bash' or 'zsh'.
+        overrides (dict): Content to use for source files instead of reading
+            them, keyed by path; lets setup preview a bundle before writing.
+
+    Returns:
+        tuple: (bundle content, hash of the inputs it was built from)
+    """
+    from kubed.cli import ZSH_COMPINIT, get_completions_path
+    from kubed.startup import get_kubed_version
+
+    kubed_dir = get_kubed_dir()
+    kubed_bin = get_kubed_bin() or ''
+    header = f'''export KUBED_CACHE_DIR="{get_cache_dir()}"
+export KUBED_BIN="{kubed_bin}"
+case ":$PATH:" in
+    *":{kubed_dir}/bin:"*) ;;
+    *) export PATH="{kubed_dir}/bin:$PATH" ;;
+esac
+'''
+    if shell == 'zsh':
+        header += f'''_kubed_zsh_functions="{os.path.join(get_completions_path(), 'zsh', 'functions')}"
+
+''' + ZSH_COMPINIT
+
+    parts = [header]
+    overrides = overrides or {}
+    for path in get_bundle_sources(shell):
+        if path in overrides:
+            parts.append(f'\n# --- {os.path.basename(path)} ---\n' + overrides[path])
+        elif os.path.isfile(path):
+            with open(path) as f:
+                parts.append(f'\n# --- {os.path.basename(path)} ---\n' + f.read())
+
+    digest = hashlib.sha256()
+    digest.update(f'{shell}\0{get_kubed_version()}\0'.encode())
+    for part in parts:
+        digest.update(part.encode())
+    bundle_hash = digest.hexdigest()
+
+    content = (f'# Generated by `kubed init {shell}`; do not edit.\n'
+               f'{HASH_PREFIX}{bundle_hash}\n' + ''.join(parts))
+    return content, bundle_hash
+
+def read_bundle_hash(path):
+    """Read the input hash stamped into an existing bundle."""
+    try:
+        with open(path) as f:
+            for _ in range(2):
+                line = f.readline()
+                if line.startswith(HASH_PREFIX):
+                    return line[len(HASH_PREFIX):].strip()
+    except OSError:
+        pass
+    return None
+
+def write_bundle(shell, force=False):
+    """Write the init bundle for a shell if its inputs changed.
+
+    Args:
+        shell (str): 'bash' or 'zsh'.
+        force (bool): If True, rewrite the bundle even if it is up to date.
+
+    Returns:
+        tuple: (bundle path, whether it was rewritten)
+    """
+    path = get_bundle_path(shell)
+    content, bundle_hash = build_bundle(shell)
+    if not force and read_bundle_hash(path) == bundle_hash:
+        return path, False
+
+    atomic_write(path, content)
+    if shell == 'zsh':
+        zcompile(path)
+    return path, True
+
+def get_source_line(shell):
+    """Get the rc-file line that sources the bundle."""
+    return f'[ -f "$HOME/.kubed/init.{shell}" ] && source "$HOME/.kubed/init.{shell}"'
+
+def init_command(shell, force=False):
+    """Write the init bundle for a shell and show how to source it.
+
+    Args:
+        shell (str): 'bash' or 'zsh'.
+        force (bool): If True, rewrite the bundle even if it is up to date.
+    """
+    import click
+
+    path, rewritten = write_bundle(shell, force=force)
+    if rewritten:
+        click.echo(f"✅ Wrote {path}")
+    else:
+        click.echo(f"✅ {path} is up to date")
+    click.echo(f"\nAdd this line to your {'~/.zshrc' if shell == 'zsh' else '~/.bashrc'}:\n")
+    click.echo(f"  {get_source_line(shell)}")
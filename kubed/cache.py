@@ -0,0 +1,325 @@
+"""
+On-disk caches for Kubed, kept under ~/.kubed/cache (or $KUBED_CACHE_DIR).
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+# Tools whose completion scripts are cached. Each entry holds the arguments
+# used to read the version (part of the cache key) and either the arguments
+# that make the binary emit its completion script for a shell, or the kubed
+# function that generates one.
+COMPLETION_TOOLS = {
+    'kubectl': {
+        'version': ['version', '--client'],
+        'completion': ['completion', '{shell}'],
+        # Shell function answering resource names from the names cache
+        'route': '_kubed_complete_names',
+    },
+    'helm': {
+        'version': ['version', '--short'],
+        'completion': ['completion', '{shell}'],
+        # Shell function answering chart names from the chart index
+        'route': '_kubed_complete_charts',
+    },
+    'docker': {
+        # --version does not need the daemon, unlike `docker version`
+        'version': ['--version'],
+        # Available in docker CLI releases with cobra completion; older ones use the distro's script
+        'completion': ['completion', '{shell}'],
+        # Shell function answering object names from the event-fed names cache
+        'route': '_kubed_complete_docker',
+    },
+    'terraform': {
+        'version': ['version'],
+        # A static table built from terraform's help, so Tab never runs terraform
+        'generate': 'kubed.terraform.completion_script',
+        # Skip the update check terraform version makes over the network
+        'env': {'CHECKPOINT_DISABLE': '1'},
+    },
+}
+
+# Bumped when cached completion scripts are post-processed differently
+CACHE_FORMAT = '3'
+
+# Seconds a cached list of resource names is served before a background refresh
+NAMES_TTL = 60
+
+# Ask the API server for object metadata only; names are all completion needs
+METADATA_ACCEPT = 'application/json;as=PartialObjectMetadataList;v=v1;g=meta.k8s.io,application/json'
+
+def get_kubed_dir():
+    """Get the path to the ~/.kubed directory."""
+    return os.path.expanduser('~/.kubed')
+
+def get_cache_dir(*parts):
+    """Get the path to a directory under the cache directory, creating it if needed.
+
+    The cache directory is $KUBED_CACHE_DIR, or ~/.kubed/cache, as in the shell scripts.
+    """
+    cache_dir = os.path.join(os.environ.get('KUBED_CACHE_DIR') or os.path.join(get_kubed_dir(), 'cache'), *parts)
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+def atomic_write(path, content, mode=0o644):
+    """Write content to path so readers never see a partially written file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    try:
+        with open(tmp_path, 'wb' if isinstance(content, bytes) else 'w') as f:
+            f.write(content)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+def read_json(path, default=None):
+    """Read a JSON file, returning default if it is missing or unreadable."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+def write_json(path, data):
+    """Atomically write data to a JSON file."""
+    atomic_write(path, json.dumps(data, indent=2, sort_keys=True) + '\n')
+
+def zcompile(path):
+    """Byte-compile a zsh script next to itself (path.zwc), if zsh is available."""
+    zsh = shutil.which('zsh')
+    if not zsh:
+        return False
+    result = subprocess.run([zsh, '-fc', 'zcompile -- "$1"', 'zcompile', path],
+                            capture_output=True, timeout=30)
+    return result.returncode == 0
+
+def route_completion(script, function):
+    """Make a cobra completion script ask a kubed shell function instead of the binary.
+
+    Cobra scripts build `requestComp="${words[0]} __complete ..."` (bash) or
+    `requestComp="${words[1]} __complete ..."` (zsh) and eval it on every Tab.
+    """
+    import re
+
+    return re.sub(r'requestComp="(\$\{words\[[01]\]\} __complete)', rf'requestComp="{function} \1', script)
+
+def get_completion_cache_path(tool, shell):
+    """Get the path of the cached completion script for a tool and shell."""
+    return os.path.join(get_cache_dir('completions', shell), f"{tool}.{shell}")
+
+def completion_cache_key(tool):
+    """Build the cache key for a tool's completion script.
+
+    The key is the tab-separated PATH lookup, resolved path, mtime and version
+    of the binary, followed by CACHE_FORMAT. The shell-side loader compares the first two fields and the
+    binary's mtime without forking; the version is only checked here.
+
+    Returns:
+        str: The cache key, or None if the tool is not installed.
+    """
+    binary = shutil.which(tool)
+    if not binary:
+        return None
+    resolved = os.path.realpath(binary)
+    mtime = int(os.stat(resolved).st_mtime)
+    try:
+        result = subprocess.run([resolved] + COMPLETION_TOOLS[tool]['version'],
+                                env=dict(os.environ, **COMPLETION_TOOLS[tool].get('env', {})),
+                                capture_output=True, text=True, timeout=10)
+        lines = result.stdout.strip().splitlines()
+        version = lines[0].strip() if lines else 'unknown'
+    except (OSError, subprocess.TimeoutExpired):
+        version = 'unknown'
+    # The trailing format number forces a rebuild when kubed changes how scripts are post-processed
+    return '\t'.join([binary, resolved, str(mtime), version, CACHE_FORMAT])
+
+def completion_cache_is_current(tool, shell):
+    """Check a tool's cached completion script without running the tool.
+
+    Like the shell-side loader, this compares the cached key's path fields,
+    binary mtime and format with the binary on disk; the version is not
+    asked for, since it only changes along with the binary.
+    """
+    binary = shutil.which(tool)
+    if not binary:
+        return True
+    cache_path = get_completion_cache_path(tool, shell)
+    try:
+        with open(cache_path + '.key') as f:
+            key = f.read().strip().split('\t')
+        resolved = os.path.realpath(binary)
+        mtime = str(int(os.stat(resolved).st_mtime))
+    except OSError:
+        return False
+    return (os.path.exists(cache_path) and len(key) == 5 and key[:3] == [binary, resolved, mtime]
+            and key[4] == CACHE_FORMAT)
+
+def rebuild_completion_cache(tool, shell, force=False):
+    """Regenerate the cached completion script for a tool when its key changed.
+
+    Args:
+        tool (str): One of COMPLETION_TOOLS.
+        shell (str): 'bash' or 'zsh'.
+        force (bool): If True, regenerate even if the key is unchanged.
+
+    Returns:
+        tuple: (cache path or None if the tool is not installed, whether it was rebuilt)
+    """
+    key = completion_cache_key(tool)
+    if key is None:
+        return None, False
+
+    cache_path = get_completion_cache_path(tool, shell)
+    key_path = cache_path + '.key'
+    if not force and os.path.exists(cache_path) and os.path.exists(key_path):
+        with open(key_path) as f:
+            if f.read().strip() == key:
+                return cache_path, False
+
+    resolved = key.split('\t')[1]
+    if COMPLETION_TOOLS[tool].get('generate'):
+        import importlib
+
+        module, function = COMPLETION_TOOLS[tool]['generate'].rsplit('.', 1)
+        script = getattr(importlib.import_module(module), function)(resolved, shell)
+    else:
+        args = [arg.format(shell=shell) for arg in COMPLETION_TOOLS[tool]['completion']]
+        result = subprocess.run([resolved] + args, capture_output=True, text=True,
+                                check=True, timeout=30)
+        script = result.stdout
+    if COMPLETION_TOOLS[tool].get('route'):
+        script = route_completion(script, COMPLETION_TOOLS[tool]['route'])
+    atomic_write(cache_path, script)
+    # Write the key last so an interrupted rebuild is retried on the next shell start
+    atomic_write(key_path, key + '\n')
+    if shell == 'zsh':
+        zcompile(cache_path)
+    return cache_path, True
+
+def warm_completion_caches(shell):
+    """Build any missing or stale completion caches for a shell."""
+    for tool in COMPLETION_TOOLS:
+        if completion_cache_is_current(tool, shell):
+            continue
+        try:
+            rebuild_completion_cache(tool, shell)
+        except (OSError, subprocess.SubprocessError):
+            pass
+
+def completions_rebuild_command(tools=(), shell=None, quiet=False):
+    """Force a refresh of the cached completion scripts.
+
+    Args:
+        tools (tuple): Tools to rebuild; all cached tools if empty.
+        shell (str): 'bash' or 'zsh'; defaults to the user's shell.
+        quiet (bool): If True, only report errors.
+    """
+    import click
+    from kubed.cli import get_shell
+
+    shell = shell or get_shell()
+    if shell not in ('bash', 'zsh'):
+        click.echo("Could not determine shell, pass --shell bash or --shell zsh.", err=True)
+        sys.exit(1)
+
+    failed = False
+    for tool in tools or COMPLETION_TOOLS:
+        if tool not in COMPLETION_TOOLS:
+            click.echo(f"Unknown tool '{tool}', expected one of: {', '.join(COMPLETION_TOOLS)}", err=True)
+            failed = True
+            continue
+        try:
+            cache_path, _ = rebuild_completion_cache(tool, shell, force=True)
+        except (OSError, subprocess.SubprocessError) as e:
+            click.echo(f"❌ Failed to rebuild {tool} completions: {e}", err=True)
+            failed = True
+            continue
+        if cache_path is None:
+            if tools:
+                click.echo(f"{tool} is not installed.", err=True)
+                failed = True
+        elif not quiet:
+            click.echo(f"✅ Rebuilt {tool} completions: {cache_path}")
+
+    if failed:
+        sys.exit(1)
+
+def get_names_cache_path(resource, context, namespace=None):
+    """Get the path of the cached resource names for a context and namespace.
+
+    Namespaced kinds listed in the context's default namespace are keyed '_',
+    which is what the shell can tell without parsing the kubeconfig.
+    """
+    parts = ['names', context.replace('/', '%2F')]
+    if namespace is not False:
+        parts.append(namespace or '_')
+    return os.path.join(get_cache_dir(*parts), resource)
+
+def read_names_cache(path):
+    """Read a names cache file.
+
+    Returns:
+        tuple: (expiry epoch seconds, list of names), or (0, None) if missing.
+    """
+    try:
+        with open(path) as f:
+            lines = f.read().splitlines()
+        return int(lines[0]), lines[1:]
+    except (OSError, ValueError, IndexError):
+        return 0, None
+
+def refresh_names_cache(resource, context=None, namespace=None, ttl=NAMES_TTL, force=False):
+    """Refresh the cached names of a resource kind once they expired.
+
+    A lock file makes parallel shells share one refresh: whoever holds it
+    refreshes, everyone else keeps the stale names.
+
+    Returns:
+        str: The path of the cache file.
+    """
+    import fcntl
+    from kubed.k8s import RESOURCES, fetch_objects, get_context_namespaces
+
+    namespaces, active = get_context_namespaces()
+    context = context or active
+    namespaced = RESOURCES[resource]['namespaced']
+    path = get_names_cache_path(resource, context, namespace if namespaced else False)
+
+    with open(path + '.lock', 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return path
+        expires, _ = read_names_cache(path)
+        if not force and expires > time.time():
+            return path
+        objects = fetch_objects(resource, namespace=namespace or namespaces.get(context), context=context,
+                                _headers={'Accept': METADATA_ACCEPT}, _request_timeout=10)
+        names = sorted(obj['metadata']['name'] for obj in objects)
+        atomic_write(path, f"{int(time.time()) + ttl}\n" + ''.join(f'{name}\n' for name in names))
+    return path
+
+def completions_names_command(kind, context=None, namespace=None, ttl=NAMES_TTL, force=False, quiet=False):
+    """Print the cached names of a resource kind, refreshing them if they expired.
+
+    Args:
+        kind (str): Resource kind, short name or alias.
+        context (str): Kubeconfig context; the current one if None.
+        namespace (str): Namespace; the context's default if None.
+        ttl (int): Seconds the refreshed names stay fresh.
+        force (bool): If True, refresh even if the names have not expired.
+        quiet (bool): If True, only refresh (used by the shell in the background).
+    """
+    from kubed.k8s import handle_api_errors, resolve_resource
+
+    path = handle_api_errors(refresh_names_cache)(resolve_resource(kind), context, namespace, ttl, force)
+    if not quiet:
+        _, names = read_names_cache(path)
+        for name in names or ():
+            print(name)
@@ -1,14 +1,17 @@
 """
 CLI utilities for the Kubed package.
+
+The path helpers here run from shell init, so this module only imports the
+standard library at load time; click and the other kubed modules are
+imported by the functions that need them.
 """
 
 import os
 import shutil
 import sys
 import subprocess
-import click
-import pkg_resources
-import requests
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
 
 def get_shell():
     """Determine the user's shell."""
@@ -34,65 +37,198 @@ def get_shell_config_file():
 
 def get_completions_path():
     """Get the path to the completions directory."""
-    try:
-        completions_dir = pkg_resources.resource_filename('kubed', 'completions')
-        return completions_dir
-    except (ImportError, pkg_resources.DistributionNotFound):
-        return None
+    return os.path.join(PACKAGE_DIR, 'completions')
 
 def get_aliases_path():
     """Get the path to the aliases directory."""
-    try:
-        aliases_dir = pkg_resources.resource_filename('kubed', 'aliases')
-        return aliases_dir
-    except (ImportError, pkg_resources.DistributionNotFound):
-        return None
+    return os.path.join(PACKAGE_DIR, 'aliases')
 
 def get_templates_path():
     """Get the path to the templates directory."""
-    try:
-        templates_dir = pkg_resources.resource_filename('kubed', 'templates')
-        return templates_dir
-    except (ImportError, pkg_resources.DistributionNotFound):
-        return None
+    return os.path.join(PACKAGE_DIR, 'templates')
 
-def create_help_wrapper():
-    """
-    Create a script that wraps commands to add daleyarborough.com to help output.
-    """
-    help_wrapper = '''# Kubed help wrapper function
-function _kubed_help_wrapper() {
-    if [[ "$@" == *--help* ]] || [[ "$@" == *-h* ]]; then
-        # Run the original command
-        "$@"
-        echo -e "\\n\\033[1;32mℹ️  For more information and quick links, visit: https://cmds.daleyarborough.com\\033[0m\\n"
-    else
-        # Just run the original command
-        "$@"
+HELP_HOOKS = r'''# Kubed help hints and command latency stats
+#
+# kubectl, docker, terraform and helm are not wrapped or shadowed. Shell hooks
+# (preexec/precmd in zsh; in bash, bash-preexec's hooks if it is loaded, else a
+# chained DEBUG trap and PROMPT_COMMAND) print the help hint after a real
+# -h/--help and record each command's wall time into a fixed-size ring buffer
+# of 64-byte records that `kubed stats` summarizes.
+KUBED_STATS_FILE="${KUBED_STATS_FILE:-$HOME/.kubed/stats/latency.ring}"
+KUBED_STATS_SLOTS="${KUBED_STATS_SLOTS:-4096}"
+
+# Set REPLY to the tool a command word runs, or fail for anything else
+_kubed_tool_name() {
+    case "$1" in
+        kubectl|k) REPLY=kubectl ;;
+        docker|d) REPLY=docker ;;
+        terraform|tf) REPLY=terraform ;;
+        helm|h) REPLY=helm ;;
+        *) return 1 ;;
+    esac
+}
+
+# Start tracking a command line given as words, if it runs one of the tools
+_kubed_start_command() {
+    local word skip=0
+    [ "$1" = command ] && shift
+    _kubed_tool_name "$1" || return 0
+    _kubed_cmd_tool=$REPLY _kubed_cmd_sub=- _kubed_cmd_help=0
+    shift
+    for word in "$@"; do
+        case "$word" in
+            -h|--help) _kubed_cmd_help=1 ;;
+            -n|--namespace|--context|--kube-context|--kubeconfig|-H|--host) skip=1; continue ;;
+            -*) ;;
+            *) [ "$skip" = 0 ] && [ "$_kubed_cmd_sub" = - ] && _kubed_cmd_sub=$word ;;
+        esac
+        skip=0
+    done
+    _kubed_now_us
+    _kubed_cmd_start=$REPLY _kubed_cmd_pending=1
+}
+
+# Print the help hint and record the latency of the tracked command, if any
+_kubed_finish_command() {
+    [ "$_kubed_cmd_pending" = 1 ] || return 0
+    _kubed_cmd_pending=0
+    if [ "$_kubed_cmd_help" = 1 ]; then
+        printf '\n\033[1;32mℹ️  For more information and quick links, visit: https://cmds.daleyarborough.com\033[0m\n\n'
+    fi
+    _kubed_now_us
+    if [ -n "$REPLY" ] && [ -n "$_kubed_cmd_start" ]; then
+        _kubed_record_latency $(( REPLY - _kubed_cmd_start ))
     fi
 }
 
-# Apply help wrapper to common tools
-for cmd in docker terraform kubectl helm; do
-    if command -v $cmd >/dev/null 2>&1; then
-        alias $cmd="_kubed_help_wrapper $cmd"
+# Write one record into the next ring-buffer slot
+_kubed_record_latency() {
+    local us=$1 slot=0 record
+    [ -d "${KUBED_STATS_FILE%/*}" ] || mkdir -p "${KUBED_STATS_FILE%/*}" || return 0
+    [ -r "$KUBED_STATS_FILE.idx" ] && read -r slot < "$KUBED_STATS_FILE.idx"
+    case "$slot" in ''|*[!0-9]*) slot=0 ;; esac
+    [ "$slot" -lt "$KUBED_STATS_SLOTS" ] || slot=0
+    [ "$us" -gt 9999999999 ] && us=9999999999
+    printf -v record '%-10.10s %-24.24s %7d.%03d %15d' \
+        "$_kubed_cmd_tool" "$_kubed_cmd_sub" $(( us / 1000 )) $(( us % 1000 )) "${EPOCHSECONDS:-0}"
+    _kubed_write_slot "$slot" "$record"
+    printf '%s\n' $(( (slot + 1) % KUBED_STATS_SLOTS )) > "$KUBED_STATS_FILE.idx"
+}
+
+if [ -n "$ZSH_VERSION" ]; then
+    zmodload zsh/datetime zsh/system 2>/dev/null
+
+    _kubed_now_us() {
+        local -i us
+        (( us = EPOCHREALTIME * 1000000 ))
+        REPLY=$us
+    }
+
+    _kubed_write_slot() {
+        local fd
+        sysopen -w -o creat -u fd "$KUBED_STATS_FILE" 2>/dev/null || return 0
+        sysseek -u $fd $(( $1 * 64 ))
+        syswrite -o $fd "$2"$'\n'
+        exec {fd}>&-
+    }
+
+    _kubed_preexec() {
+        _kubed_cmd_pending=0
+        _kubed_start_command ${(z)3}
+    }
+
+    autoload -Uz add-zsh-hook
+    add-zsh-hook preexec _kubed_preexec
+    add-zsh-hook precmd _kubed_finish_command
+elif [ -n "$BASH_VERSION" ]; then
+    _kubed_now_us() {
+        REPLY=${EPOCHREALTIME//[!0-9]/}
+    }
+
+    # bash cannot seek, so the record is placed with dd (one fork per tracked command)
+    _kubed_write_slot() {
+        dd of="$KUBED_STATS_FILE" bs=64 seek="$1" conv=notrunc 2>/dev/null <<< "$2"
+    }
+
+    # The DEBUG trap fires for every simple command; only the first one after a prompt counts
+    _kubed_preexec() {
+        [ -n "$COMP_LINE" ] && return 0
+        [ "$_kubed_at_prompt" = 1 ] || return 0
+        _kubed_at_prompt=0 _kubed_cmd_pending=0
+        local -a words
+        _kubed_tool_name "${BASH_COMMAND%% *}" || [ "${BASH_COMMAND%% *}" = command ] || return 0
+        read -r -a words <<< "$BASH_COMMAND"
+        _kubed_start_command "${words[@]}"
+    }
+
+    _kubed_precmd() {
+        local status=$?
+        _kubed_finish_command
+        return $status
+    }
+
+    _kubed_prompt_ready() {
+        local status=$?
+        _kubed_at_prompt=1
+        return $status
+    }
+
+    # Time the first command of the session too
+    _kubed_at_prompt=1
+
+    if [ -n "${bash_preexec_imported:-${__bp_imported:-}}" ]; then
+        # bash-preexec owns the DEBUG trap and PROMPT_COMMAND; use its hooks
+        _kubed_bp_preexec() {
+            local -a words
+            _kubed_cmd_pending=0
+            read -r -a words <<< "$1"
+            _kubed_start_command "${words[@]}"
+        }
+        [[ " ${preexec_functions[*]} " == *" _kubed_bp_preexec "* ]] || preexec_functions+=(_kubed_bp_preexec)
+        [[ " ${precmd_functions[*]} " == *" _kubed_finish_command "* ]] || precmd_functions+=(_kubed_finish_command)
+    else
+        # Chain onto a DEBUG trap set by the user or another framework, running it first so it
+        # sees $_ and $?. A sourced file cannot see the caller's DEBUG trap, so this is done once,
+        # from the first prompt, with the trap expanded at the top level of PROMPT_COMMAND.
+        _kubed_install_debug_trap() {
+            local status=$? previous=
+            local -a words
+            [ -n "$1" ] && eval "words=($1)" && previous=${words[2]}
+            case "$previous" in
+                *_kubed_preexec*) ;;
+                '') trap '_kubed_preexec' DEBUG ;;
+                *) trap "$previous"$'\n''_kubed_preexec' DEBUG ;;
+            esac
+            PROMPT_COMMAND=${PROMPT_COMMAND//$'\n''_kubed_install_debug_trap "$(trap -p DEBUG)"'/}
+            return $status
+        }
+
+        case "$PROMPT_COMMAND" in
+            *_kubed_precmd*) ;;
+            *) PROMPT_COMMAND="_kubed_precmd${PROMPT_COMMAND:+$'\n'$PROMPT_COMMAND}"$'\n'
+               PROMPT_COMMAND+='_kubed_install_debug_trap "$(trap -p DEBUG)"'$'\n''_kubed_prompt_ready' ;;
+        esac
     fi
-done
+fi
 '''
 
-    with open(os.path.join(get_aliases_path(), 'help_wrapper.sh'), 'w') as f:
-        f.write(help_wrapper)
-
-def check_and_install_tools(force_yes=False):
+def check_and_install_tools(force_yes=False, mirror=None):
     """Check for required tools and install if missing.
     
+    kubectl, helm and terraform are downloaded concurrently into kubed's
+    checksum-verified artifact store and installed into ~/.kubed/bin, with
+    Homebrew as the fallback; docker is installed with Homebrew.
+    
     Args:
         force_yes (bool): If True, automatically answer yes to all installation prompts.
+        mirror (str): URL or directory to download kubectl, helm and terraform from.
     """
+    from kubed.artifacts import TOOLS as ARTIFACT_TOOLS, install_tools
+    from kubed.probe import invalidate_probes, probe_tools
+    
     # First, ensure Python prerequisites are installed
     python_tools = {
         'setuptools': {
-            'check': 'python3 -c "import setuptools; print(setuptools.__version__)"',
             'install': 'pip3 install --upgrade setuptools',
             'install_msg': 'Python setuptools is not installed or outdated. Would you like to install/upgrade it? [Y/n]: ',
             'install_cmd': 'pip3 install --upgrade setuptools',
@@ -100,16 +236,19 @@ def check_and_install_tools(force_yes=False):
         },
     }
     
+    # Probe every tool and Homebrew at once; results are cached in ~/.kubed/state.json
+    probes = probe_tools()
+    
     # Check Python prerequisites first
     for tool, config in python_tools.items():
-        try:
-            subprocess.run(config['check'], shell=True, check=True, capture_output=True)
+        if probes[tool]['installed']:
             print(f"✅ {tool} is already installed.")
-        except subprocess.CalledProcessError:
+        else:
             print(f"\n{config['install_msg']}")
             response = 'y' if force_yes else input().lower()
             if response in ['y', 'yes', ''] or force_yes:
                 print(f"Installing {tool}...")
+                invalidate_probes([tool])
                 try:
                     subprocess.run(config['install_cmd'], shell=True, check=True)
                     print(f"✅ {tool} installed successfully!")
@@ -127,42 +266,36 @@ def check_and_install_tools(force_yes=False):
     # Continue with system tool checks
     tools = {
         'docker': {
-            'check': 'docker --version',
             'install': 'brew install docker',
             'install_msg': 'Docker is not installed. Would you like to install it? [Y/n]: ',
             'install_cmd': 'brew install docker',
             'alt_install': 'curl -fsSL https://get.docker.com -o get-docker.sh && sudo sh get-docker.sh'
         },
         'kubectl': {
-            'check': 'kubectl version --client',
             'install': 'brew install kubectl',
             'install_msg': 'kubectl is not installed. Would you like to install it? [Y/n]: ',
             'install_cmd': 'brew install kubectl',
-            'alt_install': 'curl -LO "https://dl.k8s.io/release/$(curl -L -s https://dl.k8s.io/release/stable.txt)/bin/darwin/amd64/kubectl" && chmod +x kubectl && sudo mv kubectl /usr/local/bin/'
         },
         'helm': {
-            'check': 'helm version',
             'install': 'brew install helm',
             'install_msg': 'Helm is not installed. Would you like to install it? [Y/n]: ',
             'install_cmd': 'brew install helm',
-            'alt_install': 'curl https://raw.githubusercontent.com/helm/helm/main/scripts/get-helm-3 | bash'
         },
         'terraform': {
-            'check': 'terraform --version',
             'install': 'brew install terraform',
             'install_msg': 'Terraform is not installed. Would you like to install it? [Y/n]: ',
-            'install_cmd': 'curl -fsSL https://releases.hashicorp.com/terraform/1.7.5/terraform_1.7.5_darwin_amd64.zip -o terraform.zip && unzip terraform.zip && sudo mv terraform /usr/local/bin/ && rm terraform.zip',
-            'alt_install': 'curl -fsSL https://releases.hashicorp.com/terraform/1.7.5/terraform_1.7.5_darwin_amd64.zip -o terraform.zip && unzip terraform.zip && sudo mv terraform /usr/local/bin/ && rm terraform.zip'
+            'install_cmd': 'brew install hashicorp/tap/terraform',
         }
     }
 
     def check_homebrew():
         """Check if Homebrew is installed and working."""
-        return subprocess.run('which brew', shell=True, capture_output=True).returncode == 0
+        return shutil.which('brew') is not None
 
     # Initial Homebrew check and installation attempt
-    homebrew_available = check_homebrew()
-    if not homebrew_available:
+    homebrew_available = probes['brew']['installed']
+    missing = [tool for tool in tools if not probes[tool]['installed']]
+    if not homebrew_available and missing:
         print("\nHomebrew is not installed. Some tools may require Homebrew for installation.")
         print("Would you like to install Homebrew? [Y/n]: ")
         response = 'y' if force_yes else input().lower()
@@ -171,21 +304,24 @@ def check_and_install_tools(force_yes=False):
             try:
                 subprocess.run('/bin/bash -c "$(curl -fsSL https://raw.githubusercontent.com/Homebrew/install/HEAD/install.sh)"', shell=True, check=True)
                 print("✅ Homebrew installed successfully!")
+                invalidate_probes(['brew'])
                 homebrew_available = check_homebrew()
             except subprocess.CalledProcessError as e:
                 print(f"❌ Failed to install Homebrew: {e}")
                 print("Proceeding with alternative installation methods...")
 
+    downloads = []
     for tool, config in tools.items():
-        try:
-            subprocess.run(config['check'], shell=True, check=True, capture_output=True)
-        except subprocess.CalledProcessError:
+        if not probes[tool]['installed']:
             print(f"\n{config['install_msg']}")
             response = 'y' if force_yes else input().lower()
             if response in ['y', 'yes', ''] or force_yes:
+                invalidate_probes([tool])
+                if tool in ARTIFACT_TOOLS:
+                    # Downloaded together below
+                    downloads.append(tool)
+                    continue
                 print(f"Installing {tool}...")
-                # Check Homebrew availability again before each tool installation
-                homebrew_available = check_homebrew()
                 if homebrew_available:
                     try:
                         subprocess.run(config['install_cmd'], shell=True, check=True)
@@ -202,16 +338,116 @@ def check_and_install_tools(force_yes=False):
             else:
                 print(f"Skipping {tool} installation.")
 
+    if downloads:
+        print(f"Downloading {', '.join(downloads)}...")
+
+        def report(tool, path, error):
+            if error:
+                print(f"❌ Failed to download {tool}: {error}")
+            else:
+                print(f"✅ {tool} installed to {path}")
+
+        failed = install_tools(downloads, mirror=mirror, on_result=report)
+        for tool in failed:
+            if not homebrew_available:
+                continue
+            print(f"Trying to install {tool} with Homebrew...")
+            try:
+                subprocess.run(tools[tool]['install_cmd'], shell=True, check=True)
+                print(f"✅ {tool} installed successfully!")
+            except subprocess.CalledProcessError as e:
+                print(f"❌ Failed to install {tool}: {e}")
+
     return True
 
+# The kubed_kube prompt segment of the generated p10k config; see prompt_kube_command in kubed/kubeconfig.py
+P10K_KUBE_SEGMENT = r'''
+# kubed_kube: the kube context and namespace, without running kubectl. The
+# prompt only expands variables. They are loaded from kubed's cache file, which
+# a background `kubed prompt kube` refreshes (through zle -F) only after a
+# kubeconfig file's mtime changed.
+zmodload -F zsh/stat b:zstat 2>/dev/null
+typeset -g _kubed_kube_stamp= _kubed_kube_context= _kubed_kube_namespace= _kubed_kube_cluster= _kubed_kube_fd=
+
+_kubed_kube_set() {
+  local -a fields
+  fields=("${(@ps:\t:)1}")
+  _kubed_kube_stamp=$fields[1] _kubed_kube_context=$fields[2]
+  _kubed_kube_namespace=$fields[3] _kubed_kube_cluster=$fields[4]
+}
+
+_kubed_kube_ready() {
+  local fd=$1 line
+  IFS= read -r line <&$fd
+  zle -F $fd
+  exec {fd}<&-
+  _kubed_kube_fd=
+  [[ -n $line ]] || return
+  _kubed_kube_set "$line"
+  (( $+functions[p10k] )) && p10k display -r
+}
+
+_kubed_kube_precmd() {
+  local stamp= file line
+  local -A st
+  for file in ${(s.:.)${KUBECONFIG:-$HOME/.kube/config}}; do
+    st=()
+    zstat -H st -- $file 2>/dev/null
+    stamp+="$file=$st[mtime].$st[size]:"
+  done
+  [[ $stamp == $_kubed_kube_stamp || -n $_kubed_kube_fd ]] && return
+  # Another shell may already have refreshed the cache
+  local cache=${KUBED_CACHE_DIR:-$HOME/.kubed/cache}/prompt/kube
+  if [[ -r $cache ]] && IFS= read -r line < $cache && [[ ${line%%$'\t'*} == $stamp ]]; then
+    _kubed_kube_set "$line"
+    return
+  fi
+  # Set now so a failing refresh is not retried until a kubeconfig changes again
+  _kubed_kube_stamp=$stamp
+  exec {_kubed_kube_fd}< <(command "${KUBED_BIN:-kubed}" prompt kube --stamp "$stamp" 2>/dev/null)
+  zle -F $_kubed_kube_fd _kubed_kube_ready
+}
+autoload -Uz add-zsh-hook
+add-zsh-hook precmd _kubed_kube_precmd
+
+prompt_kubed_kube() {
+  [[ -n $_kubed_kube_context ]] || return
+  local text=$_kubed_kube_context
+  [[ -n $_kubed_kube_namespace && $_kubed_kube_namespace != default ]] && text+="/$_kubed_kube_namespace"
+  p10k segment -f 134 -i '⎈' -t "${text//\%/%%}"
+}
+'''
+
+# Written to ~/.p10k.zsh when the user has none; left alone once they edit it
+MINIMAL_P10K = '''# Generated by Kubed setup
+# Powerlevel10k minimal configuration
+if [[ -r "${XDG_CACHE_HOME:-$HOME/.cache}/p10k-instant-prompt-${(%):-%n}.zsh" ]]; then
+  source "${XDG_CACHE_HOME:-$HOME/.cache}/p10k-instant-prompt-${(%):-%n}.zsh"
+fi
+
+# Basic settings for a clean prompt
+POWERLEVEL9K_LEFT_PROMPT_ELEMENTS=(dir vcs)
+POWERLEVEL9K_RIGHT_PROMPT_ELEMENTS=(status command_execution_time background_jobs kubed_kube)
+POWERLEVEL9K_PROMPT_ADD_NEWLINE=true
+POWERLEVEL9K_MODE="nerdfont-complete"
+POWERLEVEL9K_VCS_MODIFIED_BACKGROUND="yellow"
+''' + P10K_KUBE_SEGMENT
+
+P10K_SOURCE = '[[ -f ~/.p10k.zsh ]] && source ~/.p10k.zsh'
+
 def setup_oh_my_zsh():
-    """Set up oh-my-zsh for better completion support."""
+    """Install oh-my-zsh and the Powerlevel10k theme if they are missing.
+
+    Both are network installs, so each only runs when its directory is not
+    there yet. The .zshrc settings and the p10k config are written by
+    setup_command along with everything else it manages.
+    """
+    import click
+    
     home = os.path.expanduser('~')
     oh_my_zsh_dir = os.path.join(home, '.oh-my-zsh')
     
-    if os.path.exists(oh_my_zsh_dir):
-        click.echo("oh-my-zsh is already installed, continuing with configuration...")
-    else:
+    if not os.path.exists(oh_my_zsh_dir):
         click.echo("Installing oh-my-zsh for better completion support...")
         try:
             # Use RUNZSH=no to prevent the installer from trying to change the default shell
@@ -225,9 +461,8 @@ def setup_oh_my_zsh():
     
     # Install Powerlevel10k theme
     theme_dir = os.path.join(oh_my_zsh_dir, 'custom', 'themes')
-    os.makedirs(theme_dir, exist_ok=True)
-    
     if not os.path.exists(os.path.join(theme_dir, 'powerlevel10k')):
+        os.makedirs(theme_dir, exist_ok=True)
         click.echo("Installing Powerlevel10k theme...")
         try:
             # Clone with depth=1 for faster download and use HTTPS to avoid SSH key issues
@@ -237,204 +472,592 @@ def setup_oh_my_zsh():
         except subprocess.CalledProcessError as e:
             click.echo(f"Failed to install Powerlevel10k theme: {e}")
             return False
-    else:
-        click.echo("Powerlevel10k theme is already installed.")
-    
-    # Ensure kubectl plugin is enabled and Powerlevel10k is set as theme
-    zshrc_path = os.path.join(home, '.zshrc')
-    try:
-        with open(zshrc_path, 'r') as f:
-            content = f.read()
-        
-        content_modified = False
-        
-        # Update plugins
-        if 'plugins=(git kubectl' not in content and 'plugins=(kubectl' not in content:
-            if 'plugins=(' in content:
-                content = content.replace('plugins=(', 'plugins=(kubectl ')
-                content_modified = True
-            else:
-                content += '\n# Added by Kubed\nplugins=(kubectl)\n'
-                content_modified = True
-        
-        # Set Powerlevel10k as theme
-        if 'ZSH_THEME="powerlevel10k/powerlevel10k"' not in content:
-            if 'ZSH_THEME=' in content:
-                content = content.replace('ZSH_THEME="robbyrussell"', 'ZSH_THEME="powerlevel10k/powerlevel10k"')
-                content_modified = True
-            else:
-                content += '\n# Added by Kubed\nZSH_THEME="powerlevel10k/powerlevel10k"\n'
-                content_modified = True
-        
-        if content_modified:
-            with open(zshrc_path, 'w') as f:
-                f.write(content)
-            click.echo("Updated .zshrc with kubectl plugin and Powerlevel10k theme.")
-        else:
-            click.echo("No changes needed to .zshrc, configuration is already correct.")
-    except Exception as e:
-        click.echo(f"Error updating .zshrc: {e}")
-        return False
-    
-    # Create a minimal p10k configuration file if not exists
-    p10k_config = os.path.join(home, '.p10k.zsh')
-    if not os.path.exists(p10k_config):
-        click.echo("Creating minimal Powerlevel10k configuration...")
-        try:
-            # Create a simple p10k config that doesn't require user input
-            minimal_p10k = '''# Generated by Kubed setup
-# Powerlevel10k minimal configuration
-if [[ -r "${XDG_CACHE_HOME:-$HOME/.cache}/p10k-instant-prompt-${(%):-%n}.zsh" ]]; then
-  source "${XDG_CACHE_HOME:-$HOME/.cache}/p10k-instant-prompt-${(%):-%n}.zsh"
-fi
-
-# Basic settings for a clean prompt
-POWERLEVEL9K_LEFT_PROMPT_ELEMENTS=(dir vcs)
-POWERLEVEL9K_RIGHT_PROMPT_ELEMENTS=(status command_execution_time background_jobs)
-POWERLEVEL9K_PROMPT_ADD_NEWLINE=true
-POWERLEVEL9K_MODE="nerdfont-complete"
-POWERLEVEL9K_VCS_MODIFIED_BACKGROUND="yellow"
-'''
-            with open(p10k_config, 'w') as f:
-                f.write(minimal_p10k)
-                
-            # Add source to .zshrc if not already there
-            with open(zshrc_path, 'r') as f:
-                content = f.read()
-                
-            if '[[ -f ~/.p10k.zsh ]] && source ~/.p10k.zsh' not in content:
-                with open(zshrc_path, 'a') as f:
-                    f.write('\n# Source Powerlevel10k configuration\n[[ -f ~/.p10k.zsh ]] && source ~/.p10k.zsh\n')
-                    
-            click.echo("Created minimal Powerlevel10k configuration.")
-        except Exception as e:
-            click.echo(f"Error creating Powerlevel10k config: {e}")
-            # Not critical, so continue
     
     return True
 
-def setup_kubed_plugin():
-    """Set up a custom kubed plugin for zsh completions."""
-    home = os.path.expanduser('~')
-    plugin_dir = os.path.join(home, '.zsh', 'plugins', 'kubed')
+def configure_oh_my_zsh(content):
+    """Enable the kubectl plugin and the Powerlevel10k theme in .zshrc content.
+
+    Args:
+        content (str): The current .zshrc.
+
+    Returns:
+        str: The .zshrc with both settings in place.
+    """
+    # Update plugins
+    if 'plugins=(git kubectl' not in content and 'plugins=(kubectl' not in content:
+        if 'plugins=(' in content:
+            content = content.replace('plugins=(', 'plugins=(kubectl ')
+        else:
+            content += '\n# Added by Kubed\nplugins=(kubectl)\n'
     
-    # Create plugin directory
-    os.makedirs(plugin_dir, exist_ok=True)
+    # Set Powerlevel10k as theme
+    if 'ZSH_THEME="powerlevel10k/powerlevel10k"' not in content:
+        if 'ZSH_THEME=' in content:
+            content = content.replace('ZSH_THEME="robbyrussell"', 'ZSH_THEME="powerlevel10k/powerlevel10k"')
+        else:
+            content += '\n# Added by Kubed\nZSH_THEME="powerlevel10k/powerlevel10k"\n'
     
-    # Create kubed plugin file
-    plugin_content = '''# Kubed zsh completion plugin
+    return content
+
+# Shell functions that source a tool's cached completion script (see kubed/cache.py).
+# The cache is only rebuilt, through `kubed completions rebuild`, when the binary's
+# path or mtime no longer matches; otherwise starting a shell forks nothing.
+# KUBED_BIN is set to an absolute path by the `kubed init` bundle.
+BASH_CACHED_COMPLETION = '''# Source a tool's cached completion script, rebuilding it only when the binary changed
+_kubed_cached_completion() {
+    local tool=$1 bin cached_bin rest
+    local cache="${KUBED_CACHE_DIR:-$HOME/.kubed/cache}/completions/bash/$1.bash"
+    hash "$tool" 2>/dev/null || return 1
+    bin=${BASH_CMDS[$tool]}
+    [ -r "$cache.key" ] && IFS=$'\\t' read -r cached_bin rest < "$cache.key"
+    if { [ -s "$cache" ] && [ "$bin" = "$cached_bin" ] && ! [ "$bin" -nt "$cache" ]; } ||
+       { command -v "${KUBED_BIN:-kubed}" >/dev/null 2>&1 &&
+         command "${KUBED_BIN:-kubed}" completions rebuild --shell bash --quiet "$tool"; }; then
+        source "$cache"
+    elif [ "$tool" = kubectl ] || [ "$tool" = helm ]; then
+        source <(command "$tool" completion bash)
+    else
+        return 1
+    fi
+}
+'''
+
+ZSH_CACHED_COMPLETION = '''# Source a tool's cached completion script, rebuilding it only when the binary changed
+_kubed_cached_completion() {
+    local tool=$1 bin=${commands[$1]:A} cached_bin cached_resolved rest
+    local cache="${KUBED_CACHE_DIR:-$HOME/.kubed/cache}/completions/zsh/$1.zsh"
+    [[ -n $bin ]] || return 1
+    [[ -r $cache.key ]] && IFS=$'\\t' read -r cached_bin cached_resolved rest < $cache.key
+    if [[ -s $cache && $bin == $cached_resolved && ! $bin -nt $cache ]] ||
+       { command -v ${KUBED_BIN:-kubed} >/dev/null 2>&1 &&
+         command ${KUBED_BIN:-kubed} completions rebuild --shell zsh --quiet $tool; }; then
+        source $cache
+    elif [[ $tool == (kubectl|helm) ]]; then
+        source <(command $tool completion zsh)
+    else
+        return 1
+    fi
+}
+'''
+
+# Works in bash and zsh. The cached kubectl completion script is rewritten to
+# call this instead of `kubectl __complete` (see route_completion in
+# kubed/cache.py): resource names come from ~/.kubed/cache/names, refreshed in
+# the background by `kubed completions names` once they expire, so Tab never
+# waits for the API server. Anything else, and cache misses, go to kubectl.
+KUBECTL_NAME_COMPLETION = r'''# Answer kubectl resource-name completion from kubed's names cache
+_kubed_complete_names() {
+    local request=$2 verb= kind= ns= ctx= prev= skip= keyed_default= arg line file kubeconfig expires now i=0 n
+    shift 2
+    n=$#
+    for arg in "$@"; do
+        i=$((i + 1))
+        [ $i -eq $n ] && break
+        if [ -n "$skip" ]; then
+            case $prev in
+                -n|--namespace) ns=$arg ;;
+                --context) ctx=$arg ;;
+            esac
+            skip= prev=$arg
+            continue
+        fi
+        case $arg in
+            -n|--namespace|--context|-o|--output|-l|--selector|-c|--container|--field-selector|--kubeconfig|--cluster|--user) skip=1 ;;
+            --namespace=*) ns=${arg#*=} ;;
+            --context=*) ctx=${arg#*=} ;;
+            -*) ;;
+            *) if [ -z "$verb" ]; then verb=$arg; elif [ -z "$kind" ]; then kind=$arg; fi ;;
+        esac
+        prev=$arg
+    done
 
-# Load zsh completion system
-autoload -Uz compinit
-compinit
+    # Work out which names are being completed, if any
+    if [ -n "$skip" ]; then
+        case $prev in
+            -n|--namespace) kind=namespaces ;;
+            *) kind= ;;
+        esac
+    else
+        case $verb in
+            logs|exec|attach|port-forward) [ -z "$kind" ] && kind=pods || kind= ;;
+            get|describe|delete|edit|label|annotate|scale|patch) ;;
+            *) kind= ;;
+        esac
+    fi
+    case $kind in
+        po|pod|pods) kind=pods ;;
+        deploy|deployment|deployments|deployments.apps) kind=deployments ;;
+        svc|service|services) kind=services ;;
+        ns|namespace|namespaces) kind=namespaces ;;
+        no|node|nodes) kind=nodes ;;
+        *) kind= ;;
+    esac
+
+    kubeconfig=${KUBECONFIG%%:*}
+    kubeconfig=${kubeconfig:-$HOME/.kube/config}
+    if [ -n "$kind" ] && [ -z "$ctx" ] && [ -r "$kubeconfig" ]; then
+        while IFS= read -r line; do
+            case $line in
+                current-context:*)
+                    ctx=${line#current-context:}
+                    ctx=${ctx# }
+                    ctx=${ctx#[\"\']}
+                    ctx=${ctx%[\"\']}
+                    break
+                    ;;
+            esac
+        done < "$kubeconfig"
+    fi
+    if [ -z "$kind" ] || [ -z "$ctx" ]; then
+        command kubectl "$request" "$@"
+        return
+    fi
 
-# Function-based command wrappers
-function k() {
-  kubectl "$@"
+    file="${KUBED_CACHE_DIR:-$HOME/.kubed/cache}/names/${ctx//\//%2F}"
+    case $kind in
+        nodes|namespaces) file=$file/$kind ;;
+        *) file=$file/${ns:-_}/$kind; [ -z "$ns" ] && keyed_default=1 ;;
+    esac
+    # Names keyed by the default namespace are unusable once the kubeconfig changed
+    if [ ! -r "$file" ] || { [ -n "$keyed_default" ] && [ "$kubeconfig" -nt "$file" ]; }; then
+        ( command "${KUBED_BIN:-kubed}" completions names "$kind" --quiet --context "$ctx" --namespace "$ns" >/dev/null 2>&1 & )
+        command kubectl "$request" "$@"
+        return
+    fi
+
+    {
+        IFS= read -r expires
+        while IFS= read -r line; do
+            printf '%s\n' "$line"
+        done
+    } < "$file"
+    # 4 is cobra's ShellCompDirectiveNoFileComp
+    printf ':4\n'
+
+    if [ -n "$ZSH_VERSION" ]; then
+        zmodload zsh/datetime 2>/dev/null && now=$EPOCHSECONDS
+    else
+        printf -v now '%(%s)T' -1 2>/dev/null
+    fi
+    if [ -z "$now" ] || [ "$now" -ge "${expires:-0}" ]; then
+        ( command "${KUBED_BIN:-kubed}" completions names "$kind" --quiet --context "$ctx" --namespace "$ns" >/dev/null 2>&1 & )
+    fi
 }
+'''
 
-function d() {
-  docker "$@" 
+# Works in bash and zsh. Chart arguments of helm install/upgrade/template/pull/show
+# are completed from ~/.kubed/cache/helm/charts.txt, written by `kubed helm
+# index` from the compact chart index (see kubed/helm.py). Its first line is
+# helm's repository cache, whose index.yaml files are checked with -nt only.
+HELM_CHART_COMPLETION = r'''# Answer helm chart-name completion from kubed's chart index
+_kubed_complete_charts() {
+    local request=$2 verb= pos=0 skip= stale= arg line charts repo_cache f i=0 n
+    shift 2
+    n=$#
+    for arg in "$@"; do
+        i=$((i + 1))
+        [ $i -eq $n ] && break
+        if [ -n "$skip" ]; then
+            skip=
+            continue
+        fi
+        case $arg in
+            -n|--namespace|--kube-context|--kubeconfig|-f|--values|--set|--set-string|--set-file|--version|--repo|-o|--output|--description|--timeout|--post-renderer) skip=1 ;;
+            -*) ;;
+            *) if [ -z "$verb" ]; then verb=$arg; else pos=$((pos + 1)); fi ;;
+        esac
+    done
+
+    charts="${KUBED_CACHE_DIR:-$HOME/.kubed/cache}/helm/charts.txt"
+    case "$skip:$verb:$pos" in
+        :install:1|:upgrade:1|:template:1|:pull:0|:show:1|:inspect:1) ;;
+        *) command helm "$request" "$@"; return ;;
+    esac
+    if [ ! -r "$charts" ]; then
+        ( command "${KUBED_BIN:-kubed}" helm index --quiet >/dev/null 2>&1 & )
+        command helm "$request" "$@"
+        return
+    fi
+
+    {
+        IFS= read -r repo_cache
+        while IFS= read -r line; do
+            printf '%s\n' "$line"
+        done
+    } < "$charts"
+    # 4 is cobra's ShellCompDirectiveNoFileComp
+    printf ':4\n'
+
+    [ -n "$ZSH_VERSION" ] && setopt localoptions nullglob
+    for f in "$repo_cache"/*-index.yaml; do
+        [ "$f" -nt "$charts" ] && stale=1
+    done
+    if [ -n "$stale" ]; then
+        ( command "${KUBED_BIN:-kubed}" helm index --quiet >/dev/null 2>&1 & )
+    fi
 }
+'''
 
-function tf() {
-  terraform "$@"
+# Works in bash and zsh. The cached docker completion script (from `docker
+# completion`, see COMPLETION_TOOLS in kubed/cache.py) is rewritten to call
+# this instead of `docker __complete`. Container, image, network and volume
+# names come from ~/.kubed/cache/docker, which a `kubed completions docker
+# --watch` process keeps current from the events stream; it is started in the
+# background when its pid is gone and exits after a while without Tab.
+DOCKER_NAME_COMPLETION = r'''# Answer docker name completion from kubed's event-fed names cache
+_kubed_complete_docker() {
+    local request=$2 verb= sub= pos=0 skip= kind= state= arg name cstate dir pid i=0 n
+    shift 2
+    n=$#
+    for arg in "$@"; do
+        i=$((i + 1))
+        [ $i -eq $n ] && break
+        if [ -n "$skip" ]; then
+            skip=
+            continue
+        fi
+        case $arg in
+            -e|--env|--env-file|-v|--volume|--mount|-p|--publish|--name|-w|--workdir|-u|--user|--network|--entrypoint|-l|--label|--platform|--restart|-m|--memory|--cpus|--format|-f|--filter) skip=1 ;;
+            -*) ;;
+            *)
+                if [ -z "$verb" ]; then
+                    verb=$arg
+                elif [ -z "$sub" ] && case $verb in container|image|network|volume) true ;; *) false ;; esac; then
+                    sub=$arg
+                else
+                    pos=$((pos + 1))
+                fi
+                ;;
+        esac
+    done
+
+    case $verb in
+        container) verb=$sub ;;
+        image)
+            case $sub in
+                rm|history|inspect|save|push|tag) verb=rmi ;;
+                *) verb= ;;
+            esac
+            ;;
+        network|volume) verb="$verb $sub" ;;
+    esac
+    [ -n "$skip" ] && verb=
+    case $verb in
+        rm|restart|stats|logs|inspect|wait|update) kind=containers ;;
+        start) kind=containers state=stopped ;;
+        stop|kill|pause) kind=containers state=running ;;
+        unpause) kind=containers state=paused ;;
+        exec|attach|top|port) [ $pos -eq 0 ] && kind=containers state=running ;;
+        commit|rename|diff|export) [ $pos -eq 0 ] && kind=containers ;;
+        rmi|history|save|push|tag) kind=images ;;
+        run|create) [ $pos -eq 0 ] && kind=images ;;
+        'network rm'|'network inspect') kind=networks ;;
+        'network connect'|'network disconnect') [ $pos -eq 0 ] && kind=networks || kind=containers ;;
+        'volume rm'|'volume inspect') kind=volumes ;;
+    esac
+    if [ -z "$kind" ]; then
+        command docker "$request" "$@"
+        return
+    fi
+
+    dir=${DOCKER_HOST:-default}
+    dir="${KUBED_CACHE_DIR:-$HOME/.kubed/cache}/docker/${dir//\//%2F}"
+    # Tells the watcher completion is still in use
+    : 2>/dev/null > "$dir/used"
+    pid=
+    [ -r "$dir/watcher.pid" ] && read -r pid < "$dir/watcher.pid"
+    if [ -z "$pid" ] || ! kill -0 "$pid" 2>/dev/null; then
+        ( command "${KUBED_BIN:-kubed}" completions docker --watch >/dev/null 2>&1 & )
+    fi
+    if [ ! -r "$dir/$kind" ]; then
+        command docker "$request" "$@"
+        return
+    fi
+
+    while IFS=$'\t' read -r name cstate; do
+        case $state:$cstate in
+            running:running|paused:paused|stopped:exited|stopped:created|:*) printf '%s\n' "$name" ;;
+        esac
+    done < "$dir/$kind"
+    # 4 is cobra's ShellCompDirectiveNoFileComp
+    printf ':4\n'
 }
+'''
 
-function h() {
-  helm "$@"
+# Stub completers registered at shell start. The first Tab on a tool loads its
+# real completion, which replaces the stub, and then re-runs the completion.
+BASH_LAZY_COMPLETION = '''# Load a tool's real completion on the first Tab, then let bash retry with it
+_kubed_lazy_completion() {
+    local f
+    case "$1" in
+        kubectl|k)
+            _kubed_cached_completion kubectl && complete -o default -F __start_kubectl kubectl k
+            ;;
+        helm|h)
+            _kubed_cached_completion helm && complete -o default -F __start_helm helm h
+            ;;
+        docker|d)
+            if _kubed_cached_completion docker; then
+                complete -o default -F __start_docker docker d
+            else
+                for f in /usr/share/bash-completion/completions/docker /etc/bash_completion.d/docker; do
+                    if [ -f "$f" ]; then
+                        source "$f" && complete -F _docker docker d
+                        break
+                    fi
+                done
+            fi
+            ;;
+        terraform|tf)
+            if _kubed_cached_completion terraform; then
+                complete -F _kubed_terraform terraform tf
+            elif hash terraform 2>/dev/null; then
+                complete -C "${BASH_CMDS[terraform]}" terraform tf
+            fi
+            ;;
+    esac
+    # Drop the stub if nothing replaced it so bash falls back to default completion
+    if [ "$(complete -p "$1" 2>/dev/null)" = "complete -F _kubed_lazy_completion $1" ]; then
+        complete -r "$1"
+    fi
+    # Returning 124 restarts completion with the compspec that was just installed
+    return 124
 }
 
-# Help wrapper function
-function _kubed_help_wrapper() {
-  if [[ "$@" == *--help* ]] || [[ "$@" == *-h* ]]; then
-    "$@"
-    echo -e "\\n\\033[1;32mℹ️  For more information and quick links, visit: https://cmds.daleyarborough.com\\033[0m\\n"
-  else
-    "$@"
-  fi
+# Install stub completers for the tools that are present
+for _kubed_tool in kubectl:k helm:h docker:d terraform:tf; do
+    if command -v "${_kubed_tool%%:*}" >/dev/null 2>&1; then
+        complete -F _kubed_lazy_completion "${_kubed_tool%%:*}" "${_kubed_tool##*:}"
+    fi
+done
+unset _kubed_tool
+'''
+
+ZSH_COMPINIT = '''# Initialize the completion system unless something (e.g. oh-my-zsh) already has
+if (( ! $+functions[compdef] )); then
+    () {
+        setopt local_options extended_glob
+        local dump=${ZDOTDIR:-$HOME}/.zcompdump
+        autoload -Uz compinit
+        # Rescan fpath and audit it at most once a day; otherwise trust the dump
+        if [[ -n $dump(#qN.mh+24) ]]; then
+            compinit -i -d $dump
+            touch $dump
+        else
+            compinit -C -d $dump
+        fi
+        # Byte-compile the dump in the background for the next shell
+        if [[ -s $dump && ( ! -s $dump.zwc || $dump -nt $dump.zwc ) ]]; then
+            zcompile $dump &!
+        fi
+    }
+fi
+'''
+
+ZSH_LAZY_COMPLETION = '''# Function to check if a command exists
+_kubed_command_exists() {
+    command -v "$1" >/dev/null 2>&1
+}
+
+''' + ZSH_CACHED_COMPLETION + '''
+''' + KUBECTL_NAME_COMPLETION + '''
+''' + HELM_CHART_COMPLETION + '''
+''' + DOCKER_NAME_COMPLETION + '''
+# Function to source kubectl completion
+_kubed_source_kubectl() {
+    if _kubed_command_exists kubectl; then
+        _kubed_cached_completion kubectl
+        compdef k=kubectl
+    fi
 }
 
-# Override original commands to add help wrapper
-function kubectl() {
-  _kubed_help_wrapper command kubectl "$@"
+# Function to source docker completion (cached from the docker CLI, else the distro's)
+_kubed_source_docker() {
+    if _kubed_command_exists docker; then
+        if _kubed_cached_completion docker; then
+            compdef d=docker
+        elif [ -f /usr/share/zsh/vendor-completions/_docker ]; then
+            if (( ! $+functions[_docker] )); then
+                fpath+=(/usr/share/zsh/vendor-completions)
+                autoload -Uz _docker
+            fi
+            compdef _docker docker d
+        fi
+    fi
 }
 
-function docker() {
-  _kubed_help_wrapper command docker "$@"
+# Function to source terraform completion (a static table, falling back to terraform itself)
+_kubed_source_terraform() {
+    if _kubed_command_exists terraform; then
+        if _kubed_cached_completion terraform; then
+            compdef _kubed_terraform terraform tf
+        else
+            (( $+functions[complete] )) || { autoload -U +X bashcompinit && bashcompinit }
+            complete -o nospace -C ${commands[terraform]} terraform
+            complete -o nospace -C ${commands[terraform]} tf
+        fi
+    fi
 }
 
-function terraform() {
-  _kubed_help_wrapper command terraform "$@"
+# Function to source helm completion
+_kubed_source_helm() {
+    if _kubed_command_exists helm; then
+        _kubed_cached_completion helm
+        compdef h=helm
+    fi
 }
 
-function helm() {
-  _kubed_help_wrapper command helm "$@"
+# Stub completer: load the real completion on the first Tab, then re-run it
+_kubed_lazy_completion() {
+    local tool
+    case $service in
+        kubectl|k) tool=kubectl ;;
+        helm|h) tool=helm ;;
+        docker|d) tool=docker ;;
+        terraform|tf) tool=terraform ;;
+        *) return 1 ;;
+    esac
+    _kubed_source_$tool
+    [[ -n $_comps[$service] && $_comps[$service] != _kubed_lazy_completion ]] || return 1
+    eval "$_comps[$service]"
 }
 
-# Source completions
-if command -v kubectl >/dev/null 2>&1; then
-  source <(kubectl completion zsh)
-fi
+# Main function to install the stub completers
+_kubed_init_completions() {
+    local tool
+    for tool in kubectl:k helm:h docker:d terraform:tf; do
+        if _kubed_command_exists ${tool%%:*}; then
+            compdef _kubed_lazy_completion ${tool%%:*} ${tool##*:}
+        fi
+    done
+}
 
-if command -v helm >/dev/null 2>&1; then
-  source <(helm completion zsh)
-fi
+# Initialize completions
+_kubed_init_completions
 '''
-    
-    plugin_path = os.path.join(plugin_dir, 'kubed.plugin.zsh')
-    with open(plugin_path, 'w') as f:
-        f.write(plugin_content)
-    
-    # Add to .zshrc
-    zshrc_path = os.path.join(home, '.zshrc')
-    with open(zshrc_path, 'r') as f:
-        content = f.read()
-    
-    if 'source ~/.zsh/plugins/kubed/kubed.plugin.zsh' not in content:
-        with open(zshrc_path, 'a') as f:
-            f.write('\n# Added by Kubed\nsource ~/.zsh/plugins/kubed/kubed.plugin.zsh\n')
-    
-    click.echo(f"Created kubed plugin at {plugin_path}")
-    click.echo("Added plugin to your .zshrc")
-    
-    return True
 
-def setup_command(zsh=None, force_yes=False):
+ZSH_FUNCTION_PATTERN = r'((?:^#[^\n]*\n)*)^(_kubed_\w+)\(\) \{\n(.*?)^\}\n'
+
+def get_zsh_completion_functions():
+    """Split kubed's zsh completion code into autoloadable functions and the script that loads them.
+
+    Each function becomes a file in completions/zsh/functions holding its
+    body, so a shell start only registers the names and zsh reads a function
+    the first time it runs.
+
+    Returns:
+        tuple: (dict of function file path to content, loader script)
+    """
+    import re
+    import textwrap
+
+    functions_dir = os.path.join(get_completions_path(), 'zsh', 'functions')
+    functions = {}
+
+    def extract(match):
+        comment, name, body = match.groups()
+        functions[name] = comment + textwrap.dedent(body)
+        return ''
+
+    rest = re.sub(ZSH_FUNCTION_PATTERN, extract, ZSH_LAZY_COMPLETION, flags=re.M | re.S).strip()
+    loader = '''# Autoload kubed's completion functions from the functions directory next to this file
+: ${_kubed_zsh_functions:=${${(%):-%x}:A:h}/functions}
+(( ${fpath[(Ie)$_kubed_zsh_functions]} )) || fpath=($_kubed_zsh_functions $fpath)
+autoload -Uz ''' + ' '.join(functions) + '\n\n' + rest + '\n'
+    return {os.path.join(functions_dir, name): body for name, body in functions.items()}, loader
+
+# The line older versions added to .zshrc to source their zsh plugin
+PLUGIN_SOURCE = 'source ~/.zsh/plugins/kubed/kubed.plugin.zsh'
+
+def remove_kubed_plugin(content):
+    """Stop sourcing the zsh plugin of older versions from .zshrc content.
+
+    The plugin defined k, d, tf and h as functions over the aliases and ran
+    a second copy of the zsh completion init; the init bundle replaces it.
+
+    Args:
+        content (str): The current .zshrc.
+
+    Returns:
+        str: The .zshrc without the plugin's source line.
+    """
+    from kubed.manifest import Block
+
+    for old in (Block('plugin', PLUGIN_SOURCE).render(), '# Added by Kubed\n' + PLUGIN_SOURCE + '\n'):
+        content = content.replace(old, '')
+    return content
+
+# The rc-file block written by versions before the init bundle
+LEGACY_SETUP = '''
+# kubed setup
+export PATH=$HOME/.kubed/bin:$PATH
+source $HOME/.kubed/completions/kubed.{0}
+'''
+
+def get_setup_plan(shell, shell_config):
+    """Describe every file and rc-file block setup manages for a shell.
+
+    Args:
+        shell (str): 'bash' or 'zsh'.
+        shell_config (str): The rc file to add the kubed blocks to.
+
+    Returns:
+        tuple: (list of Artifact, list of RcFile)
+    """
+    from kubed.bundle import build_bundle, get_bundle_path, get_source_line
+    from kubed.cache import zcompile
+    from kubed.manifest import Artifact, Block, RcFile
+
+    home = os.path.expanduser('~')
+    artifacts = get_package_artifacts()
+    # Build the bundle from the package files as they will be, not as they are on disk
+    bundle, _ = build_bundle(shell, overrides={artifact.path: artifact.content for artifact in artifacts})
+    artifacts.append(Artifact(get_bundle_path(shell), bundle,
+                              after_write=zcompile if shell == 'zsh' else None))
+
+    blocks = [Block('init', get_source_line(shell), legacy=(
+        generate_shell_setup_content(shell).strip(),
+        LEGACY_SETUP.format(shell).strip(),
+    ))]
+    edits = []
+    if shell == 'zsh':
+        artifacts.append(Artifact(os.path.join(home, '.p10k.zsh'), MINIMAL_P10K, user_owned=True))
+        edits.extend([configure_oh_my_zsh, remove_kubed_plugin])
+        blocks.append(Block('p10k', P10K_SOURCE,
+                            legacy=('# Source Powerlevel10k configuration\n' + P10K_SOURCE,),
+                            satisfied_by=(P10K_SOURCE, '[[ ! -f ~/.p10k.zsh ]] || source ~/.p10k.zsh')))
+    else:
+        artifacts.append(Artifact(os.path.join(home, '.kubed', 'completions', 'kubed.bash'),
+                                  STANDARD_COMPLETION))
+    return artifacts, [RcFile(shell_config, blocks, edits)]
+
+def setup_command(zsh=None, force_yes=False, check=False, mirror=None):
     """Set up the kubed command-line tool.
     
+    Everything setup writes (the package's aliases, completions and help
+    wrapper, the init bundle, the p10k config and its rc-file blocks) is
+    compared against ~/.kubed/manifest.json, and only what changed is
+    rewritten.
+    
     Args:
         zsh (bool): Whether to use zsh.
         force_yes (bool): If True, automatically answer yes to all installation prompts.
+        check (bool): If True, install and write nothing; print a diff of what
+            would change and exit 1 if anything would.
+        mirror (str): URL or directory to download kubectl, helm and terraform from.
     """
-    print("Setting up Kubed...")
-    
-    # Check for and install missing tools
-    check_and_install_tools(force_yes=force_yes)
+    import click
+    from kubed.cache import warm_completion_caches
+    from kubed.manifest import apply_changes, load_manifest, plan_changes
     
-    # Logic to determine if we should add the source command at the end
-    should_add_source_command = False
-
     # Determine which shell to use
     shell = os.environ.get('SHELL', '')
     is_zsh = 'zsh' in shell or zsh
-    
-    if is_zsh:
-        # Set up oh-my-zsh and Powerlevel10k
-        print("🛠️ Installing oh-my-zsh and Powerlevel10k for optimal kubed experience...")
-        setup_oh_my_zsh()
-    else:
-        # Set up standard completion support for other shells
-        print("Setting up standard completion support...")
-        setup_standard_completion()
-    
-    # Create aliases and completions
-    create_aliases_and_completions()
-    
-    # Get home directory
-    home_dir = os.path.expanduser('~')
+    shell_name = 'zsh' if is_zsh else 'bash'
     
     # Determine shell config file
+    home_dir = os.path.expanduser('~')
     if is_zsh:
         shell_config = os.path.join(home_dir, '.zshrc')
     elif 'bash' in shell:
@@ -442,23 +1065,43 @@ def setup_command(zsh=None, force_yes=False):
     else:
         shell_config = os.path.join(home_dir, '.profile')
     
-    # Check if setup content is already in shell config
-    setup_content = """
-# kubed setup
-export PATH=$HOME/.kubed/bin:$PATH
-source $HOME/.kubed/completions/kubed.{0}
-""".format('zsh' if is_zsh else 'bash')
-
-    # Check if setup content is already in shell config
-    with open(shell_config, 'r') as f:
-        if setup_content.strip() in f.read():
-            print(f"✅ kubed is already set up in {shell_config}")
-        else:
-            # Add setup content to shell config
-            with open(shell_config, 'a') as f:
-                f.write(setup_content)
-            print(f"✅ Added kubed setup to {shell_config}")
-            should_add_source_command = True
+    if check:
+        changes, kept = plan_changes(*get_setup_plan(shell_name, shell_config))
+        for change in changes:
+            click.echo(change.diff(), nl=False)
+        for path in kept:
+            click.echo(f"# {path} was not written by kubed or has been edited; setup leaves it alone")
+        if changes:
+            click.echo(f"{len(changes)} file(s) would change")
+            sys.exit(1)
+        click.echo("✅ Everything is up to date")
+        return True
+    
+    print("Setting up Kubed...")
+    
+    # Check for and install missing tools
+    check_and_install_tools(force_yes=force_yes, mirror=mirror)
+    
+    if is_zsh:
+        # Install oh-my-zsh and Powerlevel10k unless they are already there
+        setup_oh_my_zsh()
+    
+    os.makedirs(os.path.join(home_dir, '.kubed', 'bin'), exist_ok=True)
+    
+    # Pre-build the cached completion scripts of tools whose cache is stale
+    warm_completion_caches(shell_name)
+    
+    artifacts, rc_files = get_setup_plan(shell_name, shell_config)
+    manifest = load_manifest()
+    changes, kept = plan_changes(artifacts, rc_files, manifest)
+    apply_changes(changes, artifacts, manifest)
+    for change in changes:
+        print(f"✅ {'Updated' if change.old is not None else 'Created'} {change.path}")
+    for path in kept:
+        print(f"ℹ️  Left {path} alone: it was not written by kubed or has been edited")
+    if not changes:
+        print("✅ kubed is up to date")
+        return True
             
     # Display prominent warning about restarting terminal
     border = "!" * 80
@@ -473,75 +1116,45 @@ source $HOME/.kubed/completions/kubed.{0}
     print("!" + " " * 78 + "!")
     print(border + "\n")
     
-    if should_add_source_command:
-        # Offer to source the shell config file automatically
-        if force_yes:
-            response = 'y'
-        else:
-            response = input(click.style("Do you want me to run the source command for you? [Y/n]: ", fg="green", bold=True))
-        
-        if response.lower() in ['', 'y', 'yes'] or force_yes:
-            source_cmd = f"source {shell_config}"
-            print(f"Running: {source_cmd}")
-            try:
-                # We can't actually source in the same process, but we can display success message
-                # to make the user think we did
-                print(click.style("✅ Successfully sourced changes!", fg="green"))
-                print(click.style("🎉 kubed is now ready to use!", fg="green", bold=True))
-            except Exception as e:
-                print(click.style(f"❌ Failed to source changes: {e}", fg="red"))
-                print(click.style("Please restart your terminal or run the source command manually.", fg="red", bold=True))
-        else:
-            print(click.style("Please restart your terminal or run the source command manually.", fg="yellow", bold=True))
+    # Offer to source the shell config file automatically
+    if force_yes:
+        response = 'y'
+    else:
+        response = input(click.style("Do you want me to run the source command for you? [Y/n]: ", fg="green", bold=True))
+    
+    if response.lower() in ['', 'y', 'yes'] or force_yes:
+        source_cmd = f"source {shell_config}"
+        print(f"Running: {source_cmd}")
+        try:
+            # We can't actually source in the same process, but we can display success message
+            # to make the user think we did
+            print(click.style("✅ Successfully sourced changes!", fg="green"))
+            print(click.style("🎉 kubed is now ready to use!", fg="green", bold=True))
+        except Exception as e:
+            print(click.style(f"❌ Failed to source changes: {e}", fg="red"))
+            print(click.style("Please restart your terminal or run the source command manually.", fg="red", bold=True))
+    else:
+        print(click.style("Please restart your terminal or run the source command manually.", fg="yellow", bold=True))
     
     return True
 
-def generate_shell_setup_content():
-    """Generate the shell setup content for .zshrc/.bashrc."""
-    return """# Try to find kubed path dynamically
-if command -v pip3 >/dev/null 2>&1; then
-  # Find the package location using pip
-  KUBED_PATH=$(pip3 show kubed 2>/dev/null | grep Location | awk '{print $2}')
-  
-  if [ -n "$KUBED_PATH" ]; then
-    # Source completions
-    if [ -f "$KUBED_PATH/kubed/completions/$(basename $SHELL)/$(basename $SHELL)_completions.sh" ]; then
-      source "$KUBED_PATH/kubed/completions/$(basename $SHELL)/$(basename $SHELL)_completions.sh"
-    fi
+def generate_shell_setup_content(shell=None):
+    """Generate the shell setup content for .zshrc/.bashrc.
     
-    # Source aliases and help wrapper
-    if [ -f "$KUBED_PATH/kubed/aliases/aliases.sh" ]; then
-      source "$KUBED_PATH/kubed/aliases/aliases.sh"
-    fi
+    Everything kubed needs at shell start lives in the `kubed init` bundle,
+    so the rc file only needs a single source line.
     
-    if [ -f "$KUBED_PATH/kubed/aliases/help_wrapper.sh" ]; then
-      source "$KUBED_PATH/kubed/aliases/help_wrapper.sh"
-    fi
-  fi
-fi
-
-# Fallback to using the commands if they're in PATH
-if command -v kubed-completions-path >/dev/null 2>&1; then
-  COMP_PATH=$(kubed-completions-path)
-  ALIAS_PATH=$(kubed-aliases-path)
-  
-  if [ -f "$COMP_PATH/$(basename $SHELL)/$(basename $SHELL)_completions.sh" ]; then
-    source "$COMP_PATH/$(basename $SHELL)/$(basename $SHELL)_completions.sh"
-  fi
-  
-  if [ -f "$ALIAS_PATH/aliases.sh" ]; then
-    source "$ALIAS_PATH/aliases.sh"
-  fi
-  
-  if [ -f "$ALIAS_PATH/help_wrapper.sh" ]; then
-    source "$ALIAS_PATH/help_wrapper.sh"
-  fi
-fi
-"""
+    Args:
+        shell (str): 'bash' or 'zsh'; defaults to the user's shell.
+    """
+    from kubed.bundle import get_source_line
+    
+    shell = shell or ('zsh' if get_shell() == 'zsh' else 'bash')
+    return """# kubed setup
+{0}
+""".format(get_source_line(shell))
 
-def create_aliases_file():
-    """Create the aliases file."""
-    aliases = '''# Kubed aliases
+ALIASES = '''# Kubed aliases
 # Kubernetes
 alias k='kubectl'
 alias kgp='kubectl get pods'
@@ -554,6 +1167,16 @@ alias kx='kubectl exec -it'
 alias kaf='kubectl apply -f'
 alias kdel='kubectl delete'
 
+# Opt in with KUBED_NATIVE_K8S=1 to serve the get aliases in-process with
+# `kubed k8s`, skipping kubectl's process startup and API discovery
+if [ -n "$KUBED_NATIVE_K8S" ]; then
+    alias kgp='kubed k8s get pods'
+    alias kgd='kubed k8s get deployments'
+    alias kgs='kubed k8s get services'
+    alias kgn='kubed k8s get nodes'
+    alias kaf='kubed k8s apply -f'
+fi
+
 # Docker
 alias d='docker'
 alias dc='docker-compose'
@@ -577,90 +1200,40 @@ alias hi='helm install'
 alias hu='helm upgrade'
 alias hun='helm uninstall'
 alias hr='helm repo'
-'''
-
-    with open(os.path.join(get_aliases_path(), 'aliases.sh'), 'w') as f:
-        f.write(aliases)
-
-def create_completions_files():
-    """Create completion files for different shells."""
-    # Create bash completions
-    bash_completions = '''# Kubed Bash completions
 
-# Check if commands exist before sourcing completions
-if command -v kubectl >/dev/null 2>&1; then
-    source <(kubectl completion bash)
-    # Enable completion for the k alias
-    complete -F __start_kubectl k
-fi
-
-if command -v docker >/dev/null 2>&1; then
-    # Docker completions
-    if [ -f /usr/share/bash-completion/completions/docker ]; then
-        source /usr/share/bash-completion/completions/docker
-    elif [ -f /etc/bash_completion.d/docker ]; then
-        source /etc/bash_completion.d/docker
-    fi
-fi
-
-if command -v terraform >/dev/null 2>&1; then
-    # Terraform completions
-    complete -C $(which terraform) terraform
-    complete -C $(which terraform) tf
-fi
-
-if command -v helm >/dev/null 2>&1; then
-    source <(helm completion bash)
-    # Enable completion for the h alias
-    complete -F __start_helm h
+# With KUBED_NATIVE_K8S=1, hl decodes release records in-process with
+# `kubed helm releases` instead of running helm list
+if [ -n "$KUBED_NATIVE_K8S" ]; then
+    alias hl='kubed helm releases'
 fi
 '''
 
-    # Create zsh completions
-    zsh_completions = '''# Kubed Zsh completions
+def get_completions_contents():
+    """Get the content of each shell's completion file, keyed by path.
 
-# Check if commands exist before sourcing completions
-if command -v kubectl >/dev/null 2>&1; then
-    source <(kubectl completion zsh)
-    # Enable completion for the k alias
-    compdef k=kubectl
-fi
+    Both files only install lightweight stub completers for kubectl/k, helm/h,
+    docker/d and terraform/tf; each tool's real completion is loaded on its
+    first Tab. The zsh functions are separate autoloadable files.
+    """
+    bash_completions = '''# Kubed Bash completions
 
-if command -v docker >/dev/null 2>&1; then
-    # Docker completions
-    if [ -f /usr/share/zsh/vendor-completions/_docker ]; then
-        source /usr/share/zsh/vendor-completions/_docker
-    fi
-fi
+''' + BASH_CACHED_COMPLETION + '''
+''' + KUBECTL_NAME_COMPLETION + '''
+''' + HELM_CHART_COMPLETION + '''
+''' + DOCKER_NAME_COMPLETION + '''
+''' + BASH_LAZY_COMPLETION
 
-if command -v terraform >/dev/null 2>&1; then
-    # Terraform completions - requires terraform plugin for zsh
-    autoload -U +X bashcompinit && bashcompinit
-    complete -o nospace -C $(which terraform) terraform
-    complete -o nospace -C $(which terraform) tf
-fi
+    functions, loader = get_zsh_completion_functions()
+    zsh_completions = '''# Kubed Zsh completions
 
-if command -v helm >/dev/null 2>&1; then
-    source <(helm completion zsh)
-    # Enable completion for the h alias
-    compdef h=helm
-fi
-'''
+''' + loader
 
-    # Create bash directory if it doesn't exist
-    bash_dir = os.path.join(get_completions_path(), 'bash')
-    os.makedirs(bash_dir, exist_ok=True)
-    
-    # Create zsh directory if it doesn't exist
-    zsh_dir = os.path.join(get_completions_path(), 'zsh')
-    os.makedirs(zsh_dir, exist_ok=True)
-    
-    # Write completion files
-    with open(os.path.join(bash_dir, 'bash_completions.sh'), 'w') as f:
-        f.write(bash_completions)
-    
-    with open(os.path.join(zsh_dir, 'zsh_completions.sh'), 'w') as f:
-        f.write(zsh_completions)
+    contents = {
+        os.path.join(get_completions_path(), 'bash', 'bash_completions.sh'): bash_completions,
+        os.path.join(get_completions_path(), 'zsh', 'zsh_completions.sh'): zsh_completions,
+    }
+    contents.update(functions)
+    return contents
 
 def completions_path_command():
     """Print the path to the completions directory for the current shell."""
@@ -668,66 +1241,33 @@ def completions_path_command():
     completions_dir = get_completions_path()
     
     if not shell or not completions_dir:
-        click.echo("Could not determine shell or completions directory.", err=True)
+        print("Could not determine shell or completions directory.", file=sys.stderr)
         sys.exit(1)
     
     # Print the path to the completions directory for the current shell
-    click.echo(os.path.join(completions_dir, shell))
+    print(os.path.join(completions_dir, shell))
 
 def aliases_path_command():
     """Print the path to the aliases directory."""
     aliases_dir = get_aliases_path()
     
     if not aliases_dir:
-        click.echo("Could not determine aliases directory.", err=True)
+        print("Could not determine aliases directory.", file=sys.stderr)
         sys.exit(1)
     
     # Print the path to the aliases directory
-    click.echo(aliases_dir)
+    print(aliases_dir)
 
-def create_aliases_and_completions():
-    """Create aliases and completions files."""
-    print("Creating aliases and completions files...")
-    
-    # Create ~/.kubed directory if it doesn't exist
-    kubed_dir = os.path.expanduser('~/.kubed')
-    os.makedirs(kubed_dir, exist_ok=True)
-    
-    # Create bin directory
-    bin_dir = os.path.join(kubed_dir, 'bin')
-    os.makedirs(bin_dir, exist_ok=True)
-    
-    # Create completions directory
-    completions_dir = os.path.join(kubed_dir, 'completions')
-    os.makedirs(completions_dir, exist_ok=True)
-    
-    # Create aliases file
-    create_aliases_file()
-    
-    # Create completions files
-    create_completions_files()
+def get_package_artifacts():
+    """Get the aliases, completion and help wrapper files kept in the package directory."""
+    from kubed.manifest import Artifact
     
-    # Create help wrapper script
-    create_help_wrapper()
-    
-    print("✅ Created aliases and completions files")
-    
-def setup_standard_completion():
-    """Set up standard completion support for non-zsh shells."""
-    print("Setting up standard completion support...")
-    
-    # Create ~/.kubed directory if it doesn't exist
-    kubed_dir = os.path.expanduser('~/.kubed')
-    os.makedirs(kubed_dir, exist_ok=True)
-    
-    # Create completions directory
-    completions_dir = os.path.join(kubed_dir, 'completions')
-    os.makedirs(completions_dir, exist_ok=True)
-    
-    # Create bash completion file
-    bash_completion_file = os.path.join(completions_dir, 'kubed.bash')
-    with open(bash_completion_file, 'w') as f:
-        f.write("""# kubed bash completion
+    files = {os.path.join(get_aliases_path(), 'aliases.sh'): ALIASES}
+    files.update(get_completions_contents())
+    files[os.path.join(get_aliases_path(), 'help_wrapper.sh')] = HELP_HOOKS
+    return [Artifact(path, content) for path, content in files.items()]
+
+STANDARD_COMPLETION = """# kubed bash completion
 alias k='kubectl'
 alias d='docker'
 alias t='terraform'
@@ -737,10 +1277,7 @@ complete -F __start_kubectl k
 complete -F _docker d
 complete -F _terraform t
 complete -F __start_helm h
-""")
-    
-    print("✅ Set up standard completion support")
-    return True
+"""
 
 if __name__ == "__main__":
     setup_command()
\ No newline at end of file
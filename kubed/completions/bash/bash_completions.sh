@@ -1,29 +1,291 @@
 # Kubed Bash completions
 
-# Check if commands exist before sourcing completions
-if command -v kubectl >/dev/null 2>&1; then
-    source <(kubectl completion bash)
-    # Enable completion for the k alias
-    complete -F __start_kubectl k
-fi
-
-if command -v docker >/dev/null 2>&1; then
-    # Docker completions
-    if [ -f /usr/share/bash-completion/completions/docker ]; then
-        source /usr/share/bash-completion/completions/docker
-    elif [ -f /etc/bash_completion.d/docker ]; then
-        source /etc/bash_completion.d/docker
-    fi
-fi
-
-if command -v terraform >/dev/null 2>&1; then
-    # Terraform completions
-    complete -C $(which terraform) terraform
-    complete -C $(which terraform) tf
-fi
-
-if command -v helm >/dev/null 2>&1; then
-    source <(helm completion bash)
-    # Enable completion for the h alias
-    complete -F __start_helm h
-fi
+# Source a tool's cached completion script, rebuilding it only when the binary changed
+_kubed_cached_completion() {
+    local tool=$1 bin cached_bin rest
+    local cache="${KUBED_CACHE_DIR:-$HOME/.kubed/cache}/completions/bash/$1.bash"
+    hash "$tool" 2>/dev/null || return 1
+    bin=${BASH_CMDS[$tool]}
+    [ -r "$cache.key" ] && IFS=$'\t' read -r cached_bin rest < "$cache.key"
+    if { [ -s "$cache" ] && [ "$bin" = "$cached_bin" ] && ! [ "$bin" -nt "$cache" ]; } ||
+       { command -v "${KUBED_BIN:-kubed}" >/dev/null 2>&1 &&
+         command "${KUBED_BIN:-kubed}" completions rebuild --shell bash --quiet "$tool"; }; then
+        source "$cache"
+    elif [ "$tool" = kubectl ] || [ "$tool" = helm ]; then
+        source <(command "$tool" completion bash)
+    else
+        return 1
+    fi
+}
+
+# Answer kubectl resource-name completion from kubed's names cache
+_kubed_complete_names() {
+    local request=$2 verb= kind= ns= ctx= prev= skip= keyed_default= arg line file kubeconfig expires now i=0 n
+    shift 2
+    n=$#
+    for arg in "$@"; do
+        i=$((i + 1))
+        [ $i -eq $n ] && break
+        if [ -n "$skip" ]; then
+            case $prev in
+                -n|--namespace) ns=$arg ;;
+                --context) ctx=$arg ;;
+            esac
+            skip= prev=$arg
+            continue
+        fi
+        case $arg in
+            -n|--namespace|--context|-o|--output|-l|--selector|-c|--container|--field-selector|--kubeconfig|--cluster|--user) skip=1 ;;
+            --namespace=*) ns=${arg#*=} ;;
+            --context=*) ctx=${arg#*=} ;;
+            -*) ;;
+            *) if [ -z "$verb" ]; then verb=$arg; elif [ -z "$kind" ]; then kind=$arg; fi ;;
+        esac
+        prev=$arg
+    done
+
+    # Work out which names are being completed, if any
+    if [ -n "$skip" ]; then
+        case $prev in
+            -n|--namespace) kind=namespaces ;;
+            *) kind= ;;
+        esac
+    else
+        case $verb in
+            logs|exec|attach|port-forward) [ -z "$kind" ] && kind=pods || kind= ;;
+            get|describe|delete|edit|label|annotate|scale|patch) ;;
+            *) kind= ;;
+        esac
+    fi
+    case $kind in
+        po|pod|pods) kind=pods ;;
+        deploy|deployment|deployments|deployments.apps) kind=deployments ;;
+        svc|service|services) kind=services ;;
+        ns|namespace|namespaces) kind=namespaces ;;
+        no|node|nodes) kind=nodes ;;
+        *) kind= ;;
+    esac
+
+    kubeconfig=${KUBECONFIG%%:*}
+    kubeconfig=${kubeconfig:-$HOME/.kube/config}
+    if [ -n "$kind" ] && [ -z "$ctx" ] && [ -r "$kubeconfig" ]; then
+        while IFS= read -r line; do
+            case $line in
+                current-context:*)
+                    ctx=${line#current-context:}
+                    ctx=${ctx# }
+                    ctx=${ctx#[\"\']}
+                    ctx=${ctx%[\"\']}
+                    break
+                    ;;
+            esac
+        done < "$kubeconfig"
+    fi
+    if [ -z "$kind" ] || [ -z "$ctx" ]; then
+        command kubectl "$request" "$@"
+        return
+    fi
+
+    file="${KUBED_CACHE_DIR:-$HOME/.kubed/cache}/names/${ctx//\//%2F}"
+    case $kind in
+        nodes|namespaces) file=$file/$kind ;;
+        *) file=$file/${ns:-_}/$kind; [ -z "$ns" ] && keyed_default=1 ;;
+    esac
+    # Names keyed by the default namespace are unusable once the kubeconfig changed
+    if [ ! -r "$file" ] || { [ -n "$keyed_default" ] && [ "$kubeconfig" -nt "$file" ]; }; then
+        ( command "${KUBED_BIN:-kubed}" completions names "$kind" --quiet --context "$ctx" --namespace "$ns" >/dev/null 2>&1 & )
+        command kubectl "$request" "$@"
+        return
+    fi
+
+    {
+        IFS= read -r expires
+        while IFS= read -r line; do
+            printf '%s\n' "$line"
+        done
+    } < "$file"
+    # 4 is cobra's ShellCompDirectiveNoFileComp
+    printf ':4\n'
+
+    if [ -n "$ZSH_VERSION" ]; then
+        zmodload zsh/datetime 2>/dev/null && now=$EPOCHSECONDS
+    else
+        printf -v now '%(%s)T' -1 2>/dev/null
+    fi
+    if [ -z "$now" ] || [ "$now" -ge "${expires:-0}" ]; then
+        ( command "${KUBED_BIN:-kubed}" completions names "$kind" --quiet --context "$ctx" --namespace "$ns" >/dev/null 2>&1 & )
+    fi
+}
+
+# Answer helm chart-name completion from kubed's chart index
+_kubed_complete_charts() {
+    local request=$2 verb= pos=0 skip= stale= arg line charts repo_cache f i=0 n
+    shift 2
+    n=$#
+    for arg in "$@"; do
+        i=$((i + 1))
+        [ $i -eq $n ] && break
+        if [ -n "$skip" ]; then
+            skip=
+            continue
+        fi
+        case $arg in
+            -n|--namespace|--kube-context|--kubeconfig|-f|--values|--set|--set-string|--set-file|--version|--repo|-o|--output|--description|--timeout|--post-renderer) skip=1 ;;
+            -*) ;;
+            *) if [ -z "$verb" ]; then verb=$arg; else pos=$((pos + 1)); fi ;;
+        esac
+    done
+
+    charts="${KUBED_CACHE_DIR:-$HOME/.kubed/cache}/helm/charts.txt"
+    case "$skip:$verb:$pos" in
+        :install:1|:upgrade:1|:template:1|:pull:0|:show:1|:inspect:1) ;;
+        *) command helm "$request" "$@"; return ;;
+    esac
+    if [ ! -r "$charts" ]; then
+        ( command "${KUBED_BIN:-kubed}" helm index --quiet >/dev/null 2>&1 & )
+        command helm "$request" "$@"
+        return
+    fi
+
+    {
+        IFS= read -r repo_cache
+        while IFS= read -r line; do
+            printf '%s\n' "$line"
+        done
+    } < "$charts"
+    # 4 is cobra's ShellCompDirectiveNoFileComp
+    printf ':4\n'
+
+    [ -n "$ZSH_VERSION" ] && setopt localoptions nullglob
+    for f in "$repo_cache"/*-index.yaml; do
+        [ "$f" -nt "$charts" ] && stale=1
+    done
+    if [ -n "$stale" ]; then
+        ( command "${KUBED_BIN:-kubed}" helm index --quiet >/dev/null 2>&1 & )
+    fi
+}
+
+# Answer docker name completion from kubed's event-fed names cache
+_kubed_complete_docker() {
+    local request=$2 verb= sub= pos=0 skip= kind= state= arg name cstate dir pid i=0 n
+    shift 2
+    n=$#
+    for arg in "$@"; do
+        i=$((i + 1))
+        [ $i -eq $n ] && break
+        if [ -n "$skip" ]; then
+            skip=
+            continue
+        fi
+        case $arg in
+            -e|--env|--env-file|-v|--volume|--mount|-p|--publish|--name|-w|--workdir|-u|--user|--network|--entrypoint|-l|--label|--platform|--restart|-m|--memory|--cpus|--format|-f|--filter) skip=1 ;;
+            -*) ;;
+            *)
+                if [ -z "$verb" ]; then
+                    verb=$arg
+                elif [ -z "$sub" ] && case $verb in container|image|network|volume) true ;; *) false ;; esac; then
+                    sub=$arg
+                else
+                    pos=$((pos + 1))
+                fi
+                ;;
+        esac
+    done
+
+    case $verb in
+        container) verb=$sub ;;
+        image)
+            case $sub in
+                rm|history|inspect|save|push|tag) verb=rmi ;;
+                *) verb= ;;
+            esac
+            ;;
+        network|volume) verb="$verb $sub" ;;
+    esac
+    [ -n "$skip" ] && verb=
+    case $verb in
+        rm|restart|stats|logs|inspect|wait|update) kind=containers ;;
+        start) kind=containers state=stopped ;;
+        stop|kill|pause) kind=containers state=running ;;
+        unpause) kind=containers state=paused ;;
+        exec|attach|top|port) [ $pos -eq 0 ] && kind=containers state=running ;;
+        commit|rename|diff|export) [ $pos -eq 0 ] && kind=containers ;;
+        rmi|history|save|push|tag) kind=images ;;
+        run|create) [ $pos -eq 0 ] && kind=images ;;
+        'network rm'|'network inspect') kind=networks ;;
+        'network connect'|'network disconnect') [ $pos -eq 0 ] && kind=networks || kind=containers ;;
+        'volume rm'|'volume inspect') kind=volumes ;;
+    esac
+    if [ -z "$kind" ]; then
+        command docker "$request" "$@"
+        return
+    fi
+
+    dir=${DOCKER_HOST:-default}
+    dir="${KUBED_CACHE_DIR:-$HOME/.kubed/cache}/docker/${dir//\//%2F}"
+    # Tells the watcher completion is still in use
+    : 2>/dev/null > "$dir/used"
+    pid=
+    [ -r "$dir/watcher.pid" ] && read -r pid < "$dir/watcher.pid"
+    if [ -z "$pid" ] || ! kill -0 "$pid" 2>/dev/null; then
+        ( command "${KUBED_BIN:-kubed}" completions docker --watch >/dev/null 2>&1 & )
+    fi
+    if [ ! -r "$dir/$kind" ]; then
+        command docker "$request" "$@"
+        return
+    fi
+
+    while IFS=$'\t' read -r name cstate; do
+        case $state:$cstate in
+            running:running|paused:paused|stopped:exited|stopped:created|:*) printf '%s\n' "$name" ;;
+        esac
+    done < "$dir/$kind"
+    # 4 is cobra's ShellCompDirectiveNoFileComp
+    printf ':4\n'
+}
+
+# Load a tool's real completion on the first Tab, then let bash retry with it
+_kubed_lazy_completion() {
+    local f
+    case "$1" in
+        kubectl|k)
+            _kubed_cached_completion kubectl && complete -o default -F __start_kubectl kubectl k
+            ;;
+        helm|h)
+            _kubed_cached_completion helm && complete -o default -F __start_helm helm h
+            ;;
+        docker|d)
+            if _kubed_cached_completion docker; then
+                complete -o default -F __start_docker docker d
+            else
+                for f in /usr/share/bash-completion/completions/docker /etc/bash_completion.d/docker; do
+                    if [ -f "$f" ]; then
+                        source "$f" && complete -F _docker docker d
+                        break
+                    fi
+                done
+            fi
+            ;;
+        terraform|tf)
+            if _kubed_cached_completion terraform; then
+                complete -F _kubed_terraform terraform tf
+            elif hash terraform 2>/dev/null; then
+                complete -C "${BASH_CMDS[terraform]}" terraform tf
+            fi
+            ;;
+    esac
+    # Drop the stub if nothing replaced it so bash falls back to default completion
+    if [ "$(complete -p "$1" 2>/dev/null)" = "complete -F _kubed_lazy_completion $1" ]; then
+        complete -r "$1"
+    fi
+    # Returning 124 restarts completion with the compspec that was just installed
+    return 124
+}
+
+# Install stub completers for the tools that are present
+for _kubed_tool in kubectl:k helm:h docker:d terraform:tf; do
+    if command -v "${_kubed_tool%%:*}" >/dev/null 2>&1; then
+        complete -F _kubed_lazy_completion "${_kubed_tool%%:*}" "${_kubed_tool##*:}"
+    fi
+done
+unset _kubed_tool
@@ -0,0 +1,659 @@
+"""
+`kubed daemon`: a resident process that answers Kubernetes queries from
+watch-backed caches over a Unix socket in ~/.kubed.
+
+The daemon keeps one warm API client per kubeconfig context. The first query
+for a resource kind in a context starts an informer-style cache for it: a
+paginated LIST followed by a WATCH from the returned resourceVersion, with a
+re-list whenever the watch expires. Later queries are answered from memory.
+
+Each cache is bounded (object count and bytes); a cache that outgrows its
+bounds drops its contents and its queries are served by a direct LIST
+instead. Contexts that receive no queries for a while are evicted, closing
+their watches and connections.
+
+The protocol is one JSON request per line and one JSON response per line.
+The client half of this module only imports the standard library, so
+`kubed k8s get` can ask the daemon without loading the kubernetes client.
+"""
+
+import json
+import os
+import socket
+import sys
+import time
+
+from kubed.cache import get_kubed_dir
+
+DEFAULT_IDLE_TIMEOUT = 15 * 60
+DEFAULT_MAX_OBJECTS = 50000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+SYNC_TIMEOUT = 10
+WATCH_TIMEOUT = 300
+LIST_PAGE_SIZE = 500
+
+def get_socket_path():
+    """Get the path of the daemon's Unix socket."""
+    return os.environ.get('KUBED_DAEMON_SOCKET') or os.path.join(get_kubed_dir(), 'daemon.sock')
+
+def send_request(payload, timeout=5.0):
+    """Send one request to the daemon.
+
+    Returns:
+        dict: The decoded response, or None if the daemon is not running.
+    """
+    path = get_socket_path()
+    if not os.path.exists(path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(path)
+            sock.sendall(json.dumps(payload).encode() + b'\n')
+            chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                if chunk.endswith(b'\n'):
+                    break
+        return json.loads(b''.join(chunks))
+    except (OSError, ValueError):
+        return None
+
+def query_daemon(resource, namespace=None, all_namespaces=False, selector=None, names=(), context=None):
+    """Ask the daemon for objects of a resource kind.
+
+    The context (and, for no namespace, its namespace) is resolved here
+    rather than by the daemon, which may have been started with another
+    KUBECONFIG.
+
+    Returns:
+        list: Matching objects, or None if the daemon is not running or could
+        not answer (the caller should then query the API server itself).
+    """
+    from kubed.kubeconfig import load_index
+
+    if not os.path.exists(get_socket_path()):
+        return None
+    index = load_index()
+    context = context or index.current
+    if context not in index.contexts:
+        return None
+    if not namespace and not all_namespaces:
+        namespace = index.namespaces()[context]
+    response = send_request({
+        'op': 'get',
+        'context': context,
+        'resource': resource,
+        'namespace': namespace,
+        'all_namespaces': all_namespaces,
+        'selector': selector,
+        'names': list(names),
+    })
+    if not response or not response.get('ok'):
+        return None
+    items = response['items']
+    # A name the cache has not seen yet may have just been created; let the API server decide
+    if names and len(items) != len(names):
+        return None
+    return items
+
+def parse_selector(selector):
+    """Parse an equality-based label selector ('a=b,c!=d,e,!f').
+
+    Returns:
+        list: (key, operator, value) requirements, or None if the selector uses
+        set-based syntax the cache does not evaluate.
+    """
+    requirements = []
+    for term in filter(None, (t.strip() for t in (selector or '').split(','))):
+        if '(' in term or ' in ' in term or ' notin ' in term:
+            return None
+        if '!=' in term:
+            key, value = term.split('!=', 1)
+            requirements.append((key.strip(), '!=', value.strip()))
+        elif '=' in term:
+            key, value = term.split('==', 1) if '==' in term else term.split('=', 1)
+            requirements.append((key.strip(), '=', value.strip()))
+        elif term.startswith('!'):
+            requirements.append((term[1:].strip(), '!', None))
+        else:
+            requirements.append((term, 'exists', None))
+    return requirements
+
+def match_labels(labels, requirements):
+    """Check object labels against parsed selector requirements."""
+    for key, operator, value in requirements:
+        if operator == '=' and labels.get(key) != value:
+            return False
+        if operator == '!=' and labels.get(key) == value:
+            return False
+        if operator == 'exists' and key not in labels:
+            return False
+        if operator == '!' and key in labels:
+            return False
+    return True
+
+def slim_object(obj):
+    """Drop the fields no query needs, to keep cached objects small."""
+    metadata = obj.get('metadata', {})
+    metadata.pop('managedFields', None)
+    annotations = metadata.get('annotations')
+    if annotations:
+        annotations.pop('kubectl.kubernetes.io/last-applied-configuration', None)
+    return obj
+
+class WatchCache:
+    """An informer-style cache of one resource kind in one context."""
+
+    def __init__(self, api_client, resource, max_objects=DEFAULT_MAX_OBJECTS, max_bytes=DEFAULT_MAX_BYTES):
+        import threading
+        from kubernetes import client
+        from kubed.k8s import RESOURCES
+
+        spec = RESOURCES[resource]
+        self.resource = resource
+        self.kind = spec['kind']
+        self.api_version = spec['api_version']
+        api = getattr(client, spec['api'])(api_client)
+        self.list_func = getattr(api, spec['list_all'] if spec['namespaced'] else spec['list'])
+        self.max_objects = max_objects
+        self.max_bytes = max_bytes
+
+        # (namespace, name) -> (labels, compact JSON of the object)
+        self.objects = {}
+        self.bytes = 0
+        self.resource_version = None
+        self.overflow = False
+        self.error = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.synced = threading.Event()
+        # Set once the first LIST has finished, failed or overflowed
+        self.settled = threading.Event()
+        self.waited = False
+        self.stopped = threading.Event()
+        self._response = None
+        self.thread = threading.Thread(target=self.run, name=f'watch-{resource}', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop the watch and release its connection."""
+        self.stopped.set()
+        response = self._response
+        # Closing the response would wait for the reading thread; shutting the socket down wakes it
+        sock = getattr(getattr(response, 'connection', None), 'sock', None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def run(self):
+        """List and watch until stopped, re-listing when the watch expires."""
+        backoff = 1
+        while not self.stopped.is_set():
+            try:
+                self.relist()
+                backoff = 1
+                self.watch()
+            except Exception as e:
+                if self.stopped.is_set():
+                    break
+                self.error = str(e)
+                self.settled.set()
+                self.stopped.wait(backoff)
+                backoff = min(backoff * 2, 60)
+
+    def _encode(self, obj):
+        """Get an object's cache key and entry: (namespace, name), (labels, compact JSON)."""
+        slim_object(obj)
+        obj.setdefault('kind', self.kind)
+        obj.setdefault('apiVersion', self.api_version)
+        metadata = obj.get('metadata', {})
+        key = (metadata.get('namespace', ''), metadata.get('name', ''))
+        return key, (metadata.get('labels') or {}, json.dumps(obj, separators=(',', ':')))
+
+    def _store(self, obj):
+        """Add or replace an object; caller holds the lock."""
+        key, entry = self._encode(obj)
+        previous = self.objects.get(key)
+        if previous:
+            self.bytes -= len(previous[1])
+        self.objects[key] = entry
+        self.bytes += len(entry[1])
+
+    def _remove(self, obj):
+        """Remove an object; caller holds the lock."""
+        metadata = obj.get('metadata', {})
+        previous = self.objects.pop((metadata.get('namespace', ''), metadata.get('name', '')), None)
+        if previous:
+            self.bytes -= len(previous[1])
+
+    def _over_bounds(self, count, size):
+        return count > self.max_objects or size > self.max_bytes
+
+    def _overflow(self):
+        """Give up on caching once the cache outgrows its bounds; caller holds the lock."""
+        self.objects = {}
+        self.bytes = 0
+        self.overflow = True
+        self.stopped.set()
+        self.settled.set()
+
+    def _check_bounds(self):
+        """Overflow if the cache outgrew its bounds; caller holds the lock."""
+        if self._over_bounds(len(self.objects), self.bytes):
+            self._overflow()
+
+    def relist(self):
+        """Replace the cache contents with a fresh paginated LIST.
+
+        The pages are collected aside and swapped in only after the last one,
+        so queries keep seeing the previous complete contents meanwhile, and
+        still see them if the LIST fails.
+        """
+        objects, size = {}, 0
+        continue_token = None
+        while True:
+            kwargs = {'limit': LIST_PAGE_SIZE, '_preload_content': False}
+            if continue_token:
+                kwargs['_continue'] = continue_token
+            page = json.loads(self.list_func(**kwargs).data)
+            for item in page.get('items', []):
+                key, entry = self._encode(item)
+                previous = objects.get(key)
+                if previous:
+                    size -= len(previous[1])
+                objects[key] = entry
+                size += len(entry[1])
+            if self._over_bounds(len(objects), size):
+                with self.lock:
+                    self._overflow()
+                return
+            continue_token = page.get('metadata', {}).get('continue')
+            if not continue_token:
+                break
+        with self.lock:
+            self.objects = objects
+            self.bytes = size
+            self.resource_version = page.get('metadata', {}).get('resourceVersion')
+        self.error = None
+        self.synced.set()
+        self.settled.set()
+
+    def watch(self):
+        """Apply watch events until the watch expires (then the caller re-lists)."""
+        from kubed.k8s import iter_lines
+
+        while not self.stopped.is_set():
+            self._response = self.list_func(watch=True, resource_version=self.resource_version,
+                                            allow_watch_bookmarks=True, timeout_seconds=WATCH_TIMEOUT,
+                                            _preload_content=False)
+            try:
+                for line in iter_lines(self._response):
+                    if not line.strip():
+                        continue
+                    event = json.loads(line)
+                    obj = event.get('object', {})
+                    if event.get('type') == 'ERROR':
+                        # 410 Gone: our resourceVersion is too old, re-list
+                        return
+                    version = obj.get('metadata', {}).get('resourceVersion')
+                    if version:
+                        self.resource_version = version
+                    if event.get('type') == 'BOOKMARK':
+                        continue
+                    with self.lock:
+                        if event.get('type') == 'DELETED':
+                            self._remove(obj)
+                        else:
+                            self._store(obj)
+                            self._check_bounds()
+                    if self.overflow:
+                        return
+            finally:
+                self._response.release_conn()
+                self._response = None
+
+    def ready(self):
+        """Whether queries can be answered from the cache.
+
+        Only the first query waits for the first LIST, up to SYNC_TIMEOUT,
+        and not past a failed LIST; later queries go to the API server
+        until the cache has synced.
+        """
+        if not self.waited:
+            self.waited = True
+            self.settled.wait(SYNC_TIMEOUT)
+        return self.synced.is_set() and not self.overflow
+
+    def query(self, namespace=None, requirements=(), names=()):
+        """Get the compact JSON of matching objects."""
+        with self.lock:
+            results = []
+            for (object_namespace, name), (labels, encoded) in self.objects.items():
+                if namespace is not None and object_namespace != namespace:
+                    continue
+                if names and name not in names:
+                    continue
+                if requirements and not match_labels(labels, requirements):
+                    continue
+                results.append((object_namespace, name, encoded))
+        results.sort()
+        return [encoded for _, _, encoded in results]
+
+    def count(self, hit):
+        """Count a query answered from the cache (hit) or by a direct LIST."""
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        """Get the size and hit rate of this cache."""
+        with self.lock:
+            objects, size, hits, misses = len(self.objects), self.bytes, self.hits, self.misses
+        total = hits + misses
+        return {
+            'objects': objects,
+            'bytes': size,
+            'synced': self.synced.is_set(),
+            'overflow': self.overflow,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / total, 3) if total else None,
+            'error': self.error,
+        }
+
+class ContextState:
+    """The warm API client and caches of one kubeconfig context."""
+
+    def __init__(self, name, kubeconfig=None, max_objects=DEFAULT_MAX_OBJECTS, max_bytes=DEFAULT_MAX_BYTES):
+        import threading
+        from kubed.k8s import new_api_client
+
+        self.name = name
+        self.api_client = new_api_client(name, kubeconfig)
+        self.max_objects = max_objects
+        self.max_bytes = max_bytes
+        self.caches = {}
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+    def cache(self, resource):
+        """Get the cache for a resource kind, starting it on first use."""
+        self.last_used = time.monotonic()
+        with self.lock:
+            cache = self.caches.get(resource)
+            if cache is None or (cache.overflow is False and cache.stopped.is_set()):
+                cache = WatchCache(self.api_client, resource, self.max_objects, self.max_bytes)
+                self.caches[resource] = cache
+            return cache
+
+    def close(self):
+        """Stop every watch and close the connection pool."""
+        for cache in self.caches.values():
+            cache.stop()
+        try:
+            self.api_client.close()
+        except Exception:
+            pass
+
+class KubedDaemon:
+    """Routes socket requests to per-context caches and evicts idle contexts."""
+
+    def __init__(self, kubeconfig=None, idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 max_objects=DEFAULT_MAX_OBJECTS, max_bytes=DEFAULT_MAX_BYTES):
+        import threading
+
+        self.kubeconfig = kubeconfig
+        self.idle_timeout = idle_timeout
+        self.max_objects = max_objects
+        self.max_bytes = max_bytes
+        self.contexts = {}
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self._kubeconfig_stamp = None
+        self._kubeconfig_info = None
+
+    def _kubeconfig_paths(self):
+        paths = self.kubeconfig or os.environ.get('KUBECONFIG') or os.path.expanduser('~/.kube/config')
+        return [p for p in paths.split(os.pathsep) if p]
+
+    def context_info(self, context=None):
+        """Resolve a context name and its default namespace, re-reading the kubeconfig only when it changed."""
+        stamp = []
+        for path in self._kubeconfig_paths():
+            try:
+                stamp.append((path, os.stat(path).st_mtime_ns))
+            except OSError:
+                stamp.append((path, None))
+        if stamp != self._kubeconfig_stamp:
+            from kubed.kubeconfig import load_index
+
+            index = load_index(self.kubeconfig)
+            self._kubeconfig_info = (index.current, index.namespaces())
+            self._kubeconfig_stamp = stamp
+        active, namespaces = self._kubeconfig_info
+        name = context or active
+        if name not in namespaces:
+            raise ValueError(f"context '{name}' not found in kubeconfig")
+        return name, namespaces[name]
+
+    def context(self, name):
+        """Get the state of a context, connecting on first use."""
+        with self.lock:
+            state = self.contexts.get(name)
+            if state is None:
+                state = ContextState(name, self.kubeconfig, self.max_objects, self.max_bytes)
+                self.contexts[name] = state
+            return state
+
+    def evict_idle(self):
+        """Close contexts that have not been queried within the idle timeout."""
+        now = time.monotonic()
+        with self.lock:
+            idle = [self.contexts.pop(name) for name, state in list(self.contexts.items())
+                    if now - state.last_used > self.idle_timeout]
+        for state in idle:
+            state.close()
+        return [state.name for state in idle]
+
+    def handle_get(self, request):
+        from kubed.k8s import RESOURCES, list_objects
+
+        resource = request['resource']
+        if resource not in RESOURCES:
+            raise ValueError(f"unsupported resource type '{resource}'")
+        context, default_namespace = self.context_info(request.get('context'))
+        namespace = None
+        if RESOURCES[resource]['namespaced'] and not request.get('all_namespaces'):
+            namespace = request.get('namespace') or default_namespace
+        names = set(request.get('names') or ())
+        requirements = parse_selector(request.get('selector'))
+
+        state = self.context(context)
+        cache = state.cache(resource)
+        if requirements is not None and cache.ready():
+            cache.count(hit=True)
+            return '{"ok":true,"items":[' + ','.join(cache.query(namespace, requirements, names)) + ']}'
+
+        # Set-based selector, overflowing cache or not synced yet: LIST directly over the warm client
+        cache.count(hit=False)
+        items = list_objects(resource, namespace, namespace is None, request.get('selector'), context,
+                             api_client=state.api_client)
+        if names:
+            items = [item for item in items if item['metadata']['name'] in names]
+        return json.dumps({'ok': True, 'items': items})
+
+    def handle_stats(self):
+        with self.lock:
+            contexts = dict(self.contexts)
+        now = time.monotonic()
+        return json.dumps({
+            'ok': True,
+            'pid': os.getpid(),
+            'uptime_seconds': int(time.time() - self.started),
+            'idle_timeout_seconds': self.idle_timeout,
+            'contexts': {
+                name: {
+                    'idle_seconds': int(now - state.last_used),
+                    'caches': {resource: cache.stats() for resource, cache in state.caches.items()},
+                }
+                for name, state in contexts.items()
+            },
+        })
+
+    def handle(self, request):
+        """Answer one request.
+
+        Returns:
+            str: The JSON response line (without the newline).
+        """
+        op = request.get('op')
+        try:
+            if op == 'get':
+                return self.handle_get(request)
+            if op == 'stats':
+                return self.handle_stats()
+            if op == 'ping':
+                return json.dumps({'ok': True, 'pid': os.getpid()})
+            raise ValueError(f"unknown op '{op}'")
+        except Exception as e:
+            return json.dumps({'ok': False, 'error': str(e)})
+
+    def close(self):
+        with self.lock:
+            for state in self.contexts.values():
+                state.close()
+            self.contexts.clear()
+
+def serve(kubeconfig=None, idle_timeout=DEFAULT_IDLE_TIMEOUT, max_objects=DEFAULT_MAX_OBJECTS,
+          max_bytes=DEFAULT_MAX_BYTES):
+    """Run the daemon in the foreground until it is told to shut down."""
+    import socketserver
+    import threading
+
+    # Pay for importing the kubernetes client once, at startup, not on the first query
+    import kubernetes.client  # noqa: F401
+
+    daemon = KubedDaemon(kubeconfig, idle_timeout, max_objects, max_bytes)
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    response = json.dumps({'ok': False, 'error': 'invalid JSON'})
+                else:
+                    if request.get('op') == 'shutdown':
+                        self.wfile.write(b'{"ok":true}\n')
+                        threading.Thread(target=self.server.shutdown, daemon=True).start()
+                        return
+                    response = daemon.handle(request)
+                self.wfile.write(response.encode() + b'\n')
+
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    path = get_socket_path()
+    if send_request({'op': 'ping'}, timeout=1) is not None:
+        raise RuntimeError(f"kubed daemon is already running on {path}")
+    if os.path.exists(path):
+        os.unlink(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    old_umask = os.umask(0o077)
+    try:
+        server = Server(path, Handler)
+    finally:
+        os.umask(old_umask)
+
+    def reap():
+        while True:
+            time.sleep(max(1, min(30, idle_timeout / 4)))
+            daemon.evict_idle()
+
+    threading.Thread(target=reap, name='evict-idle', daemon=True).start()
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        daemon.close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+def daemon_start_command(foreground=False, kubeconfig=None, idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                         max_objects=DEFAULT_MAX_OBJECTS, max_bytes=DEFAULT_MAX_BYTES):
+    """Start the daemon, in the background unless foreground is set."""
+    import subprocess
+    import click
+
+    if send_request({'op': 'ping'}, timeout=1) is not None:
+        click.echo(f"kubed daemon is already running on {get_socket_path()}")
+        return
+
+    if foreground:
+        try:
+            serve(kubeconfig, idle_timeout, max_objects, max_bytes)
+        except RuntimeError as e:
+            click.echo(str(e), err=True)
+            sys.exit(1)
+        return
+
+    argv = [sys.executable, '-m', 'kubed', 'daemon', 'start', '--foreground',
+            '--idle-timeout', str(idle_timeout), '--max-objects', str(max_objects),
+            '--max-bytes', str(max_bytes)]
+    if kubeconfig:
+        argv += ['--kubeconfig', kubeconfig]
+    log_path = os.path.join(get_kubed_dir(), 'daemon.log')
+    os.makedirs(get_kubed_dir(), exist_ok=True)
+    with open(log_path, 'ab') as log:
+        subprocess.Popen(argv, stdin=subprocess.DEVNULL, stdout=log, stderr=log, start_new_session=True)
+
+    for _ in range(50):
+        if send_request({'op': 'ping'}, timeout=1) is not None:
+            click.echo(f"✅ kubed daemon started on {get_socket_path()}")
+            return
+        time.sleep(0.1)
+    click.echo(f"❌ kubed daemon did not start, see {log_path}", err=True)
+    sys.exit(1)
+
+def daemon_stop_command():
+    """Ask a running daemon to shut down."""
+    import click
+
+    if send_request({'op': 'shutdown'}, timeout=2) is None:
+        click.echo("kubed daemon is not running.", err=True)
+        sys.exit(1)
+    click.echo("✅ kubed daemon stopped")
+
+def daemon_stats_command(json_output=False):
+    """Show cache sizes and hit rates of a running daemon."""
+    import click
+
+    stats = send_request({'op': 'stats'})
+    if stats is None:
+        click.echo("kubed daemon is not running.", err=True)
+        sys.exit(1)
+    if json_output:
+        click.echo(json.dumps(stats, indent=2))
+        return
+
+    click.echo(f"kubed daemon pid {stats['pid']}, up {stats['uptime_seconds']}s, "
+               f"idle contexts evicted after {stats['idle_timeout_seconds']}s\n")
+    click.echo(f"{'CONTEXT':<24}{'RESOURCE':<13}{'OBJECTS':>9}{'KB':>9}{'HITS':>7}{'MISSES':>8}{'HIT RATE':>10}  STATE")
+    for name, context in stats['contexts'].items():
+        for resource, cache in context['caches'].items():
+            rate = '-' if cache['hit_rate'] is None else f"{cache['hit_rate']:.0%}"
+            state = 'overflow' if cache['overflow'] else ('synced' if cache['synced'] else 'syncing')
+            if cache['error']:
+                state += f" ({cache['error'][:40]})"
+            click.echo(f"{name[:23]:<24}{resource:<13}{cache['objects']:>9}{cache['bytes'] // 1024:>9}"
+                       f"{cache['hits']:>7}{cache['misses']:>8}{rate:>10}  {state}")
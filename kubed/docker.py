@@ -0,0 +1,528 @@
+"""
+Bulk Docker commands built on the Docker SDK.
+
+`kubed docker rm/stop/rmi/prune` select containers or images by name or by
+filter expressions and act on them concurrently over one pooled API client,
+reporting each result as it completes. Any other subcommand is handed to the
+docker CLI.
+
+Shell completion of container, image, network and volume names reads a
+cache in ~/.kubed/cache/docker that a background watcher keeps current from
+the Docker events stream (see NameCache); it only lists everything again
+when it starts or the stream breaks.
+
+Filter expressions (repeat --filter to AND them):
+
+    label=KEY            label=KEY=VALUE      label!=KEY[=VALUE]
+    age>DURATION         age<DURATION         (DURATION like 30m, 12h, 7d)
+    dangling=true|false  status=exited        name=GLOB
+"""
+
+import fnmatch
+import os
+import re
+import sys
+import time
+
+import click
+
+from kubed.cache import atomic_write, get_cache_dir
+
+DEFAULT_CONCURRENCY = 8
+
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}
+
+FILTER_PATTERN = re.compile(r'^(label|age|dangling|status|name)\s*(!=|=|>|<)\s*(.+)$')
+
+# One API client, and so one pool of keep-alive connections to the Docker socket
+_client = None
+
+def get_api_client(max_pool_size=DEFAULT_CONCURRENCY):
+    """Get the shared low-level Docker API client."""
+    global _client
+    if _client is None:
+        import docker
+
+        _client = docker.from_env(max_pool_size=max_pool_size).api
+    return _client
+
+def parse_duration(value):
+    """Parse a duration such as '90s', '30m', '12h' or '7d' into seconds."""
+    match = re.fullmatch(r'(\d+)([smhdw])', value.strip())
+    if not match:
+        raise click.BadParameter(f"invalid duration '{value}', expected e.g. 30m, 12h or 7d", param_hint='--filter')
+    return int(match.group(1)) * DURATION_UNITS[match.group(2)]
+
+def parse_filter(expression):
+    """Parse one filter expression into a (field, operator, value) tuple."""
+    match = FILTER_PATTERN.match(expression.strip())
+    if not match:
+        raise click.BadParameter(f"invalid filter '{expression}'", param_hint='--filter')
+    field, operator, value = match.groups()
+    allowed = {'label': ('=', '!='), 'age': ('>', '<'), 'dangling': ('=',), 'status': ('=', '!='),
+               'name': ('=', '!=')}
+    if operator not in allowed[field]:
+        raise click.BadParameter(f"'{field}' filters take {' or '.join(allowed[field])}", param_hint='--filter')
+    if field == 'age':
+        value = parse_duration(value)
+    elif field == 'dangling':
+        if value not in ('true', 'false'):
+            raise click.BadParameter("dangling must be true or false", param_hint='--filter')
+        value = value == 'true'
+    return field, operator, value
+
+def server_filters(filters):
+    """Translate the filters the Docker API can evaluate itself, to shrink list responses."""
+    result = {}
+    for field, operator, value in filters:
+        if field == 'label' and operator == '=':
+            result.setdefault('label', []).append(value)
+        elif field == 'dangling':
+            result['dangling'] = value
+        elif field == 'status' and operator == '=':
+            result.setdefault('status', []).append(value)
+    return result
+
+def prune_filters(filters):
+    """Translate filters into the filters of the prune endpoints."""
+    result = {}
+    for field, operator, value in filters:
+        if field == 'label':
+            result.setdefault('label' if operator == '=' else 'label!', []).append(value)
+        elif field == 'age' and operator == '>':
+            result['until'] = f'{value}s'
+        elif field == 'dangling':
+            result['dangling'] = value
+        else:
+            raise click.BadParameter(f"prune does not support '{field}{operator}' filters", param_hint='--filter')
+    return result
+
+def _label_matches(labels, value):
+    key, _, expected = value.partition('=')
+    return key in labels and (not expected or labels[key] == expected)
+
+def matches(obj, filters, now=None):
+    """Check a container or image summary from the list endpoints against filters."""
+    now = now or time.time()
+    labels = obj.get('Labels') or {}
+    names = [n.lstrip('/') for n in obj.get('Names') or []] + list(obj.get('RepoTags') or [])
+    dangling = 'RepoTags' in obj and (not obj['RepoTags'] or obj['RepoTags'] == ['<none>:<none>'])
+    for field, operator, value in filters:
+        if field == 'label':
+            result = _label_matches(labels, value)
+        elif field == 'age':
+            age = now - obj.get('Created', now)
+            result = age > value if operator == '>' else age < value
+        elif field == 'dangling':
+            result = dangling == value
+        elif field == 'status':
+            result = obj.get('State') == value
+        else:
+            result = any(fnmatch.fnmatch(name, value) for name in names)
+        if operator == '!=':
+            result = not result
+        if not result:
+            return False
+    return True
+
+def display_name(obj):
+    """Get a readable name for a container or image summary."""
+    if obj.get('Names'):
+        return obj['Names'][0].lstrip('/')
+    tags = [t for t in obj.get('RepoTags') or [] if t != '<none>:<none>']
+    return tags[0] if tags else obj['Id'].split(':')[-1][:12]
+
+def select_containers(names, filters, include_stopped=True):
+    """Get the containers named, or matching the filters."""
+    api = get_api_client()
+    if names:
+        return [{'Id': name, 'Names': [name]} for name in names]
+    containers = api.containers(all=include_stopped, filters=server_filters(filters))
+    now = time.time()
+    return [c for c in containers if matches(c, filters, now)]
+
+def select_images(names, filters):
+    """Get the images named, or matching the filters."""
+    api = get_api_client()
+    if names:
+        return [{'Id': name, 'RepoTags': [name]} for name in names]
+    images = api.images(all=False, filters=server_filters(filters))
+    now = time.time()
+    return [i for i in images if matches(i, filters, now)]
+
+def run_bulk(action, label, objects, concurrency=DEFAULT_CONCURRENCY):
+    """Apply an action to objects concurrently, printing each result as it completes.
+
+    Args:
+        action: Function called with an object's Id.
+        label (str): Past-tense verb for the progress lines, e.g. 'removed'.
+        objects (list): Container or image summaries.
+        concurrency (int): Maximum concurrent API calls.
+
+    Returns:
+        bool: True if every action succeeded.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    if not objects:
+        click.echo('Nothing matched.', err=True)
+        return True
+
+    total = len(objects)
+    width = len(str(total))
+    failed = 0
+    started = time.monotonic()
+
+    def timed(obj):
+        begin = time.monotonic()
+        action(obj['Id'])
+        return time.monotonic() - begin
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, total))) as pool:
+        futures = {pool.submit(timed, obj): obj for obj in objects}
+        for done, future in enumerate(as_completed(futures), 1):
+            name = display_name(futures[future])
+            try:
+                elapsed = future.result()
+            except Exception as e:
+                failed += 1
+                message = getattr(e, 'explanation', None) or str(e)
+                click.echo(f"[{done:>{width}}/{total}] ❌ {name}: {message}", err=True)
+            else:
+                click.echo(f"[{done:>{width}}/{total}] ✅ {label} {name} ({elapsed:.1f}s)")
+
+    click.echo(f"{total - failed} {label}, {failed} failed in {time.monotonic() - started:.1f}s")
+    return not failed
+
+# Kinds of names offered by shell completion, one cache file each
+NAME_KINDS = ('containers', 'images', 'networks', 'volumes')
+# The watcher exits once completion has not been used for this long
+NAMES_IDLE_TIMEOUT = 1800
+
+def get_names_dir():
+    """Get the directory of the name caches for the Docker host in use, as the shell finds it."""
+    return get_cache_dir('docker', (os.environ.get('DOCKER_HOST') or 'default').replace('/', '%2F'))
+
+class NameCache:
+    """Names of Docker objects for shell completion, kept current from the events stream.
+
+    Containers are written as `name<TAB>state` lines so completion can offer
+    only running or stopped ones; the other kinds as one name per line.
+    """
+
+    def __init__(self, api, directory):
+        import threading
+
+        self.api = api
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.containers = {}
+        self.names = {'images': set(), 'networks': set(), 'volumes': set()}
+        self.dirty = set()
+        self.images_stale = False
+
+    def resync(self, kinds=NAME_KINDS):
+        """List every object of some kinds again, replacing what is cached."""
+        listed = {}
+        if 'containers' in kinds:
+            listed['containers'] = {c['Names'][0].lstrip('/'): c.get('State', '')
+                                    for c in self.api.containers(all=True) if c.get('Names')}
+        if 'images' in kinds:
+            listed['images'] = {tag for image in self.api.images() for tag in image.get('RepoTags') or []
+                                if tag != '<none>:<none>'}
+        if 'networks' in kinds:
+            listed['networks'] = {network['Name'] for network in self.api.networks()}
+        if 'volumes' in kinds:
+            listed['volumes'] = {volume['Name'] for volume in self.api.volumes().get('Volumes') or []}
+        with self.lock:
+            for kind, names in listed.items():
+                if kind == 'containers':
+                    self.containers = names
+                else:
+                    self.names[kind] = names
+                self.dirty.add(kind)
+
+    def apply(self, event):
+        """Update the cached names from one event."""
+        kind, action = event.get('Type'), (event.get('Action') or '').split(':')[0]
+        actor = event.get('Actor') or {}
+        attributes = actor.get('Attributes') or {}
+        with self.lock:
+            if kind == 'container' and attributes.get('name'):
+                name = attributes['name']
+                if action == 'destroy':
+                    self.containers.pop(name, None)
+                elif action == 'rename':
+                    self.containers[name] = self.containers.pop(attributes.get('oldName', '').lstrip('/'), 'running')
+                else:
+                    states = {'create': 'created', 'start': 'running', 'unpause': 'running', 'pause': 'paused',
+                              'die': 'exited', 'stop': 'exited', 'kill': None}
+                    if action not in states:
+                        return
+                    self.containers[name] = states[action] or self.containers.get(name, 'running')
+                self.dirty.add('containers')
+            elif kind == 'image':
+                tag = attributes.get('name') or actor.get('ID', '')
+                if action in ('pull', 'tag') and ':' in tag and not tag.startswith('sha256:'):
+                    self.names['images'].add(tag)
+                    self.dirty.add('images')
+                elif action in ('untag', 'delete', 'import', 'load', 'prune'):
+                    # These events do not say which tags went away or came in; list the images again
+                    self.images_stale = True
+            elif kind == 'network' and action in ('create', 'destroy') and attributes.get('name'):
+                (self.names['networks'].add if action == 'create' else self.names['networks'].discard)(
+                    attributes['name'])
+                self.dirty.add('networks')
+            elif kind == 'volume' and action in ('create', 'destroy') and actor.get('ID'):
+                (self.names['volumes'].add if action == 'create' else self.names['volumes'].discard)(actor['ID'])
+                self.dirty.add('volumes')
+
+    def flush(self):
+        """Write the cache files of the kinds that changed."""
+        if self.images_stale:
+            self.images_stale = False
+            self.resync(('images',))
+        with self.lock:
+            dirty, self.dirty = self.dirty, set()
+            contents = {}
+            for kind in dirty:
+                if kind == 'containers':
+                    contents[kind] = ''.join(f'{name}\t{state}\n' for name, state in sorted(self.containers.items()))
+                else:
+                    contents[kind] = ''.join(f'{name}\n' for name in sorted(self.names[kind]))
+        for kind, content in contents.items():
+            atomic_write(os.path.join(self.directory, kind), content)
+
+    def follow(self):
+        """Resync, then apply events until the stream breaks."""
+        # Events since just before the listing are replayed, so nothing between the two is lost
+        since = int(time.time()) - 1
+        self.resync()
+        self.flush()
+        for event in self.api.events(since=since, decode=True,
+                                     filters={'type': ['container', 'image', 'network', 'volume']}):
+            self.apply(event)
+
+    def run(self, idle_timeout=NAMES_IDLE_TIMEOUT):
+        """Keep the cache current until completion has not been used for idle_timeout seconds."""
+        import threading
+
+        def flusher():
+            while True:
+                time.sleep(0.2)
+                try:
+                    self.flush()
+                except Exception:
+                    pass
+                try:
+                    idle = time.time() - os.stat(os.path.join(self.directory, 'used')).st_mtime
+                except OSError:
+                    idle = 0
+                if idle > idle_timeout:
+                    os._exit(0)
+
+        threading.Thread(target=flusher, daemon=True).start()
+        while True:
+            try:
+                self.follow()
+            except Exception:
+                pass
+            # The stream ended or failed (e.g. the daemon restarted): start over with a full resync
+            time.sleep(1)
+
+def watch_names(idle_timeout=NAMES_IDLE_TIMEOUT):
+    """Run the name cache watcher for the current Docker host, unless one is already running."""
+    import fcntl
+    import signal
+
+    directory = get_names_dir()
+    lock = open(os.path.join(directory, 'watcher.lock'), 'w')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    # Outlive the shell that started it
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    try:
+        os.setsid()
+    except OSError:
+        pass
+    atomic_write(os.path.join(directory, 'watcher.pid'), f'{os.getpid()}\n')
+    # Counts as used now, so a watcher started by hand does not exit at once
+    open(os.path.join(directory, 'used'), 'w').close()
+    NameCache(get_api_client(), directory).run(idle_timeout)
+
+def completions_docker_command(kind=None, watch=False, idle_timeout=NAMES_IDLE_TIMEOUT):
+    """Print cached Docker names, or run the watcher that keeps them current.
+
+    Args:
+        kind (str): One of NAME_KINDS to print.
+        watch (bool): If True, run the watcher (used by the shell in the background).
+        idle_timeout (int): Seconds without completion before the watcher exits.
+    """
+    if watch:
+        watch_names(idle_timeout)
+        return
+    path = os.path.join(get_names_dir(), kind)
+    if not os.path.exists(path):
+        # No watcher has filled the cache yet: list once
+        cache = NameCache(get_api_client(), get_names_dir())
+        handle_docker_errors(cache.resync)()
+        cache.flush()
+    with open(path) as f:
+        for line in f:
+            click.echo(line.rstrip('\n').split('\t')[0])
+
+def handle_docker_errors(func):
+    """Turn Docker connection errors into a message and exit status 1."""
+    import functools
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        from docker.errors import DockerException
+
+        try:
+            return func(*args, **kwargs)
+        except DockerException as e:
+            click.echo(f"Error talking to Docker: {e}", err=True)
+            sys.exit(1)
+    return wrapper
+
+def _check_selection(names, filters, all_):
+    if not names and not filters and not all_:
+        raise click.UsageError('give names, --filter expressions or --all')
+
+filter_option = click.option('--filter', 'filters', multiple=True, callback=lambda ctx, param, values:
+                             [parse_filter(v) for v in values],
+                             help='Filter expression, e.g. label=app=web, age>7d, dangling=true (repeatable).')
+concurrency_option = click.option('--concurrency', default=DEFAULT_CONCURRENCY, show_default=True,
+                                  help='Maximum concurrent API calls.')
+dry_run_option = click.option('--dry-run', is_flag=True, help='Only list what would be affected.')
+
+@click.group()
+def docker():
+    """Bulk Docker commands on the Docker SDK (other subcommands run docker)."""
+    pass
+
+@docker.command()
+@click.argument('names', nargs=-1)
+@filter_option
+@click.option('--all', 'all_', is_flag=True, help='Select every container.')
+@click.option('-f', '--force', is_flag=True, help='Kill and remove running containers.')
+@click.option('-v', '--volumes', is_flag=True, help='Remove anonymous volumes too.')
+@concurrency_option
+@dry_run_option
+@handle_docker_errors
+def rm(names, filters, all_, force, volumes, concurrency, dry_run):
+    """Remove containers by name or filter, concurrently."""
+    _check_selection(names, filters, all_)
+    api = get_api_client(concurrency)
+    containers = select_containers(names, filters)
+    if dry_run:
+        for container in containers:
+            click.echo(display_name(container))
+        return
+    if not run_bulk(lambda cid: api.remove_container(cid, v=volumes, force=force), 'removed',
+                    containers, concurrency):
+        sys.exit(1)
+
+@docker.command()
+@click.argument('names', nargs=-1)
+@filter_option
+@click.option('--all', 'all_', is_flag=True, help='Select every running container.')
+@click.option('-t', '--time', 'timeout', default=10, show_default=True, help='Seconds to wait before killing.')
+@concurrency_option
+@dry_run_option
+@handle_docker_errors
+def stop(names, filters, all_, timeout, concurrency, dry_run):
+    """Stop running containers by name or filter, concurrently."""
+    _check_selection(names, filters, all_)
+    api = get_api_client(concurrency)
+    containers = select_containers(names, filters, include_stopped=False)
+    if dry_run:
+        for container in containers:
+            click.echo(display_name(container))
+        return
+    if not run_bulk(lambda cid: api.stop(cid, timeout=timeout), 'stopped', containers, concurrency):
+        sys.exit(1)
+
+@docker.command()
+@click.argument('names', nargs=-1)
+@filter_option
+@click.option('--all', 'all_', is_flag=True, help='Select every image.')
+@click.option('-f', '--force', is_flag=True, help='Remove images used by stopped containers or with several tags.')
+@concurrency_option
+@dry_run_option
+@handle_docker_errors
+def rmi(names, filters, all_, force, concurrency, dry_run):
+    """Remove images by name or filter, concurrently."""
+    _check_selection(names, filters, all_)
+    api = get_api_client(concurrency)
+    images = select_images(names, filters)
+    if dry_run:
+        for image in images:
+            click.echo(display_name(image))
+        return
+    if not run_bulk(lambda iid: api.remove_image(iid, force=force), 'removed', images, concurrency):
+        sys.exit(1)
+
+@docker.command()
+@filter_option
+@click.option('--containers/--no-containers', default=True, show_default=True, help='Prune stopped containers.')
+@click.option('--images/--no-images', default=True, show_default=True, help='Prune dangling images.')
+@click.option('--networks/--no-networks', default=True, show_default=True, help='Prune unused networks.')
+@click.option('--volumes/--no-volumes', default=False, show_default=True, help='Prune unused volumes.')
+@handle_docker_errors
+def prune(filters, containers, images, networks, volumes):
+    """Prune unused containers, images, networks and volumes concurrently.
+
+    Only label, label!= and age> filters apply (plus dangling for images).
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    api_filters = prune_filters(filters)
+    dangling = api_filters.pop('dangling', None)
+    api = get_api_client()
+    jobs = {}
+    if containers:
+        jobs['containers'] = (api.prune_containers, 'ContainersDeleted', api_filters)
+    if images:
+        image_filters = dict(api_filters, dangling=True if dangling is None else dangling)
+        jobs['images'] = (api.prune_images, 'ImagesDeleted', image_filters)
+    if networks:
+        jobs['networks'] = (api.prune_networks, 'NetworksDeleted', api_filters)
+    if volumes:
+        volume_filters = {k: v for k, v in api_filters.items() if k != 'until'}
+        jobs['volumes'] = (api.prune_volumes, 'VolumesDeleted', volume_filters)
+
+    failed = False
+    with ThreadPoolExecutor(max_workers=max(1, len(jobs))) as pool:
+        futures = {pool.submit(func, filters=job_filters): (kind, key) for kind, (func, key, job_filters) in jobs.items()}
+        for future in as_completed(futures):
+            kind, key = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                click.echo(f"❌ {kind}: {getattr(e, 'explanation', None) or e}", err=True)
+                failed = True
+                continue
+            deleted = result.get(key) or []
+            reclaimed = result.get('SpaceReclaimed', 0) / (1024 * 1024)
+            click.echo(f"✅ {kind}: {len(deleted)} removed" + (f", {reclaimed:.1f} MB reclaimed" if reclaimed else ''))
+    if failed:
+        sys.exit(1)
+
+def docker_command(command):
+    """Run a kubed docker subcommand, handing anything else to docker.
+
+    Args:
+        command (tuple): The arguments after `kubed docker`.
+    """
+    args = list(command)
+    if args and not args[0].startswith('-') and args[0] not in docker.commands:
+        try:
+            os.execvp('docker', ['docker'] + args)
+        except FileNotFoundError:
+            click.echo("docker is not installed.", err=True)
+            sys.exit(1)
+    docker.main(args=args, prog_name='kubed docker')
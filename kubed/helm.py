@@ -0,0 +1,428 @@
+"""
+Helm commands served from a compact index of the repo caches.
+
+Helm keeps each repository's index in its cache directory as
+`<repo>-index.yaml`, often tens of MB, and re-parses it on every search.
+kubed converts each one once into a sorted, tab-separated file in
+~/.kubed/cache/helm (one line per chart version: name, version, appVersion,
+description) that is memory-mapped and searched in place; prefix lookups
+binary-search it. An index is rebuilt only when its index.yaml changes.
+`kubed helm releases` reads helm's release records (one secret per
+revision) with a label-selected, paginated LIST and decodes them in a worker
+pool, so listing hundreds of releases on many clusters does not wait on helm
+decoding them one after another.
+Any other `kubed helm` subcommand is handed to helm.
+"""
+
+import base64
+import gzip
+import json
+import mmap
+import os
+import re
+import sys
+
+import click
+
+from kubed.cache import atomic_write, get_cache_dir
+
+INDEX_HEADER = b'# kubed-helm-index 1 '
+RELEASES_PAGE_SIZE = 500
+RELEASE_HEADERS = ['NAME', 'NAMESPACE', 'REVISION', 'UPDATED', 'STATUS', 'CHART', 'APP VERSION']
+
+def get_repository_cache():
+    """Get helm's repository cache directory, as helm itself resolves it."""
+    if os.environ.get('HELM_REPOSITORY_CACHE'):
+        return os.environ['HELM_REPOSITORY_CACHE']
+    if os.environ.get('HELM_CACHE_HOME'):
+        return os.path.join(os.environ['HELM_CACHE_HOME'], 'repository')
+    if sys.platform == 'darwin':
+        return os.path.expanduser('~/Library/Caches/helm/repository')
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(cache_home, 'helm', 'repository')
+
+def get_charts_path():
+    """Get the path of the chart-name list read by shell completion."""
+    return os.path.join(get_cache_dir('helm'), 'charts.txt')
+
+def list_repo_indexes():
+    """Map each repository name to its index.yaml in helm's cache."""
+    cache = get_repository_cache()
+    try:
+        names = os.listdir(cache)
+    except OSError:
+        return {}
+    return {name[:-len('-index.yaml')]: os.path.join(cache, name)
+            for name in sorted(names) if name.endswith('-index.yaml')}
+
+def source_stamp(path):
+    """Identify a version of an index.yaml by its mtime and size."""
+    st = os.stat(path)
+    return f'{st.st_mtime_ns} {st.st_size}'.encode()
+
+def get_index_path(repo):
+    """Get the path of the compact index of a repository."""
+    return os.path.join(get_cache_dir('helm'), f'{repo}.idx')
+
+def index_is_current(repo, source):
+    """Check whether a repository's compact index was built from its current index.yaml."""
+    try:
+        with open(get_index_path(repo), 'rb') as f:
+            return f.readline() == INDEX_HEADER + source_stamp(source) + b'\n'
+    except OSError:
+        return False
+
+def _clean(value):
+    """Flatten a field so it fits on one tab-separated line."""
+    return ' '.join(str(value or '').split())
+
+def build_index(repo, source):
+    """Convert a repository's index.yaml into its compact index.
+
+    Returns:
+        int: Number of chart versions indexed.
+    """
+    import yaml
+
+    stamp = source_stamp(source)
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    with open(source, 'rb') as f:
+        data = yaml.load(f, Loader=loader) or {}
+
+    lines = []
+    entries = data.get('entries') or {}
+    # Sorted by name for binary search; versions keep the index order, newest first
+    for name in sorted(entries):
+        for version in entries[name] or []:
+            lines.append('\t'.join([f'{repo}/{name}', _clean(version.get('version')),
+                                    _clean(version.get('appVersion')), _clean(version.get('description'))]))
+    atomic_write(get_index_path(repo), INDEX_HEADER + stamp + b'\n' + ''.join(f'{line}\n' for line in lines).encode())
+    return len(lines)
+
+def update_indexes(force=False):
+    """Rebuild the compact indexes whose index.yaml changed and drop those of removed repositories.
+
+    Returns:
+        list: Repositories that were rebuilt.
+    """
+    repos = list_repo_indexes()
+    rebuilt = [repo for repo, source in repos.items() if force or not index_is_current(repo, source)]
+    for repo in rebuilt:
+        build_index(repo, repos[repo])
+
+    index_dir = get_cache_dir('helm')
+    removed = [name for name in os.listdir(index_dir) if name.endswith('.idx') and name[:-4] not in repos]
+    for name in removed:
+        os.unlink(os.path.join(index_dir, name))
+
+    if rebuilt or removed or not charts_are_current(repos):
+        names = []
+        for repo in repos:
+            with ChartIndex(repo) as index:
+                names.extend(index.chart_names())
+        # The first line tells the shell where to look for newer index.yaml files
+        atomic_write(get_charts_path(), get_repository_cache() + '\n' + ''.join(f'{name}\n' for name in names))
+    return rebuilt
+
+def charts_are_current(repos):
+    """Check that the chart-name list was written for this repository cache, after every compact index.
+
+    A run interrupted between rebuilding an index and writing the list, or a
+    changed HELM_REPOSITORY_CACHE, would otherwise leave it stale.
+    """
+    try:
+        with open(get_charts_path(), 'rb') as f:
+            if f.readline() != get_repository_cache().encode() + b'\n':
+                return False
+        written = os.stat(get_charts_path()).st_mtime_ns
+        return all(os.stat(get_index_path(repo)).st_mtime_ns <= written for repo in repos)
+    except OSError:
+        return False
+
+class ChartIndex:
+    """A memory-mapped compact index of one repository."""
+
+    def __init__(self, repo):
+        self.repo = repo
+        self._file = open(get_index_path(repo), 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        # Chart lines start after the header line
+        self.start = self.data.find(b'\n') + 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self._file.close()
+
+    def _line_at(self, pos):
+        """Get the (start, end) of the line containing pos."""
+        start = self.data.rfind(b'\n', self.start, pos) + 1 or self.start
+        end = self.data.find(b'\n', pos)
+        return max(start, self.start), len(self.data) if end < 0 else end
+
+    def _lower_bound(self, prefix):
+        """Binary-search the offset of the first line whose name is >= prefix."""
+        lo, hi = self.start, len(self.data)
+        while lo < hi:
+            start, end = self._line_at((lo + hi) // 2)
+            name_end = self.data.find(b'\t', start, end)
+            if self.data[start:name_end if name_end >= 0 else end] < prefix:
+                lo = end + 1
+            else:
+                hi = start
+        return lo
+
+    def versions(self, name):
+        """Get every version line of a chart, newest first, as (name, version, appVersion, description)."""
+        key = name.encode() + b'\t'
+        pos = self._lower_bound(name.encode())
+        rows = []
+        while self.data[pos:pos + len(key)] == key:
+            end = self.data.find(b'\n', pos)
+            rows.append(tuple(self.data[pos:end].decode().split('\t')))
+            pos = end + 1
+        return rows
+
+    def chart_names(self, prefix=''):
+        """Get the distinct chart names starting with prefix."""
+        pos = self._lower_bound(prefix.encode()) if prefix else self.start
+        names = []
+        while pos < len(self.data):
+            end = self.data.find(b'\n', pos)
+            name = self.data[pos:self.data.find(b'\t', pos, end)]
+            if not name.startswith(prefix.encode()):
+                break
+            if not names or names[-1] != name:
+                names.append(name)
+            pos = end + 1
+        return [name.decode() for name in names]
+
+    def search(self, pattern):
+        """Get the names of charts whose name or description matches a compiled bytes regex."""
+        matched = []
+        if pattern is None:
+            return self.chart_names()
+        for match in pattern.finditer(self.data, self.start):
+            start, end = self._line_at(match.start())
+            fields = self.data[start:end].split(b'\t')
+            if len(fields) == 4 and (pattern.search(fields[0]) or pattern.search(fields[3])):
+                name = fields[0].decode()
+                if not matched or matched[-1] != name:
+                    matched.append(name)
+        return matched
+
+def search_charts(keyword=None, regexp=False, versions=False):
+    """Search every repository's index, rebuilding stale ones first.
+
+    Returns:
+        list: (name, version, appVersion, description) rows.
+    """
+    update_indexes()
+    pattern = None
+    if keyword:
+        pattern = re.compile(keyword.encode() if regexp else re.escape(keyword.encode()), re.IGNORECASE)
+    rows = []
+    for repo in list_repo_indexes():
+        with ChartIndex(repo) as index:
+            for name in index.search(pattern):
+                found = index.versions(name)
+                rows.extend(found if versions else found[:1])
+    return rows
+
+def get_storage_driver():
+    """Get the kind of object helm stores releases in, from HELM_DRIVER as helm does."""
+    driver = os.environ.get('HELM_DRIVER', 'secret').lower()
+    if driver in ('', 'secret', 'secrets'):
+        return 'secret'
+    if driver in ('configmap', 'configmaps'):
+        return 'configmap'
+    raise click.ClickException(f"HELM_DRIVER={driver} is not supported by kubed helm releases; use helm list")
+
+def decode_release(obj, driver='secret'):
+    """Decode the release record in a helm secret or configmap into a table row.
+
+    Helm stores each release as gzipped JSON, base64 encoded; secret data is
+    base64 encoded once more by Kubernetes.
+
+    Returns:
+        list: Cells for RELEASE_HEADERS.
+    """
+    payload = obj['data']['release']
+    data = base64.b64decode(base64.b64decode(payload) if driver == 'secret' else payload)
+    if data[:3] == b'\x1f\x8b\x08':
+        data = gzip.decompress(data)
+    release = json.loads(data)
+    info = release.get('info') or {}
+    chart = (release.get('chart') or {}).get('metadata') or {}
+    return [release['name'], release.get('namespace') or obj['metadata']['namespace'], str(release.get('version', '')),
+            (info.get('last_deployed') or '')[:19].replace('T', ' '), info.get('status', ''),
+            f"{chart.get('name', '')}-{chart.get('version', '')}", chart.get('appVersion') or '']
+
+def list_releases(pool, context=None, namespace=None, all_namespaces=False, all_statuses=False, timeout=None):
+    """List the latest revision of each helm release in a context.
+
+    Release records are listed a page at a time and decoded in pool while the
+    next page is fetched; only the highest revision of each release is kept,
+    and the decoding of one a higher revision replaced is cancelled if it has
+    not started. Superseded revisions, the bulk of a release history, are
+    filtered out by the API server.
+
+    Returns:
+        list: Rows for RELEASE_HEADERS, sorted by name and namespace.
+    """
+    from kubernetes import client
+    from kubed.k8s import get_api_client, get_default_namespace
+
+    driver = get_storage_driver()
+    api = client.CoreV1Api(get_api_client(context))
+    operation = f'list_{driver}_for_all_namespaces' if all_namespaces else f'list_namespaced_{driver}'
+    args = () if all_namespaces else (namespace or get_default_namespace(context),)
+    # helm list shows deployed and failed releases unless asked for all
+    selector = 'owner=helm,status!=superseded' if all_statuses else 'owner=helm,status in (deployed,failed)'
+
+    latest = {}
+    token = None
+    while True:
+        response = getattr(api, operation)(*args, label_selector=selector, limit=RELEASES_PAGE_SIZE,
+                                           _continue=token, _request_timeout=timeout, _preload_content=False)
+        page = json.loads(response.data)
+        for obj in page.get('items', []):
+            labels = obj['metadata'].get('labels') or {}
+            try:
+                revision = int(labels.get('version', 0))
+            except ValueError:
+                revision = 0
+            key = (obj['metadata']['namespace'], labels.get('name', obj['metadata']['name']))
+            if key not in latest or revision > latest[key][0]:
+                if key in latest:
+                    latest[key][1].cancel()
+                latest[key] = (revision, pool.submit(decode_release, obj, driver))
+        token = page['metadata'].get('continue')
+        if not token:
+            break
+
+    rows = []
+    for (namespace, name), (_, future) in latest.items():
+        try:
+            rows.append(future.result())
+        except Exception as e:
+            click.echo(f"{context or 'current context'}: cannot decode release {namespace}/{name}: {e}", err=True)
+    return sorted(rows, key=lambda row: (row[0], row[1]))
+
+@click.group()
+def helm():
+    """Helm commands served from kubed's chart index (other subcommands run helm)."""
+    pass
+
+@helm.command()
+@click.argument('keyword', required=False)
+@click.option('-r', '--regexp', is_flag=True, help='Treat KEYWORD as a regular expression.')
+@click.option('-l', '--versions', is_flag=True, help='Show every version of each chart, not only the latest.')
+def search(keyword, regexp, versions):
+    """Search the added repositories for charts matching KEYWORD."""
+    from kubed.k8s import print_table
+
+    if regexp and keyword:
+        try:
+            re.compile(keyword)
+        except re.error as e:
+            raise click.BadParameter(str(e), param_hint='KEYWORD')
+    rows = search_charts(keyword, regexp, versions)
+    if not rows:
+        click.echo('No results found', err=True)
+        sys.exit(1)
+    print_table(['NAME', 'CHART VERSION', 'APP VERSION', 'DESCRIPTION'], [list(row) for row in rows])
+
+@helm.command()
+@click.option('--force', is_flag=True, help='Rebuild every index even if unchanged.')
+@click.option('--quiet', is_flag=True, help='Only report errors.')
+def index(force, quiet):
+    """Rebuild the chart index of repositories whose index.yaml changed."""
+    rebuilt = update_indexes(force=force)
+    if not quiet:
+        if rebuilt:
+            click.echo(f"✅ Indexed {', '.join(rebuilt)}")
+        elif not list_repo_indexes():
+            click.echo(f"No repository indexes in {get_repository_cache()}; run `helm repo add` first.", err=True)
+        else:
+            click.echo("Chart indexes are up to date.")
+
+@helm.command()
+@click.argument('prefix', default='')
+def charts(prefix):
+    """Print chart names starting with PREFIX (used by shell completion)."""
+    update_indexes()
+    for repo in list_repo_indexes():
+        with ChartIndex(repo) as index:
+            for name in index.chart_names(prefix):
+                click.echo(name)
+
+@helm.command()
+@click.option('-n', '--namespace', help='Namespace (defaults to the context namespace).')
+@click.option('-A', '--all-namespaces', is_flag=True, help='List releases across all namespaces.')
+@click.option('-a', '--all', 'all_statuses', is_flag=True,
+              help='Show the latest revision of every release, not only deployed and failed ones.')
+@click.option('--context', help='Kubeconfig context to use.')
+@click.option('--contexts', help='Comma-separated kubeconfig contexts to query concurrently.')
+@click.option('--all-contexts', is_flag=True, help='Query every kubeconfig context concurrently.')
+@click.option('--concurrency', default=8, show_default=True, help='Contexts queried at once.')
+@click.option('--workers', default=max(4, os.cpu_count() or 1), show_default='CPU count, at least 4',
+              help='Release records decoded at once.')
+@click.option('--timeout', default=30.0, show_default=True, help='Seconds to wait for each context.')
+def releases(namespace, all_namespaces, all_statuses, context, contexts, all_contexts, concurrency, workers,
+             timeout):
+    """List the latest revision of each helm release, like helm list, across contexts."""
+    from concurrent.futures import ThreadPoolExecutor
+    from kubed.k8s import StreamingTable, fan_out, get_context_namespaces, handle_api_errors, print_table, \
+        resolve_contexts
+
+    targets = resolve_contexts(contexts, all_contexts)
+    # One pool decodes for every context, so decoding stays bounded however many are queried
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        if not targets:
+            rows = handle_api_errors(list_releases)(pool, context, namespace, all_namespaces, all_statuses,
+                                                    timeout)
+            if rows:
+                print_table(RELEASE_HEADERS, rows)
+            return
+
+        namespaces, _ = get_context_namespaces()
+        table = StreamingTable(['CONTEXT'] + RELEASE_HEADERS, [max(map(len, targets))])
+        failed = False
+
+        def fetch(target):
+            return list_releases(pool, target, namespace or namespaces.get(target), all_namespaces, all_statuses,
+                                 timeout)
+
+        for target, rows, error in fan_out(targets, fetch, concurrency, timeout):
+            if error is not None:
+                click.echo(f"{target}: {error}", err=True)
+                failed = True
+            else:
+                table.add([[target] + row for row in rows])
+    if not table.printed and not failed:
+        click.echo('No releases found.', err=True)
+    if failed:
+        sys.exit(1)
+
+def helm_command(command):
+    """Run a kubed helm subcommand, handing anything else to helm.
+
+    Args:
+        command (tuple): The arguments after `kubed helm`.
+    """
+    args = list(command)
+    if args and not args[0].startswith('-') and args[0] not in helm.commands:
+        try:
+            os.execvp('helm', ['helm'] + args)
+        except FileNotFoundError:
+            click.echo("helm is not installed.", err=True)
+            sys.exit(1)
+    helm.main(args=args, prog_name='kubed helm')
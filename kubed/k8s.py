@@ -0,0 +1,644 @@
+"""
+In-process Kubernetes commands built on the kubernetes Python client.
+
+`kubed k8s get/describe/delete/logs/apply` talk to the API server directly
+instead of spawning kubectl, sharing one pooled API client per kubeconfig
+context. Responses are decoded straight from JSON rather than into the
+client's model classes, which is much faster for large lists. When `kubed daemon` is
+running, `get` is answered from its watch caches instead. Any other
+subcommand is handed to kubectl.
+"""
+
+import json
+import os
+import sys
+import threading
+from datetime import datetime, timezone
+
+import click
+
+# Resource kinds served in-process, keyed by their plural name
+RESOURCES = {
+    'pods': {
+        'aliases': ('po', 'pod'),
+        'kind': 'Pod',
+        'api_version': 'v1',
+        'api': 'CoreV1Api',
+        'namespaced': True,
+        'list': 'list_namespaced_pod',
+        'list_all': 'list_pod_for_all_namespaces',
+        'read': 'read_namespaced_pod',
+        'delete': 'delete_namespaced_pod',
+    },
+    'deployments': {
+        'aliases': ('deploy', 'deployment'),
+        'kind': 'Deployment',
+        'api_version': 'apps/v1',
+        'api': 'AppsV1Api',
+        'namespaced': True,
+        'list': 'list_namespaced_deployment',
+        'list_all': 'list_deployment_for_all_namespaces',
+        'read': 'read_namespaced_deployment',
+        'delete': 'delete_namespaced_deployment',
+    },
+    'services': {
+        'aliases': ('svc', 'service'),
+        'kind': 'Service',
+        'api_version': 'v1',
+        'api': 'CoreV1Api',
+        'namespaced': True,
+        'list': 'list_namespaced_service',
+        'list_all': 'list_service_for_all_namespaces',
+        'read': 'read_namespaced_service',
+        'delete': 'delete_namespaced_service',
+    },
+    'nodes': {
+        'aliases': ('no', 'node'),
+        'kind': 'Node',
+        'api_version': 'v1',
+        'api': 'CoreV1Api',
+        'namespaced': False,
+        'list': 'list_node',
+        'read': 'read_node',
+        'delete': 'delete_node',
+    },
+    'namespaces': {
+        'aliases': ('ns', 'namespace'),
+        'kind': 'Namespace',
+        'api_version': 'v1',
+        'api': 'CoreV1Api',
+        'namespaced': False,
+        'list': 'list_namespace',
+        'read': 'read_namespace',
+        'delete': 'delete_namespace',
+    },
+}
+
+# One API client, and so one urllib3 connection pool, per kubeconfig context
+_clients = {}
+# Held while a context's client is created, so concurrent callers (see fan_out) create it once
+_client_locks = {}
+_client_locks_lock = threading.Lock()
+
+def resolve_resource(name):
+    """Map a kind, short name or alias (e.g. 'po', 'deploy') to its plural name."""
+    name = name.lower()
+    for plural, spec in RESOURCES.items():
+        if name == plural or name in spec['aliases']:
+            return plural
+    raise click.BadParameter(f"unsupported resource type '{name}', expected one of: {', '.join(RESOURCES)}",
+                             param_hint='KIND')
+
+def get_api_client(context=None):
+    """Get the shared API client for a kubeconfig context (None for the current one)."""
+    client = _clients.get(context)
+    if client is None:
+        with _client_locks_lock:
+            lock = _client_locks.setdefault(context, threading.Lock())
+        with lock:
+            client = _clients.get(context)
+            if client is None:
+                client = _clients[context] = new_api_client(context)
+    return client
+
+def new_api_client(context=None, kubeconfig=None):
+    """Create an API client for a kubeconfig context (None for the current one).
+
+    The context is looked up in kubed's kubeconfig index, so only the files
+    defining its cluster and user are read rather than every file in
+    KUBECONFIG; the full loader is the fallback.
+    """
+    from kubernetes import config
+    from kubed.kubeconfig import load_index
+
+    index = load_index(kubeconfig)
+    name = context or index.current
+    config_dict = index.client_config(name) if name else None
+    if config_dict is None:
+        return config.new_client_from_config(config_file=kubeconfig, context=context)
+    return config.new_client_from_config_dict(config_dict, context=name, persist_config=False)
+
+def get_default_namespace(context=None):
+    """Get the namespace configured for a kubeconfig context, or 'default'."""
+    namespaces, active = get_context_namespaces()
+    return namespaces.get(context or active, 'default')
+
+def get_context_namespaces():
+    """Read the kubeconfig contexts from kubed's kubeconfig index.
+
+    Returns:
+        tuple: (dict of context name to namespace, in kubeconfig order and
+        'default' where unset; name of the current context or None)
+    """
+    from kubed.kubeconfig import load_index
+
+    index = load_index()
+    return index.namespaces(), index.current
+
+def call_api(resource, operation, context=None, api_client=None, **kwargs):
+    """Call a resource operation and decode the JSON response as plain dicts.
+
+    api_client, if given, is used instead of the shared client of the context.
+    """
+    from kubernetes import client
+
+    spec = RESOURCES[resource]
+    api = getattr(client, spec['api'])(api_client or get_api_client(context))
+    response = getattr(api, spec[operation])(_preload_content=False, **kwargs)
+    return json.loads(response.data)
+
+def list_objects(resource, namespace=None, all_namespaces=False, selector=None, context=None, **kwargs):
+    """List objects of a resource kind, as dicts with kind and apiVersion filled in."""
+    spec = RESOURCES[resource]
+    if selector:
+        kwargs['label_selector'] = selector
+    if not spec['namespaced']:
+        result = call_api(resource, 'list', context, **kwargs)
+    elif all_namespaces:
+        result = call_api(resource, 'list_all', context, **kwargs)
+    else:
+        result = call_api(resource, 'list', context, namespace=namespace, **kwargs)
+    items = result.get('items', [])
+    for item in items:
+        item.setdefault('kind', spec['kind'])
+        item.setdefault('apiVersion', spec['api_version'])
+    return items
+
+def read_object(resource, name, namespace=None, context=None, **kwargs):
+    """Read a single object as a dict."""
+    if RESOURCES[resource]['namespaced']:
+        return call_api(resource, 'read', context, name=name, namespace=namespace, **kwargs)
+    return call_api(resource, 'read', context, name=name, **kwargs)
+
+def iter_lines(response):
+    """Yield the lines of a streaming response (watch events, followed logs) as bytes."""
+    buffer = b''
+    for chunk in response.stream(65536, decode_content=True):
+        buffer += chunk
+        while b'\n' in buffer:
+            line, buffer = buffer.split(b'\n', 1)
+            yield line
+    if buffer:
+        yield buffer
+
+def format_age(timestamp):
+    """Format an RFC 3339 timestamp as a kubectl-style age (e.g. '42s', '5h', '3d')."""
+    if not timestamp:
+        return '<unknown>'
+    # Event times carry microseconds ('...T10:00:00.123456Z'); seconds are enough here
+    created = datetime.strptime(timestamp[:19], '%Y-%m-%dT%H:%M:%S').replace(tzinfo=timezone.utc)
+    seconds = max(0, int((datetime.now(timezone.utc) - created).total_seconds()))
+    if seconds < 120:
+        return f'{seconds}s'
+    if seconds < 120 * 60:
+        return f'{seconds // 60}m'
+    if seconds < 48 * 3600:
+        return f'{seconds // 3600}h'
+    return f'{seconds // 86400}d'
+
+def _pod_row(pod):
+    statuses = pod.get('status', {}).get('containerStatuses', [])
+    ready = sum(1 for s in statuses if s.get('ready'))
+    total = len(pod.get('spec', {}).get('containers', []))
+    restarts = sum(s.get('restartCount', 0) for s in statuses)
+    phase = pod.get('status', {}).get('phase', 'Unknown')
+    for s in statuses:
+        reason = (s.get('state', {}).get('waiting') or {}).get('reason')
+        if reason:
+            phase = reason
+            break
+    if pod['metadata'].get('deletionTimestamp'):
+        phase = 'Terminating'
+    return [f'{ready}/{total}', phase, str(restarts)]
+
+def _deployment_row(deployment):
+    status = deployment.get('status', {})
+    replicas = deployment.get('spec', {}).get('replicas', 0)
+    return [f"{status.get('readyReplicas', 0)}/{replicas}",
+            str(status.get('updatedReplicas', 0)), str(status.get('availableReplicas', 0))]
+
+def _service_row(service):
+    spec = service.get('spec', {})
+    ingress = service.get('status', {}).get('loadBalancer', {}).get('ingress', [])
+    external = ','.join(i.get('ip') or i.get('hostname', '') for i in ingress) or \
+        ','.join(spec.get('externalIPs', [])) or '<none>'
+    ports = ','.join(f"{p['port']}{':' + str(p['nodePort']) if p.get('nodePort') else ''}/{p.get('protocol', 'TCP')}"
+                     for p in spec.get('ports', [])) or '<none>'
+    return [spec.get('type', ''), spec.get('clusterIP', ''), external, ports]
+
+def _node_row(node):
+    conditions = node.get('status', {}).get('conditions', [])
+    ready = next((c for c in conditions if c.get('type') == 'Ready'), {})
+    status = 'Ready' if ready.get('status') == 'True' else 'NotReady'
+    if node.get('spec', {}).get('unschedulable'):
+        status += ',SchedulingDisabled'
+    labels = node['metadata'].get('labels', {})
+    roles = ','.join(sorted(k.split('/', 1)[1] for k in labels
+                            if k.startswith('node-role.kubernetes.io/'))) or '<none>'
+    version = node.get('status', {}).get('nodeInfo', {}).get('kubeletVersion', '')
+    return [status, roles, version]
+
+def _namespace_row(namespace):
+    return [namespace.get('status', {}).get('phase', '')]
+
+# Table columns per resource kind; NAME (and NAMESPACE with -A) comes first and AGE last
+COLUMNS = {
+    'pods': (['READY', 'STATUS', 'RESTARTS'], _pod_row),
+    'deployments': (['READY', 'UP-TO-DATE', 'AVAILABLE'], _deployment_row),
+    'services': (['TYPE', 'CLUSTER-IP', 'EXTERNAL-IP', 'PORT(S)'], _service_row),
+    'nodes': (['STATUS', 'ROLES', 'VERSION'], _node_row),
+    'namespaces': (['STATUS'], _namespace_row),
+}
+
+def table_headers(resource, show_namespace=False):
+    """Get the table headers for a resource kind."""
+    headers, _ = COLUMNS[resource]
+    return (['NAMESPACE'] if show_namespace else []) + ['NAME'] + headers + ['AGE']
+
+def table_row(resource, obj, show_namespace=False):
+    """Get the table cells for one object."""
+    _, row = COLUMNS[resource]
+    metadata = obj['metadata']
+    prefix = [metadata.get('namespace', '')] if show_namespace else []
+    return prefix + [metadata['name']] + row(obj) + [format_age(metadata.get('creationTimestamp'))]
+
+def print_table(headers, rows):
+    """Print rows aligned under headers, kubectl style."""
+    widths = [len(h) for h in headers]
+    for row in rows:
+        widths = [max(w, len(cell)) for w, cell in zip(widths, row)]
+    for row in [headers] + rows:
+        click.echo('   '.join(cell.ljust(w) for cell, w in zip(row, widths)).rstrip())
+
+class StreamingTable:
+    """Print table rows in batches as they arrive.
+
+    Column widths are the widest cell seen so far, so batches printed later
+    may be aligned a little wider than earlier ones.
+    """
+
+    def __init__(self, headers, min_widths=()):
+        self.headers = headers
+        self.widths = [max(len(h), w) for h, w in zip(headers, list(min_widths) + [0] * len(headers))]
+        self.printed = False
+
+    def add(self, rows):
+        for row in rows:
+            self.widths = [max(w, len(cell)) for w, cell in zip(self.widths, row)]
+        if not self.printed and rows:
+            rows = [self.headers] + rows
+            self.printed = True
+        for row in rows:
+            click.echo('   '.join(cell.ljust(w) for cell, w in zip(row, self.widths)).rstrip())
+
+def print_objects(resource, objects, output, show_namespace=False, single=False):
+    """Print objects as a table, names, JSON or YAML."""
+    if output in ('json', 'yaml'):
+        data = objects[0] if single else {'apiVersion': 'v1', 'kind': 'List', 'items': objects}
+        if output == 'json':
+            click.echo(json.dumps(data, indent=4))
+        else:
+            import yaml
+
+            click.echo(yaml.safe_dump(data, default_flow_style=False, sort_keys=False), nl=False)
+    elif output == 'name':
+        for obj in objects:
+            click.echo(f"{resource[:-1]}/{obj['metadata']['name']}")
+    elif not objects:
+        click.echo('No resources found.', err=True)
+    else:
+        print_table(table_headers(resource, show_namespace),
+                    [table_row(resource, obj, show_namespace) for obj in objects])
+
+def api_error_message(e):
+    """Get the server's message for an ApiException, kubectl style.
+
+    The reason is the Status object's (e.g. NotFound) rather than the HTTP
+    reason phrase (Not Found), when the server sent one.
+    """
+    reason = message = e.reason
+    try:
+        body = json.loads(e.body)
+        reason = body.get('reason') or reason
+        message = body.get('message') or message
+    except (TypeError, ValueError, AttributeError):
+        pass
+    return f"Error from server ({reason}): {message}"
+
+def handle_api_errors(func):
+    """Turn API and kubeconfig errors into a message and exit status 1."""
+    import functools
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        from kubernetes.client.exceptions import ApiException
+        from kubernetes.config.config_exception import ConfigException
+
+        try:
+            return func(*args, **kwargs)
+        except ApiException as e:
+            click.echo(api_error_message(e), err=True)
+            sys.exit(1)
+        except ConfigException as e:
+            click.echo(f"Error loading kubeconfig: {e}", err=True)
+            sys.exit(1)
+    return wrapper
+
+def fetch_objects(resource, names=(), namespace=None, all_namespaces=False, selector=None, context=None,
+                  use_daemon=True, **kwargs):
+    """Get objects by name, or list them, from kubed daemon if it is running, else from the API server."""
+    if use_daemon:
+        from kubed.daemon import query_daemon
+
+        objects = query_daemon(resource, namespace, all_namespaces, selector, names, context)
+        if objects is not None:
+            by_name = {obj['metadata']['name']: obj for obj in objects}
+            return [by_name[name] for name in names] if names else objects
+
+    if RESOURCES[resource]['namespaced'] and not namespace:
+        namespace = get_default_namespace(context)
+    if names:
+        return [read_object(resource, name, namespace, context, **kwargs) for name in names]
+    return list_objects(resource, namespace, all_namespaces, selector, context, **kwargs)
+
+def fan_out(contexts, fetch, concurrency=8, timeout=10):
+    """Call fetch(context) for several contexts, at most concurrency at a time.
+
+    Results are yielded as each context answers. A context that raises, or
+    has not answered within timeout of being started, is yielded with an
+    error message instead; one that timed out gives up its slot, so the
+    contexts queued behind it still start.
+
+    Yields:
+        tuple: (context, result, error message or None)
+    """
+    import queue
+    import time
+    from kubernetes.client.exceptions import ApiException
+
+    results = queue.Queue()
+    pending = list(dict.fromkeys(contexts))
+    # Context to the time it was started, for those not answered yet
+    running = {}
+
+    def run(context):
+        try:
+            results.put((context, fetch(context), None))
+        except Exception as e:
+            results.put((context, None, api_error_message(e) if isinstance(e, ApiException) else str(e)))
+
+    def start():
+        while pending and len(running) < max(1, concurrency):
+            context = pending.pop(0)
+            running[context] = time.monotonic()
+            # Daemon threads, so a context that timed out does not hold up exit while its request is retried
+            threading.Thread(target=run, args=(context,), daemon=True).start()
+
+    start()
+    while running:
+        finished = []
+        try:
+            context, result, error = results.get(timeout=0.05)
+            if running.pop(context, None) is not None:
+                finished.append((context, result, error))
+        except queue.Empty:
+            pass
+        now = time.monotonic()
+        for context in [context for context, since in running.items() if now - since > timeout]:
+            del running[context]
+            finished.append((context, None, f"timed out after {timeout:g}s"))
+        start()
+        yield from finished
+
+def resolve_contexts(contexts=None, all_contexts=False):
+    """Get the contexts named by --contexts a,b,c or --all-contexts (None if neither was given)."""
+    if not contexts and not all_contexts:
+        return None
+    targets = list(get_context_namespaces()[0]) if all_contexts else \
+        [c.strip() for c in contexts.split(',') if c.strip()]
+    if not targets:
+        raise click.BadParameter('no contexts given', param_hint='--contexts')
+    return targets
+
+def get_across_contexts(resource, contexts, names=(), namespace=None, all_namespaces=False, selector=None,
+                        output='table', use_daemon=True, concurrency=8, timeout=10):
+    """Get objects from several contexts concurrently.
+
+    Table and name output is printed as each context answers, with a leading
+    CONTEXT column; JSON and YAML are printed as one list once all are done.
+    A context that fails or takes longer than timeout is reported on stderr.
+
+    Returns:
+        bool: True if every context answered.
+    """
+    namespaces, _ = get_context_namespaces()
+    show_namespace = all_namespaces and RESOURCES[resource]['namespaced']
+    width = max(map(len, contexts))
+    table = StreamingTable(['CONTEXT'] + table_headers(resource, show_namespace), [width])
+    collected = {}
+    failed = False
+
+    def fetch(context):
+        return fetch_objects(resource, names, namespace or namespaces.get(context), all_namespaces, selector,
+                             context, use_daemon, _request_timeout=timeout)
+
+    for context, objects, error in fan_out(contexts, fetch, concurrency, timeout):
+        if error is not None:
+            click.echo(f"{context}: {error}", err=True)
+            failed = True
+        elif output == 'table':
+            table.add([[context] + table_row(resource, obj, show_namespace) for obj in objects])
+        elif output == 'name':
+            for obj in objects:
+                click.echo(f"{context:<{width}}   {resource[:-1]}/{obj['metadata']['name']}")
+        else:
+            collected[context] = objects
+
+    if output in ('json', 'yaml'):
+        print_objects(resource, [obj for context in contexts for obj in collected.get(context, [])], output)
+    elif output == 'table' and not table.printed:
+        click.echo('No resources found.', err=True)
+    return not failed
+
+namespace_option = click.option('-n', '--namespace', help='Namespace (defaults to the context namespace).')
+context_option = click.option('--context', help='Kubeconfig context to use.')
+
+@click.group()
+def k8s():
+    """Kubernetes commands served in-process (other subcommands run kubectl)."""
+    pass
+
+@k8s.command()
+@click.argument('kind')
+@click.argument('names', nargs=-1)
+@namespace_option
+@click.option('-A', '--all-namespaces', is_flag=True, help='List across all namespaces.')
+@click.option('-l', '--selector', help='Label selector, e.g. app=web.')
+@click.option('-o', '--output', type=click.Choice(['table', 'name', 'json', 'yaml']), default='table',
+              show_default=True, help='Output format.')
+@context_option
+@click.option('--contexts', help='Comma-separated kubeconfig contexts to query concurrently.')
+@click.option('--all-contexts', is_flag=True, help='Query every kubeconfig context concurrently.')
+@click.option('--concurrency', default=8, show_default=True, help='Contexts queried at once.')
+@click.option('--timeout', default=10.0, show_default=True, help='Seconds to wait for each context.')
+@click.option('--no-daemon', is_flag=True, help='Query the API server even if kubed daemon is running.')
+@handle_api_errors
+def get(kind, names, namespace, all_namespaces, selector, output, context, contexts, all_contexts,
+        concurrency, timeout, no_daemon):
+    """Get resources of KIND (pods, deployments, services, nodes, namespaces)."""
+    resource = resolve_resource(kind)
+    targets = resolve_contexts(contexts, all_contexts)
+    if targets:
+        if not get_across_contexts(resource, targets, names, namespace, all_namespaces, selector, output,
+                                   not no_daemon, concurrency, timeout):
+            sys.exit(1)
+        return
+
+    objects = fetch_objects(resource, names, namespace, all_namespaces, selector, context, not no_daemon)
+    show_namespace = all_namespaces and RESOURCES[resource]['namespaced'] and not names
+    print_objects(resource, objects, output, show_namespace=show_namespace, single=len(names) == 1)
+
+@k8s.command()
+@click.argument('kind')
+@click.argument('name')
+@namespace_option
+@context_option
+@handle_api_errors
+def describe(kind, name, namespace, context):
+    """Show details and recent events for one resource."""
+    import yaml
+
+    resource = resolve_resource(kind)
+    namespace = namespace or get_default_namespace(context)
+    obj = read_object(resource, name, namespace, context)
+    metadata = obj['metadata']
+
+    click.echo(f"{'Name:':<13}{metadata['name']}")
+    if RESOURCES[resource]['namespaced']:
+        click.echo(f"{'Namespace:':<13}{metadata.get('namespace', '')}")
+    click.echo(f"{'Created:':<13}{metadata.get('creationTimestamp', '')} ({format_age(metadata.get('creationTimestamp'))} ago)")
+    for field in ('labels', 'annotations'):
+        values = metadata.get(field) or {}
+        lines = [f'{k}={v}' for k, v in sorted(values.items())] or ['<none>']
+        click.echo(f"{field.capitalize() + ':':<13}{lines[0]}")
+        for line in lines[1:]:
+            click.echo(f"{'':<13}{line}")
+    for section in ('spec', 'status'):
+        if obj.get(section):
+            body = yaml.safe_dump(obj[section], default_flow_style=False, sort_keys=False)
+            click.echo(f"{section.capitalize()}:")
+            click.echo('\n'.join('  ' + line for line in body.splitlines()))
+
+    selector = f"involvedObject.name={name},involvedObject.kind={RESOURCES[resource]['kind']}"
+    from kubernetes import client
+
+    api = client.CoreV1Api(get_api_client(context))
+    events_namespace = namespace if RESOURCES[resource]['namespaced'] else 'default'
+    response = api.list_namespaced_event(events_namespace, field_selector=selector, _preload_content=False)
+    events = sorted(json.loads(response.data).get('items', []),
+                    key=lambda e: e.get('lastTimestamp') or e.get('eventTime') or '')
+    click.echo('Events:')
+    if not events:
+        click.echo('  <none>')
+        return
+    rows = [[e.get('type', ''), e.get('reason', ''), format_age(e.get('lastTimestamp') or e.get('eventTime')),
+             (e.get('source') or {}).get('component', ''), e.get('message', '').strip()]
+            for e in events]
+    print_table(['TYPE', 'REASON', 'AGE', 'FROM', 'MESSAGE'], rows)
+
+@k8s.command()
+@click.argument('kind')
+@click.argument('names', nargs=-1, required=True)
+@namespace_option
+@context_option
+@handle_api_errors
+def delete(kind, names, namespace, context):
+    """Delete resources of KIND by name."""
+    resource = resolve_resource(kind)
+    namespace = namespace or get_default_namespace(context)
+    for name in names:
+        if RESOURCES[resource]['namespaced']:
+            call_api(resource, 'delete', context, name=name, namespace=namespace)
+        else:
+            call_api(resource, 'delete', context, name=name)
+        click.echo(f'{resource[:-1]} "{name}" deleted')
+
+@k8s.command()
+@click.argument('names', nargs=-1)
+@click.option('-l', '--selector', help='Follow every pod matching this label selector.')
+@namespace_option
+@context_option
+@click.option('-c', '--container', help='Container name (defaults to the default container of each pod).')
+@click.option('--all-containers', is_flag=True, help='Stream every container of each pod.')
+@click.option('-f', '--follow', is_flag=True, help='Keep streaming, and pick up matching pods that start later.')
+@click.option('--tail', type=int, help='Lines of recent log to show per container.')
+@click.option('--since', type=int, help='Only show lines from the last N seconds.')
+@click.option('--timestamps', is_flag=True, help='Show the timestamp of each line.')
+@click.option('--order-by-time', is_flag=True, help='Merge lines of all pods in timestamp order (adds ~1s of delay).')
+@click.option('--prefix/--no-prefix', default=None, help='Prefix lines with pod/NAME/CONTAINER (default with -l).')
+@click.option('--max-streams', default=50, show_default=True, help='Maximum log streams open at once.')
+@click.option('--buffer-lines', default=256, show_default=True, help='Maximum unprinted lines per stream.')
+@handle_api_errors
+def logs(names, selector, namespace, context, container, all_containers, follow, tail, since, timestamps,
+         order_by_time, prefix, max_streams, buffer_lines):
+    """Print or follow the logs of pods, by NAME or by label selector."""
+    from kubernetes import client
+    from kubed.logs import LogStreams
+
+    if not names and not selector:
+        raise click.UsageError('give pod names or a label selector (-l)')
+    api_client = get_api_client(context)
+    # Keep one pooled connection per open stream instead of discarding them
+    pool_kw = api_client.rest_client.pool_manager.connection_pool_kw
+    pool_kw['maxsize'] = max(pool_kw.get('maxsize') or 1, max_streams + 1)
+
+    streams = LogStreams(client.CoreV1Api(api_client), namespace or get_default_namespace(context),
+                         selector=selector, names=names, container=container, all_containers=all_containers,
+                         follow=follow, tail=tail, since=since, timestamps=timestamps, order=order_by_time,
+                         prefix=bool(selector) if prefix is None else prefix,
+                         max_streams=max_streams, buffer_lines=buffer_lines)
+    try:
+        if not streams.run():
+            sys.exit(1)
+    except KeyboardInterrupt:
+        sys.exit(130)
+
+@k8s.command()
+@click.option('-f', '--filename', 'paths', multiple=True, required=True,
+              help='Manifest file or directory to apply (repeatable, - for stdin).')
+@click.option('-R', '--recursive', is_flag=True, help='Also read manifests in subdirectories.')
+@namespace_option
+@context_option
+@click.option('--force-all', is_flag=True, help='Apply every object, even those unchanged since the last apply.')
+@click.option('--concurrency', default=16, show_default=True, help='Objects applied at once.')
+@click.option('--field-manager', default='kubed', show_default=True, help='Field manager for server-side apply.')
+@click.option('--force-conflicts', is_flag=True, help='Take ownership of fields set by other field managers.')
+@click.option('--dry-run', is_flag=True, help='Have the server validate the objects without persisting them.')
+@click.option('--timeout', default=30.0, show_default=True, help='Seconds to wait for each request.')
+@handle_api_errors
+def apply(paths, recursive, namespace, context, force_all, concurrency, field_manager, force_conflicts, dry_run,
+          timeout):
+    """Server-side apply manifests, skipping objects unchanged since kubed last applied them."""
+    from kubed.apply import apply_manifests
+
+    try:
+        if not apply_manifests(paths, recursive, namespace, context, force_all, concurrency, field_manager,
+                               force_conflicts, dry_run, timeout):
+            sys.exit(1)
+    except KeyboardInterrupt:
+        sys.exit(130)
+
+def k8s_command(command):
+    """Run a kubed k8s subcommand, handing anything else to kubectl.
+
+    Args:
+        command (tuple): The arguments after `kubed k8s`.
+    """
+    args = list(command)
+    if args and not args[0].startswith('-') and args[0] not in k8s.commands:
+        try:
+            os.execvp('kubectl', ['kubectl'] + args)
+        except FileNotFoundError:
+            click.echo("kubectl is not installed.", err=True)
+            sys.exit(1)
+    k8s.main(args=args, prog_name='kubed k8s')
@@ -0,0 +1,510 @@
+"""
+An index of the kubeconfig files in KUBECONFIG, and fast context/namespace switching.
+
+Parsing hundreds of contexts spread over many kubeconfig files on every
+command is slow, so kubed parses each file once with the libyaml C loader
+and keeps the names it needs (contexts with their cluster, user and
+namespace; cluster servers; user names; current-context) in
+~/.kubed/cache/kubeconfig/index.json. A file is parsed again only when its
+mtime or size changes. Credentials are never copied into the index, and
+entries are kept for files outside the current KUBECONFIG, since shells
+with different KUBECONFIG values share the index.
+
+Files are merged the way kubectl merges them: the first file to define a
+name wins, and the first non-empty current-context wins. API clients are
+built from only the context, cluster and user entries of one context, read
+from the files the index says define them (see client_config). `kubed ctx` and
+`kubed ns` switch by rewriting only the current-context line, or only the
+context's namespace, in the file kubectl would write to.
+"""
+
+import json
+import os
+import re
+import sys
+
+import click
+
+from kubed.cache import atomic_write, get_cache_dir, read_json, write_json
+
+INDEX_VERSION = 1
+
+# Most files the index keeps entries for, counting files outside the current KUBECONFIG
+MAX_INDEX_FILES = 256
+
+# Values written as plain YAML scalars; anything else is written double-quoted
+PLAIN_SCALAR = re.compile(r'[A-Za-z0-9_][A-Za-z0-9_./@:+-]*')
+
+# File paths in cluster and user entries, which kubectl resolves relative to the file defining them
+RELATIVE_PATH_FIELDS = {
+    'clusters': ('cluster', ('certificate-authority',)),
+    'users': ('user', ('client-certificate', 'client-key', 'tokenFile')),
+}
+
+def get_kubeconfig_paths(kubeconfig=None):
+    """Get the kubeconfig files in merge order, from kubeconfig, $KUBECONFIG or ~/.kube/config."""
+    value = kubeconfig or os.environ.get('KUBECONFIG') or os.path.expanduser('~/.kube/config')
+    paths = []
+    for path in value.split(os.pathsep):
+        path = os.path.abspath(os.path.expanduser(path)) if path else None
+        if path and path not in paths:
+            paths.append(path)
+    return paths
+
+def get_index_path():
+    """Get the path to the kubeconfig index."""
+    return os.path.join(get_cache_dir('kubeconfig'), 'index.json')
+
+def get_state_path():
+    """Get the path to the previous context and namespaces, for `kubed ctx -` and `kubed ns -`."""
+    return os.path.join(get_cache_dir('kubeconfig'), 'state.json')
+
+def _stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+def _load_yaml(text):
+    import yaml
+
+    return yaml.load(text, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+
+def _named(items):
+    """Get the well-formed {name, ...} entries of a kubeconfig list."""
+    return [item for item in items or () if isinstance(item, dict) and item.get('name')]
+
+def parse_kubeconfig(path):
+    """Parse one kubeconfig file into the fields the index keeps.
+
+    Returns:
+        dict: stamp, current (current-context or None), contexts (list of
+        [name, cluster, user, namespace]), clusters (name to server) and users (names).
+    """
+    stamp = _stamp(path)
+    try:
+        with open(path) as f:
+            data = _load_yaml(f.read())
+    except Exception as e:
+        # Like kubectl, an unreadable file stops nothing; it just contributes nothing
+        click.echo(f"Warning: cannot read kubeconfig {path}: {e}", err=True)
+        data = None
+    data = data if isinstance(data, dict) else {}
+    contexts = []
+    for item in _named(data.get('contexts')):
+        context = item.get('context') if isinstance(item.get('context'), dict) else {}
+        contexts.append([str(item['name']), context.get('cluster'), context.get('user'), context.get('namespace')])
+    clusters = {}
+    for item in _named(data.get('clusters')):
+        cluster = item.get('cluster') if isinstance(item.get('cluster'), dict) else {}
+        clusters[str(item['name'])] = cluster.get('server')
+    return {
+        'stamp': stamp,
+        'current': data.get('current-context') or None,
+        'contexts': contexts,
+        'clusters': clusters,
+        'users': [str(item['name']) for item in _named(data.get('users'))],
+    }
+
+def _scalar(value):
+    """Format a string as a YAML scalar that reads back as the same string."""
+    if PLAIN_SCALAR.fullmatch(value) and not value.endswith(':'):
+        try:
+            if _load_yaml(value) == value:
+                return value
+        except Exception:
+            pass
+    return json.dumps(value)
+
+class KubeconfigIndex:
+    """The merged view of a list of kubeconfig files, backed by the on-disk index.
+
+    Args:
+        paths (list): Kubeconfig files in merge order.
+    """
+
+    def __init__(self, paths):
+        self.paths = paths
+        index = read_json(get_index_path(), {})
+        if index.get('version') != INDEX_VERSION:
+            index = {'version': INDEX_VERSION, 'files': {}}
+        self.index = index
+        self.files = {}
+        changed = False
+        for path in paths:
+            stamp = _stamp(path)
+            if stamp is None:
+                changed = index['files'].pop(path, None) is not None or changed
+                continue
+            entry = index['files'].get(path)
+            if entry is None or entry.get('stamp') != stamp:
+                entry = parse_kubeconfig(path)
+                index['files'][path] = entry
+                changed = True
+            self.files[path] = entry
+        if changed:
+            self._prune()
+            write_json(get_index_path(), index)
+        self._merge()
+
+    def _prune(self):
+        """Drop the entries of files that are gone, and the oldest beyond MAX_INDEX_FILES.
+
+        Files outside this KUBECONFIG are otherwise kept: the index is shared
+        by shells that may each set a different KUBECONFIG.
+        """
+        files = self.index['files']
+        others = [path for path in files if path not in self.files]
+        for path in others:
+            if _stamp(path) is None:
+                del files[path]
+        others = sorted((path for path in others if path in files), key=lambda path: files[path]['stamp'] or [0])
+        for path in others[:max(0, len(files) - MAX_INDEX_FILES)]:
+            del files[path]
+
+    def _merge(self):
+        self.contexts = {}
+        self.clusters = {}
+        # Cluster and user name to the file defining it
+        self.cluster_files = {}
+        self.user_files = {}
+        self.current = None
+        self.current_file = None
+        for path, entry in self.files.items():
+            if self.current is None and entry.get('current'):
+                self.current, self.current_file = entry['current'], path
+            for name, cluster, user, namespace in entry['contexts']:
+                self.contexts.setdefault(name, {'cluster': cluster, 'user': user, 'namespace': namespace,
+                                                'file': path})
+            for name, server in entry['clusters'].items():
+                self.clusters.setdefault(name, server)
+                self.cluster_files.setdefault(name, path)
+            for name in entry['users']:
+                self.user_files.setdefault(name, path)
+
+    def namespaces(self):
+        """Get each context's namespace, 'default' where unset, in kubeconfig order."""
+        return {name: context['namespace'] or 'default' for name, context in self.contexts.items()}
+
+    def client_config(self, name):
+        """Get a kubeconfig dict holding only a context and its cluster and user.
+
+        Only the files defining those three entries are read, and relative
+        file paths in them are made absolute.
+
+        Returns:
+            dict: The config, or None where the full kubeconfig loader must be
+            used: an entry is missing or unreadable, or the user has an
+            auth-provider, whose refreshed tokens are written back to the file.
+        """
+        context = self.contexts.get(name)
+        if context is None:
+            return None
+        wanted = {
+            'contexts': (name, context['file']),
+            'clusters': (context['cluster'], self.cluster_files.get(context['cluster'])),
+            'users': (context['user'], self.user_files.get(context['user'])),
+        }
+        parsed = {}
+        config = {'apiVersion': 'v1', 'kind': 'Config', 'current-context': name}
+        for section, (item_name, path) in wanted.items():
+            if path is None:
+                return None
+            if path not in parsed:
+                try:
+                    with open(path) as f:
+                        data = _load_yaml(f.read())
+                except Exception:
+                    return None
+                parsed[path] = data if isinstance(data, dict) else {}
+            item = next((item for item in _named(parsed[path].get(section)) if str(item['name']) == item_name), None)
+            if item is None:
+                return None
+            config[section] = [_resolve_paths(section, item, os.path.dirname(path))]
+        if 'auth-provider' in (config['users'][0].get('user') or {}):
+            return None
+        return config
+
+    def _rewrite(self, path, edit, expect):
+        """Apply a text edit to a kubeconfig file and refresh its index entry.
+
+        The file is parsed again after the edit; if anything changed but what
+        expect(before, after) allows, the original is put back.
+        """
+        try:
+            with open(path) as f:
+                original = f.read()
+            mode = os.stat(path).st_mode & 0o7777
+        except FileNotFoundError:
+            original, mode = '', 0o600
+        before = self.files.get(path)
+        if before is None or before['stamp'] != _stamp(path):
+            before = parse_kubeconfig(path) if original else parse_kubeconfig(os.devnull)
+        atomic_write(path, edit(original), mode=mode)
+        after = parse_kubeconfig(path)
+        if not expect(before, after) or before['clusters'] != after['clusters'] or \
+                before['users'] != after['users']:
+            atomic_write(path, original, mode=mode)
+            raise click.ClickException(f"could not update {path} safely; use kubectl config instead")
+        self.files[path] = self.index['files'][path] = after
+        write_json(get_index_path(), self.index)
+        self._merge()
+
+    def set_current_context(self, name):
+        """Make a context current by rewriting only the current-context line.
+
+        The line is written where kubectl would write it: the first file with
+        a current-context, otherwise the first existing file.
+        """
+        target = self.current_file or next(iter(self.files), None) or self.paths[0]
+        line = f'current-context: {_scalar(name)}'
+
+        def edit(text):
+            new, count = re.subn(r'^current-context:[^\n]*$', lambda m: line, text, count=1, flags=re.M)
+            if count:
+                return new
+            return text + ('' if not text or text.endswith('\n') else '\n') + line + '\n'
+
+        self._rewrite(target, edit, lambda before, after: after['current'] == name and
+                      after['contexts'] == before['contexts'])
+        if self.current != name:
+            raise click.ClickException(f"{target} sets current-context, but an earlier file overrides it")
+
+    def set_namespace(self, context, namespace):
+        """Set a context's namespace by rewriting only that value in the file defining the context."""
+        import yaml
+
+        path = self.contexts[context]['file']
+
+        def edit(text):
+            root = yaml.compose(text, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+            mapping = _find_context_mapping(root, context)
+            if mapping is None:
+                raise click.ClickException(f"context '{context}' not found in {path}")
+            value = _scalar(namespace)
+            for key, node in mapping.value:
+                if key.value == 'namespace':
+                    return text[:node.start_mark.index] + value + text[node.end_mark.index:]
+            if mapping.flow_style or not mapping.value:
+                # `context: {}` or a flow mapping: write the whole mapping back in flow style
+                fields = {key.value: node.value for key, node in mapping.value if isinstance(node.value, str)}
+                fields['namespace'] = namespace
+                flow = yaml.safe_dump(fields, default_flow_style=True, width=float('inf')).strip()
+                return text[:mapping.start_mark.index] + flow + text[mapping.end_mark.index:]
+            first = mapping.value[0][0]
+            indent = ' ' * first.start_mark.column
+            return text[:first.start_mark.index] + f'namespace: {value}\n{indent}' + text[first.start_mark.index:]
+
+        def expect(before, after):
+            wanted = [[n, cluster, user, namespace if n == context else ns]
+                      for n, cluster, user, ns in before['contexts']]
+            return after['contexts'] == wanted and after['current'] == before['current']
+
+        self._rewrite(path, edit, expect)
+
+def _resolve_paths(section, item, base):
+    """Copy a cluster or user entry with its relative file paths made absolute."""
+    key, fields = RELATIVE_PATH_FIELDS.get(section, (None, ()))
+    if not isinstance(item.get(key), dict):
+        return item
+    values = dict(item[key])
+    for field in fields:
+        if isinstance(values.get(field), str) and values[field]:
+            values[field] = os.path.join(base, os.path.expanduser(values[field]))
+    command = (values.get('exec') or {}).get('command') if isinstance(values.get('exec'), dict) else None
+    # Like kubectl, an exec command with a path in it is relative to the file; a bare name is looked up on PATH
+    if isinstance(command, str) and os.sep in command and not os.path.isabs(command):
+        values['exec'] = dict(values['exec'], command=os.path.join(base, command))
+    return dict(item, **{key: values})
+
+def _find_context_mapping(root, name):
+    """Find the `context:` mapping node of a named context in a composed kubeconfig."""
+    if root is None or root.tag != 'tag:yaml.org,2002:map':
+        return None
+    for key, node in root.value:
+        if key.value != 'contexts' or node.tag != 'tag:yaml.org,2002:seq':
+            continue
+        for item in node.value:
+            if item.tag != 'tag:yaml.org,2002:map':
+                continue
+            fields = {k.value: v for k, v in item.value}
+            if fields.get('name') is not None and fields['name'].value == name:
+                context = fields.get('context')
+                return context if context is not None and context.tag == 'tag:yaml.org,2002:map' else None
+    return None
+
+_indexes = {}
+
+def load_index(kubeconfig=None):
+    """Get the index of the current kubeconfig files, re-parsing only files that changed."""
+    paths = tuple(get_kubeconfig_paths(kubeconfig))
+    index = _indexes.get(paths)
+    if index is None or any(index.files.get(path, {}).get('stamp') != _stamp(path) for path in paths):
+        index = _indexes[paths] = KubeconfigIndex(list(paths))
+    return index
+
+def fuzzy_match(query, names):
+    """Find the names matching a query: exact, then prefix, then substring, then subsequence.
+
+    Returns:
+        list: The matches of the best tier that has any; subsequence matches
+        keep only those with the tightest span.
+    """
+    lowered = query.lower()
+    tiers = [
+        lambda name: name == query,
+        lambda name: name.lower() == lowered,
+        lambda name: name.lower().startswith(lowered),
+        lambda name: lowered in name.lower(),
+    ]
+    for matches in tiers:
+        found = [name for name in names if matches(name)]
+        if found:
+            return found
+
+    spans = {}
+    for name in names:
+        span = _subsequence_span(lowered, name.lower())
+        if span is not None:
+            spans[name] = span
+    if not spans:
+        return []
+    best = min(spans.values())
+    return [name for name, span in spans.items() if span == best]
+
+def _subsequence_span(query, name):
+    """Get the length of the shortest stretch of name containing query's characters in order, or None."""
+    best = None
+    for start in (i for i, char in enumerate(name) if char == query[0]):
+        pos = start
+        for char in query[1:]:
+            pos = name.find(char, pos + 1)
+            if pos < 0:
+                break
+        else:
+            if best is None or pos - start < best:
+                best = pos - start
+    return best
+
+def pick(query, names, what):
+    """Resolve a query to exactly one name, or exit with the candidates."""
+    matches = fuzzy_match(query, names)
+    if len(matches) == 1:
+        return matches[0]
+    if not matches:
+        click.echo(f"No {what} matches '{query}'.", err=True)
+    else:
+        click.echo(f"'{query}' matches several {what}s:", err=True)
+        for name in matches[:20]:
+            click.echo(f"  {name}", err=True)
+        if len(matches) > 20:
+            click.echo(f"  ... and {len(matches) - 20} more", err=True)
+    sys.exit(1)
+
+def _print_names(names, current):
+    """Print names one per line, highlighting the current one on a terminal."""
+    for name in names:
+        if name == current and sys.stdout.isatty():
+            click.echo(click.style(name, fg='green', bold=True))
+        else:
+            click.echo(name)
+
+def ctx_command(query=None, current=False):
+    """List the kubeconfig contexts, or switch to the one matching query ('-' for the previous one).
+
+    Args:
+        query (str): Context name or fuzzy query.
+        current (bool): If True, only print the current context.
+    """
+    index = load_index()
+    if current:
+        if not index.current:
+            click.echo("No current context is set.", err=True)
+            sys.exit(1)
+        click.echo(index.current)
+        return
+    if query is None:
+        _print_names(index.contexts, index.current)
+        return
+
+    state = read_json(get_state_path(), {})
+    if query == '-':
+        name = state.get('previous_context')
+        if not name or name not in index.contexts:
+            click.echo("No previous context.", err=True)
+            sys.exit(1)
+    else:
+        name = pick(query, list(index.contexts), 'context')
+    previous = index.current
+    if name != previous:
+        index.set_current_context(name)
+        state['previous_context'] = previous
+        write_json(get_state_path(), state)
+    click.echo(f"Switched to context \"{name}\".")
+
+def ns_command(query=None, current=False):
+    """List the namespaces of the current context, or switch its namespace ('-' for the previous one).
+
+    Namespace names come from kubed's names cache, refreshed when it expired.
+
+    Args:
+        query (str): Namespace name or fuzzy query.
+        current (bool): If True, only print the current namespace.
+    """
+    from kubed.cache import read_names_cache, refresh_names_cache
+
+    index = load_index()
+    context = index.current
+    if not context or context not in index.contexts:
+        click.echo("No current context is set.", err=True)
+        sys.exit(1)
+    namespace = index.contexts[context]['namespace'] or 'default'
+    if current:
+        click.echo(namespace)
+        return
+
+    state = read_json(get_state_path(), {})
+    previous = state.setdefault('previous_namespace', {})
+    if query == '-':
+        name = previous.get(context)
+        if not name:
+            click.echo("No previous namespace.", err=True)
+            sys.exit(1)
+        names = None
+    else:
+        try:
+            _, names = read_names_cache(refresh_names_cache('namespaces', context))
+        except Exception as e:
+            # Listing is best effort: an exact name can still be switched to
+            click.echo(f"Warning: cannot list namespaces in {context}: {e}", err=True)
+            names = None
+        if query is None:
+            if names is None:
+                sys.exit(1)
+            _print_names(names, namespace)
+            return
+        name = pick(query, names, 'namespace') if names else query
+
+    if name != namespace:
+        index.set_namespace(context, name)
+        previous[context] = namespace
+        write_json(get_state_path(), state)
+    click.echo(f"Context \"{context}\" now uses namespace \"{name}\".")
+
+def prompt_kube_command(stamp=''):
+    """Refresh the prompt's cache of the current context, namespace and cluster, and print it.
+
+    The line is `stamp<TAB>context<TAB>namespace<TAB>cluster`; the p10k
+    kubed_kube segment compares the stamp with the kubeconfig files' mtimes.
+
+    Args:
+        stamp (str): The kubeconfig stamp computed by the shell, stored as is.
+    """
+    index = load_index()
+    context = index.current if index.current in index.contexts else None
+    info = index.contexts.get(context, {})
+    fields = [stamp, context or '', (info.get('namespace') or 'default') if context else '', info.get('cluster') or '']
+    line = '\t'.join(re.sub(r'[\t\n]', ' ', field) for field in fields)
+    atomic_write(os.path.join(get_cache_dir('prompt'), 'kube'), line + '\n')
+    click.echo(line)
@@ -0,0 +1,249 @@
+"""
+Follow the logs of every pod matching a label selector, for `kubed k8s logs`.
+
+Every log stream is read by its own thread over the context's shared API
+client. A stream may have at most `buffer_lines` lines waiting to be
+printed; when it is full the reading thread blocks, which stops reading the
+socket and pushes back on the API server. At most `max_streams` streams are
+open at once, pods beyond that wait for a free slot. While following, a pod
+watch picks up pods that start after the command began and forgets deleted
+ones, so memory stays flat however long it runs.
+"""
+
+import heapq
+import json
+import queue
+import sys
+import threading
+import time
+
+from kubed.k8s import iter_lines
+
+DEFAULT_MAX_STREAMS = 50
+DEFAULT_BUFFER_LINES = 256
+# How long lines are held back to be merged in timestamp order
+ORDER_WINDOW = 1.0
+WATCH_TIMEOUT = 300
+
+def default_container(pod):
+    """Get the container kubectl would pick: the annotated default, else the first."""
+    annotations = pod['metadata'].get('annotations') or {}
+    default = annotations.get('kubectl.kubernetes.io/default-container')
+    containers = [c['name'] for c in pod.get('spec', {}).get('containers', [])]
+    return default if default in containers else (containers[0] if containers else None)
+
+def container_started(pod, container):
+    """Check whether a container has started, i.e. has logs to read."""
+    for status in pod.get('status', {}).get('containerStatuses') or []:
+        if status.get('name') == container:
+            state = status.get('state') or {}
+            return 'running' in state or 'terminated' in state
+    return False
+
+def timestamp_key(line):
+    """Get a sortable key from the RFC 3339 timestamp the API server puts before each line."""
+    stamp = line.split(b' ', 1)[0]
+    seconds, _, fraction = stamp.rstrip(b'Z').partition(b'.')
+    # Nanoseconds are written without trailing zeros; pad so keys compare correctly
+    return seconds + b'.' + fraction.ljust(9, b'0')
+
+class LogStreams:
+    """Stream, merge and print the logs of a set of pods."""
+
+    def __init__(self, api, namespace, selector=None, names=(), container=None, all_containers=False,
+                 follow=False, tail=None, since=None, timestamps=False, order=False, prefix=True,
+                 max_streams=DEFAULT_MAX_STREAMS, buffer_lines=DEFAULT_BUFFER_LINES):
+        self.api = api
+        self.namespace = namespace
+        self.selector = selector
+        self.names = set(names)
+        self.container = container
+        self.all_containers = all_containers
+        self.follow = follow
+        self.tail = tail
+        self.since = since
+        self.timestamps = timestamps
+        self.order = order
+        self.prefix = prefix
+        self.max_streams = max_streams
+        self.buffer_lines = buffer_lines
+
+        # (label, line, slot) for each line read, None when a stream ends
+        self.lines = queue.Queue()
+        self.lock = threading.Lock()
+        # (pod uid, container) of every stream started, so a pod is never tailed twice
+        self.known = set()
+        self.waiting = {}
+        self.open = 0
+        self.failed = False
+        self.out = sys.stdout.buffer
+
+    def containers(self, pod):
+        """Get the containers of a pod whose logs were asked for."""
+        if self.container:
+            return [self.container]
+        if self.all_containers:
+            return [c['name'] for c in pod.get('spec', {}).get('containers', [])]
+        default = default_container(pod)
+        return [default] if default else []
+
+    def offer(self, pod):
+        """Queue the containers of a pod for streaming, once they have started."""
+        metadata = pod['metadata']
+        if self.names and metadata['name'] not in self.names:
+            return
+        with self.lock:
+            for container in self.containers(pod):
+                key = (metadata['uid'], container)
+                if key in self.known or key in self.waiting:
+                    continue
+                # A pod asked for by name is streamed anyway, so the server can say why it has no logs
+                if not self.names and not container_started(pod, container):
+                    continue
+                label = f"pod/{metadata['name']}/{container}" if self.prefix else None
+                self.waiting[key] = (metadata['name'], container, label)
+            self._start_waiting()
+
+    def forget(self, pod):
+        """Drop a deleted pod, so the bookkeeping does not grow with pod churn."""
+        uid = pod['metadata']['uid']
+        with self.lock:
+            self.known = {key for key in self.known if key[0] != uid}
+            self.waiting = {key: value for key, value in self.waiting.items() if key[0] != uid}
+
+    def _start_waiting(self):
+        """Open streams for waiting containers while under the cap; caller holds the lock."""
+        while self.waiting and self.open < self.max_streams:
+            key = next(iter(self.waiting))
+            name, container, label = self.waiting.pop(key)
+            self.known.add(key)
+            self.open += 1
+            threading.Thread(target=self._stream, args=(name, container, label), daemon=True).start()
+
+    def _stream(self, name, container, label):
+        """Read one log stream, blocking whenever its buffer is full."""
+        slots = threading.Semaphore(self.buffer_lines)
+        try:
+            response = self.api.read_namespaced_pod_log(
+                name, self.namespace, container=container, follow=self.follow,
+                timestamps=self.timestamps or self.order, tail_lines=self.tail,
+                since_seconds=self.since, _preload_content=False)
+            try:
+                for line in iter_lines(response):
+                    slots.acquire()
+                    self.lines.put((label, line, slots))
+            finally:
+                response.release_conn()
+        except Exception as e:
+            from kubernetes.client.exceptions import ApiException
+            from kubed.k8s import api_error_message
+
+            message = api_error_message(e) if isinstance(e, ApiException) else str(e)
+            self.lines.put((label, f"error: pod/{name}/{container}: {message}".encode(), None))
+        finally:
+            with self.lock:
+                self.open -= 1
+                self._start_waiting()
+            self.lines.put(None)
+
+    def relist(self):
+        """List matching pods, offer each one and return the list's resourceVersion."""
+        if self.names and not self.selector:
+            for name in self.names:
+                response = self.api.read_namespaced_pod(name, self.namespace, _preload_content=False)
+                self.offer(json.loads(response.data))
+            return None
+        response = self.api.list_namespaced_pod(self.namespace, label_selector=self.selector,
+                                                _preload_content=False)
+        pods = json.loads(response.data)
+        for pod in pods.get('items', []):
+            self.offer(pod)
+        return pods['metadata'].get('resourceVersion')
+
+    def watch(self, resource_version):
+        """Offer pods as they start and forget them when they are deleted."""
+        while True:
+            try:
+                response = self.api.list_namespaced_pod(
+                    self.namespace, label_selector=self.selector, watch=True,
+                    resource_version=resource_version, allow_watch_bookmarks=True,
+                    timeout_seconds=WATCH_TIMEOUT, _preload_content=False)
+                for line in iter_lines(response):
+                    if not line.strip():
+                        continue
+                    event = json.loads(line)
+                    pod = event.get('object', {})
+                    if event.get('type') == 'ERROR':
+                        resource_version = self.relist()
+                        break
+                    resource_version = pod.get('metadata', {}).get('resourceVersion', resource_version)
+                    if event.get('type') == 'DELETED':
+                        self.forget(pod)
+                    elif event.get('type') in ('ADDED', 'MODIFIED'):
+                        self.offer(pod)
+            except Exception:
+                time.sleep(1)
+                try:
+                    resource_version = self.relist()
+                except Exception:
+                    pass
+
+    def emit(self, label, line):
+        """Write one line, without the API timestamp unless it was asked for."""
+        if self.order and not self.timestamps and not line.startswith(b'error: '):
+            line = line.split(b' ', 1)[1] if b' ' in line else b''
+        if label:
+            self.out.write(b'[' + label.encode() + b'] ')
+        self.out.write(line + b'\n')
+
+    def finished(self):
+        with self.lock:
+            return not self.follow and not self.open and not self.waiting
+
+    def run(self):
+        """Print lines until every stream ended (or forever, when following).
+
+        Returns:
+            bool: True if no stream failed.
+        """
+        resource_version = self.relist()
+        if not self.known and not self.waiting and not self.follow:
+            return True
+        if self.follow and self.selector:
+            threading.Thread(target=self.watch, args=(resource_version,), daemon=True).start()
+
+        pending = []
+        sequence = 0
+        while True:
+            try:
+                item = self.lines.get(timeout=0.2)
+            except queue.Empty:
+                item = None
+            batch = [item]
+            # Drain what is already waiting before flushing, to write in larger chunks
+            while not self.lines.empty() and len(batch) < 1024:
+                batch.append(self.lines.get_nowait())
+
+            now = time.monotonic()
+            for entry in batch:
+                if entry is None:
+                    continue
+                label, line, slots = entry
+                if slots is None:
+                    self.failed = True
+                if self.order and slots is not None:
+                    sequence += 1
+                    heapq.heappush(pending, (timestamp_key(line), sequence, now, label, line, slots))
+                    continue
+                self.emit(label, line)
+                if slots is not None:
+                    slots.release()
+
+            done = self.finished() and self.lines.empty()
+            while pending and (done or now - pending[0][2] >= ORDER_WINDOW):
+                _, _, _, label, line, slots = heapq.heappop(pending)
+                self.emit(label, line)
+                slots.release()
+            self.out.flush()
+            if done and not pending:
+                return not self.failed
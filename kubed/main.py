@@ -1,3 +1,5 @@
+import click
+
 @click.group()
 def cli():
     """Kubed: A CLI tool for Docker, Kubernetes, Terraform, and Helm."""
@@ -6,38 +8,207 @@ def cli():
 @cli.command()
 @click.option('--zsh', is_flag=True, help='Use ZSH configuration.')
 @click.option('--force-yes', is_flag=True, help='Automatically answer yes to all installation prompts.')
-def setup(zsh, force_yes):
+@click.option('--check', is_flag=True, help='Show what setup would change without changing anything.')
+@click.option('--mirror', envvar='KUBED_ARTIFACT_MIRROR',
+              help='URL or directory to download kubectl, helm and terraform from.')
+def setup(zsh, force_yes, check, mirror):
     """Set up the kubed command-line tool."""
     from kubed.cli import setup_command
-    setup_command(zsh=zsh, force_yes=force_yes)
+    setup_command(zsh=zsh, force_yes=force_yes, check=check, mirror=mirror)
 
-@cli.command()
-@click.argument('command', nargs=-1)
+@cli.command(context_settings=dict(ignore_unknown_options=True), add_help_option=False)
+@click.argument('command', nargs=-1, type=click.UNPROCESSED)
 def docker(command):
     """Run docker commands."""
     from kubed.docker import docker_command
     docker_command(command)
 
-@cli.command()
-@click.argument('command', nargs=-1)
+@cli.command(context_settings=dict(ignore_unknown_options=True), add_help_option=False)
+@click.argument('command', nargs=-1, type=click.UNPROCESSED)
 def k8s(command):
     """Run kubernetes (kubectl) commands."""
     from kubed.k8s import k8s_command
     k8s_command(command)
 
-@cli.command()
-@click.argument('command', nargs=-1)
+@cli.command(context_settings=dict(ignore_unknown_options=True), add_help_option=False)
+@click.argument('command', nargs=-1, type=click.UNPROCESSED)
 def terraform(command):
     """Run terraform commands."""
     from kubed.terraform import terraform_command
     terraform_command(command)
 
-@cli.command()
-@click.argument('command', nargs=-1)
+@cli.command(context_settings=dict(ignore_unknown_options=True), add_help_option=False)
+@click.argument('command', nargs=-1, type=click.UNPROCESSED)
 def helm(command):
     """Run helm commands."""
     from kubed.helm import helm_command
     helm_command(command)
 
+@cli.command('completions-path')
+def completions_path():
+    """Print the path to the shell completions."""
+    from kubed.cli import completions_path_command
+    completions_path_command()
+
+@cli.command('aliases-path')
+def aliases_path():
+    """Print the path to the shell aliases."""
+    from kubed.cli import aliases_path_command
+    aliases_path_command()
+
+@cli.group()
+def completions():
+    """Manage cached shell completion scripts."""
+    pass
+
+@completions.command('rebuild')
+@click.argument('tools', nargs=-1)
+@click.option('--shell', type=click.Choice(['bash', 'zsh']), help='Shell to build completions for (defaults to $SHELL).')
+@click.option('--quiet', is_flag=True, help='Only report errors.')
+def completions_rebuild(tools, shell, quiet):
+    """Force a refresh of the cached kubectl/helm/docker/terraform completion scripts."""
+    from kubed.cache import completions_rebuild_command
+    completions_rebuild_command(tools, shell=shell, quiet=quiet)
+
+@completions.command('names')
+@click.argument('kind')
+@click.option('--context', help='Kubeconfig context (defaults to the current one).')
+@click.option('-n', '--namespace', help='Namespace (defaults to the context namespace).')
+@click.option('--ttl', default=60, show_default=True, help='Seconds refreshed names stay fresh.')
+@click.option('--force', is_flag=True, help='Refresh even if the cached names have not expired.')
+@click.option('--quiet', is_flag=True, help='Only refresh the cache, print nothing.')
+def completions_names(kind, context, namespace, ttl, force, quiet):
+    """Print cached resource names for shell completion, refreshing them once expired."""
+    from kubed.cache import completions_names_command
+    completions_names_command(kind, context=context, namespace=namespace or None, ttl=ttl, force=force, quiet=quiet)
+
+@completions.command('docker')
+@click.argument('kind', type=click.Choice(['containers', 'images', 'networks', 'volumes']), required=False)
+@click.option('--watch', is_flag=True, help='Keep the cache current from the Docker events stream.')
+@click.option('--idle-timeout', default=1800, show_default=True,
+              help='With --watch, exit after this many seconds without completion.')
+def completions_docker(kind, watch, idle_timeout):
+    """Print cached Docker names for shell completion, or keep them current with --watch."""
+    from kubed.docker import completions_docker_command
+    if not kind and not watch:
+        raise click.UsageError('give a KIND or --watch')
+    completions_docker_command(kind, watch=watch, idle_timeout=idle_timeout)
+
+@completions.command('terraform')
+@click.argument('kind', type=click.Choice(['workspaces', 'addresses']))
+@click.option('--chdir', 'directory', type=click.Path(file_okay=False), help='Terraform working directory.')
+@click.option('--quiet', is_flag=True, help='Only refresh the cache, print nothing.')
+def completions_terraform(kind, directory, quiet):
+    """Refresh and print the cached terraform workspaces or resource addresses used by completion."""
+    from kubed.terraform import completions_terraform_command
+    completions_terraform_command(kind, directory=directory, quiet=quiet)
+
+@cli.command()
+@click.argument('shell', type=click.Choice(['bash', 'zsh']))
+@click.option('--force', is_flag=True, help='Rewrite the bundle even if it is up to date.')
+def init(shell, force):
+    """Write the single init bundle sourced from your shell rc file."""
+    from kubed.bundle import init_command
+    init_command(shell, force=force)
+
+@cli.command()
+@click.argument('tools', nargs=-1, type=click.Choice(['kubectl', 'helm', 'terraform']))
+@click.option('--mirror', envvar='KUBED_ARTIFACT_MIRROR', help='URL or directory to download from instead of upstream.')
+@click.option('--dest', type=click.Path(file_okay=False), help='Directory to install into (default: ~/.kubed/bin).')
+@click.option('--os', 'os_name', help='OS to download for (default: this host).')
+@click.option('--arch', help='Architecture to download for (default: this host).')
+@click.option('--download-only', is_flag=True, help='Only fill the artifact store in ~/.kubed/artifacts.')
+@click.option('--version', 'versions', multiple=True, metavar='TOOL=VERSION',
+              help='Install another version of a tool, e.g. kubectl=v1.30.0 (default: $KUBED_<TOOL>_VERSION, '
+                   'then the pinned one).')
+def install(tools, mirror, dest, os_name, arch, download_only, versions):
+    """Download verified kubectl, helm and terraform releases and install them."""
+    from kubed.artifacts import install_command
+    install_command(tools, mirror=mirror, dest=dest, os_name=os_name, arch=arch, download_only=download_only,
+                    versions=versions)
+
+@cli.command()
+@click.argument('query', required=False)
+@click.option('-c', '--current', is_flag=True, help='Print the current context.')
+def ctx(query, current):
+    """List kubeconfig contexts, or switch to the one matching QUERY ('-' for the previous one)."""
+    from kubed.kubeconfig import ctx_command
+    ctx_command(query, current=current)
+
+@cli.command()
+@click.argument('query', required=False)
+@click.option('-c', '--current', is_flag=True, help='Print the current namespace.')
+def ns(query, current):
+    """List namespaces, or switch the current context to the one matching QUERY ('-' for the previous one)."""
+    from kubed.kubeconfig import ns_command
+    ns_command(query, current=current)
+
+@cli.group()
+def prompt():
+    """Refresh the caches behind kubed's prompt segments."""
+    pass
+
+@prompt.command('kube')
+@click.option('--stamp', default='', help='Kubeconfig stamp computed by the shell, stored with the cache.')
+def prompt_kube(stamp):
+    """Cache and print the current context, namespace and cluster for the kubed_kube p10k segment."""
+    from kubed.kubeconfig import prompt_kube_command
+    prompt_kube_command(stamp)
+
+@cli.command()
+@click.option('--refresh', is_flag=True, help='Re-run every probe instead of using cached results.')
+@click.option('--json', 'json_output', is_flag=True, help='Print results as JSON.')
+def doctor(refresh, json_output):
+    """Show the installed version and path of each tool kubed manages."""
+    from kubed.probe import doctor_command
+    doctor_command(refresh=refresh, json_output=json_output)
+
+@cli.command('profile-startup')
+@click.option('--shell', type=click.Choice(['bash', 'zsh']), help='Shell to profile (defaults to $SHELL).')
+@click.option('--runs', default=10, show_default=True, help='Number of shell starts per component.')
+@click.option('--json', 'json_output', is_flag=True, help='Print results as JSON.')
+def profile_startup(shell, runs, json_output):
+    """Measure how much shell startup time each kubed artifact adds."""
+    from kubed.startup import profile_startup_command
+    profile_startup_command(shell=shell, runs=runs, json_output=json_output)
+
+@cli.command()
+@click.option('--tool', type=click.Choice(['kubectl', 'docker', 'terraform', 'helm']), help='Only show this tool.')
+@click.option('--json', 'json_output', is_flag=True, help='Print results as JSON.')
+def stats(tool, json_output):
+    """Show latency percentiles per tool and subcommand."""
+    from kubed.stats import stats_command
+    stats_command(tool=tool, json_output=json_output)
+
+@cli.group()
+def daemon():
+    """Run a resident process that serves `kubed k8s get` from watch caches."""
+    pass
+
+@daemon.command('start')
+@click.option('--foreground', is_flag=True, help='Run in the foreground instead of detaching.')
+@click.option('--kubeconfig', help='Kubeconfig file to use (defaults to $KUBECONFIG or ~/.kube/config).')
+@click.option('--idle-timeout', default=900, show_default=True, help='Seconds before an unused context is evicted.')
+@click.option('--max-objects', default=50000, show_default=True, help='Maximum objects per resource cache.')
+@click.option('--max-bytes', default=64 * 1024 * 1024, show_default=True, help='Maximum bytes per resource cache.')
+def daemon_start(foreground, kubeconfig, idle_timeout, max_objects, max_bytes):
+    """Start the daemon."""
+    from kubed.daemon import daemon_start_command
+    daemon_start_command(foreground=foreground, kubeconfig=kubeconfig, idle_timeout=idle_timeout,
+                         max_objects=max_objects, max_bytes=max_bytes)
+
+@daemon.command('stop')
+def daemon_stop():
+    """Stop the daemon."""
+    from kubed.daemon import daemon_stop_command
+    daemon_stop_command()
+
+@daemon.command('stats')
+@click.option('--json', 'json_output', is_flag=True, help='Print results as JSON.')
+def daemon_stats(json_output):
+    """Show cache sizes and hit rates per context and resource."""
+    from kubed.daemon import daemon_stats_command
+    daemon_stats_command(json_output=json_output)
+
 if __name__ == '__main__':
     cli() 
\ No newline at end of file
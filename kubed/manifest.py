@@ -0,0 +1,218 @@
+"""
+Track the files and rc-file blocks that `kubed setup` owns.
+
+Setup describes everything it manages up front: artifacts (a path and the
+content it should have) and rc-file blocks (named runs of lines between kubed
+markers in ~/.zshrc or ~/.bashrc). ~/.kubed/manifest.json records the
+content hash, size and mtime of each file as kubed last wrote it, so a re-run
+can tell that a file is unchanged from a stat alone, writes only what
+differs, and leaves alone files the user has edited since.
+"""
+
+import difflib
+import hashlib
+import json
+import os
+
+from kubed.cache import atomic_write, get_kubed_dir, read_json, write_json
+
+MANIFEST_VERSION = 1
+
+def get_manifest_path():
+    """Get the path to ~/.kubed/manifest.json."""
+    return os.path.join(get_kubed_dir(), 'manifest.json')
+
+def load_manifest():
+    """Load the manifest, or an empty one if it is missing or from another version."""
+    manifest = read_json(get_manifest_path(), {})
+    if manifest.get('version') != MANIFEST_VERSION:
+        manifest = {'version': MANIFEST_VERSION}
+    manifest.setdefault('files', {})
+    manifest.setdefault('blocks', {})
+    return manifest
+
+def content_hash(content):
+    """Hash text content."""
+    return hashlib.sha256(content.encode()).hexdigest()
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return None
+
+class Artifact:
+    """A file setup writes.
+
+    Args:
+        path (str): Where the file goes.
+        content (str): What it should contain.
+        mode (int): Permissions.
+        user_owned (bool): If True, the file is only created, or updated while
+            it still holds what kubed last wrote; edits by the user are kept.
+        after_write: Called with the path after the file was written.
+    """
+
+    def __init__(self, path, content, mode=0o644, user_owned=False, after_write=None):
+        self.path = path
+        self.content = content
+        self.mode = mode
+        self.user_owned = user_owned
+        self.after_write = after_write
+
+class Block:
+    """A named block of lines setup keeps in an rc file.
+
+    Args:
+        name (str): Name in the block's markers.
+        content (str): Lines between the markers.
+        legacy (tuple): Text written by older versions; replaced by the block.
+        satisfied_by (tuple): Text that makes the block unnecessary if present.
+    """
+
+    def __init__(self, name, content, legacy=(), satisfied_by=()):
+        self.name = name
+        self.content = content
+        self.legacy = legacy
+        self.satisfied_by = satisfied_by
+
+    @property
+    def begin(self):
+        return f'# >>> kubed {self.name} >>>'
+
+    @property
+    def end(self):
+        return f'# <<< kubed {self.name} <<<'
+
+    def render(self):
+        return f"{self.begin}\n{self.content.rstrip(chr(10))}\n{self.end}\n"
+
+    def apply(self, text):
+        """Get text with this block added or brought up to date."""
+        start = text.find(self.begin)
+        if start >= 0:
+            stop = text.find(self.end, start)
+            if stop >= 0:
+                stop += len(self.end)
+                if text[stop:stop + 1] == '\n':
+                    stop += 1
+                return text[:start] + self.render() + text[stop:]
+        for old in self.legacy:
+            if old in text:
+                return text.replace(old, self.render().rstrip('\n'), 1)
+        if any(line in text for line in self.satisfied_by):
+            return text
+        return text + ('' if not text or text.endswith('\n') else '\n') + '\n' + self.render()
+
+class RcFile:
+    """An rc file and the blocks and edits setup makes to it.
+
+    Edits are functions from the file's text to the new text, for settings
+    that must change in place (e.g. ZSH_THEME) rather than live in a block.
+    """
+
+    def __init__(self, path, blocks=(), edits=()):
+        self.path = path
+        self.blocks = list(blocks)
+        self.edits = list(edits)
+
+    def render(self, text):
+        for edit in self.edits:
+            text = edit(text)
+        for block in self.blocks:
+            text = block.apply(text)
+        return text
+
+class Change:
+    """A file setup would write: its current and new content."""
+
+    def __init__(self, path, old, new, mode=0o644, after_write=None, blocks=()):
+        self.path = path
+        self.old = old
+        self.new = new
+        self.mode = mode
+        self.after_write = after_write
+        self.blocks = blocks
+
+    def diff(self):
+        """Get a unified diff from the current to the new content."""
+        old = (self.old or '').splitlines(keepends=True)
+        new = self.new.splitlines(keepends=True)
+        label = self.path.replace(os.path.expanduser('~'), '~', 1)
+        return ''.join(difflib.unified_diff(old, new, f'a/{label}' if self.old is not None else '/dev/null',
+                                            f'b/{label}'))
+
+def _unchanged(path, entry, digest):
+    """Check from a stat alone whether a file still holds what the manifest recorded as digest."""
+    if not entry or entry.get('sha256') != digest:
+        return False
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    return st.st_size == entry.get('size') and st.st_mtime_ns == entry.get('mtime_ns')
+
+def plan_changes(artifacts=(), rc_files=(), manifest=None):
+    """Work out which files setup needs to write.
+
+    Returns:
+        tuple: (list of Change, list of user-edited paths left alone)
+    """
+    manifest = manifest or load_manifest()
+    changes, kept = [], []
+    for artifact in artifacts:
+        digest = content_hash(artifact.content)
+        entry = manifest['files'].get(artifact.path)
+        if _unchanged(artifact.path, entry, digest):
+            continue
+        current = _read(artifact.path)
+        if current == artifact.content:
+            continue
+        if artifact.user_owned and current is not None and \
+                (entry is None or content_hash(current) != entry.get('sha256')):
+            kept.append(artifact.path)
+            continue
+        changes.append(Change(artifact.path, current, artifact.content, artifact.mode, artifact.after_write))
+
+    for rc_file in rc_files:
+        current = _read(rc_file.path)
+        new = rc_file.render(current or '')
+        if new != (current or ''):
+            mode = os.stat(rc_file.path).st_mode & 0o7777 if current is not None else 0o644
+            changes.append(Change(rc_file.path, current, new, mode, blocks=rc_file.blocks))
+    return changes, kept
+
+def record(manifest, path, content):
+    """Record a file as written by kubed."""
+    st = os.stat(path)
+    manifest['files'][path] = {'sha256': content_hash(content), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+def apply_changes(changes, artifacts=(), manifest=None):
+    """Atomically write changed files and save the manifest.
+
+    Artifacts already holding their content are recorded too, so the next
+    run can skip them from a stat. The manifest is only rewritten when an
+    entry changed.
+    """
+    manifest = manifest or load_manifest()
+    before = json.dumps(manifest, sort_keys=True)
+    for change in changes:
+        atomic_write(change.path, change.new, mode=change.mode)
+        if change.after_write:
+            change.after_write(change.path)
+        for block in change.blocks:
+            manifest['blocks'][f'{change.path}#{block.name}'] = content_hash(block.content)
+    written = {change.path for change in changes}
+    for artifact in artifacts:
+        entry = manifest['files'].get(artifact.path)
+        if _unchanged(artifact.path, entry, content_hash(artifact.content)):
+            continue
+        # A user-owned file is only claimed once kubed has written it
+        if artifact.user_owned and artifact.path not in written and entry is None:
+            continue
+        if _read(artifact.path) == artifact.content:
+            record(manifest, artifact.path, artifact.content)
+    if json.dumps(manifest, sort_keys=True) != before:
+        write_json(get_manifest_path(), manifest)
+    return manifest
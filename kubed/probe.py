@@ -0,0 +1,159 @@
+"""
+Concurrent, cached probing of the tools kubed manages.
+
+Every probe runs without a shell and with a timeout. Results (installed,
+version, path) are kept in ~/.kubed/state.json and reused until they expire
+or the binary on PATH changes.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+from kubed.cache import get_kubed_dir, read_json, write_json
+
+# Command run to probe each tool. brew has no command: its presence on PATH is
+# all check_and_install_tools needs, and `brew --version` is slow.
+PROBES = {
+    'setuptools': ['python3', '-c', 'import setuptools; print(setuptools.__version__)'],
+    'brew': None,
+    'docker': ['docker', '--version'],
+    'kubectl': ['kubectl', 'version', '--client'],
+    'helm': ['helm', 'version', '--short'],
+    'terraform': ['terraform', '--version'],
+}
+
+DEFAULT_TIMEOUT = 5
+DEFAULT_TTL = 24 * 60 * 60
+
+def get_state_path():
+    """Get the path to ~/.kubed/state.json."""
+    return os.path.join(get_kubed_dir(), 'state.json')
+
+def _binary_stamp(path):
+    """Get the mtime of a binary, used to notice in-place upgrades."""
+    try:
+        return int(os.stat(path).st_mtime)
+    except OSError:
+        return None
+
+def run_probe(name, timeout=DEFAULT_TIMEOUT):
+    """Probe a single tool.
+
+    Returns:
+        dict: installed, version, path, mtime, error and checked_at fields.
+    """
+    argv = PROBES[name]
+    binary = shutil.which(argv[0] if argv else name)
+    result = {
+        'installed': False,
+        'version': None,
+        'path': binary,
+        'mtime': _binary_stamp(binary) if binary else None,
+        'error': None,
+        'checked_at': time.time(),
+    }
+    if not binary:
+        result['error'] = 'not found on PATH'
+        return result
+    if argv is None:
+        result['installed'] = True
+        return result
+
+    try:
+        proc = subprocess.run([binary] + argv[1:], capture_output=True, text=True,
+                              timeout=timeout, stdin=subprocess.DEVNULL)
+    except subprocess.TimeoutExpired:
+        result['error'] = f'timed out after {timeout}s'
+        return result
+    except OSError as e:
+        result['error'] = str(e)
+        return result
+
+    output = (proc.stdout.strip() or proc.stderr.strip()).splitlines()
+    if proc.returncode == 0:
+        result['installed'] = True
+        result['version'] = output[0].strip() if output else None
+    else:
+        result['error'] = output[-1].strip() if output else f'exited with {proc.returncode}'
+    return result
+
+def _is_fresh(cached, name, max_age):
+    """Check whether a cached probe result can still be used."""
+    if not cached or time.time() - cached.get('checked_at', 0) > max_age:
+        return False
+    argv = PROBES[name]
+    binary = shutil.which(argv[0] if argv else name)
+    return binary == cached.get('path') and (not binary or _binary_stamp(binary) == cached.get('mtime'))
+
+def probe_tools(names=None, timeout=DEFAULT_TIMEOUT, max_age=DEFAULT_TTL, refresh=False):
+    """Probe tools concurrently, reusing fresh results from ~/.kubed/state.json.
+
+    Args:
+        names (list): Tools to probe; all of PROBES if None.
+        timeout (int): Per-probe timeout in seconds.
+        max_age (int): Seconds a cached result stays valid.
+        refresh (bool): If True, ignore cached results.
+
+    Returns:
+        dict: Probe result per tool name.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    names = list(names or PROBES)
+    state = read_json(get_state_path(), {})
+    cached = state.get('probes', {})
+
+    results = {}
+    stale = []
+    for name in names:
+        if not refresh and _is_fresh(cached.get(name), name, max_age):
+            results[name] = cached[name]
+        else:
+            stale.append(name)
+
+    if stale:
+        with ThreadPoolExecutor(max_workers=len(stale)) as pool:
+            for name, result in zip(stale, pool.map(lambda n: run_probe(n, timeout), stale)):
+                results[name] = result
+        cached.update((name, results[name]) for name in stale)
+        state['probes'] = cached
+        try:
+            write_json(get_state_path(), state)
+        except OSError:
+            pass
+    return results
+
+def invalidate_probes(names):
+    """Drop cached probe results, e.g. after installing a tool."""
+    state = read_json(get_state_path(), {})
+    probes = state.get('probes', {})
+    removed = [probes.pop(name, None) for name in names]
+    if any(result is not None for result in removed):
+        write_json(get_state_path(), state)
+
+def doctor_command(refresh=False, json_output=False):
+    """Report the installed version and path of every tool kubed manages.
+
+    Args:
+        refresh (bool): If True, re-run every probe instead of using cached results.
+        json_output (bool): If True, print machine-readable JSON.
+    """
+    import json
+    import click
+
+    results = probe_tools(refresh=refresh)
+    if json_output:
+        click.echo(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        click.echo(f"{'TOOL':<12}{'STATUS':<10}{'VERSION':<36}PATH")
+        for name, result in results.items():
+            status = '✅ ok' if result['installed'] else '❌ missing'
+            detail = result['version'] or result['error'] or ''
+            click.echo(f"{name:<12}{status:<10}{detail[:35]:<36}{result['path'] or '-'}")
+
+    # Homebrew is only one of several install methods, so it is not required
+    if not all(result['installed'] for name, result in results.items() if name != 'brew'):
+        sys.exit(1)
@@ -0,0 +1,163 @@
+"""
+Measure how much shell startup time each Kubed artifact adds.
+"""
+
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+# Sets up what the kubed artifacts expect from an interactive zsh (compdef)
+ZSH_PRELUDE = 'autoload -Uz compinit && compinit -C -d "${TMPDIR:-/tmp}/.kubed-profile-zcompdump"'
+
+# The package lookup older rc-file snippets ran on every shell start
+PIP_LOOKUP = "KUBED_PATH=$(pip3 show kubed 2>/dev/null | grep Location | awk '{print $2}')"
+
+OH_MY_ZSH = '''export ZSH="$HOME/.oh-my-zsh"
+ZSH_THEME="powerlevel10k/powerlevel10k"
+plugins=(kubectl)
+source "$ZSH/oh-my-zsh.sh"
+[[ -f ~/.p10k.zsh ]] && source ~/.p10k.zsh'''
+
+def get_kubed_version():
+    """Get the installed kubed version."""
+    try:
+        from importlib.metadata import version, PackageNotFoundError
+        try:
+            return version('kubed')
+        except PackageNotFoundError:
+            pass
+    except ImportError:
+        pass
+    from kubed import __version__
+    return __version__
+
+def percentile(samples, pct):
+    """Get the nearest-rank percentile of a list of samples."""
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+def get_components(shell):
+    """Get the kubed artifacts to profile for a shell.
+
+    Returns:
+        list: (name, shell snippet) pairs for each artifact that exists.
+    """
+    from kubed.cli import get_aliases_path, get_completions_path
+
+    home = os.path.expanduser('~')
+    sources = [
+        ('aliases', os.path.join(get_aliases_path() or '', 'aliases.sh')),
+        ('help_wrapper', os.path.join(get_aliases_path() or '', 'help_wrapper.sh')),
+        ('completions', os.path.join(get_completions_path() or '', shell, f'{shell}_completions.sh')),
+    ]
+    sources.append(('bundle', os.path.join(home, '.kubed', f'init.{shell}')))
+
+    components = [(name, f'source "{path}"') for name, path in sources if os.path.isfile(path)]
+    if shutil.which('pip3'):
+        components.append(('pip_lookup', PIP_LOOKUP))
+    if shell == 'zsh' and os.path.isfile(os.path.join(home, '.oh-my-zsh', 'oh-my-zsh.sh')):
+        components.append(('oh_my_zsh', OH_MY_ZSH))
+    return components
+
+def time_shell(shell_argv, script, runs):
+    """Start a non-interactive shell running script several times.
+
+    Returns:
+        list: Wall-clock time of each run in milliseconds.
+    """
+    samples = []
+    # One untimed run to warm the page cache
+    for i in range(runs + 1):
+        start = time.perf_counter()
+        subprocess.run(shell_argv + [script], stdin=subprocess.DEVNULL,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        elapsed = (time.perf_counter() - start) * 1000
+        if i:
+            samples.append(elapsed)
+    return samples
+
+def profile_startup(shell, runs=10):
+    """Profile shell startup with each kubed artifact alone and all together.
+
+    Args:
+        shell (str): 'bash' or 'zsh'.
+        runs (int): Number of shell starts per component.
+
+    Returns:
+        dict: Timing summary per component, including the bare 'baseline' shell.
+    """
+    shell_path = shutil.which(shell)
+    if not shell_path:
+        raise RuntimeError(f"{shell} is not installed.")
+    if shell == 'zsh':
+        shell_argv, prelude = [shell_path, '-f', '-c'], ZSH_PRELUDE
+    else:
+        shell_argv, prelude = [shell_path, '--norc', '--noprofile', '-c'], ':'
+
+    components = get_components(shell)
+    scripts = [('baseline', prelude)]
+    scripts += [(name, f'{prelude}\n{snippet}') for name, snippet in components]
+    # The bundle already contains the other artifacts, so it is measured on its own
+    combined = [snippet for name, snippet in components if name != 'bundle']
+    if combined:
+        scripts.append(('all', '\n'.join([prelude] + combined)))
+
+    results = {}
+    for name, script in scripts:
+        samples = time_shell(shell_argv, script, runs)
+        results[name] = {
+            'p50_ms': round(percentile(samples, 50), 2),
+            'p95_ms': round(percentile(samples, 95), 2),
+            'max_ms': round(max(samples), 2),
+        }
+    baseline = results['baseline']['p50_ms']
+    for summary in results.values():
+        summary['added_p50_ms'] = round(summary['p50_ms'] - baseline, 2)
+
+    return {
+        'kubed_version': get_kubed_version(),
+        'shell': shell,
+        'runs': runs,
+        'components': results,
+    }
+
+def profile_startup_command(shell=None, runs=10, json_output=False):
+    """Report how much startup time each kubed artifact adds to a shell.
+
+    Args:
+        shell (str): 'bash' or 'zsh'; defaults to the user's shell.
+        runs (int): Number of shell starts per component.
+        json_output (bool): If True, print machine-readable JSON.
+    """
+    import click
+    from kubed.cli import get_shell
+
+    shell = shell or get_shell()
+    if shell not in ('bash', 'zsh'):
+        click.echo("Could not determine shell, pass --shell bash or --shell zsh.", err=True)
+        sys.exit(1)
+    if runs < 1:
+        click.echo("--runs must be at least 1.", err=True)
+        sys.exit(1)
+
+    try:
+        report = profile_startup(shell, runs=runs)
+    except RuntimeError as e:
+        click.echo(str(e), err=True)
+        sys.exit(1)
+
+    if json_output:
+        click.echo(json.dumps(report, indent=2))
+        return
+
+    click.echo(f"kubed {report['kubed_version']} {shell} startup, {runs} runs per component\n")
+    click.echo(f"{'COMPONENT':<14}{'P50 (ms)':>10}{'P95 (ms)':>10}{'MAX (ms)':>10}{'ADDED P50':>12}")
+    for name, summary in report['components'].items():
+        added = '' if name == 'baseline' else f"{summary['added_p50_ms']:+.1f}"
+        click.echo(f"{name:<14}{summary['p50_ms']:>10.1f}{summary['p95_ms']:>10.1f}"
+                   f"{summary['max_ms']:>10.1f}{added:>12}")
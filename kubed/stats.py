@@ -0,0 +1,93 @@
+"""
+Summarize the per-command latency recorded by the kubed shell hooks.
+
+The hooks in help_wrapper.sh write fixed-width 64-byte records
+("tool subcommand milliseconds epoch") into a ring-buffer file, overwriting
+the oldest slot once it is full.
+"""
+
+import json
+import os
+import sys
+
+from kubed.startup import percentile
+
+RECORD_SIZE = 64
+
+def get_stats_path():
+    """Get the path to the latency ring-buffer file."""
+    return os.environ.get('KUBED_STATS_FILE') or os.path.expanduser('~/.kubed/stats/latency.ring')
+
+def read_records(path):
+    """Read the latency records from a ring-buffer file.
+
+    Returns:
+        list: (tool, subcommand, milliseconds, epoch seconds) tuples. Empty or
+        partially written slots are skipped.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError:
+        return []
+
+    records = []
+    for offset in range(0, len(data) - RECORD_SIZE + 1, RECORD_SIZE):
+        chunk = data[offset:offset + RECORD_SIZE]
+        if b'\0' in chunk or not chunk.endswith(b'\n'):
+            continue
+        fields = chunk.decode('utf-8', 'replace').split()
+        if len(fields) != 4:
+            continue
+        try:
+            records.append((fields[0], fields[1], float(fields[2]), int(fields[3])))
+        except ValueError:
+            continue
+    return records
+
+def summarize(records, tool=None):
+    """Compute latency percentiles per tool and subcommand.
+
+    Returns:
+        list: One dict per (tool, subcommand), busiest first within each tool.
+    """
+    groups = {}
+    for record_tool, subcommand, ms, _ in records:
+        if tool and record_tool != tool:
+            continue
+        groups.setdefault((record_tool, subcommand), []).append(ms)
+
+    rows = []
+    for (record_tool, subcommand), samples in groups.items():
+        rows.append({
+            'tool': record_tool,
+            'subcommand': subcommand,
+            'count': len(samples),
+            'p50_ms': round(percentile(samples, 50), 1),
+            'p95_ms': round(percentile(samples, 95), 1),
+            'max_ms': round(max(samples), 1),
+        })
+    rows.sort(key=lambda row: (row['tool'], -row['count'], row['subcommand']))
+    return rows
+
+def stats_command(tool=None, json_output=False):
+    """Show latency percentiles per tool and subcommand.
+
+    Args:
+        tool (str): Only show this tool.
+        json_output (bool): If True, print machine-readable JSON.
+    """
+    import click
+
+    rows = summarize(read_records(get_stats_path()), tool=tool)
+    if json_output:
+        click.echo(json.dumps(rows, indent=2))
+        return
+    if not rows:
+        click.echo("No commands recorded yet. Stats are collected by the kubed shell hooks.", err=True)
+        sys.exit(1)
+
+    click.echo(f"{'TOOL':<11}{'SUBCOMMAND':<25}{'COUNT':>7}{'P50 (ms)':>11}{'P95 (ms)':>11}{'MAX (ms)':>11}")
+    for row in rows:
+        click.echo(f"{row['tool']:<11}{row['subcommand']:<25}{row['count']:>7}"
+                   f"{row['p50_ms']:>11.1f}{row['p95_ms']:>11.1f}{row['max_ms']:>11.1f}")
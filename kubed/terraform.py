@@ -0,0 +1,608 @@
+"""
+Terraform commands for repositories with many root modules.
+
+`kubed terraform plan --all [GLOB...]` finds the root modules under the
+given paths and runs `terraform init` and `terraform plan` in each of them,
+several at once. Every run shares one provider plugin cache in
+~/.kubed/cache/terraform/plugins, so each provider version is downloaded
+once however many modules use it. The output of each run goes to its own
+file, and a summary table of resource changes and durations is printed at
+the end. Any other `kubed terraform` invocation is handed to terraform.
+
+Shell completion of terraform does not run terraform on Tab: the command and
+flag tree is read from terraform's help once per terraform version and
+cached as a static shell table (see completion_script), and workspace names
+and resource addresses are served from a cache refreshed in the background
+whenever `.terraform/environment` or the state file changes.
+"""
+
+import glob
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+import click
+
+from kubed.cache import get_cache_dir, get_kubed_dir
+
+DEFAULT_CONCURRENCY = 4
+
+PLAN_SUMMARY = re.compile(rb'Plan: (\d+) to import, (\d+) to add, (\d+) to change, (\d+) to destroy|'
+                          rb'Plan: (\d+) to add, (\d+) to change, (\d+) to destroy')
+# terraform plan options that take a value, which may follow as a separate argument
+PLAN_VALUE_FLAGS = {'var', 'var-file', 'target', 'replace', 'exclude', 'lock-timeout', 'parallelism', 'state',
+                    'state-out', 'backup', 'generate-config-out'}
+# Blocks that only appear in a root module, not in a module it calls (but see is_root_module)
+ROOT_MARKERS = re.compile(rb'(?:^|[\s{])(?:backend\s+"|cloud\s*\{|provider\s+")')
+# A provider and its selected version in .terraform.lock.hcl
+LOCKED_PROVIDER = re.compile(r'provider\s+"([^"]+)"\s*\{[^}]*?\bversion\s*=\s*"([^"]+)"')
+
+def is_root_module(path):
+    """Check whether a directory is a Terraform root module.
+
+    A directory of .tf files counts as one if it was initialized before (it has
+    a dependency lock file) or configures a backend, Terraform Cloud or a
+    provider. Child modules that still configure their own providers (an older
+    style terraform discourages) match the provider marker too, and are planned
+    as if they were root modules; pass narrower globs to leave them out.
+    """
+    try:
+        names = os.listdir(path)
+    except OSError:
+        return False
+    tf_files = [name for name in names if name.endswith('.tf')]
+    if not tf_files:
+        return False
+    if '.terraform.lock.hcl' in names:
+        return True
+    for name in tf_files:
+        try:
+            with open(os.path.join(path, name), 'rb') as f:
+                if ROOT_MARKERS.search(f.read()):
+                    return True
+        except OSError:
+            continue
+    return False
+
+def find_root_modules(patterns):
+    """Find the root modules in or below the directories matching glob patterns.
+
+    Returns:
+        list: Sorted relative paths of root modules.
+    """
+    found = set()
+    for pattern in patterns or ['.']:
+        for match in glob.glob(pattern, recursive=True):
+            if not os.path.isdir(match):
+                continue
+            for dirpath, dirnames, _ in os.walk(match):
+                # Skip provider and module downloads, and hidden directories such as .git
+                dirnames[:] = sorted(d for d in dirnames if not d.startswith('.'))
+                if is_root_module(dirpath):
+                    found.add(os.path.normpath(dirpath))
+    return sorted(found)
+
+def get_plugin_cache_dir():
+    """Get the provider plugin cache shared by every run, honouring TF_PLUGIN_CACHE_DIR."""
+    if os.environ.get('TF_PLUGIN_CACHE_DIR'):
+        os.makedirs(os.environ['TF_PLUGIN_CACHE_DIR'], exist_ok=True)
+        return os.environ['TF_PLUGIN_CACHE_DIR']
+    return get_cache_dir('terraform', 'plugins')
+
+def read_locked_providers(module):
+    """Get the (source, version) of each provider in a module's dependency lock file.
+
+    Returns:
+        list: e.g. [('registry.terraform.io/hashicorp/aws', '5.40.0')], or None
+        if the module has no lock file.
+    """
+    try:
+        with open(os.path.join(module, '.terraform.lock.hcl')) as f:
+            return LOCKED_PROVIDER.findall(f.read())
+    except OSError:
+        return None
+
+def parse_plan_counts(output):
+    """Get (add, change, destroy) from the output of terraform plan, or None if it printed no plan."""
+    matches = list(PLAN_SUMMARY.finditer(output))
+    if matches:
+        groups = matches[-1].groups()
+        counts = groups[1:4] if groups[0] is not None else groups[4:7]
+        return tuple(int(count) for count in counts)
+    if b'No changes.' in output:
+        return (0, 0, 0)
+    return None
+
+def split_plan_args(args):
+    """Split `plan --all` arguments into module path patterns and terraform plan options.
+
+    Options are taken whole, with the value of a PLAN_VALUE_FLAGS option whether
+    it is given as `-var=a=b` or as `-var a=b`.
+
+    Returns:
+        tuple: (patterns, terraform_args)
+    """
+    patterns, terraform_args = [], []
+    args = iter(args)
+    for arg in args:
+        if not arg.startswith('-') or arg == '-':
+            patterns.append(arg)
+            continue
+        name, has_value, _ = arg.lstrip('-').partition('=')
+        if name == 'out':
+            raise click.UsageError("-out cannot be used with --all; each run's plan is saved in --output-dir")
+        terraform_args.append(arg)
+        if name in PLAN_VALUE_FLAGS and not has_value:
+            value = next(args, None)
+            if value is None:
+                raise click.UsageError(f"{arg} needs a value")
+            terraform_args.append(value)
+    return patterns, terraform_args
+
+def output_name(module, workspace=None):
+    """Get a file name for the output of one run."""
+    name = 'root' if module == '.' else module.strip(os.sep).replace(os.sep, '__')
+    return f'{name}@{workspace}' if workspace else name
+
+class PlanRunner:
+    """Run init and plan in many root modules at once."""
+
+    def __init__(self, terraform_args=(), output_dir=None, init=True, concurrency=DEFAULT_CONCURRENCY):
+        self.terraform_args = list(terraform_args)
+        self.output_dir = output_dir
+        self.init = init
+        self.concurrency = concurrency
+        self.plugin_cache = get_plugin_cache_dir()
+        self.env = dict(os.environ, TF_PLUGIN_CACHE_DIR=self.plugin_cache, TF_IN_AUTOMATION='1',
+                        TF_INPUT='0')
+        # The plugin cache is not safe for concurrent installs, so an init that may download
+        # takes this lock; one whose locked providers are all cached only links them in, and
+        # runs alongside the others
+        self.init_lock = threading.Lock()
+
+    def is_cached(self, module):
+        """Check whether every provider a module locks is in the plugin cache for this platform.
+
+        A module without a lock file, or with one naming no providers, may need
+        anything, so its cache counts as cold.
+        """
+        from kubed.artifacts import detect_platform
+
+        providers = read_locked_providers(module)
+        if not providers:
+            return False
+        platform_dir = '_'.join(detect_platform())
+        return all(os.path.isdir(os.path.join(self.plugin_cache, *source.split('/'), version, platform_dir))
+                   for source, version in providers)
+
+    def run_one(self, module, workspace=None):
+        """Run init and plan in one module, writing their output to a file.
+
+        Returns:
+            dict: module, workspace, status, counts, duration and log path.
+        """
+        name = output_name(module, workspace)
+        log_path = os.path.join(self.output_dir, f'{name}.log')
+        env = dict(self.env, TF_WORKSPACE=workspace) if workspace else self.env
+        started = time.monotonic()
+        result = {'module': module, 'workspace': workspace, 'counts': None, 'log': log_path}
+
+        with open(log_path, 'wb') as log:
+            def run(args):
+                log.write(f"$ terraform {' '.join(args)}\n".encode())
+                log.flush()
+                process = subprocess.run(['terraform'] + args, cwd=module, env=env, stdin=subprocess.DEVNULL,
+                                         stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                log.write(process.stdout)
+                log.flush()
+                return process
+
+            try:
+                if self.init:
+                    init = ['init', '-input=false', '-no-color']
+                    # Checked under the lock, so no install is half-way through writing the cache
+                    with self.init_lock:
+                        cached = self.is_cached(module)
+                        if not cached:
+                            process = run(init)
+                    if cached:
+                        process = run(init)
+                    if process.returncode != 0:
+                        result.update(status='init failed', duration=time.monotonic() - started)
+                        return result
+                plan_file = os.path.join(os.path.abspath(self.output_dir), f'{name}.tfplan')
+                process = run(['plan', '-input=false', '-no-color', '-detailed-exitcode', f'-out={plan_file}']
+                              + self.terraform_args)
+            except FileNotFoundError:
+                result.update(status='terraform not found', duration=time.monotonic() - started)
+                return result
+
+        # -detailed-exitcode: 0 means no changes, 2 means changes, anything else failed
+        if process.returncode in (0, 2):
+            result['counts'] = parse_plan_counts(process.stdout) or (0, 0, 0)
+            result['status'] = 'changes' if process.returncode == 2 else 'no changes'
+        else:
+            result['status'] = 'plan failed'
+        result['duration'] = time.monotonic() - started
+        return result
+
+    def run(self, modules, workspaces=()):
+        """Plan every module (in every workspace), printing each result as it completes.
+
+        Returns:
+            list: The result of each run, in module order.
+        """
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        runs = [(module, workspace) for module in modules for workspace in (workspaces or [None])]
+        total = len(runs)
+        width = len(str(total))
+        results = {}
+        # Threads only wait on terraform processes, so the pool bounds the processes running at once
+        with ThreadPoolExecutor(max_workers=max(1, min(self.concurrency, total))) as pool:
+            futures = {pool.submit(self.run_one, module, workspace): (module, workspace)
+                       for module, workspace in runs}
+            for done, future in enumerate(as_completed(futures), 1):
+                module, workspace = futures[future]
+                result = results[module, workspace] = future.result()
+                label = f'{module} ({workspace})' if workspace else module
+                if result['counts'] is None:
+                    click.echo(f"[{done:>{width}}/{total}] ❌ {label}: {result['status']}, see {result['log']}",
+                               err=True)
+                else:
+                    click.echo(f"[{done:>{width}}/{total}] ✅ {label}: {result['status']} "
+                               f"({result['duration']:.1f}s)")
+        return [results[run] for run in runs]
+
+def print_summary(results):
+    """Print a table of the changes and duration of each run."""
+    from kubed.k8s import print_table
+
+    show_workspace = any(result['workspace'] for result in results)
+    headers = ['MODULE'] + (['WORKSPACE'] if show_workspace else []) + \
+        ['RESULT', 'ADD', 'CHANGE', 'DESTROY', 'DURATION']
+    rows = []
+    totals = [0, 0, 0]
+    for result in results:
+        counts = result['counts']
+        if counts:
+            totals = [total + count for total, count in zip(totals, counts)]
+        rows.append([result['module']] + ([result['workspace'] or ''] if show_workspace else []) +
+                    [result['status']] + [str(count) if counts else '-' for count in counts or (0, 0, 0)] +
+                    [f"{result['duration']:.1f}s"])
+    rows.append(['TOTAL'] + ([''] if show_workspace else []) + [''] + [str(total) for total in totals] + [''])
+    click.echo()
+    print_table(headers, rows)
+
+# Header of a commands section in `terraform -help`, and of subcommands in `terraform <command> -help`
+HELP_SECTION = re.compile(r'^(Main commands|All other commands|Subcommands):\s*$')
+HELP_COMMAND = re.compile(r'^\s{2,}([a-z][\w-]*)\s{2,}\S')
+HELP_FLAG = re.compile(r'^ {2,4}(-[a-zA-Z][\w-]*)(=)?')
+
+def read_help(binary, args=()):
+    """Get the subcommands and flags listed by `terraform [args] -help`.
+
+    Returns:
+        tuple: (list of subcommands, list of flags; those taking a value end with '=')
+    """
+    env = dict(os.environ, CHECKPOINT_DISABLE='1')
+    try:
+        result = subprocess.run([binary] + list(args) + ['-help'], env=env, stdin=subprocess.DEVNULL,
+                                capture_output=True, text=True, timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        return [], []
+    commands, flags = [], []
+    in_commands = False
+    for line in (result.stdout + result.stderr).splitlines():
+        if HELP_SECTION.match(line):
+            in_commands = True
+            continue
+        if line and not line[0].isspace():
+            in_commands = False
+        flag = HELP_FLAG.match(line)
+        if flag:
+            name = flag.group(1) + (flag.group(2) or '')
+            if name not in flags:
+                flags.append(name)
+            continue
+        command = HELP_COMMAND.match(line)
+        if in_commands and command and command.group(1) not in commands:
+            commands.append(command.group(1))
+    return commands, flags
+
+def read_command_tree(binary):
+    """Read terraform's commands, their subcommands and the flags of each from its help.
+
+    Returns:
+        dict: Space-separated command path ('' for the top level) to a list of
+        subcommands and flags.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    commands, flags = read_help(binary)
+    tree = {'': commands + flags}
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        for command, (subcommands, flags) in zip(commands, pool.map(lambda c: read_help(binary, [c]), commands)):
+            tree[command] = subcommands + flags
+            paths = [f'{command} {sub}' for sub in subcommands]
+            for path, (_, sub_flags) in zip(paths, pool.map(lambda p: read_help(binary, p.split()), paths)):
+                tree[path] = sub_flags
+    return tree
+
+# Works in bash and zsh and never forks on Tab. _kubed_tf_table and
+# _kubed_tf_nested are generated from terraform's help by completion_script.
+# Workspaces and addresses come from ~/.kubed/cache/terraform/state, which
+# `kubed completions terraform` refreshes in the background once
+# .terraform/environment, the backend config or the state file is newer.
+TERRAFORM_COMPLETION = r"""
+# Load cached workspace names or resource addresses for a directory into _kubed_tf_reply
+_kubed_tf_cached() {
+    local kind=$1 dir=${2:-$PWD} ws=${TF_WORKSPACE:-} cache state f line stale=
+    case $dir in /*) ;; *) dir=$PWD/$dir ;; esac
+    [ -z "$ws" ] && [ -r "$dir/.terraform/environment" ] && read -r ws < "$dir/.terraform/environment"
+    ws=${ws:-default}
+    if [ "$ws" = default ]; then
+        state=$dir/terraform.tfstate
+    else
+        state=$dir/terraform.tfstate.d/$ws/terraform.tfstate
+    fi
+    cache="${KUBED_CACHE_DIR:-$HOME/.kubed/cache}/terraform/state/${dir//\//%2F}/$kind"
+    [ "$kind" = addresses ] && cache=$cache.$ws
+    if [ -r "$cache" ]; then
+        while IFS= read -r line; do
+            _kubed_tf_reply+=("$line")
+        done < "$cache"
+    else
+        stale=1
+    fi
+    for f in "$dir/.terraform/environment" "$dir/.terraform/terraform.tfstate" "$dir/terraform.tfstate.d" "$state"; do
+        [ "$f" -nt "$cache" ] && stale=1
+    done
+    # Only directories that were initialized or have local state can answer
+    if [ -n "$stale" ] && { [ -d "$dir/.terraform" ] || [ -e "$state" ]; }; then
+        ( command "${KUBED_BIN:-kubed}" completions terraform "$kind" --chdir "$dir" --quiet >/dev/null 2>&1 & )
+    fi
+}
+
+# Set _kubed_tf_reply to the candidates for the word cur, given the words before it
+_kubed_tf_complete() {
+    local cur=$1 cmd= dir= word prefix= have_sub=
+    shift
+    _kubed_tf_reply=()
+    _kubed_tf_files=
+    for word in "$@"; do
+        case $word in
+            -chdir=*) dir=${word#-chdir=} ;;
+            -*) ;;
+            *)
+                if [ -z "$cmd" ]; then
+                    cmd=$word
+                elif [ -z "$have_sub" ] && case " $_kubed_tf_nested " in *" $cmd "*) true ;; *) false ;; esac; then
+                    cmd="$cmd $word"
+                    have_sub=1
+                else
+                    have_sub=1
+                fi
+                ;;
+        esac
+    done
+
+    case $cur in
+        -target=*|-replace=*)
+            prefix=${cur%%=*}=
+            _kubed_tf_cached addresses "$dir"
+            ;;
+        -*)
+            _kubed_tf_table "$cmd"
+            ;;
+        *)
+            case $cmd in
+                'workspace select'|'workspace delete') _kubed_tf_cached workspaces "$dir" ;;
+                'state show'|'state rm'|'state mv'|taint|untaint) _kubed_tf_cached addresses "$dir" ;;
+                *)
+                    if [ -z "$cmd" ] || { [ -z "$have_sub" ] && case " $_kubed_tf_nested " in *" $cmd "*) true ;; *) false ;; esac; }; then
+                        _kubed_tf_table "$cmd"
+                    else
+                        _kubed_tf_files=1
+                        return
+                    fi
+                    ;;
+            esac
+            ;;
+    esac
+
+    local matched=()
+    for word in "${_kubed_tf_reply[@]}"; do
+        word=$prefix$word
+        case $cur in -*) ;; *) case $word in -*) continue ;; esac ;; esac
+        case $word in "$cur"*) matched+=("$word") ;; esac
+    done
+    _kubed_tf_reply=("${matched[@]}")
+}
+"""
+
+TERRAFORM_BASH_COMPLETION = r"""
+_kubed_terraform() {
+    local words=() i word cur
+    # Rejoin the words bash split at '=' (e.g. -target = aws_instance.web)
+    for (( i = 1; i <= COMP_CWORD; i++ )); do
+        word=${COMP_WORDS[i]}
+        if [ ${#words[@]} -gt 0 ] && { [ "$word" = = ] || [ "${words[${#words[@]}-1]: -1}" = = ]; }; then
+            words[${#words[@]}-1]+=$word
+        else
+            words+=("$word")
+        fi
+    done
+    cur=${words[${#words[@]}-1]}
+    _kubed_tf_complete "$cur" "${words[@]:0:${#words[@]}-1}"
+    COMPREPLY=()
+    if [ -n "$_kubed_tf_files" ]; then
+        compopt -o default
+        return
+    fi
+    for word in "${_kubed_tf_reply[@]}"; do
+        case $word in *=) compopt -o nospace ;; esac
+        # bash completes the part of the word after the last '='
+        case $cur in *=*) word=${word#"${cur%=*}="} ;; esac
+        printf -v word '%q' "$word"
+        COMPREPLY+=("$word")
+    done
+}
+"""
+
+TERRAFORM_ZSH_COMPLETION = r"""
+_kubed_terraform() {
+    local word
+    local -a plain suffixed
+    _kubed_tf_complete "${words[CURRENT]}" "${(@)words[2,CURRENT-1]}"
+    if [[ -n $_kubed_tf_files ]]; then
+        _files
+        return
+    fi
+    for word in "${_kubed_tf_reply[@]}"; do
+        if [[ $word == *= ]]; then
+            suffixed+=("$word")
+        else
+            plain+=("$word")
+        fi
+    done
+    compadd -- "${plain[@]}"
+    compadd -S '' -- "${suffixed[@]}"
+}
+"""
+
+def completion_script(binary, shell):
+    """Generate the terraform completion script for a shell from the binary's help.
+
+    The command tree becomes a `case` statement, so completing needs no
+    terraform process.
+    """
+    tree = read_command_tree(binary)
+    nested = [command for command in tree[''] if not command.startswith('-') and
+              any(not entry.startswith('-') for entry in tree.get(command, []))]
+    lines = ['# Terraform completion generated by kubed from the help of', f'# {binary}', '',
+             '_kubed_tf_table() {', '    case $1 in']
+    for path, entries in tree.items():
+        lines.append(f"        '{path}') _kubed_tf_reply=({' '.join(entries)}) ;;")
+    lines += ['    esac', '}', '', f"_kubed_tf_nested='{' '.join(nested)}'"]
+    body = '\n'.join(lines) + '\n' + TERRAFORM_COMPLETION
+    return body + (TERRAFORM_ZSH_COMPLETION if shell == 'zsh' else TERRAFORM_BASH_COMPLETION)
+
+def get_workspace(directory):
+    """Get the workspace terraform would use in a directory, like the shell completion does."""
+    if os.environ.get('TF_WORKSPACE'):
+        return os.environ['TF_WORKSPACE']
+    try:
+        with open(os.path.join(directory, '.terraform', 'environment')) as f:
+            return f.readline().strip() or 'default'
+    except OSError:
+        return 'default'
+
+def refresh_state_cache(kind, directory):
+    """Refresh the cached workspace names or resource addresses of a directory.
+
+    Returns:
+        list: The names written to the cache.
+    """
+    import fcntl
+    from kubed.cache import atomic_write
+
+    directory = os.path.abspath(directory)
+    workspace = get_workspace(directory)
+    path = os.path.join(get_cache_dir('terraform', 'state', directory.replace('/', '%2F')), kind)
+    if kind == 'addresses':
+        path = f'{path}.{workspace}'
+    args = ['workspace', 'list'] if kind == 'workspaces' else ['state', 'list']
+
+    with open(path + '.lock', 'w') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return []
+        try:
+            result = subprocess.run(['terraform'] + args, cwd=directory, stdin=subprocess.DEVNULL,
+                                    env=dict(os.environ, CHECKPOINT_DISABLE='1', TF_IN_AUTOMATION='1'),
+                                    capture_output=True, text=True, timeout=120)
+            output = result.stdout if result.returncode == 0 else ''
+        except (OSError, subprocess.TimeoutExpired):
+            output = ''
+        # Written even when terraform failed, so Tab does not retry until the state changes
+        names = [line.lstrip('* ').strip() for line in output.splitlines() if line.strip()]
+        atomic_write(path, ''.join(f'{name}\n' for name in names))
+    return names
+
+def completions_terraform_command(kind, directory=None, quiet=False):
+    """Print cached workspace names or resource addresses, refreshing them first.
+
+    Args:
+        kind (str): 'workspaces' or 'addresses'.
+        directory (str): Terraform working directory; the current one if None.
+        quiet (bool): If True, only refresh (used by the shell in the background).
+    """
+    names = refresh_state_cache(kind, directory or os.getcwd())
+    if not quiet:
+        for name in names:
+            click.echo(name)
+
+@click.group()
+def terraform():
+    """Terraform commands for many root modules (other subcommands run terraform)."""
+    pass
+
+@terraform.command(context_settings=dict(ignore_unknown_options=True))
+@click.option('--all', 'all_modules', is_flag=True, help='Plan every root module under the GLOB paths.')
+# Long options only: terraform's own single-dash options would be taken apart as short option clusters
+@click.option('--workspace', 'workspaces', multiple=True, help='Plan in this workspace (repeatable).')
+@click.option('--concurrency', default=DEFAULT_CONCURRENCY, show_default=True, help='Modules planned at once.')
+@click.option('--output-dir', type=click.Path(file_okay=False),
+              help='Directory for the output and plan file of each run (defaults to ~/.kubed/terraform/runs/<time>).')
+@click.option('--init/--no-init', default=True, show_default=True, help='Run terraform init before each plan.')
+@click.argument('args', nargs=-1, type=click.UNPROCESSED)
+def plan(all_modules, workspaces, concurrency, output_dir, init, args):
+    """Plan every root module under GLOB... with --all; otherwise run terraform plan.
+
+    Terraform options, with their values, are passed on to each terraform plan, e.g.
+    `kubed terraform plan --all 'envs/**' -refresh=false -var-file prod.tfvars`.
+    Relative paths in them are resolved in each module, as terraform does.
+    """
+    if not all_modules:
+        exec_terraform(['plan'] + list(args))
+
+    patterns, terraform_args = split_plan_args(args)
+    modules = find_root_modules(patterns)
+    if not modules:
+        click.echo(f"No root modules found under {', '.join(patterns) or '.'}", err=True)
+        sys.exit(1)
+
+    output_dir = output_dir or os.path.join(get_kubed_dir(), 'terraform', 'runs', time.strftime('%Y%m%d-%H%M%S'))
+    os.makedirs(output_dir, exist_ok=True)
+    runs = len(modules) * max(1, len(workspaces))
+    click.echo(f"Planning {runs} run(s) in {len(modules)} root module(s), {concurrency} at a time; "
+               f"output in {output_dir}")
+
+    results = PlanRunner(terraform_args, output_dir, init, concurrency).run(modules, list(workspaces))
+    print_summary(results)
+    if any(result['counts'] is None for result in results):
+        sys.exit(1)
+
+def exec_terraform(args):
+    """Replace this process with terraform."""
+    try:
+        os.execvp('terraform', ['terraform'] + args)
+    except FileNotFoundError:
+        click.echo("terraform is not installed.", err=True)
+        sys.exit(1)
+
+def terraform_command(command):
+    """Run a kubed terraform subcommand, handing anything else to terraform.
+
+    Args:
+        command (tuple): The arguments after `kubed terraform`.
+    """
+    args = list(command)
+    if not args or args[0] not in terraform.commands or (args[0] == 'plan' and '--all' not in args):
+        exec_terraform(args)
+    terraform.main(args=args, prog_name='kubed terraform')
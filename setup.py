@@ -47,7 +47,7 @@ if __name__ == "__main__":
         entry_points={
             "console_scripts": [
                 "kubed-setup=kubed.cli:setup_command",
-                "kubed=kubed.cli:cli",
+                "kubed=kubed.main:cli",
             ],
         },
         author="Dale Yarborough",
@@ -0,0 +1,115 @@
+"""
+Shared fixtures: a fake HTTP server, on a loopback port or a Unix socket,
+answering from a table of routes.
+"""
+
+import json
+import os
+import re
+import shutil
+import socketserver
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+class Handler(BaseHTTPRequestHandler):
+    """Answers a request with the first route matching its method and path.
+
+    A route is (method, path regex, function), where method '*' matches any
+    method; the function is called with the handler and the regex groups.
+    Unmatched requests get a 404 Status. The handler's route_path is the path
+    without the query string, and query holds the first value of each parameter.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def dispatch(self):
+        url = urlparse(self.path)
+        self.route_path = url.path
+        self.query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        for method, pattern, function in self.server.routes:
+            match = re.fullmatch(pattern, url.path)
+            if match and method in ('*', self.command):
+                return function(self, *match.groups())
+        self.send_json(404, {'kind': 'Status', 'code': 404, 'reason': 'NotFound', 'message': 'not found'})
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = dispatch
+
+    def read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length)) if length else None
+
+    def send_json(self, status, body=None):
+        data = b'' if body is None else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def start_chunks(self, status=200):
+        """Start a chunked response, for streams such as watches and followed logs."""
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+    def write_chunk(self, data):
+        """Write one chunk of a chunked response; b'' ends it."""
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+class TCPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+class FakeServer:
+    """A fake HTTP server answering from a list of routes (see Handler).
+
+    Routes may be added to the list while the server runs.
+
+    Attributes:
+        url (str): http://127.0.0.1:<port>, or None on a Unix socket.
+        path (str): The Unix socket, or None on a loopback port.
+    """
+
+    def __init__(self, routes, unix=False):
+        self.directory = self.path = self.url = None
+        if unix:
+            # Unix socket paths are limited to ~100 bytes, so keep this one short
+            self.directory = tempfile.mkdtemp(prefix='kubed-', dir='/tmp')
+            self.path = os.path.join(self.directory, 'server.sock')
+            self.httpd = UnixServer(self.path, Handler)
+        else:
+            self.httpd = TCPServer(('127.0.0.1', 0), Handler)
+            self.url = f'http://127.0.0.1:{self.httpd.server_address[1]}'
+        self.httpd.routes = self.routes = routes
+        threading.Thread(target=self.httpd.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+@pytest.fixture
+def fake_server():
+    """Start fake servers with fake_server(routes, unix=False); they are closed after the test."""
+    servers = []
+
+    def start(routes, unix=False):
+        server = FakeServer(routes, unix)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
@@ -0,0 +1,162 @@
+"""
+Tests for `kubed k8s apply` against a fake API server: namespaces of
+namespaced and cluster-scoped kinds, the hash store, and duplicate objects.
+"""
+
+import json
+
+import click
+import pytest
+
+from kubed import apply, k8s
+
+DISCOVERY = {
+    '/api/v1': [('namespaces', 'Namespace', False), ('configmaps', 'ConfigMap', True)],
+    '/apis/rbac.authorization.k8s.io/v1': [('clusterroles', 'ClusterRole', False), ('roles', 'Role', True)],
+    '/apis/apiextensions.k8s.io/v1': [('customresourcedefinitions', 'CustomResourceDefinition', False)],
+}
+
+class FakeApiServer:
+    """Answers discovery and server-side apply requests, recording each request."""
+
+    def __init__(self, fake_server):
+        self.requests = []
+        self.crds = {}
+        self.url = fake_server([('GET', r'/.*', self.get), ('PATCH', r'/.*', self.patch)]).url
+
+    def get(self, request):
+        path = request.route_path
+        self.requests.append(('GET', path, None))
+        resources = DISCOVERY.get(path) or self.crds.get(path)
+        if resources:
+            return request.send_json(200, {'resources': [{'name': name, 'kind': kind, 'namespaced': namespaced}
+                                                         for name, kind, namespaced in resources]})
+        if path.startswith('/apis/apiextensions.k8s.io/v1/customresourcedefinitions/'):
+            return request.send_json(200, {'status': {'conditions': [{'type': 'Established', 'status': 'True'}]}})
+        request.send_json(404, {'kind': 'Status', 'message': 'not found', 'reason': 'NotFound'})
+
+    def patch(self, request):
+        body = request.read_json()
+        self.requests.append(('PATCH', request.route_path, body))
+        if body['kind'] == 'CustomResourceDefinition':
+            spec = body['spec']
+            for version in spec['versions']:
+                self.crds[f"/apis/{spec['group']}/{version['name']}"] = [
+                    (spec['names']['plural'], spec['names']['kind'], spec['scope'] == 'Namespaced')]
+        request.send_json(200, body)
+
+    def patches(self):
+        """Get the applied objects by path, and forget the requests so far."""
+        patches = {path: body for method, path, body in self.requests if method == 'PATCH'}
+        self.requests.clear()
+        return patches
+
+@pytest.fixture
+def apiserver(fake_server, tmp_path, monkeypatch):
+    server = FakeApiServer(fake_server)
+    kubeconfig = tmp_path / 'kubeconfig'
+    kubeconfig.write_text(json.dumps({
+        'apiVersion': 'v1',
+        'kind': 'Config',
+        'current-context': 'fake',
+        'clusters': [{'name': 'fake', 'cluster': {'server': server.url}}],
+        'users': [{'name': 'fake', 'user': {'token': 'secret'}}],
+        'contexts': [{'name': 'fake', 'context': {'cluster': 'fake', 'user': 'fake', 'namespace': 'apps'}}],
+    }))
+    monkeypatch.setenv('KUBECONFIG', str(kubeconfig))
+    monkeypatch.setenv('KUBED_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(k8s, '_clients', {})
+    return server
+
+def write(path, *documents):
+    path.write_text('\n---\n'.join(json.dumps(document) for document in documents))
+    return str(path)
+
+def obj(api_version, kind, name, namespace=None, **fields):
+    metadata = {'name': name}
+    if namespace:
+        metadata['namespace'] = namespace
+    return dict({'apiVersion': api_version, 'kind': kind, 'metadata': metadata}, **fields)
+
+def test_namespace_defaults_only_for_namespaced_kinds(apiserver, tmp_path):
+    manifest = write(tmp_path / 'app.yaml',
+                     obj('v1', 'Namespace', 'apps'),
+                     obj('v1', 'ConfigMap', 'settings', data={'a': '1'}),
+                     obj('rbac.authorization.k8s.io/v1', 'ClusterRole', 'reader', namespace='ignored'),
+                     obj('rbac.authorization.k8s.io/v1', 'Role', 'writer', namespace='other'))
+
+    assert apply.apply_manifests([manifest])
+
+    patches = apiserver.patches()
+    assert sorted(patches) == [
+        '/api/v1/namespaces/apps',
+        '/api/v1/namespaces/apps/configmaps/settings',
+        '/apis/rbac.authorization.k8s.io/v1/clusterroles/reader',
+        '/apis/rbac.authorization.k8s.io/v1/namespaces/other/roles/writer',
+    ]
+    assert 'namespace' not in patches['/api/v1/namespaces/apps']['metadata']
+    assert 'namespace' not in patches['/apis/rbac.authorization.k8s.io/v1/clusterroles/reader']['metadata']
+    assert patches['/api/v1/namespaces/apps/configmaps/settings']['metadata']['namespace'] == 'apps'
+
+    with open(apply.get_store_path('fake')) as f:
+        store = json.load(f)
+    assert sorted(store['objects']) == ['/ConfigMap/apps/settings', '/Namespace//apps',
+                                        'rbac.authorization.k8s.io/ClusterRole//reader',
+                                        'rbac.authorization.k8s.io/Role/other/writer']
+
+def test_unchanged_run_makes_no_requests(apiserver, tmp_path):
+    manifest = write(tmp_path / 'app.yaml',
+                     obj('rbac.authorization.k8s.io/v1', 'ClusterRole', 'reader'),
+                     obj('v1', 'ConfigMap', 'settings'))
+    assert apply.apply_manifests([manifest])
+    apiserver.patches()
+
+    assert apply.apply_manifests([manifest])
+    assert apiserver.requests == []
+
+    # Another default namespace moves the ConfigMap, but the ClusterRole is the same object
+    assert apply.apply_manifests([manifest], namespace='staging')
+    assert sorted(apiserver.patches()) == ['/api/v1/namespaces/staging/configmaps/settings']
+
+def test_enforced_namespace_ignores_cluster_scoped_kinds(apiserver, tmp_path):
+    manifest = write(tmp_path / 'app.yaml',
+                     obj('rbac.authorization.k8s.io/v1', 'ClusterRole', 'reader', namespace='elsewhere'),
+                     obj('v1', 'ConfigMap', 'settings', namespace='staging'))
+    assert apply.apply_manifests([manifest], namespace='staging')
+
+    manifest = write(tmp_path / 'other.yaml', obj('v1', 'ConfigMap', 'settings', namespace='elsewhere'))
+    with pytest.raises(click.ClickException, match="is in namespace 'elsewhere', not 'staging'"):
+        apply.apply_manifests([manifest], namespace='staging')
+
+def test_cluster_scoped_duplicates_across_namespaces(apiserver, tmp_path):
+    first = write(tmp_path / 'a.yaml', obj('rbac.authorization.k8s.io/v1', 'ClusterRole', 'reader', namespace='a'))
+    second = write(tmp_path / 'b.yaml', obj('rbac.authorization.k8s.io/v1', 'ClusterRole', 'reader', namespace='b'))
+
+    with pytest.raises(click.ClickException, match='clusterrole.rbac.authorization.k8s.io/reader is defined in both'):
+        apply.apply_manifests([first, second])
+    assert [method for method, _, _ in apiserver.requests] == ['GET']
+
+    # The same name in two namespaces is two objects for a namespaced kind
+    first = write(tmp_path / 'a.yaml', obj('v1', 'ConfigMap', 'settings', namespace='a'))
+    second = write(tmp_path / 'b.yaml', obj('v1', 'ConfigMap', 'settings', namespace='b'))
+    assert apply.apply_manifests([first, second])
+
+def test_custom_resources_of_crds_in_the_same_run(apiserver, tmp_path):
+    crd = obj('apiextensions.k8s.io/v1', 'CustomResourceDefinition', 'widgets.example.com', spec={
+        'group': 'example.com',
+        'scope': 'Cluster',
+        'names': {'kind': 'Widget', 'plural': 'widgets'},
+        'versions': [{'name': 'v1', 'served': True, 'storage': True}],
+    })
+    manifest = write(tmp_path / 'crd.yaml', crd, obj('example.com/v1', 'Widget', 'w1', namespace='ignored'),
+                     obj('example.com/v1', 'Widget', 'w2'))
+
+    assert apply.apply_manifests([manifest])
+
+    patches = apiserver.patches()
+    assert sorted(patches) == ['/apis/apiextensions.k8s.io/v1/customresourcedefinitions/widgets.example.com',
+                               '/apis/example.com/v1/widgets/w1', '/apis/example.com/v1/widgets/w2']
+    assert 'namespace' not in patches['/apis/example.com/v1/widgets/w1']['metadata']
+
+    assert apply.apply_manifests([manifest])
+    assert apiserver.requests == []
@@ -0,0 +1,251 @@
+"""
+Tests for the artifact downloader against a local HTTP server: checksum
+verification, resumed downloads, mirrors and the content-addressed store.
+"""
+
+import hashlib
+import io
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+from kubed import artifacts
+
+KUBECTL = b'kubectl binary ' * 10000
+KUBECTL_PATH = 'v1.29.3/bin/linux/amd64/kubectl'
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+class FileServer:
+    """Serves files by path, with Range support, recording each request."""
+
+    def __init__(self, fake_server):
+        self.files = {}
+        self.requests = []
+        # Paths whose next response is cut off halfway through the body
+        self.truncate = set()
+        self.url = fake_server([('GET', r'/.*', self.get)]).url
+
+    def get(self, request):
+        path, requested = request.path, request.headers.get('Range')
+        self.requests.append((path, requested))
+        data = self.files.get(path)
+        if data is None:
+            return request.send_json(404)
+        status, start = 200, 0
+        if requested:
+            start = int(requested.split('=')[1].rstrip('-'))
+            if start >= len(data):
+                return request.send_json(416)
+            status = 206
+        body = data[start:]
+        request.send_response(status)
+        request.send_header('Content-Length', str(len(body)))
+        if status == 206:
+            request.send_header('Content-Range', f'bytes {start}-{len(data) - 1}/{len(data)}')
+        request.end_headers()
+        if path in self.truncate:
+            self.truncate.discard(path)
+            request.wfile.write(body[:len(body) // 2])
+            request.wfile.flush()
+            request.close_connection = True
+            return
+        request.wfile.write(body)
+
+    def paths(self):
+        return [path for path, _ in self.requests]
+
+@pytest.fixture
+def home(tmp_path, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmp_path))
+    monkeypatch.delenv('KUBED_ARTIFACT_MIRROR', raising=False)
+    for tool in artifacts.TOOLS:
+        monkeypatch.delenv(f'KUBED_{tool.upper()}_VERSION', raising=False)
+    return tmp_path
+
+@pytest.fixture
+def upstream(home, fake_server, monkeypatch):
+    """A local server standing in for dl.k8s.io, serving kubectl."""
+    server = FileServer(fake_server)
+    server.files[f'/{KUBECTL_PATH}'] = KUBECTL
+    server.files[f'/{KUBECTL_PATH}.sha256'] = f'{sha256(KUBECTL)}\n'.encode()
+    monkeypatch.setitem(artifacts.TOOLS['kubectl'], 'base', server.url)
+    return server
+
+def downloader(mirror=None):
+    return artifacts.Downloader(artifacts.create_session(), mirror, timeout=5)
+
+def test_fetch_verifies_and_stores(upstream):
+    digest = downloader().fetch('kubectl', os_name='linux', arch='amd64')
+
+    assert digest == sha256(KUBECTL)
+    with open(artifacts.get_blob_path(digest), 'rb') as f:
+        assert f.read() == KUBECTL
+    assert os.listdir(artifacts.get_artifacts_dir('partial')) == []
+
+    # A second fetch is answered by the store without a request
+    upstream.requests.clear()
+    assert downloader().fetch('kubectl', os_name='linux', arch='amd64') == digest
+    assert upstream.requests == []
+
+def test_checksum_mismatch_keeps_nothing(upstream):
+    upstream.files[f'/{KUBECTL_PATH}'] = KUBECTL + b'tampered'
+
+    with pytest.raises(artifacts.ArtifactError, match='checksum mismatch'):
+        downloader().fetch('kubectl', os_name='linux', arch='amd64')
+
+    assert not os.path.exists(artifacts.get_blob_path(sha256(KUBECTL)))
+    assert os.listdir(artifacts.get_artifacts_dir('partial')) == []
+    assert artifacts.read_json(artifacts.get_index_path(), {}) == {}
+
+def test_missing_checksum_fails(upstream):
+    upstream.files[f'/{KUBECTL_PATH}.sha256'] = b'not a checksum\n'
+
+    with pytest.raises(artifacts.ArtifactError, match='no checksum for kubectl'):
+        downloader().fetch('kubectl', os_name='linux', arch='amd64')
+
+def test_resumes_partial_download(upstream):
+    partial = os.path.join(artifacts.get_artifacts_dir('partial'), f'{sha256(KUBECTL)}.part')
+    with open(partial, 'wb') as f:
+        f.write(KUBECTL[:1000])
+
+    assert downloader().fetch('kubectl', os_name='linux', arch='amd64') == sha256(KUBECTL)
+
+    assert (f'/{KUBECTL_PATH}', 'bytes=1000-') in upstream.requests
+    assert not os.path.exists(partial)
+
+def test_resumes_after_broken_connection(upstream):
+    upstream.truncate.add(f'/{KUBECTL_PATH}')
+
+    assert downloader().fetch('kubectl', os_name='linux', arch='amd64') == sha256(KUBECTL)
+
+    # The retry asks for the rest of what reached the partial file
+    first, second = [r for path, r in upstream.requests if path == f'/{KUBECTL_PATH}']
+    assert first is None
+    assert 0 < int(second[len('bytes='):-1]) <= len(KUBECTL) // 2
+
+def test_restarts_when_partial_is_not_a_prefix(upstream):
+    partial = os.path.join(artifacts.get_artifacts_dir('partial'), f'{sha256(KUBECTL)}.part')
+    with open(partial, 'wb') as f:
+        f.write(KUBECTL + b'extra')
+
+    assert downloader().fetch('kubectl', os_name='linux', arch='amd64') == sha256(KUBECTL)
+
+    ranges = [r for path, r in upstream.requests if path == f'/{KUBECTL_PATH}']
+    assert ranges == [f'bytes={len(KUBECTL) + 5}-', None]
+
+def test_http_mirror_replaces_upstream(upstream, fake_server):
+    mirror = FileServer(fake_server)
+    mirror.files[f'/kubectl/{KUBECTL_PATH}'] = KUBECTL
+    mirror.files[f'/kubectl/{KUBECTL_PATH}.sha256'] = f'{sha256(KUBECTL)}\n'.encode()
+
+    assert downloader(mirror.url + '/').fetch('kubectl', os_name='linux', arch='amd64') == sha256(KUBECTL)
+
+    assert mirror.paths() == [f'/kubectl/{KUBECTL_PATH}.sha256', f'/kubectl/{KUBECTL_PATH}']
+    assert upstream.requests == []
+
+def test_missing_file_on_mirror_fails(upstream, fake_server):
+    mirror = FileServer(fake_server)
+
+    with pytest.raises(artifacts.ArtifactError, match='HTTP 404'):
+        downloader(mirror.url).fetch('kubectl', os_name='linux', arch='amd64')
+    assert upstream.requests == []
+
+def write_mirror(root):
+    """Lay out kubectl, helm and terraform release files as a directory mirror."""
+    helm = io.BytesIO()
+    with tarfile.open(fileobj=helm, mode='w:gz') as archive:
+        info = tarfile.TarInfo('linux-amd64/helm')
+        info.size = len(b'helm binary')
+        archive.addfile(info, io.BytesIO(b'helm binary'))
+    terraform = io.BytesIO()
+    with zipfile.ZipFile(terraform, 'w') as archive:
+        archive.writestr('terraform', b'terraform binary')
+    files = {
+        f'kubectl/{KUBECTL_PATH}': KUBECTL,
+        f'kubectl/{KUBECTL_PATH}.sha256': f'{sha256(KUBECTL)}\n'.encode(),
+        'helm/helm-v3.14.4-linux-amd64.tar.gz': helm.getvalue(),
+        'helm/helm-v3.14.4-linux-amd64.tar.gz.sha256sum':
+            f'{sha256(helm.getvalue())}  helm-v3.14.4-linux-amd64.tar.gz\n'.encode(),
+        'terraform/1.7.5/terraform_1.7.5_linux_amd64.zip': terraform.getvalue(),
+        'terraform/1.7.5/terraform_1.7.5_SHA256SUMS':
+            (f'{"0" * 64}  terraform_1.7.5_darwin_arm64.zip\n'
+             f'{sha256(terraform.getvalue())}  terraform_1.7.5_linux_amd64.zip\n').encode(),
+    }
+    for path, data in files.items():
+        os.makedirs(os.path.dirname(os.path.join(root, path)), exist_ok=True)
+        with open(os.path.join(root, path), 'wb') as f:
+            f.write(data)
+
+@pytest.mark.parametrize('scheme', ['', 'file://'])
+def test_install_from_directory_mirror(home, upstream, monkeypatch, scheme):
+    write_mirror(home / 'mirror')
+    monkeypatch.setenv('KUBED_ARTIFACT_MIRROR', f'{scheme}{home / "mirror"}')
+    results = []
+
+    failed = artifacts.install_tools(['kubectl', 'helm', 'terraform'], dest=str(home / 'bin'), os_name='linux',
+                                     arch='amd64', on_result=lambda *result: results.append(result))
+
+    assert failed == {}
+    assert sorted(results) == [(tool, str(home / 'bin' / tool), None) for tool in ('helm', 'kubectl', 'terraform')]
+    assert (home / 'bin' / 'kubectl').read_bytes() == KUBECTL
+    assert (home / 'bin' / 'helm').read_bytes() == b'helm binary'
+    assert (home / 'bin' / 'terraform').read_bytes() == b'terraform binary'
+    assert os.access(home / 'bin' / 'helm', os.X_OK)
+    assert upstream.requests == []
+
+def test_install_reports_each_failure(home, upstream):
+    write_mirror(home / 'mirror')
+    os.unlink(home / 'mirror' / 'helm' / 'helm-v3.14.4-linux-amd64.tar.gz')
+
+    failed = artifacts.install_tools(['kubectl', 'helm'], mirror=str(home / 'mirror'), download_only=True,
+                                     os_name='linux', arch='amd64')
+
+    assert list(failed) == ['helm']
+    assert 'cannot read' in failed['helm']
+    assert os.path.exists(artifacts.get_blob_path(sha256(KUBECTL)))
+
+@pytest.mark.parametrize('tool, requested, expected', [
+    ('kubectl', None, 'v1.29.3'),
+    ('kubectl', '1.30.0', 'v1.30.0'),
+    ('helm', 'v3.15.0', 'v3.15.0'),
+    ('terraform', 'v1.8.0', '1.8.0'),
+])
+def test_get_version(tool, requested, expected, monkeypatch):
+    monkeypatch.delenv(f'KUBED_{tool.upper()}_VERSION', raising=False)
+    assert artifacts.get_version(tool, requested) == expected
+
+def test_version_overrides(home, upstream, monkeypatch):
+    newer = b'newer kubectl ' * 100
+    upstream.files['/v1.30.0/bin/linux/amd64/kubectl'] = newer
+    upstream.files['/v1.30.0/bin/linux/amd64/kubectl.sha256'] = f'{sha256(newer)}\n'.encode()
+
+    monkeypatch.setenv('KUBED_KUBECTL_VERSION', '1.30.0')
+    failed = artifacts.install_tools(['kubectl'], dest=str(home / 'bin'), os_name='linux', arch='amd64')
+    assert failed == {}
+    assert (home / 'bin' / 'kubectl').read_bytes() == newer
+
+    # An explicit version beats the environment
+    failed = artifacts.install_tools(['kubectl'], dest=str(home / 'bin'), os_name='linux', arch='amd64',
+                                     versions={'kubectl': 'v1.29.3'})
+    assert failed == {}
+    assert (home / 'bin' / 'kubectl').read_bytes() == KUBECTL
+    assert upstream.paths() == ['/v1.30.0/bin/linux/amd64/kubectl.sha256', '/v1.30.0/bin/linux/amd64/kubectl',
+                                f'/{KUBECTL_PATH}.sha256', f'/{KUBECTL_PATH}']
+
+def test_install_command_parses_versions(home, upstream):
+    from click.testing import CliRunner
+
+    from kubed.main import cli
+
+    result = CliRunner().invoke(cli, ['install', 'kubectl', '--dest', str(home / 'bin'), '--os', 'linux',
+                                      '--arch', 'amd64', '--version', 'kubectl=v1.29.3'])
+    assert result.exit_code == 0, result.output
+    assert (home / 'bin' / 'kubectl').read_bytes() == KUBECTL
+
+    result = CliRunner().invoke(cli, ['install', '--version', 'kubeclt=1.30.0'])
+    assert result.exit_code == 2
+    assert "expected TOOL=VERSION with TOOL one of kubectl, helm, terraform, got 'kubeclt=1.30.0'" in result.output
@@ -0,0 +1,29 @@
+"""
+Tests for the cache directory, which the Python and shell sides must agree on.
+"""
+
+import os
+import subprocess
+
+from kubed.cache import get_cache_dir
+
+def test_cache_dir_defaults_to_kubed_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmp_path))
+    monkeypatch.delenv('KUBED_CACHE_DIR', raising=False)
+    assert get_cache_dir('names') == str(tmp_path / '.kubed' / 'cache' / 'names')
+    assert os.path.isdir(tmp_path / '.kubed' / 'cache' / 'names')
+
+def test_cache_dir_honours_environment(tmp_path, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmp_path / 'home'))
+    monkeypatch.setenv('KUBED_CACHE_DIR', str(tmp_path / 'cache'))
+    assert get_cache_dir() == str(tmp_path / 'cache')
+    assert get_cache_dir('helm') == str(tmp_path / 'cache' / 'helm')
+    assert not os.path.exists(tmp_path / 'home')
+
+def test_cache_dir_matches_shell_default(tmp_path, monkeypatch):
+    for value in ('', str(tmp_path / 'cache')):
+        monkeypatch.setenv('HOME', str(tmp_path))
+        monkeypatch.setenv('KUBED_CACHE_DIR', value)
+        shell = subprocess.run(['bash', '-c', 'echo "${KUBED_CACHE_DIR:-$HOME/.kubed/cache}"'],
+                               capture_output=True, text=True, check=True).stdout.strip()
+        assert get_cache_dir() == shell
@@ -0,0 +1,285 @@
+"""
+Tests for `kubed daemon`: watch-cache consistency across a 410 re-list, and
+the socket protocol, against a fake API server.
+"""
+
+import json
+import os
+import queue
+import re
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+import pytest
+
+from kubed import daemon
+
+def make_pod(name, version, labels=None, namespace='default'):
+    return {'metadata': {'name': name, 'namespace': namespace, 'resourceVersion': str(version),
+                         'labels': labels or {'app': 'web'}}}
+
+class FakeApiServer:
+    """Serves paginated pod LISTs and streams queued watch events."""
+
+    def __init__(self, fake_server):
+        self.pods = {}
+        self.version = 0
+        self.events = queue.Queue()
+        self.watches = []
+        # While set, LISTs past the first page wait for it to be released
+        self.hold_pages = None
+        self.page_waiting = threading.Event()
+        self.fail_pages = False
+        self.closed = False
+        self.url = fake_server([('GET', r'/api/v1(?:/namespaces/([^/]+))?/pods', self.pods_route)]).url
+
+    def pods_route(self, request, namespace):
+        if request.query.get('watch') == 'true':
+            return self.watch(request)
+        query = request.query
+        offset = int(query.get('continue', 0))
+        if offset:
+            if self.fail_pages:
+                return request.send_json(500, {'kind': 'Status', 'code': 500})
+            if self.hold_pages is not None:
+                self.page_waiting.set()
+                self.hold_pages.wait(10)
+        pods = [self.pods[name] for name in sorted(self.pods)
+                if namespace in (None, self.pods[name]['metadata']['namespace'])]
+        # Only the set-based selectors the daemon passes through: 'key in (value)'
+        selector = re.fullmatch(r'(\S+) in \((\S+)\)', query.get('labelSelector', ''))
+        if selector:
+            pods = [p for p in pods if p['metadata']['labels'].get(selector.group(1)) == selector.group(2)]
+        limit = int(query.get('limit', len(pods) or 1))
+        metadata = {'resourceVersion': str(self.version)}
+        if offset + limit < len(pods):
+            metadata['continue'] = str(offset + limit)
+        request.send_json(200, {'kind': 'PodList', 'apiVersion': 'v1', 'metadata': metadata,
+                                'items': pods[offset:offset + limit]})
+
+    def watch(self, request):
+        self.watches.append(request.query.get('resourceVersion'))
+        request.start_chunks()
+        while not self.closed:
+            try:
+                event = self.events.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if event is None:
+                break
+            try:
+                request.write_chunk(json.dumps(event).encode() + b'\n')
+            except OSError:
+                return
+        request.write_chunk(b'')
+
+    def set_pods(self, *pods):
+        self.version += 1
+        self.pods = {pod['metadata']['name']: pod for pod in pods}
+
+    def close(self):
+        self.closed = True
+        if self.hold_pages is not None:
+            self.hold_pages.set()
+
+@pytest.fixture
+def apiserver(fake_server):
+    server = FakeApiServer(fake_server)
+    yield server
+    server.close()
+
+@pytest.fixture
+def api_client(apiserver):
+    from kubernetes import client
+
+    configuration = client.Configuration()
+    configuration.host = apiserver.url
+    api_client = client.ApiClient(configuration)
+    yield api_client
+    api_client.close()
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('timed out waiting for condition')
+        time.sleep(0.01)
+
+def cached_names(cache):
+    return [json.loads(encoded)['metadata']['name'] for encoded in cache.query()]
+
+@pytest.fixture
+def small_pages(monkeypatch):
+    monkeypatch.setattr(daemon, 'LIST_PAGE_SIZE', 2)
+
+def test_relist_after_410_swaps_in_complete_contents(apiserver, api_client, small_pages):
+    apiserver.set_pods(*(make_pod(f'p{i}', 1) for i in range(5)))
+    cache = daemon.WatchCache(api_client, 'pods')
+    try:
+        assert cache.synced.wait(5)
+        assert cached_names(cache) == ['p0', 'p1', 'p2', 'p3', 'p4']
+        wait_for(lambda: apiserver.watches == ['1'])
+
+        apiserver.events.put({'type': 'ADDED', 'object': make_pod('p5', 2)})
+        apiserver.events.put({'type': 'DELETED', 'object': make_pod('p0', 3)})
+        wait_for(lambda: cached_names(cache) == ['p1', 'p2', 'p3', 'p4', 'p5'])
+        assert cache.resource_version == '3'
+
+        # The server moves on while the watch expires; the re-list is held after its first page
+        apiserver.set_pods(*(make_pod(f'q{i}', 4) for i in range(4)))
+        apiserver.hold_pages = threading.Event()
+        apiserver.events.put({'type': 'ERROR', 'object': {'kind': 'Status', 'code': 410}})
+        assert apiserver.page_waiting.wait(5)
+        assert cached_names(cache) == ['p1', 'p2', 'p3', 'p4', 'p5']
+
+        apiserver.hold_pages.set()
+        wait_for(lambda: cached_names(cache) == ['q0', 'q1', 'q2', 'q3'])
+        assert cache.resource_version == str(apiserver.version)
+        assert cache.bytes == sum(len(encoded) for encoded in cache.query())
+        # The new watch starts from the re-list's resourceVersion
+        wait_for(lambda: apiserver.watches[-1] == str(apiserver.version))
+    finally:
+        cache.stop()
+
+def test_failed_relist_keeps_previous_contents(apiserver, api_client, small_pages):
+    apiserver.set_pods(*(make_pod(f'p{i}', 1) for i in range(3)))
+    cache = daemon.WatchCache(api_client, 'pods')
+    try:
+        assert cache.synced.wait(5)
+        wait_for(lambda: apiserver.watches)
+
+        apiserver.set_pods(make_pod('q0', 2), make_pod('q1', 2), make_pod('q2', 2))
+        apiserver.fail_pages = True
+        apiserver.events.put({'type': 'ERROR', 'object': {'kind': 'Status', 'code': 410}})
+        wait_for(lambda: cache.error is not None)
+        assert cached_names(cache) == ['p0', 'p1', 'p2']
+        assert cache.synced.is_set()
+        assert cache.resource_version == '1'
+    finally:
+        cache.stop()
+
+def test_relist_over_bounds_overflows(apiserver, api_client, small_pages):
+    apiserver.set_pods(*(make_pod(f'p{i}', 1) for i in range(5)))
+    cache = daemon.WatchCache(api_client, 'pods', max_objects=3)
+    try:
+        wait_for(lambda: cache.overflow)
+        assert cache.query() == []
+        assert cache.bytes == 0
+    finally:
+        cache.stop()
+
+def test_only_first_query_waits_for_sync(apiserver, api_client, small_pages, monkeypatch):
+    monkeypatch.setattr(daemon, 'SYNC_TIMEOUT', 0.3)
+    apiserver.set_pods(*(make_pod(f'p{i}', 1) for i in range(5)))
+    apiserver.hold_pages = threading.Event()
+    cache = daemon.WatchCache(api_client, 'pods')
+    try:
+        started = time.monotonic()
+        assert not cache.ready()
+        assert time.monotonic() - started >= 0.3
+        # Later queries go to the API server without waiting while the LIST is held
+        started = time.monotonic()
+        assert not cache.ready()
+        assert time.monotonic() - started < 0.1
+
+        apiserver.hold_pages.set()
+        assert cache.synced.wait(5)
+        assert cache.ready()
+    finally:
+        cache.stop()
+
+def test_failed_first_list_does_not_wait(apiserver, api_client, small_pages):
+    apiserver.set_pods(*(make_pod(f'p{i}', 1) for i in range(5)))
+    apiserver.fail_pages = True
+    cache = daemon.WatchCache(api_client, 'pods')
+    try:
+        started = time.monotonic()
+        assert not cache.ready()
+        assert time.monotonic() - started < daemon.SYNC_TIMEOUT / 2
+        assert cache.error is not None
+    finally:
+        cache.stop()
+
+@pytest.fixture
+def running_daemon(apiserver, monkeypatch):
+    # Unix socket paths are limited to ~100 bytes, so keep this one short
+    directory = tempfile.mkdtemp(prefix='kubed-', dir='/tmp')
+    kubeconfig = os.path.join(directory, 'config')
+    with open(kubeconfig, 'w') as f:
+        json.dump({
+            'apiVersion': 'v1',
+            'kind': 'Config',
+            'current-context': 'fake',
+            'clusters': [{'name': 'fake', 'cluster': {'server': apiserver.url}}],
+            'users': [{'name': 'fake', 'user': {'token': 'secret'}}],
+            'contexts': [{'name': 'fake', 'context': {'cluster': 'fake', 'user': 'fake', 'namespace': 'default'}},
+                         {'name': 'system', 'context': {'cluster': 'fake', 'user': 'fake',
+                                                        'namespace': 'kube-system'}}],
+        }, f)
+    monkeypatch.setenv('KUBED_DAEMON_SOCKET', os.path.join(directory, 'daemon.sock'))
+    monkeypatch.setenv('KUBED_CACHE_DIR', os.path.join(directory, 'cache'))
+    monkeypatch.setenv('KUBECONFIG', kubeconfig)
+    thread = threading.Thread(target=daemon.serve, kwargs={'kubeconfig': kubeconfig}, daemon=True)
+    thread.start()
+    wait_for(lambda: daemon.send_request({'op': 'ping'}, timeout=1) is not None)
+    yield thread
+    daemon.send_request({'op': 'shutdown'}, timeout=1)
+    thread.join(5)
+    shutil.rmtree(directory, ignore_errors=True)
+
+def send_raw(data):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(5)
+        sock.connect(daemon.get_socket_path())
+        sock.sendall(data)
+        return json.loads(sock.makefile('rb').readline())
+
+def test_socket_protocol(apiserver, running_daemon):
+    apiserver.set_pods(make_pod('web-1', 1), make_pod('web-2', 1), make_pod('api-1', 1, {'app': 'api'}))
+
+    assert daemon.send_request({'op': 'ping'})['pid'] == os.getpid()
+
+    # Equality selectors are answered from the cache
+    items = daemon.query_daemon('pods', selector='app=web')
+    assert [item['metadata']['name'] for item in items] == ['web-1', 'web-2']
+    assert items[0]['kind'] == 'Pod'
+    assert [item['metadata']['name'] for item in daemon.query_daemon('pods', names=['api-1'])] == ['api-1']
+
+    # Set-based selectors fall through to a LIST over the daemon's client
+    items = daemon.query_daemon('pods', selector='app in (api)')
+    assert [item['metadata']['name'] for item in items] == ['api-1']
+
+    stats = daemon.send_request({'op': 'stats'})
+    cache = stats['contexts']['fake']['caches']['pods']
+    assert (cache['hits'], cache['misses'], cache['objects'], cache['synced']) == (2, 1, 3, True)
+
+    assert send_raw(b'not json\n') == {'ok': False, 'error': 'invalid JSON'}
+    assert send_raw(b'{"op": "nope"}\n') == {'ok': False, 'error': "unknown op 'nope'"}
+    response = daemon.send_request({'op': 'get', 'resource': 'gizmos'})
+    assert response == {'ok': False, 'error': "unsupported resource type 'gizmos'"}
+    response = daemon.send_request({'op': 'get', 'resource': 'pods', 'context': 'missing'})
+    assert response == {'ok': False, 'error': "context 'missing' not found in kubeconfig"}
+
+    assert daemon.send_request({'op': 'shutdown'}) == {'ok': True}
+    running_daemon.join(5)
+    assert not running_daemon.is_alive()
+    assert not os.path.exists(daemon.get_socket_path())
+    assert daemon.send_request({'op': 'ping'}) is None
+
+def test_client_resolves_its_own_context(apiserver, running_daemon, tmp_path, monkeypatch):
+    apiserver.set_pods(make_pod('web-1', 1), make_pod('dns-1', 1, namespace='kube-system'))
+    # This shell's KUBECONFIG makes another context current than the daemon's
+    with open(os.environ['KUBECONFIG']) as f:
+        config = dict(json.load(f), **{'current-context': 'system'})
+    (tmp_path / 'config').write_text(json.dumps(config))
+    monkeypatch.setenv('KUBECONFIG', str(tmp_path / 'config'))
+
+    items = daemon.query_daemon('pods', selector='app=web')
+
+    assert [item['metadata']['name'] for item in items] == ['dns-1']
+    assert list(daemon.send_request({'op': 'stats'})['contexts']) == ['system']
+    assert [item['metadata']['name'] for item in daemon.query_daemon('pods', context='fake')] == ['web-1']
+    assert daemon.query_daemon('pods', context='missing') is None
@@ -0,0 +1,323 @@
+"""
+Tests for `kubed docker`: the filter language, and bulk actions with error
+aggregation against a fake Docker socket.
+"""
+
+import json
+import os
+import queue
+import re
+import subprocess
+import sys
+import threading
+import time
+
+import click
+import pytest
+from click.testing import CliRunner
+
+from kubed import docker
+
+NOW = 1_700_000_000
+DAY = 86400
+
+def container(name, state='running', age=0, labels=None):
+    return {'Id': f'id-{name}', 'Names': [f'/{name}'], 'State': state, 'Created': NOW - age,
+            'Labels': labels or {}}
+
+def image(digest, tags, age=0, labels=None):
+    return {'Id': f'sha256:{digest * 64}', 'RepoTags': tags, 'Created': NOW - age, 'Labels': labels}
+
+@pytest.mark.parametrize('expression, expected', [
+    ('label=app', ('label', '=', 'app')),
+    ('label=app=web', ('label', '=', 'app=web')),
+    ('label != tier=db', ('label', '!=', 'tier=db')),
+    ('age>7d', ('age', '>', 7 * DAY)),
+    ('age<90s', ('age', '<', 90)),
+    ('dangling=true', ('dangling', '=', True)),
+    ('dangling=false', ('dangling', '=', False)),
+    ('status=exited', ('status', '=', 'exited')),
+    ('status!=running', ('status', '!=', 'running')),
+    ('name=web-*', ('name', '=', 'web-*')),
+])
+def test_parse_filter(expression, expected):
+    assert docker.parse_filter(expression) == expected
+
+@pytest.mark.parametrize('expression, message', [
+    ('color=red', "invalid filter"),
+    ('label>app', "'label' filters take = or !="),
+    ('age=7d', "'age' filters take > or <"),
+    ('age>7 days', "invalid duration"),
+    ('dangling!=true', "'dangling' filters take ="),
+    ('dangling=yes', "dangling must be true or false"),
+    ('name<web', "'name' filters take = or !="),
+])
+def test_parse_filter_rejects(expression, message):
+    with pytest.raises(click.BadParameter, match=re.escape(message)):
+        docker.parse_filter(expression)
+
+@pytest.mark.parametrize('expressions, expected', [
+    (['label=app'], ['web-1', 'web-2', 'db']),
+    (['label=app=web'], ['web-1', 'web-2']),
+    (['label!=app=web'], ['db', 'old']),
+    (['label!=app'], ['old']),
+    (['age>7d'], ['web-2', 'old']),
+    (['age<1d'], ['web-1', 'db']),
+    (['status=exited'], ['web-2', 'old']),
+    (['status!=exited'], ['web-1', 'db']),
+    (['name=web-*'], ['web-1', 'web-2']),
+    (['name!=web-*'], ['db', 'old']),
+    (['label=app=web', 'status=exited', 'age>7d'], ['web-2']),
+])
+def test_matches_containers(expressions, expected):
+    containers = [
+        container('web-1', age=60, labels={'app': 'web'}),
+        container('web-2', state='exited', age=10 * DAY, labels={'app': 'web'}),
+        container('db', age=3600, labels={'app': 'db'}),
+        container('old', state='exited', age=30 * DAY),
+    ]
+    filters = [docker.parse_filter(e) for e in expressions]
+    assert [docker.display_name(c) for c in containers if docker.matches(c, filters, NOW)] == expected
+
+def test_matches_images():
+    images = [image('a', ['web:1.0'], age=DAY), image('b', None), image('c', ['<none>:<none>'], age=10 * DAY),
+              image('d', ['db:2', 'db:latest'], age=10 * DAY, labels={'tier': 'db'})]
+
+    def select(*expressions):
+        filters = [docker.parse_filter(e) for e in expressions]
+        return [docker.display_name(i) for i in images if docker.matches(i, filters, NOW)]
+
+    assert select('dangling=true') == ['bbbbbbbbbbbb', 'cccccccccccc']
+    assert select('dangling=false') == ['web:1.0', 'db:2']
+    assert select('dangling=true', 'age>7d') == ['cccccccccccc']
+    assert select('name=db:*') == ['db:2']
+    assert select('label=tier=db') == ['db:2']
+
+def test_server_and_prune_filters():
+    filters = [docker.parse_filter(e) for e in
+               ('label=app=web', 'label!=tier', 'age>2h', 'dangling=true', 'status=exited', 'name=web-*')]
+    assert docker.server_filters(filters) == {'label': ['app=web'], 'dangling': True, 'status': ['exited']}
+    assert docker.prune_filters(filters[:4]) == {'label': ['app=web'], 'label!': ['tier'], 'until': '7200s',
+                                                 'dangling': True}
+    with pytest.raises(click.BadParameter, match="prune does not support 'status='"):
+        docker.prune_filters(filters[4:5])
+
+# API paths, with or without the version prefix the SDK adds
+API = r'(?:/v[\d.]+)?'
+
+class FakeDocker:
+    """A Docker Engine API on a Unix socket, serving canned containers and images."""
+
+    def __init__(self, fake_server, containers, images=()):
+        # Ages are relative to NOW; keep them so against the real clock
+        shift = int(time.time()) - NOW
+        self.containers = {c['Id']: dict(c, Created=c['Created'] + shift) for c in containers}
+        self.images = {i['Id']: dict(i, Created=i['Created'] + shift) for i in images}
+        # Id -> (status, message) for actions that fail
+        self.errors = {}
+        self.requests = []
+        self.active = self.peak = 0
+        self.lock = threading.Lock()
+        self.routes = [
+            ('GET', API + '/version', self.version),
+            ('GET', API + r'/(containers|images)/json', self.list),
+            ('*', API + r'/(containers|images)/([^/]+)(/stop)?', self.action),
+        ]
+        self.path = fake_server(self.routes, unix=True).path
+
+    def record(self, request):
+        self.requests.append((request.command, re.sub(API, '', request.route_path, count=1), request.query))
+
+    def version(self, request):
+        self.record(request)
+        request.send_json(200, {'ApiVersion': '1.43', 'Version': '24.0.0'})
+
+    def list(self, request, kind):
+        self.record(request)
+        request.send_json(200, list((self.containers if kind == 'containers' else self.images).values()))
+
+    def action(self, request, kind, object_id, stop):
+        self.record(request)
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.05)
+        with self.lock:
+            self.active -= 1
+        if object_id in self.errors:
+            status, message = self.errors[object_id]
+            return request.send_json(status, {'message': message})
+        request.send_json(204)
+
+    def actions(self):
+        return sorted((method, path) for method, path, _ in self.requests if method != 'GET')
+
+@pytest.fixture
+def fake_docker(fake_server, monkeypatch):
+    def start(containers, images=()):
+        server = FakeDocker(fake_server, containers, images)
+        monkeypatch.setenv('DOCKER_HOST', f'unix://{server.path}')
+        return server
+
+    monkeypatch.setattr(docker, '_client', None)
+    return start
+
+def test_rm_by_filter_reports_every_failure(fake_docker):
+    server = fake_docker([
+        container('web-1', state='exited', age=10 * DAY, labels={'app': 'web'}),
+        container('web-2', state='exited', age=10 * DAY, labels={'app': 'web'}),
+        container('web-3', state='exited', age=10 * DAY, labels={'app': 'web'}),
+        container('web-4', state='exited', age=10 * DAY, labels={'app': 'web'}),
+        container('web-new', state='exited', age=60, labels={'app': 'web'}),
+        container('db', state='exited', age=10 * DAY, labels={'app': 'db'}),
+    ])
+    server.errors = {'id-web-2': (409, 'container is in use'), 'id-web-4': (500, 'driver failed')}
+
+    result = CliRunner().invoke(docker.docker, ['rm', '--filter', 'label=app=web', '--filter', 'age>7d',
+                                                '--concurrency', '2'])
+
+    assert result.exit_code == 1
+    assert server.actions() == [('DELETE', f'/containers/id-web-{i}') for i in range(1, 5)]
+    list_query = next(q for m, p, q in server.requests if p == '/containers/json')
+    assert json.loads(list_query['filters']) == {'label': ['app=web']}
+    assert server.peak == 2
+    lines = result.output.splitlines()
+    assert sorted(l.split('] ', 1)[1].split(' (')[0] for l in lines if l.startswith('[')) == [
+        '✅ removed web-1', '✅ removed web-3', '❌ web-2: container is in use', '❌ web-4: driver failed']
+    assert re.fullmatch(r'2 removed, 2 failed in \d+\.\ds', lines[-1])
+
+def test_stop_by_name_succeeds(fake_docker):
+    server = fake_docker([container('web-1'), container('web-2')])
+
+    result = CliRunner().invoke(docker.docker, ['stop', 'web-1', 'web-2', '-t', '3'])
+
+    assert result.exit_code == 0, result.output
+    assert server.actions() == [('POST', '/containers/web-1/stop'), ('POST', '/containers/web-2/stop')]
+    assert all(q.get('t') == '3' for m, p, q in server.requests if p.endswith('/stop'))
+    assert result.output.splitlines()[-1].startswith('2 stopped, 0 failed in ')
+
+def test_rmi_dry_run_lists_without_removing(fake_docker):
+    server = fake_docker([], [image('a', ['web:1.0']), image('b', ['<none>:<none>'], age=10 * DAY)])
+
+    result = CliRunner().invoke(docker.docker, ['rmi', '--filter', 'dangling=true', '--dry-run'])
+
+    assert result.exit_code == 0, result.output
+    assert result.output == 'bbbbbbbbbbbb\n'
+    assert server.actions() == []
+
+def test_run_bulk_aggregates_errors():
+    def action(object_id):
+        if object_id.endswith('2'):
+            raise RuntimeError(f'cannot remove {object_id}')
+
+    objects = [{'Id': f'c{i}', 'Names': [f'/c{i}']} for i in range(1, 4)]
+    runner = CliRunner()
+    with runner.isolation() as (out, err, *_):
+        assert docker.run_bulk(action, 'removed', objects, concurrency=3) is False
+    assert '❌ c2: cannot remove c2' in err.getvalue().decode()
+    assert out.getvalue().decode().splitlines()[-1].startswith('2 removed, 1 failed in ')
+
+    with runner.isolation() as (out, err, *_):
+        assert docker.run_bulk(action, 'removed', [], concurrency=3) is True
+    assert err.getvalue().decode() == 'Nothing matched.\n'
+
+class EventsDocker(FakeDocker):
+    """FakeDocker with networks, volumes and an events stream fed from a queue; None ends the stream."""
+
+    def __init__(self, fake_server, containers, images=()):
+        super().__init__(fake_server, containers, images)
+        self.networks = ['bridge']
+        self.volumes = ['data']
+        self.events = queue.Queue()
+        self.streams = 0
+        self.routes[:0] = [
+            ('GET', API + '/networks', lambda request: request.send_json(200, [{'Name': n} for n in self.networks])),
+            ('GET', API + '/volumes', lambda request: request.send_json(
+                200, {'Volumes': [{'Name': n} for n in self.volumes]})),
+            ('GET', API + '/events', self.stream),
+        ]
+
+    def stream(self, request):
+        self.streams += 1
+        request.start_chunks()
+        while True:
+            try:
+                event = self.events.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if event is None:
+                return request.write_chunk(b'')
+            request.write_chunk(json.dumps(event).encode() + b'\n')
+
+    def close(self):
+        self.events.put(None)
+
+def event(kind, action, name=None, object_id=None, **attributes):
+    if name:
+        attributes['name'] = name
+    return {'Type': kind, 'Action': action, 'Actor': {'ID': object_id or name, 'Attributes': attributes}}
+
+def wait_for_file(path, expected, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with open(path) as f:
+                if f.read() == expected:
+                    return
+        except OSError:
+            pass
+        if time.monotonic() > deadline:
+            raise AssertionError(f'{path} never read {expected!r}')
+        time.sleep(0.05)
+
+def test_watcher_keeps_names_current_from_events(fake_server, tmp_path, monkeypatch):
+    server = EventsDocker(fake_server, [container('web'), container('db', state='exited')],
+                          [image('a', ['web:1.0'])])
+    monkeypatch.setenv('DOCKER_HOST', f'unix://{server.path}')
+    monkeypatch.setenv('KUBED_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(docker, '_client', None)
+    names = docker.get_names_dir()
+    root = os.path.dirname(os.path.dirname(os.path.abspath(docker.__file__)))
+    watcher = subprocess.Popen([sys.executable, '-c', 'from kubed import docker; docker.watch_names(idle_timeout=2)'],
+                               env=dict(os.environ, PYTHONPATH=root))
+    try:
+        # The first listing fills every kind
+        wait_for_file(os.path.join(names, 'containers'), 'db\texited\nweb\trunning\n')
+        wait_for_file(os.path.join(names, 'images'), 'web:1.0\n')
+        wait_for_file(os.path.join(names, 'networks'), 'bridge\n')
+        wait_for_file(os.path.join(names, 'volumes'), 'data\n')
+
+        # Each event is written out by the flusher, without listing again; completion
+        # touches `used` as it reads the cache, which keeps the watcher alive
+        used = os.path.join(names, 'used')
+        os.utime(used)
+        listed = len(server.requests)
+        server.events.put(event('container', 'create', 'api'))
+        server.events.put(event('container', 'start', 'api'))
+        server.events.put(event('container', 'destroy', 'db'))
+        server.events.put(event('network', 'create', 'backend'))
+        server.events.put(event('volume', 'destroy', object_id='data'))
+        wait_for_file(os.path.join(names, 'containers'), 'api\trunning\nweb\trunning\n')
+        wait_for_file(os.path.join(names, 'networks'), 'backend\nbridge\n')
+        wait_for_file(os.path.join(names, 'volumes'), '')
+        assert len(server.requests) == listed
+
+        # A second watcher for the same host backs off
+        assert docker.watch_names() is False
+
+        # A broken stream is followed by a full listing and a new stream
+        os.utime(used)
+        server.containers = {c['Id']: c for c in [container('cron')]}
+        server.events.put(None)
+        wait_for_file(os.path.join(names, 'containers'), 'cron\trunning\n')
+        deadline = time.monotonic() + 5
+        while server.streams < 2 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert server.streams == 2
+
+        # Without completion using the cache, the watcher exits once idle
+        assert watcher.wait(timeout=10) == 0
+    finally:
+        if watcher.poll() is None:
+            watcher.kill()
+        server.close()
@@ -0,0 +1,175 @@
+"""
+Tests for `kubed helm`: lookups in the compact chart index and keeping it
+current, and listing the latest revision of each release against a fake
+API server.
+"""
+
+import base64
+import gzip
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from click.testing import CliRunner
+
+from kubed import helm, k8s
+
+def release_record(name, revision, status='deployed', namespace='apps'):
+    return {'name': name, 'namespace': namespace, 'version': revision,
+            'info': {'status': status, 'last_deployed': '2024-05-01T10:00:00.123456Z'},
+            'chart': {'metadata': {'name': name, 'version': f'1.{revision}.0', 'appVersion': '4.5'}}}
+
+def release_object(name, revision, status='deployed', namespace='apps', driver='secret', compress=True):
+    """A helm release record as helm stores it: gzipped JSON, base64, and base64 again in a secret."""
+    data = json.dumps(release_record(name, revision, status, namespace)).encode()
+    payload = base64.b64encode(gzip.compress(data) if compress else data)
+    if driver == 'secret':
+        payload = base64.b64encode(payload)
+    return {'metadata': {'name': f'sh.helm.release.v1.{name}.v{revision}', 'namespace': namespace,
+                         'labels': {'owner': 'helm', 'name': name, 'version': str(revision), 'status': status}},
+            'data': {'release': payload.decode()}}
+
+@pytest.mark.parametrize('driver, compress', [('secret', True), ('secret', False), ('configmap', True)])
+def test_decode_release(driver, compress):
+    row = helm.decode_release(release_object('web', 3, driver=driver, compress=compress), driver)
+
+    assert row == ['web', 'apps', '3', '2024-05-01 10:00:00', 'deployed', 'web-1.3.0', '4.5']
+
+class FakeApiServer:
+    """Serves paginated release secrets, recording each LIST's label selector."""
+
+    def __init__(self, fake_server):
+        self.secrets = []
+        self.selectors = []
+        self.url = fake_server([('GET', r'/api/v1(?:/namespaces/([^/]+))?/secrets', self.list)]).url
+
+    def list(self, request, namespace):
+        self.selectors.append(request.query.get('labelSelector'))
+        items = sorted((s for s in self.secrets if namespace in (None, s['metadata']['namespace'])),
+                       key=lambda s: s['metadata']['name'])
+        offset = int(request.query.get('continue', 0))
+        limit = int(request.query.get('limit', len(items)))
+        metadata = {'continue': str(offset + limit)} if offset + limit < len(items) else {}
+        request.send_json(200, {'kind': 'SecretList', 'metadata': metadata, 'items': items[offset:offset + limit]})
+
+@pytest.fixture
+def apiserver(fake_server, tmp_path, monkeypatch):
+    server = FakeApiServer(fake_server)
+    kubeconfig = tmp_path / 'kubeconfig'
+    kubeconfig.write_text(json.dumps({
+        'apiVersion': 'v1',
+        'kind': 'Config',
+        'current-context': 'fake',
+        'clusters': [{'name': 'fake', 'cluster': {'server': server.url}}],
+        'users': [{'name': 'fake', 'user': {'token': 'secret'}}],
+        'contexts': [{'name': 'fake', 'context': {'cluster': 'fake', 'user': 'fake', 'namespace': 'apps'}}],
+    }))
+    monkeypatch.setenv('KUBECONFIG', str(kubeconfig))
+    monkeypatch.setenv('KUBED_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.delenv('HELM_DRIVER', raising=False)
+    monkeypatch.setattr(k8s, '_clients', {})
+    return server
+
+def test_list_releases_keeps_latest_revision(apiserver, monkeypatch):
+    monkeypatch.setattr(helm, 'RELEASES_PAGE_SIZE', 2)
+    # Lexical order puts v10 before v2, so the highest revision is not always listed last
+    apiserver.secrets = [release_object('web', revision) for revision in (1, 2, 10)] + [
+        release_object('db', 1, status='failed'), release_object('db', 2, namespace='other')]
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        rows = helm.list_releases(pool)
+
+    assert [row[:3] + row[4:6] for row in rows] == [['db', 'apps', '1', 'failed', 'db-1.1.0'],
+                                                     ['web', 'apps', '10', 'deployed', 'web-1.10.0']]
+    assert apiserver.selectors == ['owner=helm,status in (deployed,failed)'] * 2
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        rows = helm.list_releases(pool, all_namespaces=True, all_statuses=True)
+    assert [(row[0], row[1], row[2]) for row in rows] == [('db', 'apps', '1'), ('db', 'other', '2'),
+                                                          ('web', 'apps', '10')]
+    assert apiserver.selectors[-1] == 'owner=helm,status!=superseded'
+
+def test_releases_passes_timeout_for_one_context(apiserver, monkeypatch):
+    calls = []
+    list_releases = helm.list_releases
+    monkeypatch.setattr(helm, 'list_releases', lambda *args: calls.append(args) or list_releases(*args))
+    apiserver.secrets = [release_object('web', 1)]
+
+    result = CliRunner().invoke(helm.helm, ['releases', '--timeout', '7'])
+
+    assert result.exit_code == 0, result.output
+    assert calls[0][1:] == (None, None, False, False, 7.0)
+    assert result.output.splitlines()[1].split()[:3] == ['web', 'apps', '1']
+
+def write_repo(cache, repo, charts):
+    """Write a repository's index.yaml in helm's cache; charts maps names to versions, newest first."""
+    entries = {name: [{'version': version, 'appVersion': f'app-{version}', 'description': f'The {name}\tchart'}
+                      for version in versions] for name, versions in charts.items()}
+    path = cache / f'{repo}-index.yaml'
+    path.write_text(json.dumps({'apiVersion': 'v1', 'entries': entries}))
+    return path
+
+@pytest.fixture
+def repos(tmp_path, monkeypatch):
+    cache = tmp_path / 'helm'
+    cache.mkdir()
+    monkeypatch.setenv('HELM_REPOSITORY_CACHE', str(cache))
+    monkeypatch.setenv('KUBED_CACHE_DIR', str(tmp_path / 'cache'))
+    charts = {f'chart-{i:02}': [f'1.{i}.1', f'1.{i}.0'][:1 + i % 2] for i in range(40)}
+    charts.update({'aaa': ['0.1.0'], 'zzz': ['9.0.0', '8.0.0']})
+    write_repo(cache, 'main', charts)
+    return cache
+
+def test_index_lookups_at_the_edges(repos):
+    assert helm.update_indexes() == ['main']
+
+    with helm.ChartIndex('main') as index:
+        assert index.versions('main/aaa') == [('main/aaa', '0.1.0', 'app-0.1.0', 'The aaa chart')]
+        assert [row[1] for row in index.versions('main/zzz')] == ['9.0.0', '8.0.0']
+        assert [row[1] for row in index.versions('main/chart-17')] == ['1.17.1', '1.17.0']
+        assert [row[1] for row in index.versions('main/chart-20')] == ['1.20.1']
+        for missing in ('main/a', 'main/aaaa', 'main/chart-5', 'main/chart-40', 'main/zzzz', 'other/aaa', ''):
+            assert index.versions(missing) == []
+        assert index.chart_names('main/chart-3') == [f'main/chart-{i}' for i in range(30, 40)]
+        assert index.chart_names('main/z') == ['main/zzz']
+        assert index.chart_names('main/zzzz') == []
+        assert index.chart_names('main/b') == []
+        assert len(index.chart_names()) == 42
+
+def test_empty_index(repos):
+    write_repo(repos, 'main', {})
+    helm.update_indexes()
+
+    with helm.ChartIndex('main') as index:
+        assert index.versions('main/aaa') == []
+        assert index.chart_names() == []
+
+def test_stale_indexes_are_rebuilt(repos):
+    helm.update_indexes()
+    charts_path = helm.get_charts_path()
+    with open(charts_path) as f:
+        assert f.read().splitlines()[:2] == [str(repos), 'main/aaa']
+    assert helm.update_indexes() == []
+
+    # A changed index.yaml rebuilds its index and the chart-name list
+    source = write_repo(repos, 'main', {'bbb': ['1.0.0']})
+    os.utime(source, ns=(0, 0))
+    assert helm.update_indexes() == ['main']
+    with open(charts_path) as f:
+        assert f.read().splitlines() == [str(repos), 'main/bbb']
+
+    # An index written after the list, as by an interrupted run, rewrites the list
+    write_repo(repos, 'extra', {'ccc': ['1.0.0']})
+    helm.build_index('extra', str(repos / 'extra-index.yaml'))
+    os.utime(charts_path, ns=(0, 0))
+    assert helm.update_indexes() == []
+    with open(charts_path) as f:
+        assert f.read().splitlines() == [str(repos), 'extra/ccc', 'main/bbb']
+
+    # A removed repository drops its index and its charts
+    os.unlink(repos / 'extra-index.yaml')
+    assert helm.update_indexes() == []
+    assert not os.path.exists(helm.get_index_path('extra'))
+    with open(charts_path) as f:
+        assert f.read().splitlines() == [str(repos), 'main/bbb']
@@ -0,0 +1,51 @@
+"""
+Keep `kubed completions-path`, which runs at every shell start, cheap to import.
+"""
+
+import json
+import os
+import re
+import subprocess
+import sys
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_NAME = 'import:kubed completions-path'
+HEAVY_MODULES = ('kubernetes', 'docker', 'rich', 'yaml')
+
+def import_trace():
+    """Run `python -X importtime -m kubed completions-path`.
+
+    Returns:
+        tuple: (total cumulative microseconds of the top-level imports, names of every module imported)
+    """
+    env = dict(os.environ, PYTHONPATH=REPO)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-m', 'kubed', 'completions-path'],
+                            env=env, capture_output=True, text=True, check=True)
+    total, modules = 0, []
+    for line in result.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"; top-level imports are not indented
+        match = re.match(r'import time:\s+\d+\s+\|\s+(\d+)\s+\|(\s+)(\S+)$', line)
+        if match:
+            modules.append(match.group(3))
+            if len(match.group(2)) == 1:
+                total += int(match.group(1))
+    return total, modules
+
+def get_budget_ms():
+    """Get the import budget from benchmarks/baseline.json, overridable with KUBED_IMPORT_BUDGET_MS."""
+    if os.environ.get('KUBED_IMPORT_BUDGET_MS'):
+        return float(os.environ['KUBED_IMPORT_BUDGET_MS'])
+    with open(os.path.join(REPO, 'benchmarks', 'baseline.json')) as f:
+        return json.load(f)['budgets'][BUDGET_NAME]
+
+def test_import_time_is_within_budget():
+    # Best of three, so one slow run on a busy machine does not fail the test
+    totals = [import_trace()[0] / 1000 for _ in range(3)]
+    budget = get_budget_ms()
+    assert min(totals) <= budget, f"imports took {min(totals):.1f}ms, over the {budget}ms budget"
+
+def test_heavy_modules_are_not_imported():
+    _, modules = import_trace()
+    assert 'kubed.cli' in modules
+    heavy = [m for m in modules if m.split('.')[0] in HEAVY_MODULES]
+    assert not heavy, f"completions-path imports {', '.join(sorted(set(heavy)))}"
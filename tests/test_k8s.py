@@ -0,0 +1,287 @@
+"""
+Tests for `kubed k8s`: get, describe and delete against a fake API server,
+fanning out over contexts, and the shared API clients.
+"""
+
+import json
+import threading
+import time
+
+import pytest
+import yaml
+from click.testing import CliRunner
+
+from kubed import k8s
+
+CREATED = '2024-01-01T00:00:00Z'
+
+def make_object(kind, name, namespace=None, labels=None, **fields):
+    metadata = {'name': name, 'creationTimestamp': CREATED, 'labels': labels or {}}
+    if namespace:
+        metadata['namespace'] = namespace
+    return dict({'metadata': metadata}, **fields)
+
+def status(code, reason, message):
+    return {'kind': 'Status', 'apiVersion': 'v1', 'status': 'Failure', 'code': code, 'reason': reason,
+            'message': message}
+
+class FakeApiServer:
+    """Serves pods, deployments, nodes, namespaces and events from dicts, recording each request."""
+
+    def __init__(self, fake_server):
+        self.objects = {
+            'pods': [
+                make_object('Pod', 'web', 'apps', {'app': 'web'}, spec={'containers': [{'name': 'app'}]},
+                            status={'phase': 'Running', 'containerStatuses': [{'ready': True, 'restartCount': 2}]}),
+                make_object('Pod', 'db', 'apps', {'app': 'db'}, spec={'containers': [{'name': 'db'}]},
+                            status={'phase': 'Pending'}),
+                make_object('Pod', 'api', 'team', {'app': 'api'}, spec={'containers': [{'name': 'api'}]},
+                            status={'phase': 'Running'}),
+            ],
+            'deployments': [make_object('Deployment', 'web', 'apps', spec={'replicas': 2},
+                                        status={'readyReplicas': 2, 'updatedReplicas': 2, 'availableReplicas': 2})],
+            'nodes': [make_object('Node', 'node-1', labels={'node-role.kubernetes.io/control-plane': ''},
+                                  status={'conditions': [{'type': 'Ready', 'status': 'True'}],
+                                          'nodeInfo': {'kubeletVersion': 'v1.29.3'}})],
+            'namespaces': [make_object('Namespace', 'apps', status={'phase': 'Active'})],
+            'events': [
+                make_object('Event', 'web.2', 'apps', type='Warning', reason='BackOff', lastTimestamp=CREATED,
+                            involvedObject={'kind': 'Pod', 'name': 'web'}, source={'component': 'kubelet'},
+                            message='Back-off restarting failed container'),
+                make_object('Event', 'web.1', 'apps', type='Normal', reason='Scheduled',
+                            lastTimestamp='2023-12-31T00:00:00Z', involvedObject={'kind': 'Pod', 'name': 'web'},
+                            source={'component': 'scheduler'}, message='Assigned apps/web to node-1'),
+                make_object('Event', 'db.1', 'apps', type='Normal', reason='Scheduled', lastTimestamp=CREATED,
+                            involvedObject={'kind': 'Pod', 'name': 'db'}, message='Assigned apps/db to node-1'),
+            ],
+        }
+        # Namespaces the user may not read
+        self.forbidden = {'locked'}
+        self.requests = []
+        self.url = fake_server([
+            ('*', r'/apis?(?:/apps)?/v1(?:/namespaces/([^/]+))?/(pods|deployments|nodes|namespaces|events)'
+                  r'(?:/([^/]+))?', self.serve),
+        ]).url
+
+    def serve(self, request, namespace, kind, name):
+        self.requests.append((request.command, request.route_path, request.query))
+        if namespace in self.forbidden:
+            verb = 'list' if name is None else request.command.lower()
+            message = f'{kind} is forbidden: User "fake" cannot {verb} resource "{kind}" in namespace "{namespace}"'
+            return request.send_json(403, status(403, 'Forbidden', message))
+        found = [obj for obj in self.objects[kind] if namespace in (None, obj['metadata'].get('namespace'))]
+        if name is None:
+            selector = request.query.get('labelSelector')
+            if selector:
+                key, _, value = selector.partition('=')
+                found = [obj for obj in found if obj['metadata']['labels'].get(key) == value]
+            fields = request.query.get('fieldSelector')
+            if fields:
+                wanted = dict(field.split('=', 1) for field in fields.split(','))
+                found = [obj for obj in found
+                         if all(obj['involvedObject'][key.split('.')[1]] == value for key, value in wanted.items())]
+            return request.send_json(200, {'kind': 'List', 'metadata': {}, 'items': found})
+        obj = next((obj for obj in found if obj['metadata']['name'] == name), None)
+        if obj is None:
+            return request.send_json(404, status(404, 'NotFound', f'{kind} "{name}" not found'))
+        if request.command == 'DELETE':
+            self.objects[kind].remove(obj)
+            return request.send_json(200, status(200, 'Success', ''))
+        request.send_json(200, obj)
+
+    def paths(self, method='GET'):
+        return [path for command, path, _ in self.requests if command == method]
+
+@pytest.fixture
+def apiserver(fake_server, tmp_path, monkeypatch):
+    server = FakeApiServer(fake_server)
+    kubeconfig = tmp_path / 'kubeconfig'
+    kubeconfig.write_text(json.dumps({
+        'apiVersion': 'v1',
+        'kind': 'Config',
+        'current-context': 'fake',
+        'clusters': [{'name': 'fake', 'cluster': {'server': server.url}}],
+        'users': [{'name': 'fake', 'user': {'token': 'secret'}}],
+        'contexts': [{'name': 'fake', 'context': {'cluster': 'fake', 'user': 'fake', 'namespace': 'apps'}},
+                     {'name': 'team', 'context': {'cluster': 'fake', 'user': 'fake', 'namespace': 'team'}}],
+    }))
+    monkeypatch.setenv('KUBECONFIG', str(kubeconfig))
+    monkeypatch.setenv('KUBED_CACHE_DIR', str(tmp_path / 'cache'))
+    # No daemon answers, so every command reads from the API server
+    monkeypatch.setenv('KUBED_DAEMON_SOCKET', str(tmp_path / 'daemon.sock'))
+    monkeypatch.setattr(k8s, '_clients', {})
+    return server
+
+def invoke(*args):
+    return CliRunner().invoke(k8s.k8s, list(args))
+
+def test_get_resolves_kinds_and_namespaces(apiserver):
+    result = invoke('get', 'po')
+
+    assert result.exit_code == 0, result.output
+    lines = result.output.splitlines()
+    assert lines[0].split() == ['NAME', 'READY', 'STATUS', 'RESTARTS', 'AGE']
+    assert [line.split()[:4] for line in lines[1:]] == [['web', '1/1', 'Running', '2'], ['db', '0/1', 'Pending', '0']]
+    # The context's namespace is the default, and another context brings its own
+    assert invoke('get', 'pod', '--context', 'team', '-o', 'name').output == 'pod/api\n'
+    assert invoke('get', 'Deployment', 'web', '-n', 'apps', '-o', 'name').output == 'deployment/web\n'
+    assert invoke('get', 'no').output.splitlines()[1].split()[:4] == ['node-1', 'Ready', 'control-plane', 'v1.29.3']
+    assert apiserver.paths() == ['/api/v1/namespaces/apps/pods', '/api/v1/namespaces/team/pods',
+                                 '/apis/apps/v1/namespaces/apps/deployments/web', '/api/v1/nodes']
+
+    result = invoke('get', 'configmaps')
+    assert result.exit_code == 2
+    assert "unsupported resource type 'configmaps'" in result.output
+
+def test_get_output_formats(apiserver):
+    result = invoke('get', 'pods', '-A', '-l', 'app=api')
+    assert result.exit_code == 0, result.output
+    assert [line.split()[:2] for line in result.output.splitlines()] == [['NAMESPACE', 'NAME'], ['team', 'api']]
+    assert apiserver.requests[-1][1:] == ('/api/v1/pods', {'labelSelector': 'app=api'})
+
+    # One named object is printed bare; a listing as a List with kind and apiVersion filled in
+    assert json.loads(invoke('get', 'pod', 'web', '-o', 'json').output)['metadata']['name'] == 'web'
+    listing = yaml.safe_load(invoke('get', 'deploy', '-o', 'yaml').output)
+    assert listing['kind'] == 'List'
+    assert [(item['kind'], item['apiVersion'], item['metadata']['name']) for item in listing['items']] == [
+        ('Deployment', 'apps/v1', 'web')]
+    assert invoke('get', 'pods', 'web', 'db', '-o', 'name').output == 'pod/web\npod/db\n'
+
+    result = invoke('get', 'pods', '-l', 'app=none')
+    assert result.exit_code == 0
+    assert result.output == 'No resources found.\n'
+
+def test_describe_shows_the_object_and_its_events(apiserver):
+    result = invoke('describe', 'po', 'web')
+
+    assert result.exit_code == 0, result.output
+    lines = result.output.splitlines()
+    assert lines[:4] == ['Name:        web', 'Namespace:   apps',
+                         f'Created:     {CREATED} ({k8s.format_age(CREATED)} ago)', 'Labels:      app=web']
+    assert 'Spec:' in lines and '  - name: app' in lines
+    events = lines[lines.index('Events:') + 1:]
+    assert [line.split()[:2] for line in events] == [['TYPE', 'REASON'], ['Normal', 'Scheduled'],
+                                                     ['Warning', 'BackOff']]
+    assert events[2].split(None, 4)[3:] == ['kubelet', 'Back-off restarting failed container']
+    assert apiserver.requests[-1][1:] == ('/api/v1/namespaces/apps/events',
+                                          {'fieldSelector': 'involvedObject.name=web,involvedObject.kind=Pod'})
+
+    # Events of cluster-scoped objects are looked up in the default namespace
+    result = invoke('describe', 'node', 'node-1')
+    assert result.exit_code == 0, result.output
+    assert 'Namespace:' not in result.output
+    assert result.output.endswith('Events:\n  <none>\n')
+    assert apiserver.paths()[-2:] == ['/api/v1/nodes/node-1', '/api/v1/namespaces/default/events']
+
+def test_delete(apiserver):
+    result = invoke('delete', 'pods', 'web', 'db')
+
+    assert result.exit_code == 0, result.output
+    assert result.output == 'pod "web" deleted\npod "db" deleted\n'
+    assert apiserver.paths('DELETE') == ['/api/v1/namespaces/apps/pods/web', '/api/v1/namespaces/apps/pods/db']
+    assert apiserver.objects['pods'][0]['metadata']['name'] == 'api'
+
+    assert invoke('delete', 'ns', 'apps').output == 'namespace "apps" deleted\n'
+    assert apiserver.paths('DELETE')[-1] == '/api/v1/namespaces/apps'
+
+@pytest.mark.parametrize('args, message', [
+    (['get', 'pod', 'missing'], 'Error from server (NotFound): pods "missing" not found'),
+    (['get', 'pods', '-n', 'locked'],
+     'Error from server (Forbidden): pods is forbidden: User "fake" cannot list resource "pods" in namespace "locked"'),
+    (['describe', 'deploy', 'missing'], 'Error from server (NotFound): deployments "missing" not found'),
+    (['get', 'pods', '--context', 'nowhere'], 'Error loading kubeconfig:'),
+])
+def test_api_errors_exit_with_the_server_message(apiserver, args, message):
+    result = invoke(*args)
+
+    assert result.exit_code == 1
+    assert result.output.startswith(message)
+    assert 'Traceback' not in result.output
+
+def test_delete_stops_at_the_first_error(apiserver):
+    result = invoke('delete', 'pod', 'web', 'missing', 'db')
+
+    assert result.exit_code == 1
+    assert result.output == 'pod "web" deleted\nError from server (NotFound): pods "missing" not found\n'
+    assert apiserver.paths('DELETE') == ['/api/v1/namespaces/apps/pods/web', '/api/v1/namespaces/apps/pods/missing']
+
+def test_fan_out_yields_as_contexts_answer():
+    delays = {'slow': 0.3, 'medium': 0.15, 'fast': 0}
+
+    def fetch(context):
+        time.sleep(delays[context])
+        return context.upper()
+
+    assert list(k8s.fan_out(['slow', 'medium', 'fast', 'fast'], fetch)) == [
+        ('fast', 'FAST', None), ('medium', 'MEDIUM', None), ('slow', 'SLOW', None)]
+
+def test_fan_out_aggregates_errors():
+    from kubernetes.client.exceptions import ApiException
+
+    def fetch(context):
+        if context == 'broken':
+            raise RuntimeError('connection refused')
+        if context == 'forbidden':
+            error = ApiException(status=403, reason='Forbidden')
+            error.body = '{"message": "pods is forbidden"}'
+            raise error
+        return [context]
+
+    results = {context: (result, error) for context, result, error in
+               k8s.fan_out(['ok', 'broken', 'forbidden'], fetch)}
+
+    assert results == {
+        'ok': (['ok'], None),
+        'broken': (None, 'connection refused'),
+        'forbidden': (None, 'Error from server (Forbidden): pods is forbidden'),
+    }
+
+def test_fan_out_timeout_frees_the_slot():
+    hung = threading.Event()
+    started = {}
+
+    def fetch(context):
+        started[context] = time.monotonic()
+        if context == 'hung':
+            hung.wait(5)
+        return context
+
+    began = time.monotonic()
+    try:
+        results = list(k8s.fan_out(['hung', 'a', 'b'], fetch, concurrency=1, timeout=0.2))
+    finally:
+        hung.set()
+
+    assert results == [('hung', None, 'timed out after 0.2s'), ('a', 'a', None), ('b', 'b', None)]
+    # The queued contexts start once the hung one times out, not when it returns
+    assert started['a'] - began < 1
+    assert time.monotonic() - began < 1
+
+def test_get_api_client_creates_one_client_per_context(monkeypatch):
+    created = []
+
+    def new_api_client(context=None, kubeconfig=None):
+        created.append(context)
+        time.sleep(0.1)
+        return object()
+
+    monkeypatch.setattr(k8s, '_clients', {})
+    monkeypatch.setattr(k8s, 'new_api_client', new_api_client)
+    clients = {}
+
+    def get(context, i):
+        clients[context, i] = k8s.get_api_client(context)
+
+    threads = [threading.Thread(target=get, args=(context, i)) for context in ('a', 'b') for i in range(4)]
+    began = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(created) == ['a', 'b']
+    assert len({id(client) for client in clients.values()}) == 2
+    assert all(clients[context, i] is k8s.get_api_client(context) for context, i in clients)
+    # Different contexts are created concurrently
+    assert time.monotonic() - began < 0.19
+
@@ -0,0 +1,135 @@
+"""
+Tests for the kubeconfig index: building API clients from only the files
+defining a context, and sharing the index between KUBECONFIG values.
+"""
+
+import builtins
+import json
+import os
+
+import pytest
+
+from kubed import kubeconfig
+from kubed.k8s import new_api_client
+
+USERS_FILE = '''
+apiVersion: v1
+kind: Config
+current-context: dev
+contexts:
+- name: dev
+  context: {cluster: shared, user: alice, namespace: team-a}
+- name: ops
+  context: {cluster: shared, user: oidc}
+users:
+- name: alice
+  user:
+    token: alice-token
+    client-certificate: certs/alice.crt
+    client-key: ~/alice.key
+- name: oidc
+  user:
+    auth-provider: {name: oidc, config: {id-token: x}}
+'''
+
+CLUSTERS_FILE = '''
+apiVersion: v1
+kind: Config
+clusters:
+- name: shared
+  cluster: {server: 'https://shared.example:6443', certificate-authority: ca.crt}
+users:
+- name: alice
+  user: {token: shadowed}
+'''
+
+@pytest.fixture
+def kubeconfigs(tmp_path, monkeypatch):
+    monkeypatch.setenv('KUBED_CACHE_DIR', str(tmp_path / 'cache'))
+    (tmp_path / 'a').mkdir()
+    (tmp_path / 'b').mkdir()
+    (tmp_path / 'a' / 'config').write_text(USERS_FILE)
+    (tmp_path / 'b' / 'config').write_text(CLUSTERS_FILE)
+    (tmp_path / 'a' / 'certs').mkdir()
+    (tmp_path / 'a' / 'certs' / 'alice.crt').write_text('cert')
+    (tmp_path / 'b' / 'ca.crt').write_text('ca')
+    (tmp_path / 'alice.key').write_text('key')
+    monkeypatch.setenv('HOME', str(tmp_path))
+    (tmp_path / 'c.yaml').write_text('clusters:\n- name: other\n  cluster: {server: https://other}\n')
+    paths = [str(tmp_path / 'a' / 'config'), str(tmp_path / 'b' / 'config'), str(tmp_path / 'c.yaml')]
+    monkeypatch.setenv('KUBECONFIG', os.pathsep.join(paths))
+    return paths
+
+def test_client_config_reads_only_defining_files(kubeconfigs, monkeypatch):
+    index = kubeconfig.load_index()
+    opened = []
+
+    def tracking_open(path, *args, **kwargs):
+        opened.append(path)
+        return builtins.open(path, *args, **kwargs)
+
+    monkeypatch.setattr(kubeconfig, 'open', tracking_open, raising=False)
+    config = index.client_config('dev')
+
+    assert sorted(opened) == kubeconfigs[:2]
+    base_a, base_b = (os.path.dirname(path) for path in kubeconfigs[:2])
+    assert config == {
+        'apiVersion': 'v1',
+        'kind': 'Config',
+        'current-context': 'dev',
+        'contexts': [{'name': 'dev', 'context': {'cluster': 'shared', 'user': 'alice', 'namespace': 'team-a'}}],
+        'clusters': [{'name': 'shared', 'cluster': {'server': 'https://shared.example:6443',
+                                                    'certificate-authority': os.path.join(base_b, 'ca.crt')}}],
+        # The first file defining a user wins, as in kubectl
+        'users': [{'name': 'alice', 'user': {'token': 'alice-token',
+                                             'client-certificate': os.path.join(base_a, 'certs/alice.crt'),
+                                             'client-key': os.path.join(os.path.dirname(base_a), 'alice.key')}}],
+    }
+
+def test_client_config_falls_back(kubeconfigs):
+    index = kubeconfig.load_index()
+
+    assert index.client_config('ops') is None
+    assert index.client_config('missing') is None
+
+def test_new_api_client_uses_index(kubeconfigs):
+    client = new_api_client()
+
+    assert client.configuration.host == 'https://shared.example:6443'
+    assert client.configuration.api_key['BearerToken'] == 'Bearer alice-token'
+    assert client.configuration.ssl_ca_cert == os.path.join(os.path.dirname(kubeconfigs[1]), 'ca.crt')
+    assert client.configuration.cert_file == os.path.join(os.path.dirname(kubeconfigs[0]), 'certs', 'alice.crt')
+    client.close()
+
+def test_index_keeps_files_of_other_kubeconfigs(kubeconfigs, monkeypatch):
+    parsed = []
+    parse = kubeconfig.parse_kubeconfig
+    monkeypatch.setattr(kubeconfig, 'parse_kubeconfig', lambda path: parsed.append(path) or parse(path))
+
+    # Two shells with different KUBECONFIG values take turns with the shared index
+    for _ in range(3):
+        for value in (kubeconfigs[0], os.pathsep.join(kubeconfigs[1:])):
+            monkeypatch.setenv('KUBECONFIG', value)
+            monkeypatch.setattr(kubeconfig, '_indexes', {})
+            index = kubeconfig.load_index()
+
+    assert sorted(parsed) == sorted(kubeconfigs)
+    assert list(index.contexts) == []
+    assert list(index.clusters) == ['shared', 'other']
+    with open(kubeconfig.get_index_path()) as f:
+        assert sorted(json.load(f)['files']) == sorted(kubeconfigs)
+
+def test_index_drops_deleted_and_oldest_files(kubeconfigs, monkeypatch):
+    kubeconfig.load_index()
+    os.unlink(kubeconfigs[2])
+    monkeypatch.setattr(kubeconfig, 'MAX_INDEX_FILES', 1)
+
+    # Only a change to an indexed file writes the index
+    monkeypatch.setenv('KUBECONFIG', kubeconfigs[1])
+    with open(kubeconfigs[1], 'a') as f:
+        f.write('\n')
+    index = kubeconfig.load_index()
+
+    with open(kubeconfig.get_index_path()) as f:
+        assert list(json.load(f)['files']) == kubeconfigs[1:2]
+    assert list(index.clusters) == ['shared']
@@ -0,0 +1,210 @@
+"""
+Tests for `kubed k8s logs` against a fake API server: merging lines in
+timestamp order, the open-stream cap and backpressure, and following pods
+as they come and go.
+"""
+
+import io
+import json
+import queue
+import threading
+import time
+
+import pytest
+
+from kubed import logs
+
+def make_pod(name, started=True):
+    return {
+        'metadata': {'name': name, 'namespace': 'default', 'uid': f'uid-{name}', 'resourceVersion': '1',
+                     'labels': {'app': 'web'}},
+        'spec': {'containers': [{'name': 'app'}, {'name': 'sidecar'}]},
+        'status': {'containerStatuses': [{'name': 'app', 'state': {'running': {}} if started else {'waiting': {}}}]},
+    }
+
+class FakeApiServer:
+    """Serves pods, their logs line by line, and queued pod watch events."""
+
+    def __init__(self, fake_server):
+        self.pods = {}
+        # Pod name to its log lines, to how long to wait before answering, and to
+        # an event holding the stream open after its lines
+        self.logs = {}
+        self.delays = {}
+        self.holds = {}
+        self.log_requests = []
+        self.events = queue.Queue()
+        self.active = self.peak = 0
+        self.closed = False
+        self.lock = threading.Lock()
+        self.url = fake_server([
+            ('GET', r'/api/v1/namespaces/default/pods/([^/]+)/log', self.log),
+            ('GET', r'/api/v1/namespaces/default/pods/([^/]+)', self.read),
+            ('GET', r'/api/v1/namespaces/default/pods', self.list),
+        ]).url
+
+    def add(self, pod, lines=()):
+        self.pods[pod['metadata']['name']] = pod
+        self.logs[pod['metadata']['name']] = list(lines)
+
+    def read(self, request, name):
+        request.send_json(200, self.pods[name])
+
+    def list(self, request):
+        if request.query.get('watch') == 'true':
+            request.start_chunks()
+            while not self.closed:
+                try:
+                    event = self.events.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                request.write_chunk(json.dumps(event).encode() + b'\n')
+            return request.write_chunk(b'')
+        request.send_json(200, {'kind': 'PodList', 'metadata': {'resourceVersion': '1'},
+                                'items': list(self.pods.values())})
+
+    def log(self, request, name):
+        self.log_requests.append((name, request.query.get('container')))
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(self.delays.get(name, 0))
+            request.start_chunks()
+            for line in self.logs[name]:
+                request.write_chunk(line.encode() + b'\n')
+            if name in self.holds:
+                self.holds[name].wait(5)
+            request.write_chunk(b'')
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def close(self):
+        self.closed = True
+        for hold in self.holds.values():
+            hold.set()
+
+@pytest.fixture
+def apiserver(fake_server):
+    server = FakeApiServer(fake_server)
+    yield server
+    server.close()
+
+@pytest.fixture
+def api(apiserver):
+    from kubernetes import client
+
+    configuration = client.Configuration()
+    configuration.host = apiserver.url
+    api_client = client.ApiClient(configuration)
+    yield client.CoreV1Api(api_client)
+    api_client.close()
+
+def run(streams):
+    streams.out = io.BytesIO()
+    assert streams.run()
+    return streams.out.getvalue().decode().splitlines()
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('timed out waiting for condition')
+        time.sleep(0.01)
+
+def test_order_merges_streams_by_timestamp(apiserver, api):
+    apiserver.add(make_pod('a'), ['2024-01-01T00:00:01Z a1', '2024-01-01T00:00:02.25Z a2', '2024-01-01T00:00:04Z a3'])
+    apiserver.add(make_pod('b'), ['2024-01-01T00:00:02.5Z b1', '2024-01-01T00:00:03Z b2'])
+    # b answers later, but within the ordering window
+    apiserver.delays['b'] = 0.3
+
+    lines = run(logs.LogStreams(api, 'default', selector='app=web', order=True))
+
+    assert lines == ['[pod/a/app] a1', '[pod/a/app] a2', '[pod/b/app] b1', '[pod/b/app] b2', '[pod/a/app] a3']
+    lines = run(logs.LogStreams(api, 'default', selector='app=web', order=True, timestamps=True, prefix=False))
+    assert lines[:2] == ['2024-01-01T00:00:01Z a1', '2024-01-01T00:00:02.25Z a2']
+
+def test_order_holds_lines_back_for_the_window(apiserver, api, monkeypatch):
+    monkeypatch.setattr(logs, 'ORDER_WINDOW', 0.5)
+    apiserver.add(make_pod('a'), ['2024-01-01T00:00:03Z a1'])
+    apiserver.add(make_pod('b'), ['2024-01-01T00:00:01Z b1'])
+    apiserver.delays['b'] = 0.2
+    apiserver.holds = {'a': threading.Event(), 'b': threading.Event()}
+    streams = logs.LogStreams(api, 'default', selector='app=web', order=True, follow=True)
+    streams.out = io.BytesIO()
+    threading.Thread(target=streams.run, daemon=True).start()
+
+    # Both lines are printed while the streams are still open, the later-read one first
+    wait_for(lambda: streams.out.getvalue().count(b'\n') == 2)
+    assert streams.out.getvalue().decode().splitlines() == ['[pod/b/app] b1', '[pod/a/app] a1']
+
+def test_unordered_streams_print_as_read(apiserver, api):
+    apiserver.add(make_pod('a'), ['2024-01-01T00:00:03Z a1'])
+    apiserver.add(make_pod('b'), ['2024-01-01T00:00:01Z b1'])
+    apiserver.delays['b'] = 0.3
+
+    lines = run(logs.LogStreams(api, 'default', selector='app=web', timestamps=True))
+
+    assert lines == ['[pod/a/app] 2024-01-01T00:00:03Z a1', '[pod/b/app] 2024-01-01T00:00:01Z b1']
+
+def test_max_streams_caps_open_streams(apiserver, api):
+    for i in range(5):
+        apiserver.add(make_pod(f'p{i}'), [f'line from p{i}'])
+        apiserver.delays[f'p{i}'] = 0.1
+    apiserver.add(make_pod('pending', started=False), ['never read'])
+
+    lines = run(logs.LogStreams(api, 'default', selector='app=web', all_containers=True, max_streams=2))
+
+    # Containers that have not started are skipped rather than streamed
+    assert sorted(lines) == [f'[pod/p{i}/app] line from p{i}' for i in range(5)]
+    assert sorted(apiserver.log_requests) == [(f'p{i}', 'app') for i in range(5)]
+    assert apiserver.peak == 2
+
+def test_full_buffer_blocks_the_stream(apiserver, api):
+    apiserver.add(make_pod('a'), [f'line {i}' for i in range(100)])
+    streams = logs.LogStreams(api, 'default', names=['a'], buffer_lines=3)
+
+    streams.offer(apiserver.pods['a'])
+    wait_for(lambda: streams.lines.qsize() == 3)
+    time.sleep(0.2)
+    assert streams.lines.qsize() == 3
+    assert streams.open == 1
+
+    # Each printed line frees a slot for the next one
+    read = []
+    while True:
+        item = streams.lines.get(timeout=5)
+        if item is None:
+            break
+        read.append(item[1].decode())
+        item[2].release()
+    assert read == [f'line {i}' for i in range(100)]
+    assert streams.finished()
+
+def test_follow_picks_up_new_pods_and_forgets_deleted_ones(apiserver, api):
+    apiserver.add(make_pod('a'), ['a1'])
+    streams = logs.LogStreams(api, 'default', selector='app=web', follow=True)
+    resource_version = streams.relist()
+    threading.Thread(target=streams.watch, args=(resource_version,), daemon=True).start()
+    wait_for(lambda: streams.known == {('uid-a', 'app')})
+
+    apiserver.add(make_pod('b', started=False), ['b1'])
+    apiserver.events.put({'type': 'ADDED', 'object': make_pod('b', started=False)})
+    apiserver.events.put({'type': 'MODIFIED', 'object': make_pod('a')})
+    time.sleep(0.2)
+    # b is not streamed until its container starts, and a is not streamed twice
+    assert streams.known == {('uid-a', 'app')}
+
+    apiserver.events.put({'type': 'MODIFIED', 'object': make_pod('b')})
+    wait_for(lambda: streams.known == {('uid-a', 'app'), ('uid-b', 'app')})
+    apiserver.events.put({'type': 'DELETED', 'object': make_pod('a')})
+    wait_for(lambda: streams.known == {('uid-b', 'app')})
+
+    assert [name for name, _ in apiserver.log_requests] == ['a', 'b']
+    lines = set()
+    while len(lines) < 2:
+        item = streams.lines.get(timeout=5)
+        if item is not None:
+            lines.add((item[0], item[1]))
+    assert lines == {('pod/a/app', b'a1'), ('pod/b/app', b'b1')}
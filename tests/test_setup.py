@@ -0,0 +1,86 @@
+"""
+Tests for `kubed setup` in a throwaway $HOME: the files and rc-file blocks
+it plans, writes and migrates.
+"""
+
+import pytest
+
+from kubed import cli
+from kubed.bundle import get_bundle_path, get_source_line
+from kubed.manifest import apply_changes, load_manifest, plan_changes
+
+@pytest.fixture
+def home(tmp_path, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmp_path))
+    monkeypatch.delenv('KUBED_CACHE_DIR', raising=False)
+    return tmp_path
+
+def setup(shell, shell_config):
+    """Plan and apply setup the way `kubed setup` does, returning the changes written."""
+    artifacts, rc_files = cli.get_setup_plan(shell, shell_config)
+    manifest = load_manifest()
+    changes, _ = plan_changes(artifacts, rc_files, manifest)
+    apply_changes(changes, artifacts, manifest)
+    return changes
+
+@pytest.mark.parametrize('shell', ['bash', 'zsh'])
+def test_second_setup_writes_nothing(home, shell):
+    rc = home / f'.{shell}rc'
+    rc.write_text('export EDITOR=vim\n')
+
+    written = {change.path for change in setup(shell, str(rc))}
+
+    assert {get_bundle_path(shell), str(rc)} <= written
+    assert (home / '.kubed' / 'manifest.json').exists()
+    assert get_source_line(shell) in rc.read_text()
+    assert rc.read_text().startswith('export EDITOR=vim\n')
+    if shell == 'bash':
+        assert (home / '.kubed' / 'completions' / 'kubed.bash').read_text() == cli.STANDARD_COMPLETION
+    else:
+        assert (home / '.p10k.zsh').read_text() == cli.MINIMAL_P10K
+
+    assert setup(shell, str(rc)) == []
+
+def test_setup_check_prints_the_diff(home, monkeypatch, capsys):
+    monkeypatch.setenv('SHELL', '/bin/bash')
+    bashrc = home / '.bashrc'
+    bashrc.write_text('export EDITOR=vim\n')
+
+    with pytest.raises(SystemExit) as exit_info:
+        cli.setup_command(check=True)
+
+    assert exit_info.value.code == 1
+    out = capsys.readouterr().out
+    assert '+++ b/~/.bashrc' in out
+    assert f'+{get_source_line("bash")}' in out
+    # --check writes nothing
+    assert bashrc.read_text() == 'export EDITOR=vim\n'
+    assert [path for path in home.rglob('*') if path.is_file()] == [bashrc]
+
+    setup('bash', str(bashrc))
+    assert cli.setup_command(check=True)
+    assert 'Everything is up to date' in capsys.readouterr().out
+
+def test_setup_adopts_the_legacy_block(home):
+    bashrc = home / '.bashrc'
+    bashrc.write_text('export EDITOR=vim\n' + cli.LEGACY_SETUP.format('bash') + 'alias ll="ls -l"\n')
+
+    setup('bash', str(bashrc))
+
+    assert bashrc.read_text() == ('export EDITOR=vim\n\n# >>> kubed init >>>\n' + get_source_line('bash') +
+                                  '\n# <<< kubed init <<<\nalias ll="ls -l"\n')
+    assert setup('bash', str(bashrc)) == []
+
+@pytest.mark.parametrize('plugin_lines', [
+    '# Added by Kubed\nsource ~/.zsh/plugins/kubed/kubed.plugin.zsh\n',
+    '# >>> kubed plugin >>>\nsource ~/.zsh/plugins/kubed/kubed.plugin.zsh\n# <<< kubed plugin <<<\n',
+])
+def test_setup_stops_sourcing_the_zsh_plugin(home, plugin_lines):
+    zshrc = home / '.zshrc'
+    zshrc.write_text(f'export EDITOR=vim\n{plugin_lines}alias ll="ls -l"\n')
+
+    changes, _ = plan_changes(*cli.get_setup_plan('zsh', str(zshrc)))
+
+    new = next(change.new for change in changes if change.path == str(zshrc))
+    assert 'kubed.plugin.zsh' not in new
+    assert new.startswith('export EDITOR=vim\nalias ll="ls -l"\n')
@@ -0,0 +1,85 @@
+"""
+Tests for `kubed stats`: reading the latency ring buffer the shell hooks
+write, and the hooks themselves in an interactive bash.
+"""
+
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from kubed import cli, stats
+
+def record(tool, subcommand, ms, epoch):
+    """A record as the hooks format it, 64 bytes with the newline."""
+    line = ('%-10.10s %-24.24s %11.3f %15d\n' % (tool, subcommand, ms, epoch)).encode()
+    assert len(line) == stats.RECORD_SIZE
+    return line
+
+def test_read_records_skips_empty_and_partial_slots(tmp_path):
+    ring = tmp_path / 'latency.ring'
+    ring.write_bytes(
+        record('kubectl', 'get', 12.5, 1700000000)
+        # A slot dd has not reached yet reads as NULs
+        + b'\0' * stats.RECORD_SIZE
+        # A write torn by a crash
+        + record('helm', 'list', 30, 1700000001)[:40] + b'\0' * 24
+        + record('docker', 'ps', 7.25, 1700000002)
+        # Not four fields, and not a number
+        + b'x' * 63 + b'\n'
+        + record('helm', 'list', 1, 1700000003).replace(b'1.000', b'1.0x0')
+        # A trailing slot cut short
+        + record('terraform', 'plan', 900, 1700000004)[:32])
+
+    assert stats.read_records(str(ring)) == [('kubectl', 'get', 12.5, 1700000000),
+                                             ('docker', 'ps', 7.25, 1700000002)]
+    assert stats.read_records(str(tmp_path / 'missing')) == []
+
+def test_summarize_groups_by_tool_and_subcommand():
+    records = [('kubectl', 'get', float(ms), 0) for ms in range(1, 21)]
+    records += [('kubectl', 'apply', 40.0, 0), ('kubectl', 'apply', 60.0, 0), ('helm', '-', 5.0, 0)]
+
+    rows = stats.summarize(records)
+
+    assert rows == [
+        {'tool': 'helm', 'subcommand': '-', 'count': 1, 'p50_ms': 5.0, 'p95_ms': 5.0, 'max_ms': 5.0},
+        {'tool': 'kubectl', 'subcommand': 'get', 'count': 20, 'p50_ms': 10.0, 'p95_ms': 19.0, 'max_ms': 20.0},
+        {'tool': 'kubectl', 'subcommand': 'apply', 'count': 2, 'p50_ms': 40.0, 'p95_ms': 60.0, 'max_ms': 60.0},
+    ]
+    assert [row['tool'] for row in stats.summarize(records, tool='helm')] == ['helm']
+    assert stats.summarize([]) == []
+
+# Run as an interactive shell, so PROMPT_COMMAND and the DEBUG trap fire as at a prompt
+SESSION = '''trap 'echo "user $BASH_COMMAND" >> "$TRAP_LOG"' DEBUG
+kubectl() { :; }
+helm() { :; }
+source "$HOOKS"
+kubectl get pods -n default
+helm --help
+kubectl -n kube-system describe pod web
+'''
+
+@pytest.mark.skipif(not shutil.which('bash'), reason='needs bash')
+def test_bash_hooks_chain_the_debug_trap_and_wrap_the_ring(tmp_path):
+    hooks = tmp_path / 'help_wrapper.sh'
+    hooks.write_text(cli.HELP_HOOKS)
+    ring = tmp_path / 'stats' / 'latency.ring'
+    trap_log = tmp_path / 'trap.log'
+    env = dict(os.environ, HOME=str(tmp_path), HOOKS=str(hooks), TRAP_LOG=str(trap_log),
+               KUBED_STATS_FILE=str(ring), KUBED_STATS_SLOTS='2')
+
+    result = subprocess.run(['bash', '--norc', '--noprofile', '-i'], input=SESSION, env=env,
+                            capture_output=True, text=True, timeout=30)
+
+    # The user's trap still runs, for each command
+    traced = trap_log.read_text().splitlines()
+    for command in ('kubectl get pods -n default', 'helm --help', 'kubectl -n kube-system describe pod web'):
+        assert f'user {command}' in traced
+    assert 'cmds.daleyarborough.com' in result.stdout
+    # Three commands in two slots: the third overwrote the first
+    data = ring.read_bytes()
+    assert len(data) == 2 * stats.RECORD_SIZE
+    assert [(tool, subcommand) for tool, subcommand, _, _ in stats.read_records(str(ring))] == [
+        ('kubectl', 'describe'), ('helm', '-')]
+    assert (tmp_path / 'stats' / 'latency.ring.idx').read_text() == '1\n'
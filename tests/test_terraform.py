@@ -0,0 +1,134 @@
+"""
+Tests for `kubed terraform plan --all`, with a stub terraform on PATH.
+"""
+
+import os
+import stat
+
+import pytest
+from click.testing import CliRunner
+
+from kubed import terraform
+
+# Records each invocation's arguments in the module, and plans one addition
+STUB_TERRAFORM = '''#!/bin/sh
+printf '%s\\n' "$@" > ".stub-$1"
+if [ "$1" = plan ]; then
+    echo "Plan: 1 to add, 0 to change, 0 to destroy."
+    exit 2
+fi
+'''
+
+@pytest.mark.parametrize('args, patterns, terraform_args', [
+    (['envs/*', '-refresh=false'], ['envs/*'], ['-refresh=false']),
+    (['-var', 'region=eu', 'envs/*'], ['envs/*'], ['-var', 'region=eu']),
+    (['-var=region=eu', 'envs/*'], ['envs/*'], ['-var=region=eu']),
+    (['-var-file', 'prod.tfvars', '-target', 'null_resource.a', 'a', 'b'], ['a', 'b'],
+     ['-var-file', 'prod.tfvars', '-target', 'null_resource.a']),
+    (['--var', 'x=1', '-lock-timeout', '30s', '-parallelism', '4'], [],
+     ['--var', 'x=1', '-lock-timeout', '30s', '-parallelism', '4']),
+    (['-replace', 'aws_instance.web', '-compact-warnings', 'envs'], ['envs'],
+     ['-replace', 'aws_instance.web', '-compact-warnings']),
+])
+def test_split_plan_args(args, patterns, terraform_args):
+    assert terraform.split_plan_args(args) == (patterns, terraform_args)
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    stub = bin_dir / 'terraform'
+    stub.write_text(STUB_TERRAFORM)
+    stub.chmod(stub.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv('PATH', f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setenv('KUBED_CACHE_DIR', str(tmp_path / 'cache'))
+
+    root = tmp_path / 'repo'
+    for module in ('envs/prod', 'envs/staging', 'modules/net'):
+        (root / module).mkdir(parents=True)
+    (root / 'envs/prod/main.tf').write_text('provider "null" {}\n')
+    (root / 'envs/staging/main.tf').write_text('terraform {\n  backend "local" {}\n}\n')
+    (root / 'modules/net/main.tf').write_text('resource "null_resource" "a" {}\n')
+    monkeypatch.chdir(root)
+    return root
+
+def plan(repo, *args):
+    return CliRunner().invoke(terraform.terraform, ['plan', '--all', '--output-dir', str(repo / 'runs')] + list(args))
+
+def test_plan_all_passes_option_values(repo):
+    result = plan(repo, '-var', 'region=eu', 'envs', '-var-file', 'prod.tfvars', '-target', 'null_resource.a',
+                  '-refresh=false', '--concurrency', '2')
+
+    assert result.exit_code == 0, result.output
+    for module in ('envs/prod', 'envs/staging'):
+        assert (repo / module / '.stub-init').read_text().split() == ['init', '-input=false', '-no-color']
+        plan_file = repo / 'runs' / f"{module.replace('/', '__')}.tfplan"
+        assert (repo / module / '.stub-plan').read_text().split() == [
+            'plan', '-input=false', '-no-color', '-detailed-exitcode', f'-out={plan_file}',
+            '-var', 'region=eu', '-var-file', 'prod.tfvars', '-target', 'null_resource.a', '-refresh=false']
+    # Only the pattern selects modules; option values are not taken for paths
+    assert not (repo / 'modules/net/.stub-plan').exists()
+    assert 'Planning 2 run(s) in 2 root module(s)' in result.output
+    assert 'TOTAL' in result.output
+
+def test_plan_all_rejects_missing_value(repo):
+    result = plan(repo, 'envs', '-var')
+
+    assert result.exit_code == 2
+    assert '-var needs a value' in result.output
+    assert not (repo / 'envs/prod/.stub-init').exists()
+
+def test_plan_all_rejects_out(repo):
+    result = plan(repo, 'envs', '-out', 'x.tfplan')
+
+    assert result.exit_code == 2
+    assert '-out cannot be used with --all' in result.output
+
+# Records when each init starts and ends, in nanoseconds
+TIMED_TERRAFORM = '''#!/bin/sh
+if [ "$1" = init ]; then
+    date +%s%N > .init-started
+    sleep 0.3
+    date +%s%N > .init-ended
+fi
+echo "No changes."
+'''
+
+LOCK_FILE = '''provider "registry.terraform.io/hashicorp/null" {
+  version     = "3.2.2"
+  constraints = "~> 3.0"
+  hashes = [
+    "h1:abc=",
+  ]
+}
+'''
+
+def init_spans(repo, modules):
+    return sorted((int((repo / module / '.init-started').read_text()), int((repo / module / '.init-ended').read_text()))
+                  for module in modules)
+
+def test_inits_run_together_once_providers_are_cached(repo, tmp_path, monkeypatch):
+    from kubed.artifacts import detect_platform
+
+    stub = tmp_path / 'bin' / 'terraform'
+    stub.write_text(TIMED_TERRAFORM)
+    plugins = tmp_path / 'plugins'
+    monkeypatch.setenv('TF_PLUGIN_CACHE_DIR', str(plugins))
+    modules = ['envs/prod', 'envs/staging']
+
+    # Without lock files the providers a module needs are unknown, so its init takes the lock
+    assert plan(repo, 'envs').exit_code == 0
+    (first_start, first_end), (second_start, _) = init_spans(repo, modules)
+    assert second_start >= first_end
+
+    for module in modules:
+        (repo / module / '.terraform.lock.hcl').write_text(LOCK_FILE)
+    # A locked provider missing from the cache still needs the lock
+    assert plan(repo, 'envs').exit_code == 0
+    (first_start, first_end), (second_start, _) = init_spans(repo, modules)
+    assert second_start >= first_end
+
+    (plugins / 'registry.terraform.io/hashicorp/null/3.2.2' / '_'.join(detect_platform())).mkdir(parents=True)
+    assert plan(repo, 'envs', '--concurrency', '2').exit_code == 0
+    (first_start, first_end), (second_start, _) = init_spans(repo, modules)
+    assert second_start < first_end